@@ -10,12 +10,18 @@ from aws_iot_akame.stack_G_cognito import CognitoStack
 from aws_iot_akame.stack_H_activation_code import ActivationCodeStack
 from aws_iot_akame.stack_E_activation_api import ActivationApiStack
 from aws_iot_akame.stack_I_ingestion import TelemetryIngestionStack
-from aws_iot_akame.stack_L_telemetry_analytics import TelemetryAnalyticsStack
+from aws_iot_akame.stack_L_telemetry_analytics import (
+    TelemetryAnalyticsStack,
+    TELEMETRY_FLAT_TABLE,
+    TELEMETRY_ROLLUPS_TABLE,
+    TELEMETRY_SUPERSEDED_TABLE,
+)
 from aws_iot_akame.stack_M_telemetry_query import TelemetryQueryStack
 from aws_iot_akame.stack_N_telemetry_athena_view import TelemetryAthenaViewsStack
 from aws_iot_akame.stack_O_telemetry_aggregates_api import TelemetryAggregatesApiStack
 from aws_iot_akame.stack_P_telemetry_api import TelemetryApiStack
 from aws_iot_akame.stack_Q_telemetry_athena_workgroup import TelemetryAthenaWorkGroupStack
+from aws_iot_akame.stack_R_telemetry_compaction import TelemetryCompactionStack
 
 
 app = cdk.App()
@@ -25,10 +31,51 @@ env = cdk.Environment(
     region=os.getenv("AWS_REGION", "us-east-2")
 )
 
+# Formato de salida de la telemetria RAW: "json" (GZIP) o "parquet"
+# cdk deploy -c telemetry_output_format=parquet
+telemetry_output_format = app.node.try_get_context("telemetry_output_format") or "json"
+
+# Una fila por lectura (nodeId) en telemetry_flat: la vista ya no necesita UNNEST
+# cdk deploy -c telemetry_flatten=true
+# La vista solo la usa desde telemetry_flatten_since (epoch de cuando se
+# activo, a fijar en el despliegue siguiente; la vista corta en la hora
+# siguiente); antes, UNNEST sobre RAW.
+telemetry_flatten = str(app.node.try_get_context("telemetry_flatten") or "false").lower() == "true"
+telemetry_flatten_since = app.node.try_get_context("telemetry_flatten_since")
+
+# Validacion de payloads en el transform de Firehose (-c telemetry_validate=false para desactivar)
+telemetry_validate = str(app.node.try_get_context("telemetry_validate") or "true").lower() == "true"
+
+# Descarte de lecturas duplicadas (meshId, event_ts, nodeId) en el transform.
+# No obliga a parsear: sin validacion ni rollups descarta solo reenvios
+# exactos del record, sobre los bytes del fast path.
+telemetry_dedup = str(app.node.try_get_context("telemetry_dedup") or "true").lower() == "true"
+
+# Rollups minuto/hora en la ingesta (cdk deploy -c telemetry_rollups=true).
+# Cuestan ~10x el parseo completo en el transform, por eso van apagados.
+# telemetry_aggregates los lee desde la marca que escribe el primer lote con
+# rollups (rollups/_since.json); antes, RAW.
+telemetry_rollups = str(app.node.try_get_context("telemetry_rollups") or "false").lower() == "true"
+
+# Authorizer con tokens firmados (sin DynamoDB por conexion); requiere el
+# parametro /akame/gateway-token/keys. cdk deploy -c gateway_token_auth=true
+gateway_token_auth = str(app.node.try_get_context("gateway_token_auth") or "false").lower() == "true"
+
+# Expiracion a la hora exacta desde el stream de DeviceMetadata; el job por
+# buckets pasa a ser reconciliacion horaria (-c expiry_scheduler=false para desactivar)
+expiry_scheduler = str(app.node.try_get_context("expiry_scheduler") or "true").lower() == "true"
+
+# Shards por hora del GSI ByLifecycleBucket (TRIAL#YYYYMMDDHH#n): reparte las
+# escrituras de provisioning/activaciones masivas. Solo subirlo (o migrar con
+# scripts/reshard_lifecycle_buckets.py). cdk deploy -c lifecycle_bucket_shards=16
+lifecycle_bucket_shards = int(app.node.try_get_context("lifecycle_bucket_shards") or 8)
+
 # Módulo A
 factory= DeviceFactoryStack(
     app,
     "DeviceFactoryStack",
+    metadata_stream=expiry_scheduler,
+    bucket_shards=lifecycle_bucket_shards,
     env=env  
 )
 
@@ -37,6 +84,7 @@ authorizer = AuthorizerStack(
     app,
     "AuthorizerStack",
     metadata_table=factory.metadata_table,   # PASA LA TABLA
+    token_auth=gateway_token_auth,
     env=env
 )
 
@@ -45,6 +93,8 @@ certificate_lifecycle = CertificateLifecycleStack(
     app,
     "CertificateLifecycleStack",
     metadata_table=factory.metadata_table,   # PASA LA TABLA
+    expiry_scheduler=expiry_scheduler,
+    bucket_shards=lifecycle_bucket_shards,
     env=env
 )
 
@@ -53,6 +103,7 @@ renewal = RenewalStack(
     app,
     "RenewalStack",
     metadata_table=factory.metadata_table,   # PASA LA TABLA
+    token_denylist_table=authorizer.token_denylist_table,
     env=env
 )
 
@@ -70,6 +121,8 @@ activation_code = ActivationCodeStack(
     "ActivationCodeStack",
     metadata_table=factory.metadata_table,   # PASA LA TABLA
     activation_code_table=factory.activation_code_table,  # PASA LA TABLA
+    gateway_token=gateway_token_auth,
+    bucket_shards=lifecycle_bucket_shards,
     env=env
 )
 
@@ -87,6 +140,12 @@ activation_api = ActivationApiStack(
 telemetry_ingestion = TelemetryIngestionStack(  
     app,
     "TelemetryIngestionStack",
+    output_format=telemetry_output_format,
+    flatten=telemetry_flatten,
+    validate_payloads=telemetry_validate,
+    dedup=telemetry_dedup,
+    rollups=telemetry_rollups,
+    metadata_table=factory.metadata_table,   # filtro de entitlements
     env=env
 )
 
@@ -95,10 +154,22 @@ telemetry_analytics = TelemetryAnalyticsStack(
     app,
     "TelemetryAnalyticsStack",
     telemetry_bucket_name=telemetry_ingestion.telemetry_bucket.bucket_name,
+    output_format=telemetry_output_format,
+    flatten=telemetry_flatten,
+    rollups=telemetry_rollups,
     env=env
 )
 
-
+# Módulo R
+telemetry_compaction = TelemetryCompactionStack(
+    app,
+    "TelemetryCompactionStack",
+    telemetry_bucket=telemetry_ingestion.telemetry_bucket,
+    output_format=telemetry_output_format,
+    flatten=telemetry_flatten,
+    rollups=telemetry_rollups,
+    env=env
+)
 
 # Módulo Q
 telemetry_athena_workgroup = TelemetryAthenaWorkGroupStack(
@@ -114,6 +185,9 @@ telemetry_athena_views = TelemetryAthenaViewsStack(
     "TelemetryAthenaViewsStack",
     athena_database=telemetry_analytics.athena_database,
     athena_output_bucket=telemetry_analytics.athena_output_bucket,
+    flat_table=TELEMETRY_FLAT_TABLE if telemetry_flatten else "",
+    flatten_since=int(telemetry_flatten_since) if telemetry_flatten_since else None,
+    superseded_table=TELEMETRY_SUPERSEDED_TABLE,
     env=env
 )
 telemetry_athena_views.add_dependency(telemetry_athena_workgroup)
@@ -135,6 +209,9 @@ telemetry_aggregates_api = TelemetryAggregatesApiStack(
     metadata_table_name=factory.metadata_table.table_name,
     athena_database=telemetry_analytics.athena_database,
     athena_output_bucket=telemetry_analytics.athena_output_bucket,
+    rollups_table=TELEMETRY_ROLLUPS_TABLE if telemetry_rollups else "",
+    telemetry_bucket_name=telemetry_ingestion.telemetry_bucket.bucket_name,
+    superseded_table=TELEMETRY_SUPERSEDED_TABLE,
     env=env
 )
 
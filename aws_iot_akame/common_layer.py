@@ -0,0 +1,16 @@
+from aws_cdk import aws_lambda as lambda_
+from constructs import Construct
+
+
+def common_layer(scope: Construct) -> lambda_.LayerVersion:
+    """Layer con lambda/common/python (paquete akame_common)."""
+    return lambda_.LayerVersion(
+        scope,
+        "AkameCommonLayer",
+        code=lambda_.Code.from_asset("lambda/common"),
+        compatible_runtimes=[
+            lambda_.Runtime.PYTHON_3_11,
+            lambda_.Runtime.PYTHON_3_12,
+        ],
+        description="Shared helpers for akame Lambdas (akame_common)",
+    )
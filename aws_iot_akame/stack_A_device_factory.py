@@ -9,9 +9,18 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+
 
 class DeviceFactoryStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs):
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        metadata_stream: bool = False,
+        bucket_shards: int = 1,
+        **kwargs,
+    ):
         super().__init__(scope, construct_id, **kwargs)
 
         gateway_thing_type = iot.CfnThingType(
@@ -63,6 +72,8 @@ class DeviceFactoryStack(Stack):
             },
             billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
             removal_policy=RemovalPolicy.RETAIN,
+            # Cambios de expiresAt para el scheduler de expiracion (stack C)
+            stream=dynamodb.StreamViewType.NEW_AND_OLD_IMAGES if metadata_stream else None,
         )
 
         metadata_table.add_global_secondary_index(
@@ -99,11 +110,25 @@ class DeviceFactoryStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.main",
             code=lambda_.Code.from_asset("lambda/device_factory"),
-            timeout=Duration.seconds(30),
+            layers=[common_layer(self)],
+            # Un lote de FACTORY_MAX_BATCH al TPS de IoT tarda ~1 min
+            timeout=Duration.seconds(300),
+            # Los limitadores de TPS son por contenedor: una ejecucion a la
+            # vez para que la factory no pase de su parte de la cuota
+            reserved_concurrent_executions=1,
             environment={
                 "METADATA_TABLE": metadata_table.table_name,
                 "ACTIVATION_CODE_TABLE": activation_code_table.table_name,
                 "DEFAULT_EXPIRATION_SECONDS": str(3 * 24 * 3600),
+                "LIFECYCLE_BUCKET_SHARDS": str(bucket_shards),
+                # Modo lote (event.count)
+                "FACTORY_MAX_BATCH": "500",
+                "FACTORY_WORKERS": "8",
+                # APIs que solo usa la factory: 80% de la cuota (10/s)
+                "IOT_PROVISIONING_TPS": "8",
+                # UpdateCertificate (rollbacks) se comparte con el lifecycle
+                # de stack C: 1 de 10, ver CertificateLifecycleStack
+                "IOT_UPDATE_CERTIFICATE_TPS": "1",
             }
         )
 
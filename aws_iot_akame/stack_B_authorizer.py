@@ -1,14 +1,34 @@
 # aws_iot_akame/stack_B_authorizer.py
 from aws_cdk import (
     Duration,
+    RemovalPolicy,
     Stack,
+    aws_dynamodb as dynamodb,
+    aws_iam as iam,
     aws_lambda as lambda_,
     aws_iot as iot,
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+
+# SecureString con las claves HMAC de los tokens de gateway (se crea fuera de
+# CDK, como los secretos de Stripe):
+#   {"active": "k1", "keys": {"k1": "<base64 de 32 bytes aleatorios>"}}
+GATEWAY_TOKEN_KEYS_PARAM = "/akame/gateway-token/keys"
+
+
+def grant_gateway_token_keys(fn: lambda_.IFunction, stack: Stack):
+    fn.add_to_role_policy(
+        iam.PolicyStatement(
+            actions=["ssm:GetParameter"],
+            resources=[f"arn:aws:ssm:{stack.region}:{stack.account}:parameter{GATEWAY_TOKEN_KEYS_PARAM}"],
+        )
+    )
+
+
 class AuthorizerStack(Stack):
-    def __init__(self, scope: Construct, id: str, metadata_table, **kwargs):
+    def __init__(self, scope: Construct, id: str, metadata_table, token_auth: bool = False, **kwargs):
         super().__init__(scope, id, **kwargs)
 
 
@@ -17,16 +37,43 @@ class AuthorizerStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.lambda_handler",
             code=lambda_.Code.from_asset("lambda/auth_lambda"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(5),
             memory_size=128,
             
             environment={
                 "DEVICE_METADATA_TABLE": metadata_table.table_name,
+                # Cache de decisiones por contenedor (ver handler)
+                "AUTH_CACHE_TTL_SECONDS": "60",
+                "AUTH_NEGATIVE_CACHE_TTL_SECONDS": "15",
+                # Revocaciones de status llegan a conexiones abiertas en <= 1h
+                "AUTH_REFRESH_MAX_SECONDS": "3600",
+                # Con LOG_LEVEL=DEBUG, el evento de 1 de cada 100 conexiones
+                "LOG_SAMPLE_RATES": "DEBUG=0.01",
             }
         )
 
         metadata_table.grant_read_data(auth_fn)
 
+        # Modo token: verificacion local del token firmado + deny list pequenia
+        self.token_denylist_table = None
+        if token_auth:
+            denylist_table = dynamodb.Table(
+                self,
+                "GatewayTokenDenyList",
+                partition_key=dynamodb.Attribute(name="thingName", type=dynamodb.AttributeType.STRING),
+                time_to_live_attribute="expiresAt",
+                billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+                removal_policy=RemovalPolicy.RETAIN,
+            )
+            denylist_table.grant_read_data(auth_fn)
+            grant_gateway_token_keys(auth_fn, self)
+
+            auth_fn.add_environment("AUTH_MODE", "token")
+            auth_fn.add_environment("GATEWAY_TOKEN_KEYS_PARAM", GATEWAY_TOKEN_KEYS_PARAM)
+            auth_fn.add_environment("TOKEN_DENYLIST_TABLE", denylist_table.table_name)
+            self.token_denylist_table = denylist_table
+
         authorizer = iot.CfnAuthorizer(
             self,
             "CustomGatewayAuthorizer",
@@ -1,47 +1,210 @@
 from aws_cdk import (
     Stack,
     Duration,
+    RemovalPolicy,
+    aws_dynamodb as dynamodb,
     aws_lambda as lambda_,
+    aws_lambda_event_sources as event_sources,
     aws_events as events,
     aws_events_targets as targets,
     aws_iam as iam,
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+
 class CertificateLifecycleStack(Stack):
-    def __init__(self, scope: Construct, id: str, metadata_table, **kwargs):
+    def __init__(
+        self,
+        scope: Construct,
+        id: str,
+        metadata_table,
+        expiry_scheduler: bool = False,
+        bucket_shards: int = 1,
+        **kwargs,
+    ):
         super().__init__(scope, id, **kwargs)
 
+        # Estado del job (watermark de buckets drenados por prefijo y
+        # checkpoint del scheduler)
+        state_table = dynamodb.Table(
+            self,
+            "LifecycleState",
+            partition_key=dynamodb.Attribute(name="stateKey", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            removal_policy=RemovalPolicy.RETAIN,
+        )
+
+        # Cuota por defecto de IoT: 10 TPS por API y cuenta/region. Los
+        # limitadores son por contenedor y cada funcion que llama a IoT corre
+        # con concurrencia reservada 1, asi que cada una tiene una parte fija.
+        # UpdateCertificate (el unico API compartido):
+        #   barrido 3 (6 sin scheduler) + tick 3 + reconciliacion 1
+        #   + device factory 1 (rollbacks) = 8
+        # y quedan 2 para las activaciones, que no pasan por un limitador.
+        # DescribeCertificate solo lo usa la reconciliacion.
+        sweep_update_tps = 3 if expiry_scheduler else 6
+
+        environment = {
+            "DEVICE_METADATA_TABLE": metadata_table.table_name,
+            "LIFECYCLE_STATE_TABLE": state_table.table_name,
+            # Pool de expiracion; el ritmo lo marca el TPS de IoT
+            "LIFECYCLE_WORKERS": "8",
+            # Consulta todos los shards de cada hora en paralelo
+            "LIFECYCLE_BUCKET_SHARDS": str(bucket_shards),
+            "LIFECYCLE_QUERY_WORKERS": "8",
+        }
+
+        layer = common_layer(self)
+
         lifecycle_fn = lambda_.Function(
             self,
             "CertificateLifecycleLambda",
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.main",
             code=lambda_.Code.from_asset("lambda/certificate_lifecycle"),
+            layers=[layer],
             timeout=Duration.seconds(300),
             memory_size=256,
             environment={
-                "DEVICE_METADATA_TABLE": metadata_table.table_name,
-            }
+                **environment,
+                "IOT_UPDATE_CERTIFICATE_TPS": str(sweep_update_tps),
+                # Rondas de 8 x PAGE_SIZE dispositivos, ~50 s a su TPS
+                "LIFECYCLE_PAGE_SIZE": str(sweep_update_tps * 50 // 8),
+            },
+            # Una sola ejecucion a la vez: la programada y sus continuaciones
+            # comparten el registro de progreso en LifecycleState
+            reserved_concurrent_executions=1,
         )
 
         # Permisos completos necesarios
         metadata_table.grant_read_write_data(lifecycle_fn)
+        state_table.grant_read_write_data(lifecycle_fn)
 
-        lifecycle_fn.add_to_role_policy(
-            iam.PolicyStatement(
-                actions=[
-                    "iot:UpdateCertificate",
-                    "iot:DescribeCertificate",
-                ],
-                resources=[f"arn:aws:iot:{self.region}:{self.account}:cert/*"]
-            )
+        # Continuaciones: la funcion se invoca a si misma antes del timeout.
+        # Permiso en la funcion (no en el rol) para no crear una dependencia
+        # circular rol -> funcion
+        lifecycle_fn.add_permission(
+            "SelfContinuation",
+            principal=iam.ArnPrincipal(lifecycle_fn.role.role_arn),
+            action="lambda:InvokeFunction",
+        )
+
+        certificate_policy = iam.PolicyStatement(
+            actions=[
+                "iot:UpdateCertificate",
+                "iot:DescribeCertificate",
+            ],
+            resources=[f"arn:aws:iot:{self.region}:{self.account}:cert/*"]
         )
+        lifecycle_fn.add_to_role_policy(certificate_policy)
 
-        # EventBridge rule cada 30 minutos
+        # Con el scheduler el barrido por buckets solo reconcilia lo que el
+        # stream no agendo o no pudo expirar; sin el es el unico mecanismo
         events.Rule(
             self,
             "CertificateLifecycleSchedule",
-            schedule=events.Schedule.rate(Duration.minutes(30)),
+            schedule=events.Schedule.rate(Duration.hours(1) if expiry_scheduler else Duration.minutes(30)),
             targets=[targets.LambdaFunction(lifecycle_fn)]
-        )
\ No newline at end of file
+        )
+
+        # Reconciliacion de certificateStatus contra IoT: recorre la tabla
+        # por tramos (cursor en LifecycleState) y solo describe los items sin
+        # estado o con estado de mas de RECONCILE_STALE_DAYS: cada
+        # certificado cuesta un DescribeCertificate por semana, no por pasada
+        reconcile_fn = lambda_.Function(
+            self,
+            "CertificateReconcileLambda",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="reconcile.main",
+            code=lambda_.Code.from_asset("lambda/certificate_lifecycle"),
+            layers=[layer],
+            timeout=Duration.seconds(300),
+            memory_size=256,
+            # Una pasada a la vez sobre el mismo cursor
+            reserved_concurrent_executions=1,
+            environment={
+                **environment,
+                "IOT_DESCRIBE_CERTIFICATE_TPS": "5",
+                "IOT_UPDATE_CERTIFICATE_TPS": "1",
+                "RECONCILE_PAGE_SIZE": "100",
+                "RECONCILE_STALE_DAYS": "7",
+            },
+        )
+        metadata_table.grant_read_write_data(reconcile_fn)
+        state_table.grant_read_write_data(reconcile_fn)
+        reconcile_fn.add_to_role_policy(certificate_policy)
+
+        events.Rule(
+            self,
+            "CertificateReconcileSchedule",
+            schedule=events.Schedule.rate(Duration.hours(1)),
+            targets=[targets.LambdaFunction(reconcile_fn)]
+        )
+
+        self.lifecycle_state_table = state_table
+
+        if not expiry_scheduler:
+            return
+
+        # ---------- Scheduler de expiracion (stream de DeviceMetadata) ----------
+
+        # Agenda: slots de un minuto (dueMinute) -> things que vencen en el
+        schedule_table = dynamodb.Table(
+            self,
+            "ExpirySchedule",
+            partition_key=dynamodb.Attribute(name="dueMinute", type=dynamodb.AttributeType.NUMBER),
+            sort_key=dynamodb.Attribute(name="thingName", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="ttl",
+            removal_policy=RemovalPolicy.RETAIN,
+        )
+        scheduler_environment = {**environment, "EXPIRY_SCHEDULE_TABLE": schedule_table.table_name}
+
+        stream_fn = lambda_.Function(
+            self,
+            "ExpiryStreamLambda",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="scheduler.stream",
+            code=lambda_.Code.from_asset("lambda/certificate_lifecycle"),
+            layers=[layer],
+            timeout=Duration.seconds(60),
+            environment=scheduler_environment,
+        )
+        schedule_table.grant_read_write_data(stream_fn)
+        stream_fn.add_event_source(
+            event_sources.DynamoEventSource(
+                metadata_table,
+                starting_position=lambda_.StartingPosition.LATEST,
+                batch_size=100,
+                max_batching_window=Duration.seconds(1),
+                report_batch_item_failures=True,
+                retry_attempts=10,
+            )
+        )
+
+        # Un tick por minuto; corre hasta el ultimo vencimiento de su minuto
+        tick_fn = lambda_.Function(
+            self,
+            "ExpiryTickLambda",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="scheduler.tick",
+            code=lambda_.Code.from_asset("lambda/certificate_lifecycle"),
+            layers=[layer],
+            timeout=Duration.seconds(120),
+            memory_size=256,
+            # Un solo tick a la vez: el siguiente retoma desde el checkpoint
+            reserved_concurrent_executions=1,
+            environment={**scheduler_environment, "IOT_UPDATE_CERTIFICATE_TPS": "3"},
+        )
+        metadata_table.grant_read_write_data(tick_fn)
+        state_table.grant_read_write_data(tick_fn)
+        schedule_table.grant_read_data(tick_fn)
+        tick_fn.add_to_role_policy(certificate_policy)
+
+        events.Rule(
+            self,
+            "ExpiryTickSchedule",
+            schedule=events.Schedule.rate(Duration.minutes(1)),
+            targets=[targets.LambdaFunction(tick_fn, retry_attempts=0)]
+        )
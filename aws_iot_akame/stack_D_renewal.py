@@ -8,11 +8,14 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+from aws_iot_akame.stack_B_authorizer import GATEWAY_TOKEN_KEYS_PARAM, grant_gateway_token_keys
+
 DEFAULT_RENEWAL_DAYS = "30"
 
 
 class RenewalStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, metadata_table, **kwargs):
+    def __init__(self, scope: Construct, construct_id: str, metadata_table, token_denylist_table=None, **kwargs):
         super().__init__(scope, construct_id, **kwargs)
 
         renewal_days_param = CfnParameter(
@@ -29,6 +32,7 @@ class RenewalStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.lambda_handler",
             code=lambda_.Code.from_asset("lambda/renewal_lambda"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(15),
             memory_size=256,
             environment={
@@ -40,6 +44,13 @@ class RenewalStack(Stack):
         # DynamoDB permissions
         metadata_table.grant_read_write_data(renewal_fn)
 
+        # Modo token del authorizer: tokens nuevos y deny list de revocados
+        if token_denylist_table is not None:
+            renewal_fn.add_environment("GATEWAY_TOKEN_KEYS_PARAM", GATEWAY_TOKEN_KEYS_PARAM)
+            renewal_fn.add_environment("TOKEN_DENYLIST_TABLE", token_denylist_table.table_name)
+            token_denylist_table.grant_read_write_data(renewal_fn)
+            grant_gateway_token_keys(renewal_fn, self)
+
         # API Gateway
         api = apigw.RestApi(
             self,
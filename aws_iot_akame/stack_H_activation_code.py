@@ -6,8 +6,20 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+from aws_iot_akame.stack_B_authorizer import GATEWAY_TOKEN_KEYS_PARAM, grant_gateway_token_keys
+
 class ActivationCodeStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, metadata_table, activation_code_table, **kwargs):
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        metadata_table,
+        activation_code_table,
+        gateway_token: bool = False,
+        bucket_shards: int = 1,
+        **kwargs,
+    ):
         super().__init__(scope, construct_id, **kwargs)
 
         consume_lambda = lambda_.Function(
@@ -16,11 +28,13 @@ class ActivationCodeStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.main",
             code=lambda_.Code.from_asset("lambda/activation_code"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(10),
             memory_size=128,
             environment={
                 "ACTIVATION_CODE_TABLE": activation_code_table.table_name,
                 "DEVICE_METADATA_TABLE": metadata_table.table_name,
+                "LIFECYCLE_BUCKET_SHARDS": str(bucket_shards),
             },
         )
 
@@ -29,7 +43,7 @@ class ActivationCodeStack(Stack):
 
         consume_lambda.add_to_role_policy(
             iam.PolicyStatement(
-                actions=["iot:UpdateThing", "iot:DescribeThing", "iot:DescribeCertificate", "iot:UpdateCertificate"],
+                actions=["iot:UpdateThing", "iot:DescribeThing", "iot:UpdateCertificate"],
                 resources=[
                     f"arn:aws:iot:{self.region}:{self.account}:thing/*",
                     f"arn:aws:iot:{self.region}:{self.account}:cert/*"
@@ -37,4 +51,9 @@ class ActivationCodeStack(Stack):
             )
         )
 
+        # Modo token del authorizer: la activacion devuelve el token del gateway
+        if gateway_token:
+            consume_lambda.add_environment("GATEWAY_TOKEN_KEYS_PARAM", GATEWAY_TOKEN_KEYS_PARAM)
+            grant_gateway_token_keys(consume_lambda, self)
+
         self.consume_lambda = consume_lambda
\ No newline at end of file
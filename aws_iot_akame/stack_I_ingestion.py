@@ -8,15 +8,78 @@ from aws_cdk import (
     aws_iam as iam,
     aws_iot as iot,
     aws_lambda as _lambda,
+    aws_dynamodb as dynamodb,
+    aws_glue as glue,
     aws_kinesisfirehose as firehose,
+    custom_resources as cr,
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+from aws_iot_akame.telemetry_schema import flat_columns, raw_columns, reading_schema_json
+from aws_iot_akame.stack_L_telemetry_analytics import (
+    FLAT_ROOT,
+    OUTPUT_FORMAT_ROOTS,
+    ROLLUPS_ROOT,
+    ROLLUPS_SINCE_MARKER,
+    ROLLUP_GRANULARITIES,
+    TELEMETRY_FLAT_TABLE,
+    TELEMETRY_RAW_TABLE,
+)
+
+# Catalogo propio para la conversion a Parquet: solo el schema que lee
+# Firehose, sin datos ni particiones. Las tablas de consulta viven en
+# TelemetryAnalyticsStack, que depende del bucket de este stack; leer el
+# schema de alli obligaria a desplegar L antes que I.
+INGEST_SCHEMA_DATABASE = "telemetry_ingest_schema"
+
 
 class TelemetryIngestionStack(Stack):
-    def __init__(self, scope: Construct, construct_id: str, **kwargs):
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        *,
+        output_format: str = "json",
+        flatten: bool = False,
+        validate_payloads: bool = True,
+        dedup: bool = True,
+        rollups: bool = False,
+        metadata_table: dynamodb.ITable = None,
+        **kwargs,
+    ):
         super().__init__(scope, construct_id, **kwargs)
 
+        if output_format not in OUTPUT_FORMAT_ROOTS:
+            raise ValueError(f"Unsupported telemetry output format: {output_format}")
+
+        format_root = OUTPUT_FORMAT_ROOTS[output_format]
+
+        # Validacion/coercion en el transform, compilada del schema de lecturas
+        transform_env = {
+            "VALIDATE_PAYLOADS": "true" if validate_payloads else "false",
+            "READING_SCHEMA": reading_schema_json(),
+        }
+
+        # Supresion de duplicados por contenedor (filtro de fingerprints por ventana)
+        if dedup:
+            transform_env.update({
+                "DEDUP_ENABLED": "true",
+                "DEDUP_WINDOW_SECONDS": "900",
+                "DEDUP_CAPACITY": "500000",
+                "DEDUP_MAX_BYTES": str(8 * 1024 * 1024),
+            })
+
+        # Filtro de entitlements (expiresAt/status) contra DeviceMetadata
+        if metadata_table is not None:
+            transform_env.update({
+                "ENFORCE_ENTITLEMENTS": "true",
+                "DEVICE_METADATA_TABLE": metadata_table.table_name,
+                "ENTITLEMENT_CACHE_TTL_SECONDS": "60",
+            })
+
+        layer = common_layer(self)
+
         telemetry_bucket = s3.Bucket(
             self,
             "TelemetryRawBucket",
@@ -33,8 +96,38 @@ class TelemetryIngestionStack(Stack):
             timeout=Duration.seconds(30),
             memory_size=256,
             code=_lambda.Code.from_asset("lambda/ingestion"),
+            layers=[layer],
+            environment={
+                "TRANSFORM_MODE": "batch",
+                **transform_env,
+            },
         )
 
+        # Rollups minuto/hora: solo el stream RAW (el flat ve los mismos mensajes)
+        if rollups:
+            ingestion_lambda.add_environment("ROLLUPS_ENABLED", "true")
+            ingestion_lambda.add_environment("ROLLUP_BUCKET", telemetry_bucket.bucket_name)
+            ingestion_lambda.add_environment("ROLLUP_PREFIX", ROLLUPS_ROOT)
+            ingestion_lambda.add_environment("ROLLUP_GRANULARITIES", ",".join(ROLLUP_GRANULARITIES))
+            ingestion_lambda.add_environment("ROLLUP_MARKER_KEY", ROLLUPS_SINCE_MARKER)
+            telemetry_bucket.grant_put(ingestion_lambda, f"{ROLLUPS_ROOT}*")
+
+            # La marca de inicio la escribe el transform con su primer lote.
+            # Al apagar los rollups este recurso se elimina y borra la marca:
+            # si se vuelven a activar, el corte es el de la nueva activacion.
+            cr.AwsCustomResource(
+                self,
+                "RollupsSinceMarker",
+                on_delete=cr.AwsSdkCall(
+                    service="S3",
+                    action="deleteObject",
+                    parameters={"Bucket": telemetry_bucket.bucket_name, "Key": ROLLUPS_SINCE_MARKER},
+                ),
+                policy=cr.AwsCustomResourcePolicy.from_sdk_calls(
+                    resources=[telemetry_bucket.arn_for_objects(ROLLUPS_SINCE_MARKER)]
+                ),
+            )
+
         firehose_role = iam.Role(
             self,
             "FirehoseRole",
@@ -74,6 +167,46 @@ class TelemetryIngestionStack(Stack):
             )
         )
 
+        iot_rule_role = iam.Role(
+            self,
+            "IoTRuleRole",
+            assumed_by=iam.ServicePrincipal("iot.amazonaws.com"),
+        )
+
+        # Conversion a Parquet: Firehose lee el schema de las tablas Glue
+        schema_tables = {}
+        if output_format == "parquet":
+            schema_database = glue.CfnDatabase(
+                self,
+                "IngestSchemaDatabase",
+                catalog_id=self.account,
+                database_input=glue.CfnDatabase.DatabaseInputProperty(
+                    name=INGEST_SCHEMA_DATABASE,
+                ),
+            )
+            schema_tables[TELEMETRY_RAW_TABLE] = self._schema_table(
+                "RawSchemaTable", schema_database, TELEMETRY_RAW_TABLE, raw_columns()
+            )
+            if flatten:
+                schema_tables[TELEMETRY_FLAT_TABLE] = self._schema_table(
+                    "FlatSchemaTable", schema_database, TELEMETRY_FLAT_TABLE, flat_columns()
+                )
+
+            firehose_role.add_to_policy(
+                iam.PolicyStatement(
+                    actions=[
+                        "glue:GetTable",
+                        "glue:GetTableVersion",
+                        "glue:GetTableVersions",
+                    ],
+                    resources=[
+                        f"arn:aws:glue:{self.region}:{self.account}:catalog",
+                        f"arn:aws:glue:{self.region}:{self.account}:database/{INGEST_SCHEMA_DATABASE}",
+                        f"arn:aws:glue:{self.region}:{self.account}:table/{INGEST_SCHEMA_DATABASE}/*",
+                    ],
+                )
+            )
+
         my_kms_key = kms.Key(
             self,
             "TelemetryFirehoseKMSKey",
@@ -81,68 +214,88 @@ class TelemetryIngestionStack(Stack):
             removal_policy=RemovalPolicy.RETAIN,
         )
 
+        if metadata_table is not None:
+            metadata_table.grant_read_data(ingestion_lambda)
+
         telemetry_bucket.grant_write(firehose_role)
         ingestion_lambda.grant_invoke(firehose_role)
         my_kms_key.grant_encrypt_decrypt(firehose_role)
 
-        delivery_stream = firehose.CfnDeliveryStream(
-            self,
+        delivery_stream = self._delivery_stream(
             "TelemetryFirehose",
-            delivery_stream_type="DirectPut",
-            extended_s3_destination_configuration=firehose.CfnDeliveryStream.ExtendedS3DestinationConfigurationProperty(
-                bucket_arn=telemetry_bucket.bucket_arn,
-                role_arn=firehose_role.role_arn,
-                compression_format="GZIP",
-                prefix="meshid=!{partitionKeyFromLambda:meshId}/year=!{timestamp:YYYY}/",
-                error_output_prefix="errors/!{firehose:error-output-type}/",
-                buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
-                    interval_in_seconds=300,
-                    size_in_m_bs=64,
-                ),
-                encryption_configuration=firehose.CfnDeliveryStream.EncryptionConfigurationProperty(
-                    kms_encryption_config=firehose.CfnDeliveryStream.KMSEncryptionConfigProperty(
-                        awskms_key_arn=my_kms_key.key_arn
-                    )
-                ),
-                processing_configuration=firehose.CfnDeliveryStream.ProcessingConfigurationProperty(
-                    enabled=True,
-                    processors=[
-                        firehose.CfnDeliveryStream.ProcessorProperty(
-                            type="Lambda",
-                            parameters=[
-                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
-                                    parameter_name="LambdaArn",
-                                    parameter_value=ingestion_lambda.function_arn,
-                                ),
-                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
-                                    parameter_name="NumberOfRetries",
-                                    parameter_value="3",
-                                ),
-                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
-                                    parameter_name="RoleArn",
-                                    parameter_value=firehose_role.role_arn,
-                                ),
-                            ],
-                        )
-                    ],
-                ),
-                dynamic_partitioning_configuration=firehose.CfnDeliveryStream.DynamicPartitioningConfigurationProperty(
-                    enabled=True
-                ),
-
-            ),
+            bucket=telemetry_bucket,
+            role=firehose_role,
+            kms_key=my_kms_key,
+            transform_fn=ingestion_lambda,
+            prefix_root=format_root,
+            error_prefix="errors/",
+            schema_table=schema_tables.get(TELEMETRY_RAW_TABLE),
         )
 
-        iot_rule_role = iam.Role(
-            self,
-            "IoTRuleRole",
-            assumed_by=iam.ServicePrincipal("iot.amazonaws.com"),
-        )
+        firehose_actions = [
+            iot.CfnTopicRule.ActionProperty(
+                firehose=iot.CfnTopicRule.FirehoseActionProperty(
+                    delivery_stream_name=delivery_stream.ref,
+                    role_arn=iot_rule_role.role_arn,
+                    separator="\n",
+                )
+            )
+        ]
+
+        # Stream opcional con una fila por lectura (nodeId) -> telemetry_flat
+        flat_stream = None
+        if flatten:
+            flatten_lambda = _lambda.Function(
+                self,
+                "TelemetryFlattenLambda",
+                runtime=_lambda.Runtime.PYTHON_3_12,
+                handler="handler.handler",
+                timeout=Duration.seconds(60),
+                memory_size=512,
+                code=_lambda.Code.from_asset("lambda/ingestion"),
+                layers=[layer],
+                environment={
+                    "TRANSFORM_OUTPUT": "flat",
+                    **transform_env,
+                },
+            )
+
+            firehose_role.add_to_policy(
+                iam.PolicyStatement(
+                    actions=["lambda:InvokeFunction", "lambda:GetFunctionConfiguration"],
+                    resources=[flatten_lambda.function_arn],
+                )
+            )
+            flatten_lambda.grant_invoke(firehose_role)
+            if metadata_table is not None:
+                metadata_table.grant_read_data(flatten_lambda)
+
+            flat_stream = self._delivery_stream(
+                "TelemetryFlatFirehose",
+                bucket=telemetry_bucket,
+                role=firehose_role,
+                kms_key=my_kms_key,
+                transform_fn=flatten_lambda,
+                prefix_root=format_root + FLAT_ROOT,
+                error_prefix="errors/" + FLAT_ROOT,
+                schema_table=schema_tables.get(TELEMETRY_FLAT_TABLE),
+            )
+
+            firehose_actions.append(
+                iot.CfnTopicRule.ActionProperty(
+                    firehose=iot.CfnTopicRule.FirehoseActionProperty(
+                        delivery_stream_name=flat_stream.ref,
+                        role_arn=iot_rule_role.role_arn,
+                        separator="\n",
+                    )
+                )
+            )
 
         iot_rule_role.add_to_policy(
             iam.PolicyStatement(
                 actions=["firehose:PutRecord", "firehose:PutRecordBatch"],
-                resources=[delivery_stream.attr_arn],
+                resources=[delivery_stream.attr_arn]
+                + ([flat_stream.attr_arn] if flat_stream else []),
             )
         )
 
@@ -159,15 +312,7 @@ class TelemetryIngestionStack(Stack):
                     timestamp() AS ingestedAt
                 FROM 'gateway/data/telemetry/+'
                 """,
-                actions=[
-                    iot.CfnTopicRule.ActionProperty(
-                        firehose=iot.CfnTopicRule.FirehoseActionProperty(
-                            delivery_stream_name=delivery_stream.ref,
-                            role_arn=iot_rule_role.role_arn,
-                            separator="\n",
-                        )
-                    )
-                ],
+                actions=firehose_actions,
                 rule_disabled=False,
             ),
         )
@@ -195,3 +340,142 @@ class TelemetryIngestionStack(Stack):
 
         self.telemetry_bucket = telemetry_bucket
         self.firehose_stream = delivery_stream
+        self.flat_firehose_stream = flat_stream
+
+    def _schema_table(
+        self,
+        construct_id: str,
+        database: glue.CfnDatabase,
+        name: str,
+        columns: list,
+    ) -> glue.CfnTable:
+        """Tabla Glue solo con columnas: el schema de entrada de la conversion."""
+        return glue.CfnTable(
+            self,
+            construct_id,
+            catalog_id=self.account,
+            database_name=database.ref,
+            table_input=glue.CfnTable.TableInputProperty(
+                name=name,
+                table_type="EXTERNAL_TABLE",
+                storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                    columns=[
+                        glue.CfnTable.ColumnProperty(name=column, type=type_)
+                        for column, type_ in columns
+                    ],
+                ),
+            ),
+        )
+
+    def _delivery_stream(
+        self,
+        construct_id: str,
+        *,
+        bucket: s3.IBucket,
+        role: iam.IRole,
+        kms_key: kms.IKey,
+        transform_fn: _lambda.IFunction,
+        prefix_root: str,
+        error_prefix: str,
+        schema_table: glue.CfnTable = None,
+    ) -> firehose.CfnDeliveryStream:
+        # Con schema_table la salida es Parquet; sin ella, JSON gzip
+        if schema_table is not None:
+            data_format_conversion = firehose.CfnDeliveryStream.DataFormatConversionConfigurationProperty(
+                enabled=True,
+                input_format_configuration=firehose.CfnDeliveryStream.InputFormatConfigurationProperty(
+                    deserializer=firehose.CfnDeliveryStream.DeserializerProperty(
+                        open_x_json_ser_de=firehose.CfnDeliveryStream.OpenXJsonSerDeProperty(
+                            case_insensitive=True,
+                        )
+                    )
+                ),
+                output_format_configuration=firehose.CfnDeliveryStream.OutputFormatConfigurationProperty(
+                    serializer=firehose.CfnDeliveryStream.SerializerProperty(
+                        parquet_ser_de=firehose.CfnDeliveryStream.ParquetSerDeProperty(
+                            compression="SNAPPY",
+                        )
+                    )
+                ),
+                schema_configuration=firehose.CfnDeliveryStream.SchemaConfigurationProperty(
+                    catalog_id=self.account,
+                    database_name=INGEST_SCHEMA_DATABASE,
+                    # Ref de la tabla: el stream se crea despues del schema
+                    table_name=schema_table.ref,
+                    region=self.region,
+                    role_arn=role.role_arn,
+                    version_id="LATEST",
+                ),
+            )
+            # Parquet ya comprime por columna
+            compression_format = "UNCOMPRESSED"
+        else:
+            data_format_conversion = None
+            compression_format = "GZIP"
+
+        return firehose.CfnDeliveryStream(
+            self,
+            construct_id,
+            delivery_stream_type="DirectPut",
+            extended_s3_destination_configuration=firehose.CfnDeliveryStream.ExtendedS3DestinationConfigurationProperty(
+                bucket_arn=bucket.bucket_arn,
+                role_arn=role.role_arn,
+                compression_format=compression_format,
+                data_format_conversion_configuration=data_format_conversion,
+                # Particion por hora del evento (event_ts), no de llegada: el
+                # filtro de particiones de las consultas es por event_ts y los
+                # datos atrasados del gateway caen en su hora. Las keys las
+                # calcula el transform.
+                prefix=(
+                    prefix_root
+                    + "meshid=!{partitionKeyFromLambda:meshId}/"
+                    "year=!{partitionKeyFromLambda:year}/month=!{partitionKeyFromLambda:month}/"
+                    "day=!{partitionKeyFromLambda:day}/hour=!{partitionKeyFromLambda:hour}/"
+                ),
+                error_output_prefix=error_prefix + "!{firehose:error-output-type}/",
+                buffering_hints=firehose.CfnDeliveryStream.BufferingHintsProperty(
+                    interval_in_seconds=300,
+                    size_in_m_bs=64,
+                ),
+                encryption_configuration=firehose.CfnDeliveryStream.EncryptionConfigurationProperty(
+                    kms_encryption_config=firehose.CfnDeliveryStream.KMSEncryptionConfigProperty(
+                        awskms_key_arn=kms_key.key_arn
+                    )
+                ),
+                processing_configuration=firehose.CfnDeliveryStream.ProcessingConfigurationProperty(
+                    enabled=True,
+                    processors=[
+                        firehose.CfnDeliveryStream.ProcessorProperty(
+                            type="Lambda",
+                            parameters=[
+                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                    parameter_name="LambdaArn",
+                                    parameter_value=transform_fn.function_arn,
+                                ),
+                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                    parameter_name="NumberOfRetries",
+                                    parameter_value="3",
+                                ),
+                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                    parameter_name="RoleArn",
+                                    parameter_value=role.role_arn,
+                                ),
+                                # Lotes grandes por invocacion (miles de mensajes MQTT):
+                                # un BatchGetItem por 100 gateways distintos del lote
+                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                    parameter_name="BufferSizeInMBs",
+                                    parameter_value="3",
+                                ),
+                                firehose.CfnDeliveryStream.ProcessorParameterProperty(
+                                    parameter_name="BufferIntervalInSeconds",
+                                    parameter_value="60",
+                                ),
+                            ],
+                        )
+                    ],
+                ),
+                dynamic_partitioning_configuration=firehose.CfnDeliveryStream.DynamicPartitioningConfigurationProperty(
+                    enabled=True
+                ),
+            ),
+        )
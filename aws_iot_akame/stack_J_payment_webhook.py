@@ -10,6 +10,8 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+
 
 class StripeWebhookStack(Stack):
     def __init__(self, scope: Construct, id: str, renewal_lambda, **kwargs):
@@ -34,6 +36,7 @@ class StripeWebhookStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.main",
             code=lambda_.Code.from_asset("lambda/stripe_webhook"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(10),
             memory_size=256,
             environment={
@@ -6,6 +6,37 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.telemetry_schema import flat_columns, raw_columns
+
+TELEMETRY_DATABASE = "telemetry"
+TELEMETRY_RAW_TABLE = "telemetry_raw"
+TELEMETRY_FLAT_TABLE = "telemetry_flat"
+TELEMETRY_ROLLUPS_TABLE = "telemetry_rollups"
+TELEMETRY_SUPERSEDED_TABLE = "telemetry_superseded"
+
+# Prefijo (bajo la raiz del formato) de las filas pre-aplanadas
+FLAT_ROOT = "flat/"
+
+# Agregados parciales minuto/hora que escribe el transform de ingesta.
+# Siempre JSON gzip, independiente del formato de la telemetria RAW.
+ROLLUPS_ROOT = "rollups/"
+ROLLUP_GRANULARITIES = ("minute", "hour")
+# Marca con el instante del primer lote con rollups (fuera de las
+# particiones); telemetry_aggregates los usa desde la hora siguiente
+ROLLUPS_SINCE_MARKER = f"{ROLLUPS_ROOT}_since.json"
+
+# Rutas ("$path") de objetos que la compactacion ya reemplazo y todavia no
+# borro. Las vistas y los agregados las excluyen; una query directa sobre
+# las tablas puede verlas duplicadas durante la gracia de la compactacion.
+SUPERSEDED_ROOT = "compaction/superseded/"
+
+# Formatos de salida del pipeline de ingesta -> raiz del prefijo en el bucket RAW
+OUTPUT_FORMAT_ROOTS = {
+    "json": "",
+    "parquet": "parquet/",
+}
+
+
 class TelemetryAnalyticsStack(Stack):
     def __init__(
         self,
@@ -13,10 +44,18 @@ class TelemetryAnalyticsStack(Stack):
         construct_id: str,
         *,
         telemetry_bucket_name: str,
+        output_format: str = "json",
+        flatten: bool = False,
+        rollups: bool = False,
         **kwargs,
     ):
         super().__init__(scope, construct_id, **kwargs)
 
+        if output_format not in OUTPUT_FORMAT_ROOTS:
+            raise ValueError(f"Unsupported telemetry output format: {output_format}")
+
+        format_root = OUTPUT_FORMAT_ROOTS[output_format]
+
         athena_output_bucket = s3.Bucket(
             self,
             "AthenaOutputBucket",
@@ -33,23 +72,149 @@ class TelemetryAnalyticsStack(Stack):
             "TelemetryDatabase",
             catalog_id=self.account,
             database_input=glue.CfnDatabase.DatabaseInputProperty(
-                name="telemetry"
+                name=TELEMETRY_DATABASE
             ),
         )
 
         # 2. RAW table (schema flexible)
+        if output_format == "parquet":
+            # Columnar: Athena solo lee las columnas que usa cada query
+            format_parameters = {
+                "classification": "parquet",
+                "parquet.compression": "SNAPPY",
+            }
+            input_format = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetInputFormat"
+            output_format_class = "org.apache.hadoop.hive.ql.io.parquet.MapredParquetOutputFormat"
+            serialization_library = "org.apache.hadoop.hive.ql.io.parquet.serde.ParquetHiveSerDe"
+        else:
+            format_parameters = {
+                "classification": "json",
+                "compressionType": "gzip",
+                "json.open.content": "true",
+            }
+            input_format = "org.apache.hadoop.mapred.TextInputFormat"
+            output_format_class = "org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat"
+            serialization_library = "org.openx.data.jsonserde.JsonSerDe"
+
+        self._hourly_table(
+            "TelemetryRawTable",
+            database=database,
+            name=TELEMETRY_RAW_TABLE,
+            location=f"s3://{telemetry_bucket_name}/{format_root}",
+            format_parameters=format_parameters,
+            input_format=input_format,
+            output_format=output_format_class,
+            serialization_library=serialization_library,
+            columns=[
+                glue.CfnTable.ColumnProperty(name=name, type=type_)
+                for name, type_ in raw_columns()
+            ],
+        )
+
+        # 3. FLAT table: una fila por lectura, columnas tipadas (sin UNNEST)
+        if flatten:
+            self._hourly_table(
+                "TelemetryFlatTable",
+                database=database,
+                name=TELEMETRY_FLAT_TABLE,
+                location=f"s3://{telemetry_bucket_name}/{format_root}{FLAT_ROOT}",
+                format_parameters=format_parameters,
+                input_format=input_format,
+                output_format=output_format_class,
+                serialization_library=serialization_library,
+                columns=[
+                    glue.CfnTable.ColumnProperty(name=name, type=type_)
+                    for name, type_ in flat_columns()
+                ],
+            )
+
+        # 4. ROLLUPS: una fila por (meshid, nodeid, bucket_ts) con
+        #    metrics[metrica] = [count, sum, min, max]
+        if rollups:
+            self._hourly_table(
+                "TelemetryRollupsTable",
+                database=database,
+                name=TELEMETRY_ROLLUPS_TABLE,
+                location=f"s3://{telemetry_bucket_name}/{ROLLUPS_ROOT}",
+                format_parameters={
+                    "classification": "json",
+                    "compressionType": "gzip",
+                },
+                input_format="org.apache.hadoop.mapred.TextInputFormat",
+                output_format="org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+                serialization_library="org.openx.data.jsonserde.JsonSerDe",
+                columns=[
+                    glue.CfnTable.ColumnProperty(name="meshid", type="string"),
+                    glue.CfnTable.ColumnProperty(name="nodeid", type="int"),
+                    glue.CfnTable.ColumnProperty(name="bucket_ts", type="bigint"),
+                    glue.CfnTable.ColumnProperty(name="metrics", type="map<string,array<double>>"),
+                ],
+                # Los rollups de todas las mallas de una hora van juntos
+                leading_key="granularity",
+                leading_projection={
+                    "projection.granularity.type": "enum",
+                    "projection.granularity.values": ",".join(ROLLUP_GRANULARITIES),
+                },
+            )
+
+        # 5. SUPERSEDED: una fila por objeto reemplazado por la compactacion
         glue.CfnTable(
             self,
-            "TelemetryRawTable",
+            "TelemetrySupersededTable",
+            catalog_id=self.account,
+            database_name=database.ref,
+            table_input=glue.CfnTable.TableInputProperty(
+                name=TELEMETRY_SUPERSEDED_TABLE,
+                table_type="EXTERNAL_TABLE",
+                parameters={"classification": "json"},
+                storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
+                    location=f"s3://{telemetry_bucket_name}/{SUPERSEDED_ROOT}",
+                    input_format="org.apache.hadoop.mapred.TextInputFormat",
+                    output_format="org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+                    serde_info=glue.CfnTable.SerdeInfoProperty(
+                        serialization_library="org.openx.data.jsonserde.JsonSerDe",
+                    ),
+                    columns=[glue.CfnTable.ColumnProperty(name="path", type="string")],
+                ),
+            ),
+        )
+
+        # EXPORTS PARA OTROS STACKS
+        self.athena_database = database.ref
+        self.athena_output_bucket = athena_output_bucket.bucket_name
+        self.telemetry_bucket_name = telemetry_bucket_name
+        self.athena_output_bucket = athena_output_bucket
+        self.flatten = flatten
+        self.rollups = rollups
+
+    def _hourly_table(
+        self,
+        construct_id: str,
+        *,
+        database: glue.CfnDatabase,
+        name: str,
+        location: str,
+        format_parameters: dict,
+        input_format: str,
+        output_format: str,
+        serialization_library: str,
+        columns: list,
+        leading_key: str = "meshid",
+        leading_projection: dict = None,
+    ) -> glue.CfnTable:
+        if leading_projection is None:
+            leading_projection = {f"projection.{leading_key}.type": "injected"}
+
+        return glue.CfnTable(
+            self,
+            construct_id,
             catalog_id=self.account,
             database_name=database.ref,
             table_input=glue.CfnTable.TableInputProperty(
-                name="telemetry_raw",
+                name=name,
                 table_type="EXTERNAL_TABLE",
                 parameters={
-                    "classification": "json",
-                    "compressionType": "gzip",
-                    "json.open.content": "true",
+                    **format_parameters,
 
                     # PARTITION PROJECTION
                     "projection.enabled": "true",
@@ -57,41 +222,45 @@ class TelemetryAnalyticsStack(Stack):
                     "projection.year.type": "integer",
                     "projection.year.range": "2023,2100",
 
-                    "projection.meshid.type": "injected",
+                    "projection.month.type": "integer",
+                    "projection.month.range": "1,12",
+                    "projection.month.digits": "2",
+
+                    "projection.day.type": "integer",
+                    "projection.day.range": "1,31",
+                    "projection.day.digits": "2",
+
+                    "projection.hour.type": "integer",
+                    "projection.hour.range": "0,23",
+                    "projection.hour.digits": "2",
+
+                    **leading_projection,
 
                     # cómo construir el path
                     "storage.location.template": (
-                        f"s3://{telemetry_bucket_name}/"
-                        "meshid=${meshid}/"
+                        location
+                        + f"{leading_key}=${{{leading_key}}}/"
                         "year=${year}/"
-                      
+                        "month=${month}/"
+                        "day=${day}/"
+                        "hour=${hour}/"
                     ),
                 },
                 partition_keys=[
-                    glue.CfnTable.ColumnProperty(name="meshid", type="string"),
+                    glue.CfnTable.ColumnProperty(name=leading_key, type="string"),
                     glue.CfnTable.ColumnProperty(name="year", type="string"),
-                 ],
+                    glue.CfnTable.ColumnProperty(name="month", type="string"),
+                    glue.CfnTable.ColumnProperty(name="day", type="string"),
+                    glue.CfnTable.ColumnProperty(name="hour", type="string"),
+                ],
                 storage_descriptor=glue.CfnTable.StorageDescriptorProperty(
-                    location=f"s3://{telemetry_bucket_name}/",
-                    input_format="org.apache.hadoop.mapred.TextInputFormat",
-                    output_format="org.apache.hadoop.hive.ql.io.HiveIgnoreKeyTextOutputFormat",
+                    location=location,
+                    input_format=input_format,
+                    output_format=output_format,
                     serde_info=glue.CfnTable.SerdeInfoProperty(
-                        serialization_library="org.openx.data.jsonserde.JsonSerDe",
+                        serialization_library=serialization_library,
                     ),
-                    columns=[
-                        glue.CfnTable.ColumnProperty(name="event_ts", type="bigint"),
-                        glue.CfnTable.ColumnProperty(name="ingestedAt", type="bigint"),
-                        glue.CfnTable.ColumnProperty(
-                            name="readings",
-                            type="array<struct<nodeId:int,humidity:double,raw:int,soil_moisture:double,soil_temperature:double,soil_ph:double,soil_ec:double,soil_nitrogen:double,soil_phosphorus:double,soil_potassium:double,soil_salinity:double,air_temperature:double,air_humidity:double,air_pressure:double,wind_speed:double,rainfall:double,solar_radiation:double,co2_level:double,leaf_wetness:double,pm1:double,pm2_5:double,pm10:double,voc:double,o3_level:double,no2_level:double,so2_level:double,battery_voltage:double,battery_level:double,battery_health:double,signal_strength:int,device_temperature:double,uptime:bigint>>",
-                        ),
-                    ],
+                    columns=columns,
                 ),
             ),
         )
-
-        # EXPORTS PARA OTROS STACKS
-        self.athena_database = database.ref
-        self.athena_output_bucket = athena_output_bucket.bucket_name
-        self.telemetry_bucket_name = telemetry_bucket_name
-        self.athena_output_bucket = athena_output_bucket
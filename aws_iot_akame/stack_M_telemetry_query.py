@@ -10,6 +10,8 @@ from aws_cdk import (
     aws_s3 as s3,
 )
 from constructs import Construct
+
+from aws_iot_akame.common_layer import common_layer
 from typing import Union
 
 
@@ -49,6 +51,7 @@ class TelemetryQueryStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_11,
             handler="handler.main",
             code=lambda_.Code.from_asset("lambda/telemetry_query"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(30),
             memory_size=1024,
             log_retention=logs.RetentionDays.ONE_WEEK,
@@ -8,6 +8,9 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+from aws_iot_akame.telemetry_schema import reading_schema_json
+
 
 class TelemetryAthenaViewsStack(Stack):
     def __init__(
@@ -17,6 +20,9 @@ class TelemetryAthenaViewsStack(Stack):
         *,
         athena_database: str,
         athena_output_bucket: str,
+        flat_table: str = "",
+        flatten_since: int = None,
+        superseded_table: str = "",
         **kwargs,
     ):
         super().__init__(scope, construct_id, **kwargs)
@@ -27,11 +33,19 @@ class TelemetryAthenaViewsStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.main",
             code=lambda_.Code.from_asset("lambda/athena_views"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(60),
             environment={
                 "ATHENA_DATABASE": athena_database,
                 "ATHENA_OUTPUT": f"s3://{athena_output_bucket}/",
                 "ATHENA_WORKGROUP": "telemetry-prod",
+                "FLAT_TABLE": flat_table,
+                # epoch desde el que hay filas planas (sin el todo sale de RAW)
+                "FLATTEN_SINCE": str(flatten_since or ""),
+                # objetos reemplazados por la compactacion (excluidos por "$path")
+                "SUPERSEDED_TABLE": superseded_table,
+                # Columnas de las lecturas (mismo schema que el struct Glue)
+                "READING_SCHEMA": reading_schema_json(),
             },
         )
 
@@ -87,6 +101,12 @@ class TelemetryAthenaViewsStack(Stack):
             self,
             "TelemetryAthenaViews",
             service_token=provider.service_token,
+            # Cambiar el origen de la vista re-ejecuta el CREATE OR REPLACE
+            properties={
+                "FlatTable": flat_table,
+                "FlattenSince": str(flatten_since or ""),
+                "SupersededTable": superseded_table,
+            },
         )
 
         self.view_lambda = view_lambda
@@ -6,6 +6,10 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+from aws_iot_akame.stack_L_telemetry_analytics import ROLLUPS_SINCE_MARKER
+from aws_iot_akame.telemetry_schema import reading_schema_json
+
 
 class TelemetryAggregatesApiStack(Stack):
     def __init__(
@@ -16,6 +20,9 @@ class TelemetryAggregatesApiStack(Stack):
         metadata_table_name: str,
         athena_database: str,
         athena_output_bucket: str,
+        rollups_table: str = "",
+        telemetry_bucket_name: str = "",
+        superseded_table: str = "",
         **kwargs,
     ):
         super().__init__(scope, construct_id, **kwargs)
@@ -27,6 +34,7 @@ class TelemetryAggregatesApiStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.main",
             code=lambda_.Code.from_asset("lambda/telemetry_aggregates"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(60),
             memory_size=512,
             environment={
@@ -34,6 +42,16 @@ class TelemetryAggregatesApiStack(Stack):
                 "ATHENA_DATABASE": athena_database,
                 "ATHENA_OUTPUT": f"s3://{athena_output_bucket}/",
                 "ATHENA_WORKGROUP": "telemetry-prod",
+                # Metricas consultables (mismo schema que el struct Glue)
+                "READING_SCHEMA": reading_schema_json(),
+                # horas cerradas desde los rollups de la ingesta (vacio = todo RAW)
+                "ROLLUPS_TABLE": rollups_table,
+                "ROLLUP_GRACE_SECONDS": "900",
+                # marca del primer lote con rollups (sin ella todo sale de RAW)
+                "ROLLUPS_MARKER_BUCKET": telemetry_bucket_name if rollups_table else "",
+                "ROLLUPS_MARKER_KEY": ROLLUPS_SINCE_MARKER if rollups_table else "",
+                # parciales ya consolidados por la compactacion (excluidos por "$path")
+                "SUPERSEDED_TABLE": superseded_table,
             },
         )
 
@@ -75,6 +93,21 @@ class TelemetryAggregatesApiStack(Stack):
                 ],
             )
         )
-        
+
+
+        # Marca de inicio de los rollups (ListBucket: sin marca, 404 y no 403)
+        if rollups_table:
+            aggregates_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["s3:GetObject"],
+                    resources=[f"arn:aws:s3:::{telemetry_bucket_name}/{ROLLUPS_SINCE_MARKER}"],
+                )
+            )
+            aggregates_lambda.add_to_role_policy(
+                iam.PolicyStatement(
+                    actions=["s3:ListBucket"],
+                    resources=[f"arn:aws:s3:::{telemetry_bucket_name}"],
+                )
+            )
 
         self.lambda_function = aggregates_lambda
@@ -0,0 +1,93 @@
+from aws_cdk import (
+    Stack,
+    Duration,
+    Fn,
+    aws_lambda as lambda_,
+    aws_events as events,
+    aws_events_targets as targets,
+    aws_iam as iam,
+    aws_kms as kms,
+    aws_s3 as s3,
+)
+from constructs import Construct
+
+from aws_iot_akame.common_layer import common_layer
+from aws_iot_akame.stack_L_telemetry_analytics import (
+    FLAT_ROOT,
+    ROLLUPS_ROOT,
+    ROLLUP_GRANULARITIES,
+    SUPERSEDED_ROOT,
+)
+
+
+class TelemetryCompactionStack(Stack):
+    def __init__(
+        self,
+        scope: Construct,
+        construct_id: str,
+        *,
+        telemetry_bucket: s3.IBucket,
+        output_format: str = "json",
+        flatten: bool = False,
+        rollups: bool = False,
+        **kwargs,
+    ):
+        super().__init__(scope, construct_id, **kwargs)
+
+        # Importar KMS Key de Firehose (los objetos RAW van cifrados con ella)
+        my_kms_key_arn = Fn.import_value("TelemetryKMSKeyArn")
+        telemetry_key = kms.Key.from_key_arn(self, "TelemetryKMSKey", my_kms_key_arn)
+
+        compaction_fn = lambda_.Function(
+            self,
+            "TelemetryCompactionLambda",
+            runtime=lambda_.Runtime.PYTHON_3_12,
+            handler="handler.main",
+            code=lambda_.Code.from_asset("lambda/telemetry_compaction"),
+            layers=[common_layer(self)],
+            timeout=Duration.seconds(900),
+            memory_size=1024,
+            # Un solo run a la vez: la programada y sus continuaciones comparten
+            # el estado, y los swaps de una particion no se solapan
+            reserved_concurrent_executions=1,
+            environment={
+                "TELEMETRY_BUCKET": telemetry_bucket.bucket_name,
+                "KMS_KEY_ARN": my_kms_key_arn,
+                "OUTPUT_FORMAT": output_format,
+                "SMALL_OBJECT_BYTES": str(8 * 1024 * 1024),
+                "TARGET_OBJECT_BYTES": str(256 * 1024 * 1024),
+                "MIN_AGE_SECONDS": str(2 * 3600),
+                # Cada hora se compacta al cerrarse y al salir de esta ventana
+                "LOOKBACK_HOURS": "24",
+                "PARTITION_ROOTS": ",".join([""] + ([FLAT_ROOT] if flatten else [])),
+                # Consolidacion de los parciales por lote de los rollups
+                "ROLLUPS_ROOT": ROLLUPS_ROOT if rollups else "",
+                "ROLLUP_GRANULARITIES": ",".join(ROLLUP_GRANULARITIES),
+                # Origenes reemplazados: ocultos por "$path" y borrados tras la gracia
+                "SUPERSEDED_ROOT": SUPERSEDED_ROOT,
+                "SUPERSEDED_GRACE_SECONDS": "3600",
+            },
+        )
+
+        telemetry_bucket.grant_read_write(compaction_fn)
+        telemetry_bucket.grant_delete(compaction_fn)
+        telemetry_key.grant_encrypt_decrypt(compaction_fn)
+
+        # Continuaciones: la funcion se invoca a si misma antes del timeout.
+        # Permiso en la funcion (no en el rol) para no crear una dependencia
+        # circular rol -> funcion
+        compaction_fn.add_permission(
+            "SelfContinuation",
+            principal=iam.ArnPrincipal(compaction_fn.role.role_arn),
+            action="lambda:InvokeFunction",
+        )
+
+        # EventBridge rule cada hora
+        events.Rule(
+            self,
+            "TelemetryCompactionSchedule",
+            schedule=events.Schedule.rate(Duration.hours(1)),
+            targets=[targets.LambdaFunction(compaction_fn)],
+        )
+
+        self.compaction_lambda = compaction_fn
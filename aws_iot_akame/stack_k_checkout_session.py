@@ -7,6 +7,8 @@ from aws_cdk import (
 )
 from constructs import Construct
 
+from aws_iot_akame.common_layer import common_layer
+
 class CheckoutSessionStack(Stack):
     def __init__(self, scope: Construct, id: str, **kwargs):
         super().__init__(scope, id, **kwargs)
@@ -18,6 +20,7 @@ class CheckoutSessionStack(Stack):
             runtime=lambda_.Runtime.PYTHON_3_12,
             handler="handler.lambda_handler",
             code=lambda_.Code.from_asset("lambda/create_checkout_session"),
+            layers=[common_layer(self)],
             timeout=Duration.seconds(10),
             memory_size=256,
             environment={
@@ -0,0 +1,58 @@
+import json
+
+# Schema de una lectura (un elemento de "readings") tal como la publica el
+# gateway. Fuente unica para las tablas Glue y las validaciones.
+READING_FIELDS = [
+    ("nodeId", "int"),
+    ("humidity", "double"),
+    ("raw", "int"),
+    ("soil_moisture", "double"),
+    ("soil_temperature", "double"),
+    ("soil_ph", "double"),
+    ("soil_ec", "double"),
+    ("soil_nitrogen", "double"),
+    ("soil_phosphorus", "double"),
+    ("soil_potassium", "double"),
+    ("soil_salinity", "double"),
+    ("air_temperature", "double"),
+    ("air_humidity", "double"),
+    ("air_pressure", "double"),
+    ("wind_speed", "double"),
+    ("rainfall", "double"),
+    ("solar_radiation", "double"),
+    ("co2_level", "double"),
+    ("leaf_wetness", "double"),
+    ("pm1", "double"),
+    ("pm2_5", "double"),
+    ("pm10", "double"),
+    ("voc", "double"),
+    ("o3_level", "double"),
+    ("no2_level", "double"),
+    ("so2_level", "double"),
+    ("battery_voltage", "double"),
+    ("battery_level", "double"),
+    ("battery_health", "double"),
+    ("signal_strength", "int"),
+    ("device_temperature", "double"),
+    ("uptime", "bigint"),
+]
+
+
+def readings_struct_type() -> str:
+    fields = ",".join(f"{name}:{type_}" for name, type_ in READING_FIELDS)
+    return f"array<struct<{fields}>>"
+
+
+def raw_columns() -> list:
+    """(nombre, tipo) de una fila RAW: un mensaje del gateway."""
+    return [("event_ts", "bigint"), ("ingestedAt", "bigint"), ("readings", readings_struct_type())]
+
+
+def flat_columns() -> list:
+    """(nombre, tipo) de una fila FLAT: una lectura con sus campos tipados."""
+    return [("event_ts", "bigint"), ("ingestedAt", "bigint")] + READING_FIELDS
+
+
+def reading_schema_json() -> str:
+    """{campo: tipo Glue} para la validacion del transform de ingesta."""
+    return json.dumps(dict(READING_FIELDS), separators=(",", ":"))
@@ -0,0 +1,278 @@
+"""
+Tormenta de reconexiones contra el authorizer MQTT (lambda/auth_lambda).
+
+    python -m benchmarks.bench_authorizer_storm [--gateways 50000] [--duration 60]
+        [--attempts 1] [--concurrency 100] [--latency-ms 8] [--deny-fraction 0.1]
+        [--modes metadata,token] [--max-p99-ms N] [--output results.json]
+
+Reproduce `--gateways` gateways reconectando en `--duration` segundos (0 = lo
+mas rapido posible). Cada hilo es un contenedor de Lambda: se carga en frio
+la primera vez que recibe una conexion, mantiene su cache entre invocaciones
+y atiende una conexion a la vez. DynamoDB es el stand-in en memoria de
+tests/support con `--latency-ms` por llamada.
+
+Reporta la latencia de decision (handler) y de conexion (incluye la espera por
+un contenedor libre), el coste de arranque en frio contra invocaciones en
+caliente, llamadas a DynamoDB por conexion y decisiones incorrectas segun el
+estado sembrado de cada gateway. Sale con codigo 1 si alguna decision es
+incorrecta o si el p99 supera `--max-p99-ms`: sirve de gate de regresion.
+
+Con mucha concurrencia la latencia incluye la contencion del GIL: medir
+siempre con los mismos parametros al comparar commits.
+"""
+import argparse
+import base64
+import contextlib
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+
+from benchmarks import harness
+from tests.support import load_lambda
+from tests.support.fake_dynamodb import FakeDynamoDB
+
+from akame_common import gateway_token
+
+METADATA_TABLE = "DeviceMetadata"
+DENYLIST_TABLE = "GatewayTokenDenyList"
+KEYS_PARAM = "/akame/gateway-token/keys"
+KEYRING = '{"active": "k1", "keys": {"k1": "YmVuY2gtc2VjcmV0LWJlbmNoLXNlY3JldC0zMmI="}}'
+
+MODES = {
+    "metadata": {"DEVICE_METADATA_TABLE": METADATA_TABLE},
+    "token": {
+        "DEVICE_METADATA_TABLE": METADATA_TABLE,
+        "AUTH_MODE": "token",
+        "GATEWAY_TOKEN_KEYS_PARAM": KEYS_PARAM,
+        "TOKEN_DENYLIST_TABLE": DENYLIST_TABLE,
+    },
+}
+
+# Estados sembrados entre los gateways denegados
+DENY_KINDS = ("expired", "revoked", "unknown")
+
+
+def seed_fleet(gateways: int, deny_fraction: float, now: int, seed: int = 0):
+    """[(thingName, userId, kind)] con kind = "active" o uno de DENY_KINDS."""
+    rng = random.Random(seed)
+    fleet = []
+    for i in range(gateways):
+        kind = "active" if rng.random() >= deny_fraction else rng.choice(DENY_KINDS)
+        fleet.append((f"gw_{i:08d}", f"user-{i % 997}", kind))
+    return fleet
+
+
+def _populate(dynamodb: FakeDynamoDB, fleet, now: int):
+    for thing_name, user_id, kind in fleet:
+        if kind == "unknown":
+            continue
+        dynamodb.put(METADATA_TABLE, {
+            "thingName": thing_name,
+            "userId": user_id,
+            "status": "revoked" if kind == "revoked" else "active",
+            "expiresAt": now - 60 if kind == "expired" else now + 30 * 86400,
+        })
+        if kind == "revoked":
+            dynamodb.put(DENYLIST_TABLE, {"thingName": thing_name, "revokedAt": now - 60})
+
+
+def _events(mode: str, fleet, now: int):
+    """Evento de conexion de cada gateway (MQTT: clientId + password)."""
+    keyring = gateway_token.parse_keyring(KEYRING)
+    events = []
+    for thing_name, user_id, kind in fleet:
+        mqtt = {"clientId": thing_name, "username": thing_name}
+        if mode == "token" and kind != "unknown":
+            iat = now - 3600
+            exp = now - 60 if kind == "expired" else now + 30 * 86400
+            token = gateway_token.mint(keyring, thing_name, user_id, iat, exp)
+            mqtt["password"] = base64.b64encode(token.encode()).decode()
+        events.append({
+            "principalId": thing_name,
+            "protocolData": {"mqtt": mqtt},
+            "connectionMetadata": {"id": f"conn-{thing_name}"},
+        })
+    return events
+
+
+class _Container:
+    """Un contenedor de Lambda: modulo propio (cache propia), una conexion a la vez."""
+
+    _load_lock = threading.Lock()
+
+    def __init__(self, mode: str, dynamodb: FakeDynamoDB):
+        # load_lambda toca sys.modules y os.environ: una carga a la vez (la
+        # espera por el lock no cuenta como arranque)
+        with self._load_lock:
+            start = time.perf_counter()
+            self.module = load_lambda("auth_lambda", env=MODES[mode])
+            self.init_ms = (time.perf_counter() - start) * 1000
+        self.module.dynamodb = dynamodb
+        self.module.table = dynamodb.Table(METADATA_TABLE)
+        if mode == "token":
+            # En Lambda viene de SSM en la primera conexion; aqui se precarga
+            self.module._keyring.set(KEYS_PARAM, gateway_token.parse_keyring(KEYRING))
+        self.invocations = 0
+
+
+def run(
+    mode: str,
+    gateways: int,
+    attempts: int,
+    duration: float,
+    concurrency: int,
+    latency_ms: float,
+    deny_fraction: float,
+) -> dict:
+    now = int(time.time())
+    fleet = seed_fleet(gateways, deny_fraction, now)
+    dynamodb = FakeDynamoDB()
+    _populate(dynamodb, fleet, now)
+    dynamodb.calls.clear()
+    dynamodb.latency = latency_ms / 1000
+
+    events = _events(mode, fleet, now)
+    expected = [kind == "active" for _, _, kind in fleet]
+    # Cada gateway reintenta `attempts` veces; los reintentos llegan despues
+    schedule = [i for _ in range(attempts) for i in range(gateways)]
+    interval = duration / len(schedule) if duration else 0.0
+
+    next_slot = itertools.count()
+    lock = threading.Lock()
+    cold_init, cold_first, warm, connect, wrong = [], [], [], [], []
+
+    def worker():
+        container = None
+        while True:
+            with lock:
+                slot = next(next_slot)
+            if slot >= len(schedule):
+                return
+
+            scheduled = start + slot * interval
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+            if container is None:
+                container = _Container(mode, dynamodb)
+                cold_init.append(container.init_ms)
+
+            gateway = schedule[slot]
+            t0 = time.perf_counter()
+            result = container.module.lambda_handler(events[gateway], None)
+            t1 = time.perf_counter()
+
+            (warm if container.invocations else cold_first).append((t1 - t0) * 1000)
+            container.invocations += 1
+            connect.append((t1 - max(scheduled, start)) * 1000)
+            if result["isAuthenticated"] != expected[gateway]:
+                wrong.append(fleet[gateway][0])
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    # El handler solo imprime los resumenes periodicos (cache, denegaciones);
+    # su coste se mide, la salida no
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - start
+
+    decisions = cold_first + warm
+    calls = sum(dynamodb.calls.values())
+
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "connects": len(schedule),
+        "connects_per_sec": len(schedule) / elapsed,
+        "decision_p50_ms": harness.percentile(decisions, 50),
+        "decision_p99_ms": harness.percentile(decisions, 99),
+        "connect_p50_ms": harness.percentile(connect, 50),
+        "connect_p99_ms": harness.percentile(connect, 99),
+        "containers": len(cold_init),
+        "cold_init_ms": sum(cold_init) / max(len(cold_init), 1),
+        "cold_first_invoke_ms": sum(cold_first) / max(len(cold_first), 1),
+        "warm_p50_ms": harness.percentile(warm, 50),
+        "dynamodb_calls_per_connect": calls / len(schedule),
+        "dynamodb_calls": dict(dynamodb.calls),
+        "wrong_decisions": len(wrong),
+        "wrong_sample": wrong[:5],
+        "peak_rss_mb": harness.peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gateways", type=int, default=50000)
+    parser.add_argument("--duration", type=float, default=60, help="segundos para reconectar todos (0 = sin limite)")
+    parser.add_argument("--attempts", type=int, default=1, help="conexiones por gateway")
+    parser.add_argument("--concurrency", type=int, default=100, help="contenedores concurrentes")
+    parser.add_argument("--latency-ms", type=float, default=8, help="latencia por llamada a DynamoDB")
+    parser.add_argument("--deny-fraction", type=float, default=0.1)
+    parser.add_argument("--modes", default="metadata")
+    parser.add_argument("--max-p99-ms", type=float, help="falla si el p99 de decision lo supera")
+    parser.add_argument("--output", help="ruta del JSON de resultados")
+    args = parser.parse_args()
+
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    print(
+        f"gateways={args.gateways} attempts={args.attempts} duration={args.duration}s "
+        f"concurrency={args.concurrency} latency={args.latency_ms}ms deny={args.deny_fraction}"
+    )
+    print(
+        f"{'mode':<10}{'conn/s':>9}{'dec p50':>9}{'dec p99':>9}{'conn p99':>10}"
+        f"{'cold init':>11}{'cold 1st':>10}{'warm p50':>10}{'ddb/conn':>10}{'wrong':>7}"
+    )
+
+    results = []
+    failed = False
+    for mode in modes:
+        r = harness.run_isolated(
+            run, mode, args.gateways, args.attempts, args.duration,
+            args.concurrency, args.latency_ms, args.deny_fraction,
+        )
+        results.append(r)
+        print(
+            f"{r['mode']:<10}{r['connects_per_sec']:>9,.0f}{r['decision_p50_ms']:>9.3f}"
+            f"{r['decision_p99_ms']:>9.3f}{r['connect_p99_ms']:>10.3f}{r['cold_init_ms']:>11.1f}"
+            f"{r['cold_first_invoke_ms']:>10.3f}{r['warm_p50_ms']:>10.3f}"
+            f"{r['dynamodb_calls_per_connect']:>10.3f}{r['wrong_decisions']:>7}"
+        )
+        if r["wrong_decisions"]:
+            print(f"  wrong decisions, e.g. {', '.join(r['wrong_sample'])}")
+            failed = True
+        if args.max_p99_ms is not None and r["decision_p99_ms"] > args.max_p99_ms:
+            print(f"  decision p99 {r['decision_p99_ms']:.3f} ms > {args.max_p99_ms} ms")
+            failed = True
+
+    path = harness.save_results(
+        "authorizer_storm",
+        {
+            "gateways": args.gateways,
+            "attempts": args.attempts,
+            "duration": args.duration,
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "deny_fraction": args.deny_fraction,
+        },
+        results,
+        args.output,
+    )
+    print(f"results: {path}")
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
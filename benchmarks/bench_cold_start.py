@@ -0,0 +1,188 @@
+"""
+Coste de arranque en frio de cada handler de lambda/.
+
+    python -m benchmarks.bench_cold_start [--handlers auth_lambda,ingestion,...]
+        [--repeat 5] [--output results.json]
+
+Cada medicion corre en un proceso nuevo (como un contenedor nuevo) y reporta:
+    import_ms        importar el modulo del handler (fase INIT de Lambda)
+    boto3_at_import  si importar el handler ya importo boto3
+    first_ms         primera invocacion (incluye construir los clientes)
+    second_ms        segunda invocacion (contenedor caliente)
+    rss_mb           pico de RSS tras las dos invocaciones
+
+Los endpoints de AWS apuntan a un puerto local cerrado con un solo intento:
+las llamadas fallan en el acto, asi que las invocaciones miden el trabajo
+local del camino frio (imports diferidos, construccion de clientes,
+serializacion) sin la red. Cada valor es la mediana de --repeat procesos.
+"""
+import argparse
+import base64
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+
+from aws_iot_akame.telemetry_schema import reading_schema_json
+from benchmarks import harness
+
+# Sin red ni credenciales reales; un intento por llamada
+AWS_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-2",
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "AWS_ENDPOINT_URL": "http://127.0.0.1:9",
+    "AWS_MAX_ATTEMPTS": "1",
+    "AWS_RETRY_MODE": "standard",
+}
+
+_JWT = {"authorizer": {"jwt": {"claims": {"sub": "user-1"}}}}
+
+# name -> (entry point, env, evento)
+HANDLERS = {
+    "activation_code": ("main", {
+        "ACTIVATION_CODE_TABLE": "ActivationCodes",
+        "DEVICE_METADATA_TABLE": "DeviceMetadata",
+    }, {"body": json.dumps({"activationCode": "ACT-BENCH"}), "requestContext": _JWT}),
+    "athena_views": ("main", {
+        "ATHENA_DATABASE": "telemetry",
+        "ATHENA_OUTPUT": "s3://bench/athena/",
+        "ATHENA_WORKGROUP": "bench",
+        "READING_SCHEMA": reading_schema_json(),
+    }, {}),
+    "auth_lambda": ("lambda_handler", {
+        "DEVICE_METADATA_TABLE": "DeviceMetadata",
+    }, {"principalId": "gw_bench", "protocolData": {"mqtt": {"clientId": "gw_bench"}}}),
+    "certificate_lifecycle": ("main", {"DEVICE_METADATA_TABLE": "DeviceMetadata"}, {}),
+    "create_checkout_session": ("lambda_handler", {
+        "STRIPE_SECRET_PARAM": "/stripe/secret",
+    }, {"body": json.dumps({"userId": "user-1", "planId": "monthly"})}),
+    "device_factory": ("main", {
+        "METADATA_TABLE": "DeviceMetadata",
+        "ACTIVATION_CODE_TABLE": "ActivationCodes",
+    }, {}),
+    "ingestion": ("handler", {"TRANSFORM_MODE": "batch"}, {"records": [{
+        "recordId": "0",
+        "data": base64.b64encode(json.dumps({
+            "meshId": "gw_bench", "event_ts": 1760700000, "readings": [{"nodeId": 1, "humidity": 40.5}],
+        }).encode()).decode(),
+    }]}),
+    "renewal_lambda": ("lambda_handler", {
+        "DEVICE_METADATA_TABLE": "DeviceMetadata",
+    }, {"path": "/thing/renew", "body": json.dumps({"thingName": "gw_bench"})}),
+    "stripe_webhook": ("main", {
+        "STRIPE_WEBHOOK_SECRET_PARAM": "/stripe/webhook/secret",
+        "RENEWAL_LAMBDA_ARN": "arn:aws:lambda:us-east-2:000000000000:function:bench",
+        "IDEMPOTENCY_TABLE": "StripeWebhookIdempotency",
+    }, {"body": "{}", "headers": {"Stripe-Signature": "t=1,v1=bench"}}),
+    "telemetry_aggregates": ("handler", {
+        "ATHENA_DATABASE": "telemetry",
+        "ATHENA_WORKGROUP": "bench",
+        "READING_SCHEMA": reading_schema_json(),
+    }, {"body": json.dumps({
+        "things": ["gw_bench"], "metrics": ["humidity"], "interval": "day",
+        "from": 1760000000, "to": 1760700000,
+    })}),
+    "telemetry_compaction": ("main", {"TELEMETRY_BUCKET": "bench"}, {"lookbackHours": 1}),
+    "telemetry_query": ("main", {
+        "METADATA_TABLE": "DeviceMetadata",
+        "ATHENA_DATABASE": "telemetry",
+        "ATHENA_OUTPUT": "s3://bench/athena/",
+        "ATHENA_WORKGROUP": "bench",
+    }, {"requestContext": _JWT, "queryStringParameters": {"fromTs": "1760690000", "toTs": "1760700000"}}),
+}
+
+
+def _invoke(fn, event):
+    start = time.perf_counter()
+    try:
+        fn(event, None)
+    except Exception:
+        # Los handlers que no capturan el fallo de red lo propagan
+        pass
+    return (time.perf_counter() - start) * 1000
+
+
+def measure(name: str) -> dict:
+    os.environ.update(AWS_ENV)
+    # La carga de load_lambda/tests.support no cuenta como import del handler
+    from tests.support import load_lambda
+
+    entry, env, event = HANDLERS[name]
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        try:
+            module = load_lambda(name, env=env)
+        except ImportError as e:
+            # p.ej. el SDK de Stripe no instalado localmente
+            return {"handler": name, "error": str(e)}
+        import_ms = (time.perf_counter() - start) * 1000
+        boto3_at_import = "boto3" in sys.modules
+
+        # Los handlers leen el entorno al importar; los clientes al invocar
+        os.environ.update(env)
+        fn = getattr(module, entry)
+        first_ms = _invoke(fn, event)
+        second_ms = _invoke(fn, event)
+
+    return {
+        "handler": name,
+        "import_ms": import_ms,
+        "boto3_at_import": boto3_at_import,
+        "first_ms": first_ms,
+        "second_ms": second_ms,
+        "rss_mb": harness.peak_rss_mb(),
+    }
+
+
+def run(name: str, repeat: int) -> dict:
+    samples = [harness.run_isolated(measure, name) for _ in range(repeat)]
+    if "error" in samples[0]:
+        return {"mode": name, "repeat": repeat, "error": samples[0]["error"]}
+
+    result = {"mode": name, "repeat": repeat, "boto3_at_import": samples[0]["boto3_at_import"]}
+    for key in ("import_ms", "first_ms", "second_ms", "rss_mb"):
+        result[key] = statistics.median(s[key] for s in samples)
+    result["cold_total_ms"] = result["import_ms"] + result["first_ms"]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--handlers", default=",".join(HANDLERS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="ruta del JSON de resultados")
+    args = parser.parse_args()
+
+    names = [n for n in args.handlers.split(",") if n]
+    unknown = set(names) - set(HANDLERS)
+    if unknown:
+        parser.error(f"unknown handlers: {', '.join(sorted(unknown))}")
+
+    print(f"repeat={args.repeat} (medianas)")
+    print(
+        f"{'handler':<25}{'import ms':>10}{'boto3':>7}{'1st ms':>9}{'2nd ms':>9}"
+        f"{'cold ms':>9}{'RSS MiB':>9}"
+    )
+
+    results = []
+    for name in names:
+        r = run(name, args.repeat)
+        results.append(r)
+        if "error" in r:
+            print(f"{name:<25}error: {r['error']}")
+            continue
+        print(
+            f"{name:<25}{r['import_ms']:>10.1f}{'yes' if r['boto3_at_import'] else 'no':>7}"
+            f"{r['first_ms']:>9.1f}{r['second_ms']:>9.1f}{r['cold_total_ms']:>9.1f}{r['rss_mb']:>9.1f}"
+        )
+
+    path = harness.save_results("cold_start", {"repeat": args.repeat}, results, args.output)
+    print(f"results: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+"""
+Benchmark del transform de Firehose (lambda/ingestion).
+
+    python -m benchmarks.bench_ingestion_transform [--iterations N]
+        [--nodes N | --payload-bytes N] [--sparsity F] [--batch-sizes 1,100,500]
+        [--modes legacy,batch,...] [--output results.json]
+
+Cada (modo, lote) corre en un proceso nuevo, como un contenedor frio, y
+reporta records/sec, latencia por lote p50/p99 y pico de RSS. Los resultados
+se guardan en benchmarks/results/ para compararlos entre commits con
+benchmarks.compare.
+
+Modos:
+    legacy    json.loads completo de cada record (comportamiento original)
+    batch     escaneo de meshId sobre los bytes
+    bdedup    batch + supresion de reenvios exactos (sin parseo)
+    validate  batch + validacion/coercion contra el schema de lecturas
+    dedup     validate + supresion de duplicados
+    rollups   dedup + agregados minuto/hora (S3 en memoria)
+    flat      una fila por lectura (telemetry_flat) + validacion
+
+Los overheads se miden contra "legacy", el coste del parseo completo que
+validate/dedup/rollups/flat necesitan de todas formas.
+"""
+import argparse
+
+from aws_iot_akame.telemetry_schema import reading_schema_json
+from benchmarks import harness
+from benchmarks.payloads import BASE_TS, event_bytes, firehose_event, nodes_for_size
+from tests.support import load_lambda
+
+BATCH_SIZES = (1, 100, 500)
+
+_VALIDATE = {
+    "VALIDATE_PAYLOADS": "true",
+    "READING_SCHEMA": reading_schema_json(),
+}
+
+MODES = {
+    "legacy": {"TRANSFORM_MODE": "legacy"},
+    "batch": {"TRANSFORM_MODE": "batch"},
+    "bdedup": {"TRANSFORM_MODE": "batch", "DEDUP_ENABLED": "true"},
+    "validate": {"TRANSFORM_MODE": "batch", **_VALIDATE},
+    "dedup": {"TRANSFORM_MODE": "batch", **_VALIDATE, "DEDUP_ENABLED": "true"},
+    "rollups": {
+        "TRANSFORM_MODE": "batch",
+        **_VALIDATE,
+        "DEDUP_ENABLED": "true",
+        "ROLLUPS_ENABLED": "true",
+        "ROLLUP_BUCKET": "bench",
+    },
+    "flat": {"TRANSFORM_OUTPUT": "flat", **_VALIDATE},
+}
+
+# Con estado entre invocaciones: cada iteracion necesita lecturas nuevas
+FRESH_EVENT_MODES = {"bdedup", "dedup", "rollups"}
+
+
+def _inputs(mode: str, batch_size: int, nodes: int, sparsity: float, iterations: int):
+    if mode not in FRESH_EVENT_MODES:
+        event = firehose_event(batch_size, nodes, sparsity=sparsity)
+        for _ in range(iterations + 1):
+            yield event
+        return
+
+    for i in range(iterations + 1):
+        yield firehose_event(
+            batch_size, nodes,
+            sparsity=sparsity,
+            ts=BASE_TS + i * batch_size,
+            seed=i,
+            record_prefix=f"{i}-",
+        )
+
+
+def run(mode: str, batch_size: int, nodes: int, sparsity: float, iterations: int) -> dict:
+    module = load_lambda("ingestion", env=MODES[mode])
+
+    if mode == "rollups":
+        from tests.support.fake_s3 import FakeS3
+        module.rollups.s3 = FakeS3()
+
+    stats = harness.measure(
+        lambda event: module.handler(event, None),
+        _inputs(mode, batch_size, nodes, sparsity, iterations),
+    )
+    payload = event_bytes(firehose_event(batch_size, nodes, sparsity=sparsity))
+
+    return {
+        "mode": mode,
+        "batch_size": batch_size,
+        "records_per_sec": batch_size / (stats["mean_ms"] / 1000),
+        "batch_latency_ms": stats["mean_ms"],
+        "batch_latency_p50_ms": stats["p50_ms"],
+        "batch_latency_p99_ms": stats["p99_ms"],
+        "avg_payload_bytes": payload / batch_size,
+        "peak_rss_mb": harness.peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--nodes", type=int, default=20, help="readings por mensaje")
+    parser.add_argument("--payload-bytes", type=int, help="tamanio objetivo del payload (ignora --nodes)")
+    parser.add_argument("--sparsity", type=float, default=0.0, help="fraccion de metricas ausentes por lectura")
+    parser.add_argument("--batch-sizes", default=",".join(map(str, BATCH_SIZES)))
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--output", help="ruta del JSON de resultados")
+    args = parser.parse_args()
+
+    nodes = nodes_for_size(args.payload_bytes, args.sparsity) if args.payload_bytes else args.nodes
+    modes = [m for m in args.modes.split(",") if m]
+    unknown = set(modes) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+
+    print(f"nodes={nodes} sparsity={args.sparsity} iterations={args.iterations}")
+    print(
+        f"{'mode':<10}{'batch':>7}{'records/s':>14}{'p50 ms':>10}{'p99 ms':>10}"
+        f"{'payload B':>11}{'RSS MiB':>9}"
+    )
+
+    all_results = []
+    for batch_size in map(int, args.batch_sizes.split(",")):
+        results = {}
+        for mode in modes:
+            r = results[mode] = harness.run_isolated(
+                run, mode, batch_size, nodes, args.sparsity, args.iterations
+            )
+            all_results.append(r)
+            print(
+                f"{r['mode']:<10}{r['batch_size']:>7}{r['records_per_sec']:>14,.0f}"
+                f"{r['batch_latency_p50_ms']:>10.3f}{r['batch_latency_p99_ms']:>10.3f}"
+                f"{r['avg_payload_bytes']:>11,.0f}{r['peak_rss_mb']:>9.1f}"
+            )
+
+        if "legacy" in results:
+            base = results["legacy"]["batch_latency_ms"]
+            for mode in modes:
+                if mode not in ("legacy", "batch"):
+                    overhead = results[mode]["batch_latency_ms"] / base - 1
+                    print(f"{'':<10}{mode} overhead vs full parse: {overhead:+.1%}")
+
+    path = harness.save_results(
+        "ingestion_transform",
+        {
+            "nodes": nodes,
+            "sparsity": args.sparsity,
+            "iterations": args.iterations,
+            "batch_sizes": args.batch_sizes,
+        },
+        all_results,
+        args.output,
+    )
+    print(f"results: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""
+Simulacion de certificate_lifecycle sobre una flota completa: cuanto tarda
+el barrido, cuantas continuaciones necesita y cuanta memoria usa.
+
+    python -m benchmarks.bench_lifecycle_fleet [--devices 100000,1000000]
+        [--trial-fraction 0.7] [--spread-days 30] [--backlog-hours 1]
+        [--promotion-fraction 0.02] [--shards 8] [--workers 8]
+        [--latency-ms 8] [--iot-latency-ms 40] [--iot-tps 8] [--iot-quota 10]
+        [--timeout-s 300] [--time-scale 10] [--output results.json]
+
+Flota sembrada (por cada valor de `--devices`):
+    - vencimientos uniformes en +-`--spread-days` alrededor de ahora, TRIAL#
+      o ACTIVE# segun `--trial-fraction`
+    - los vencidos antes de `--backlog-hours` ya estan EXPIRED (los expiro
+      una ejecucion anterior; el watermark queda justo antes)
+    - una promocion: `--promotion-fraction` de la flota en trial que vence
+      toda en la ultima hora (el pico que hay que dimensionar)
+
+El job corre como en Lambda: `--timeout-s` por invocacion, continuaciones
+hasta terminar, TokenBucket a `--iot-tps` y una cuota de IoT de
+`--iot-quota` llamadas/s por API que rechaza el exceso con
+ThrottlingException. DynamoDB e IoT son los stand-ins de tests/support con
+`--latency-ms` / `--iot-latency-ms` por llamada.
+
+El TPS de IoT hace que una promocion tarde minutos u horas; `--time-scale K`
+corre K veces mas rapido (TPS y cuota x K, latencias, timeout y margenes / K)
+y reporta los tiempos ya multiplicados por K. La CPU del proceso tambien se
+multiplica: `cpu_s` (sin escalar) dice cuanto pesa; con K=1 no hay ajuste.
+
+Reporta por flota:
+    pending / expired     dispositivos vencidos sin procesar / expirados
+    wall_s                duracion total del barrido (suma de invocaciones)
+    invocations           invocaciones (1 + continuaciones) con `--timeout-s`
+    overruns              invocaciones que pasaron de `--timeout-s` (en Lambda
+                          se cortan y repiten la ronda): debe ser 0
+    devices_per_s         expirados por segundo
+    ddb_per_device        llamadas a DynamoDB por dispositivo expirado
+    iot_per_device        llamadas a IoT por dispositivo expirado (incluye
+                          las rechazadas)
+    throttled             ThrottlingException de IoT
+    job_peak_mb           pico de RSS por encima de la flota ya sembrada: lo
+                          que el job suma a la memoria del contenedor
+"""
+import argparse
+import contextlib
+import os
+import random
+import time
+
+from benchmarks import harness
+
+TABLE = "DeviceMetadata"
+STATE_TABLE = "LifecycleState"
+NOW = 1760700000
+FUNCTION_ARN = "arn:aws:lambda:us-east-2:123456789012:function:CertificateLifecycle"
+
+
+class Context:
+    """Context de Lambda con `timeout` segundos desde su creacion."""
+
+    invoked_function_arn = FUNCTION_ARN
+
+    def __init__(self, timeout: float, request_id: str):
+        self.deadline = time.monotonic() + timeout
+        self.aws_request_id = request_id
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class FakeLambda:
+    def __init__(self):
+        self.payloads = []
+
+    def invoke(self, FunctionName, InvocationType, Payload):
+        self.payloads.append(Payload)
+        return {"StatusCode": 202}
+
+
+def seed_fleet(ddb, iot, devices, trial_fraction, spread_days, backlog_hours, promotion_fraction, shards,
+               seed=0) -> int:
+    """Siembra la flota y devuelve cuantos dispositivos estan pendientes de expirar."""
+    from akame_common import lifecycle_buckets
+
+    rng = random.Random(seed)
+    spread = spread_days * 86400
+    backlog_start = NOW - backlog_hours * 3600
+    promotion = int(devices * promotion_fraction)
+    pending = 0
+
+    for i in range(devices):
+        thing = f"gw_{i:032x}"
+        if i < promotion:
+            status, expires_at = "TRIAL", rng.randint(NOW - 3600, NOW)
+        else:
+            status = "TRIAL" if rng.random() < trial_fraction else "ACTIVE"
+            expires_at = rng.randint(NOW - spread, NOW + spread)
+
+        if expires_at < backlog_start:
+            status, prefix, cert_status = "EXPIRED", "EXPIRED#", "INACTIVE"
+        else:
+            prefix, cert_status = f"{status}#", "ACTIVE"
+            if expires_at <= NOW:
+                pending += 1
+                iot.add_certificate(f"cert-{thing}", cert_status)
+
+        ddb.put(TABLE, {
+            "thingName": thing,
+            "certificateId": f"cert-{thing}",
+            "lifecycleStatus": status,
+            "lifecycleBucket": lifecycle_buckets.bucket_for(prefix, expires_at, thing, shards),
+            "expiresAt": expires_at,
+            "certificateStatus": cert_status,
+        })
+
+    # Lo anterior al backlog ya esta drenado
+    drained = backlog_start // 3600 * 3600 - 3600
+    for prefix in ("TRIAL#", "ACTIVE#"):
+        ddb.put(STATE_TABLE, {"stateKey": f"watermark#{prefix}", "drainedThrough": drained}, key="stateKey")
+    return pending
+
+
+def run(devices: int, args: dict) -> dict:
+    from tests.support import load_lambda
+    from tests.support.fake_dynamodb import FakeDynamoDB
+    from tests.support.fake_iot import FakeIoT
+
+    scale = args["time_scale"]
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        lifecycle = load_lambda("certificate_lifecycle", env={
+            "DEVICE_METADATA_TABLE": TABLE,
+            "LIFECYCLE_STATE_TABLE": STATE_TABLE,
+            "LIFECYCLE_BUCKET_SHARDS": str(args["shards"]),
+            "LIFECYCLE_WORKERS": str(args["workers"]),
+            "LIFECYCLE_QUERY_WORKERS": str(args["workers"]),
+            "IOT_DESCRIBE_CERTIFICATE_TPS": str(args["iot_tps"] * scale),
+            "IOT_UPDATE_CERTIFICATE_TPS": str(args["iot_tps"] * scale),
+        })
+    from akame_common import ratelimit
+
+    lifecycle.SAFETY_MS = lifecycle.SAFETY_MS / scale
+    ratelimit.THROTTLE_PENALTY_SECONDS = ratelimit.THROTTLE_PENALTY_SECONDS / scale
+
+    ddb = FakeDynamoDB()
+    table = ddb.Table(TABLE)
+    table.add_index("ByLifecycleBucket", "lifecycleBucket", "expiresAt")
+    iot = FakeIoT(throttle_tps=args["iot_quota"] * scale)
+    pending = seed_fleet(
+        ddb, iot, devices, args["trial_fraction"], args["spread_days"], args["backlog_hours"],
+        args["promotion_fraction"], args["shards"],
+    )
+
+    ddb.latency = args["latency_ms"] / 1000 / scale
+    iot.latency = args["iot_latency_ms"] / 1000 / scale
+    lifecycle.device_table = table
+    lifecycle.state_table = ddb.Table(STATE_TABLE, key="stateKey")
+    lifecycle.iot = iot
+    lifecycle.lambda_client = FakeLambda()
+    lifecycle.time.time = lambda: NOW
+
+    # --- Barrido: la ejecucion programada y sus continuaciones ---
+    rss_before = harness.peak_rss_mb()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    event, invocations, overruns = {}, 0, 0
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        while True:
+            invocations += 1
+            context = Context(args["timeout_s"] / scale, f"req-{invocations}")
+            result = lifecycle.main(event, context)
+            overruns += time.monotonic() > context.deadline
+            if result["status"] != "continued":
+                break
+            event = {"continuation": "req-1"}
+    wall_s = (time.perf_counter() - start) * scale
+    cpu_s = time.process_time() - cpu_start
+    job_peak_mb = max(0.0, harness.peak_rss_mb() - rss_before)
+
+    expired = result["expired"]
+    ddb_calls = sum(ddb.calls.values())
+    iot_calls = sum(iot.calls.values())
+    return {
+        "mode": f"devices={devices}",
+        "devices": devices,
+        "pending": pending,
+        "expired": expired,
+        "failed": result["failed"],
+        "queries": result["queries"],
+        "wall_s": wall_s,
+        "cpu_s": cpu_s,
+        "invocations": invocations,
+        "overruns": overruns,
+        "devices_per_s": expired / wall_s if wall_s else 0.0,
+        "ddb_calls": dict(ddb.calls),
+        "iot_calls": dict(iot.calls),
+        "ddb_per_device": ddb_calls / expired if expired else 0.0,
+        "iot_per_device": iot_calls / expired if expired else 0.0,
+        "throttled": sum(iot.throttled.values()),
+        "job_peak_mb": job_peak_mb,
+        "peak_rss_mb": harness.peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", default="100000")
+    parser.add_argument("--trial-fraction", type=float, default=0.7)
+    parser.add_argument("--spread-days", type=int, default=30)
+    parser.add_argument("--backlog-hours", type=int, default=1)
+    parser.add_argument("--promotion-fraction", type=float, default=0.02)
+    parser.add_argument("--shards", type=int, default=8)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=8.0)
+    parser.add_argument("--iot-latency-ms", type=float, default=40.0)
+    parser.add_argument("--iot-tps", type=float, default=8.0)
+    parser.add_argument("--iot-quota", type=float, default=10.0)
+    parser.add_argument("--timeout-s", type=float, default=300.0)
+    parser.add_argument("--time-scale", type=float, default=10.0)
+    parser.add_argument("--output", help="ruta del JSON de resultados")
+    args = parser.parse_args()
+    params = {k: v for k, v in vars(args).items() if k not in ("devices", "output")}
+
+    print(" ".join(f"{k}={v}" for k, v in params.items()))
+    print(
+        f"{'devices':>9}{'pending':>9}{'expired':>9}{'wall s':>9}{'cpu s':>8}{'invoc':>7}{'over':>6}{'dev/s':>8}"
+        f"{'ddb/dev':>9}{'iot/dev':>9}{'thrott':>8}{'job MB':>8}"
+    )
+
+    results = []
+    for devices in map(int, args.devices.split(",")):
+        r = harness.run_isolated(run, devices, params)
+        results.append(r)
+        print(
+            f"{r['devices']:>9,}{r['pending']:>9,}{r['expired']:>9,}{r['wall_s']:>9.1f}{r['cpu_s']:>8.1f}"
+            f"{r['invocations']:>7}{r['overruns']:>6}{r['devices_per_s']:>8.1f}{r['ddb_per_device']:>9.2f}"
+            f"{r['iot_per_device']:>9.2f}{r['throttled']:>8}{r['job_peak_mb']:>8.1f}"
+        )
+
+    path = harness.save_results("lifecycle_fleet", {"devices": args.devices, **params}, results, args.output)
+    print(f"results: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""
+Coste del sharding de lifecycleBucket (TRIAL#YYYYMMDDHH#n) para
+certificate_lifecycle: escrituras repartidas contra fan-out de consultas.
+
+    python -m benchmarks.bench_lifecycle_shards [--devices 10000] [--shards 1,2,4,8,16,32]
+        [--latency-ms 5] [--query-workers 8] [--idle-hours 24]
+        [--partition-writes 1000] [--output results.json]
+
+Por cada numero de shards:
+    hot_key_items     items de `--devices` (una tanda de provisioning que vence
+                      en la misma hora) en la clave mas cargada del GSI
+    min_write_s       segundos minimos para escribir la tanda si cada clave del
+                      GSI acepta `--partition-writes` escrituras/s (modelo: el
+                      limite de una particion de DynamoDB, sin split for heat)
+    drain_queries     consultas para recoger la hora vencida (2 prefijos x
+                      (clave antigua + shards))
+    drain_requests    llamadas Query incluyendo paginas (1 MB ~ 1000 items)
+    drain_ms          tiempo de esa recogida con `--latency-ms` por llamada;
+                      el stand-in evalua cada item de la particion en cada
+                      pagina, asi que con pocos shards (particiones grandes)
+                      es pesimista: comparar tambien drain_requests
+    idle_queries/ms   una ejecucion sin nada que expirar sobre `--idle-hours`
+                      horas por prefijo (primer despliegue o catch-up; con el
+                      watermark al dia es 1 hora)
+
+DynamoDB es el stand-in en memoria de tests/support; las paginas se piden
+con `_query_page` del handler en un pool de LIFECYCLE_QUERY_WORKERS, sin
+expirar nada (solo el coste de las consultas).
+"""
+import argparse
+import contextlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks import harness
+
+TABLE = "DeviceMetadata"
+NOW = 1760700000
+
+
+def _drain(lifecycle, hours: dict, query_workers: int):
+    """(items, consultas) de recorrer todas las paginas de los buckets de `hours`."""
+    plan = lifecycle._plan({"hours": hours, "shards": lifecycle.BUCKET_SHARDS})
+
+    def pages(bucket):
+        items, cursor = [], None
+        while True:
+            found, cursor = lifecycle._query_page(bucket, cursor, NOW)
+            items.extend(found)
+            if not cursor:
+                return items
+
+    with ThreadPoolExecutor(max_workers=query_workers) as pool:
+        found = [i for items in pool.map(pages, [bucket for _, _, bucket in plan]) for i in items]
+    return found, len(plan)
+
+
+def run(shards: int, devices: int, latency_ms: float, query_workers: int, idle_hours: int,
+        partition_writes: int) -> dict:
+    from tests.support import load_lambda
+    from tests.support.fake_dynamodb import FakeDynamoDB
+    from akame_common import lifecycle_buckets
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        lifecycle = load_lambda("certificate_lifecycle", env={
+            "DEVICE_METADATA_TABLE": TABLE,
+            "LIFECYCLE_BUCKET_SHARDS": str(shards),
+            "LIFECYCLE_QUERY_WORKERS": str(query_workers),
+        })
+
+    # --- Escrituras: reparto de una tanda que vence en la misma hora ---
+    expires_at = NOW - 1800
+    per_key = {}
+    ddb = FakeDynamoDB()
+    table = ddb.Table(TABLE)
+    table.add_index("ByLifecycleBucket", "lifecycleBucket", "expiresAt")
+    for i in range(devices):
+        thing = f"gw_{i:032x}"
+        bucket = lifecycle_buckets.bucket_for("TRIAL#", expires_at, thing, shards)
+        per_key[bucket] = per_key.get(bucket, 0) + 1
+        ddb.put(TABLE, {
+            "thingName": thing,
+            "certificateId": f"cert-{thing}",
+            "lifecycleStatus": "TRIAL",
+            "lifecycleBucket": bucket,
+            "expiresAt": expires_at,
+        })
+    hot_key_items = max(per_key.values())
+
+    # --- Lecturas: recoger la hora vencida ---
+    ddb.latency = latency_ms / 1000
+    lifecycle.device_table = table
+    hour = expires_at // 3600 * 3600
+    start = time.perf_counter()
+    found, drain_queries = _drain(lifecycle, {"TRIAL#": [hour], "ACTIVE#": [hour]}, query_workers)
+    drain_ms = (time.perf_counter() - start) * 1000
+    drain_requests = ddb.calls["query"]
+    assert len(found) == devices
+
+    # --- Ejecucion sin nada que expirar ---
+    idle = FakeDynamoDB(latency=latency_ms / 1000).Table(TABLE)
+    idle.add_index("ByLifecycleBucket", "lifecycleBucket", "expiresAt")
+    lifecycle.device_table = idle
+    hours = [hour - h * 3600 for h in range(idle_hours)]
+    start = time.perf_counter()
+    _, idle_queries = _drain(lifecycle, {"TRIAL#": hours, "ACTIVE#": hours}, query_workers)
+    idle_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "mode": f"shards={shards}",
+        "shards": shards,
+        "devices": devices,
+        "hot_key_items": hot_key_items,
+        "min_write_s": hot_key_items / partition_writes,
+        "drain_queries": drain_queries,
+        "drain_requests": drain_requests,
+        "drain_ms": drain_ms,
+        "idle_queries": idle_queries,
+        "idle_ms": idle_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--shards", default="1,2,4,8,16,32")
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    parser.add_argument("--query-workers", type=int, default=8)
+    parser.add_argument("--idle-hours", type=int, default=24)
+    parser.add_argument("--partition-writes", type=int, default=1000)
+    parser.add_argument("--output", help="ruta del JSON de resultados")
+    args = parser.parse_args()
+
+    print(
+        f"devices={args.devices} latency_ms={args.latency_ms} query_workers={args.query_workers} "
+        f"idle_hours={args.idle_hours}"
+    )
+    print(
+        f"{'shards':>7}{'hot key':>9}{'write s':>9}{'drain q':>9}{'requests':>10}{'drain ms':>10}"
+        f"{'idle q':>8}{'idle ms':>9}"
+    )
+
+    results = []
+    for shards in map(int, args.shards.split(",")):
+        r = harness.run_isolated(
+            run, shards, args.devices, args.latency_ms, args.query_workers, args.idle_hours, args.partition_writes
+        )
+        results.append(r)
+        print(
+            f"{r['shards']:>7}{r['hot_key_items']:>9,}{r['min_write_s']:>9.1f}{r['drain_queries']:>9}"
+            f"{r['drain_requests']:>10}{r['drain_ms']:>10.1f}{r['idle_queries']:>8}{r['idle_ms']:>9.1f}"
+        )
+
+    path = harness.save_results(
+        "lifecycle_shards",
+        {
+            "devices": args.devices,
+            "latency_ms": args.latency_ms,
+            "query_workers": args.query_workers,
+            "idle_hours": args.idle_hours,
+            "partition_writes": args.partition_writes,
+        },
+        results,
+        args.output,
+    )
+    print(f"results: {path}")
+
+
+if __name__ == "__main__":
+    main()
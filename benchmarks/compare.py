@@ -0,0 +1,72 @@
+"""
+Compara dos JSON de resultados de benchmark (p.ej. de dos commits).
+
+    python -m benchmarks.compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+import argparse
+import json
+
+METRICS = (
+    # bench_ingestion_transform
+    ("records_per_sec", "records/s"),
+    ("batch_latency_p50_ms", "p50 ms"),
+    ("batch_latency_p99_ms", "p99 ms"),
+    # bench_authorizer_storm
+    ("connects_per_sec", "conn/s"),
+    ("decision_p50_ms", "dec p50"),
+    ("decision_p99_ms", "dec p99"),
+    ("cold_init_ms", "cold ms"),
+    ("dynamodb_calls_per_connect", "ddb/conn"),
+    # bench_cold_start
+    ("import_ms", "import ms"),
+    ("first_ms", "1st ms"),
+    ("cold_total_ms", "cold ms"),
+    ("peak_rss_mb", "RSS MiB"),
+)
+
+
+def _load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def _key(result: dict):
+    # Lote en la ingesta, contenedores concurrentes en el authorizer
+    return result["mode"], result.get("batch_size", result.get("concurrency"))
+
+
+def compare(before: dict, after: dict):
+    """[(mode, batch, metric, antes, despues, cambio relativo)] para las corridas comunes."""
+    rows = []
+    previous = {_key(r): r for r in before["results"]}
+
+    for r in after["results"]:
+        old = previous.get(_key(r))
+        if old is None:
+            continue
+        for metric, label in METRICS:
+            a, b = old.get(metric), r.get(metric)
+            if a is None or b is None:
+                continue
+            change = (b / a - 1) if a else 0.0
+            rows.append((*_key(r), label, a, b, change))
+
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    args = parser.parse_args()
+
+    before, after = _load(args.before), _load(args.after)
+    print(f"{before.get('commit')} -> {after.get('commit')}  ({after.get('benchmark')})")
+    print(f"{'mode':<10}{'run':>7}  {'metric':<10}{'before':>12}{'after':>12}{'change':>9}")
+
+    for mode, batch, label, a, b, change in compare(before, after):
+        print(f"{mode:<10}{batch:>7}  {label:<10}{a:>12,.2f}{b:>12,.2f}{change:>+9.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Utilidades comunes de los benchmarks: medicion de latencias, percentiles,
+pico de RSS, ejecucion aislada en un proceso nuevo y resultados en JSON para
+comparar entre commits (ver benchmarks/compare.py).
+"""
+import json
+import math
+import multiprocessing
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentile(values, pct: float) -> float:
+    """Percentil por rango mas cercano (pct en 0..100)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[min(len(ordered), max(rank, 1)) - 1]
+
+
+def peak_rss_mb() -> float:
+    """Pico de RSS del proceso actual en MiB (0 si no se puede medir)."""
+    if resource is None:
+        return 0.0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reporta KiB, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def measure(fn, inputs, warmup: int = 1) -> dict:
+    """
+    Llama fn(x) por cada x de `inputs` (iterable) y devuelve las latencias.
+    Los primeros `warmup` inputs no se cuentan.
+    """
+    latencies = []
+    for i, x in enumerate(inputs):
+        start = time.perf_counter()
+        fn(x)
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            latencies.append(elapsed)
+
+    return {
+        "iterations": len(latencies),
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+
+def run_isolated(func, *args):
+    """
+    Ejecuta func(*args) en un proceso nuevo (spawn): cada medicion arranca
+    como un contenedor frio y el pico de RSS no arrastra corridas previas.
+    `func` debe ser importable a nivel de modulo.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def save_results(name: str, params: dict, results: list, path: str = None) -> str:
+    commit = git_commit()
+    path = path or os.path.join(RESULTS_DIR, f"{name}-{commit}.json")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    with open(path, "w") as f:
+        json.dump({
+            "benchmark": name,
+            "commit": commit,
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "params": params,
+            "results": results,
+        }, f, indent=2)
+        f.write("\n")
+
+    return path
@@ -0,0 +1,98 @@
+"""
+Generador de payloads sinteticos de gateway para los benchmarks.
+
+Sigue el schema de las lecturas (aws_iot_akame.telemetry_schema, el mismo que
+el struct "readings" de telemetry_raw en TelemetryAnalyticsStack) y la forma
+que produce la IoT Rule: SELECT *, event_ts, meshId, ingestedAt.
+"""
+import base64
+import json
+import random
+
+from aws_iot_akame.telemetry_schema import READING_FIELDS
+
+METRIC_FIELDS = [(name, type_) for name, type_ in READING_FIELDS if name != "nodeId"]
+
+BASE_TS = 1760700000
+
+
+def _value(rng: random.Random, type_: str):
+    if type_ == "double":
+        return round(rng.uniform(-40.0, 120.0), 2)
+    if type_ == "bigint":
+        return rng.randrange(0, 10_000_000)
+    return rng.randrange(-120, 1024)
+
+
+def reading(rng: random.Random, node_id: int, sparsity: float = 0.0) -> dict:
+    """Una lectura; `sparsity` es la fraccion de metricas ausentes (0..1)."""
+    data = {"nodeId": node_id}
+    for name, type_ in METRIC_FIELDS:
+        if sparsity and rng.random() < sparsity:
+            continue
+        data[name] = _value(rng, type_)
+    return data
+
+
+def gateway_payload(
+    mesh_id: str,
+    nodes: int,
+    ts: int,
+    *,
+    sparsity: float = 0.0,
+    rng: random.Random = None,
+) -> bytes:
+    rng = rng or random.Random(0)
+    return json.dumps({
+        "timestamp": ts,
+        "readings": [reading(rng, n, sparsity) for n in range(1, nodes + 1)],
+        "event_ts": ts,
+        "meshId": mesh_id,
+        "ingestedAt": ts * 1000 + 120,
+    }).encode()
+
+
+def nodes_for_size(payload_bytes: int, sparsity: float = 0.0, seed: int = 0) -> int:
+    """Nodos por mensaje para un payload de ~payload_bytes."""
+    rng = random.Random(seed)
+    one = len(gateway_payload("gw_" + "0" * 32, 1, BASE_TS, sparsity=sparsity, rng=rng))
+    two = len(gateway_payload("gw_" + "0" * 32, 2, BASE_TS, sparsity=sparsity, rng=rng))
+    per_node = max(1, two - one)
+    return max(1, round((payload_bytes - (one - per_node)) / per_node))
+
+
+def firehose_event(
+    batch_size: int,
+    nodes: int,
+    *,
+    meshes: int = 50,
+    sparsity: float = 0.0,
+    ts: int = BASE_TS,
+    seed: int = 0,
+    record_prefix: str = "",
+) -> dict:
+    """
+    Evento de transform de Firehose con `batch_size` records repartidos entre
+    `meshes` gateways. Eventos con distinto `ts` no comparten lecturas.
+    """
+    rng = random.Random(seed)
+    return {
+        "invocationId": f"bench-{record_prefix}{ts}",
+        "deliveryStreamArn": "arn:aws:firehose:us-east-2:000000000000:deliverystream/bench",
+        "region": "us-east-2",
+        "records": [
+            {
+                "recordId": f"{record_prefix}{i:08d}",
+                "approximateArrivalTimestamp": (ts + i) * 1000,
+                "data": base64.b64encode(
+                    gateway_payload(f"gw_{i % meshes:032x}", nodes, ts + i, sparsity=sparsity, rng=rng)
+                ).decode(),
+            }
+            for i in range(batch_size)
+        ],
+    }
+
+
+def event_bytes(event: dict) -> int:
+    """Bytes de payload decodificados del evento."""
+    return sum(len(base64.b64decode(r["data"])) for r in event["records"])
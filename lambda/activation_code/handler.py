@@ -1,24 +1,32 @@
 import os
 import time
-import boto3
 import json
 from botocore.exceptions import ClientError
-from datetime import datetime, timezone
 
-dynamodb = boto3.resource("dynamodb")
-iot = boto3.client("iot")
+from akame_common import certificates, clients, gateway_token, lifecycle_buckets, log
+
+iot = clients.client("iot")
+ssm = clients.client("ssm")
 
 ACTIVATION_CODE_TABLE = os.environ["ACTIVATION_CODE_TABLE"]
 DEVICE_METADATA_TABLE = os.environ["DEVICE_METADATA_TABLE"]
+# Si esta definido se devuelve un token firmado para el authorizer (modo token)
+GATEWAY_TOKEN_KEYS_PARAM = os.environ.get("GATEWAY_TOKEN_KEYS_PARAM", "")
+
+# Shards por hora del GSI ByLifecycleBucket (ver akame_common.lifecycle_buckets)
+BUCKET_SHARDS = int(os.environ.get("LIFECYCLE_BUCKET_SHARDS", "1"))
+
+activation_table = clients.table(ACTIVATION_CODE_TABLE)
+device_table = clients.table(DEVICE_METADATA_TABLE)
 
-activation_table = dynamodb.Table(ACTIVATION_CODE_TABLE)
-device_table = dynamodb.Table(DEVICE_METADATA_TABLE)
+logger = log.get_logger("activation_code")
 
 
-def _bucket_for_expiry(expires_at: int) -> str:
-    return f"ACTIVE#{datetime.fromtimestamp(expires_at, tz=timezone.utc):%Y%m%d%H}"
+def _bucket_for_expiry(expires_at: int, thing_name: str) -> str:
+    return lifecycle_buckets.bucket_for("ACTIVE#", expires_at, thing_name, BUCKET_SHARDS)
 
 
+@log.invocation
 def main(event, context):
     try:
         body = json.loads(event.get("body", "{}"))
@@ -47,6 +55,9 @@ def main(event, context):
 
         now = int(time.time())
 
+        # Antes de cualquier escritura: si SSM falla no se consume el codigo
+        keyring = gateway_token.load_keyring(ssm, GATEWAY_TOKEN_KEYS_PARAM) if GATEWAY_TOKEN_KEYS_PARAM else None
+
         # Obtener activation code
         code_resp = activation_table.get_item(
             Key={"code": activation_code}
@@ -87,16 +98,17 @@ def main(event, context):
 
         # Actualizar metadata (paso CRÍTICO)
         try:
-            device_table.update_item(
+            update_resp = device_table.update_item(
                 Key={"thingName": thing_name},
-                UpdateExpression="""
+                UpdateExpression=f"""
                     SET userId = :uid,
                         activatedBy = if_not_exists(activatedBy, :uid),
                         lastRenewalDate = :now,
                         expiresAt = :exp,
                         lifecycleStatus = :active,
                         lifecycleBucket = :bucket,
-                        displayName = :dn
+                        displayName = :dn,
+                        {certificates.SET_STATUS}
                 """,
                 ConditionExpression="""
                     lifecycleStatus IN (:trial, :expired)
@@ -110,9 +122,12 @@ def main(event, context):
                     ":trial": "TRIAL",
                     ":expired": "EXPIRED",
                     ":unassigned_val": "unassigned",
-                    ":bucket": _bucket_for_expiry(new_expires_at),
-                    ":dn": display_name
+                    ":bucket": _bucket_for_expiry(new_expires_at, thing_name),
+                    ":dn": display_name,
+                    **certificates.status_values(certificates.ACTIVE, now),
                 },
+                # El certificateStatus previo dice si hay que reactivar en IoT
+                ReturnValues="UPDATED_OLD",
             )
 
         except ClientError as e:
@@ -127,20 +142,17 @@ def main(event, context):
                 }
             raise
 
-        # Reactivar certificado si estaba inactivo
-        try:
-            cert_desc = iot.describe_certificate(
-                certificateId=cert_id
-            )["certificateDescription"]
-
-            if cert_desc["status"] != "ACTIVE":
+        # Reactivar certificado si estaba inactivo (o sin estado conocido)
+        if certificates.changed(update_resp, certificates.ACTIVE):
+            try:
                 iot.update_certificate(
                     certificateId=cert_id,
                     newStatus="ACTIVE"
                 )
-        except ClientError as cert_error:
-            print(f"Certificate update failed {cert_id}: {cert_error}")
-            # NO abortamos: metadata ya es la fuente de verdad
+            except ClientError as cert_error:
+                logger.warning("certificate update failed", certificateId=cert_id, error=str(cert_error))
+                # NO abortamos: metadata ya es la fuente de verdad
+                certificates.forget(device_table, thing_name, certificates.ACTIVE)
 
         # Actualizar atributo userId en el Thing
         try:
@@ -155,7 +167,7 @@ def main(event, context):
                 },
             )
         except ClientError as thing_error:
-            print(f"Thing update failed {thing_name}: {thing_error}")
+            logger.warning("thing update failed", thing=thing_name, error=str(thing_error))
 
         # Borrar activation code (ÚLTIMO PASO)
         try:
@@ -168,20 +180,24 @@ def main(event, context):
             if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
                 raise
 
+        result = {
+            "status": "ok",
+            "thingName": thing_name,
+            "lastRenewalDate": now,
+            "expiresAt": new_expires_at,
+            "userId": cognito_sub
+        }
+        if keyring:
+            result["gatewayToken"] = gateway_token.mint(keyring, thing_name, cognito_sub, now, new_expires_at)
+
         return {
             "statusCode": 200,
             "headers": {"Content-Type": "application/json"},
-            "body": json.dumps({
-                "status": "ok",
-                "thingName": thing_name,
-                "lastRenewalDate": now,
-                "expiresAt": new_expires_at,
-                "userId": cognito_sub
-            })
+            "body": json.dumps(result)
         }
 
     except Exception as e:
-        print("ConsumeActivationCode error:", str(e))
+        logger.error("consume activation code failed", error=str(e))
         return {
             "statusCode": 500,
             "headers": {"Content-Type": "application/json"},
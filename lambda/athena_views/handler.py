@@ -1,70 +1,116 @@
+import json
 import os
 import time
-import boto3
 
-athena = boto3.client("athena")
+from akame_common import clients, log
+from akame_common.partitions import partition_cutover
+
+athena = clients.client("athena")
+
+logger = log.get_logger("athena_views")
 
 DATABASE = os.environ["ATHENA_DATABASE"]
 OUTPUT = os.environ["ATHENA_OUTPUT"]
 
-VIEW_SQL = """
+# Columnas de cada lectura (mismo orden que el struct de telemetry_raw),
+# del schema de lecturas que inyecta TelemetryAthenaViewStack
+READING_COLUMNS = list(json.loads(os.environ["READING_SCHEMA"]))
+
+# Tabla pre-aplanada en la ingesta (vacio = se aplana con UNNEST)
+FLAT_TABLE = os.environ.get("FLAT_TABLE", "")
+# Corte (epoch): la tabla plana tiene lecturas desde que se activo; lo
+# anterior sigue saliendo de telemetry_raw (que se sigue escribiendo) con
+# UNNEST. Sin corte no se usa la tabla plana.
+FLATTEN_SINCE = int(os.environ.get("FLATTEN_SINCE") or 0)
+# Objetos que la compactacion ya reemplazo (vacio = no se excluye nada): la
+# vista nunca ve a la vez los origenes y su compactado
+SUPERSEDED_TABLE = os.environ.get("SUPERSEDED_TABLE", "")
+
+# El corte va sobre las columnas de particion para que partition projection
+# pode cada rama: RAW solo lee las horas anteriores al corte. Se redondea a
+# la hora siguiente: la hora en que se activo la tabla plana esta completa
+# solo en RAW. Las dos tablas se particionan igual (hora de event_ts).
+CUTOVER_HOUR = -(-FLATTEN_SINCE // 3600) * 3600
+
+VIEW_SQL_RAW = """
 CREATE OR REPLACE VIEW telemetry.telemetry_flattened AS
 SELECT
     r.meshid,
     r.event_ts AS timestamp,
     r.ingestedAt,
-    rd.nodeId,
-
-    rd.humidity,
-    rd.raw,
-
-    rd.soil_moisture,
-    rd.soil_temperature,
-    rd.soil_ph,
-    rd.soil_ec,
-    rd.soil_nitrogen,
-    rd.soil_phosphorus,
-    rd.soil_potassium,
-    rd.soil_salinity,
-
-    rd.air_temperature,
-    rd.air_humidity,
-    rd.air_pressure,
-    rd.wind_speed,
-    rd.rainfall,
-    rd.solar_radiation,
-    rd.co2_level,
-    rd.leaf_wetness,
-
-    rd.pm1,
-    rd.pm2_5,
-    rd.pm10,
-    rd.voc,
-    rd.o3_level,
-    rd.no2_level,
-    rd.so2_level,
-
-    rd.battery_voltage,
-    rd.battery_level,
-    rd.battery_health,
-    rd.signal_strength,
-    rd.device_temperature,
-    rd.uptime,
-
-    r.year
+    {columns},
+    r.year,
+    r.month,
+    r.day,
+    r.hour
 FROM telemetry.telemetry_raw r
 CROSS JOIN UNNEST(r.readings) AS t(rd)
-WHERE r.meshid IS NOT NULL;
+WHERE r.meshid IS NOT NULL{raw_visible};
 
 """
 
+VIEW_SQL_FLAT = """
+CREATE OR REPLACE VIEW telemetry.telemetry_flattened AS
+SELECT
+    f.meshid,
+    f.event_ts AS timestamp,
+    f.ingestedAt,
+    {flat_columns},
+    f.year,
+    f.month,
+    f.day,
+    f.hour
+FROM telemetry.{table} f
+WHERE f.meshid IS NOT NULL
+  AND {flat_partitions}{flat_visible}
+UNION ALL
+SELECT
+    r.meshid,
+    r.event_ts AS timestamp,
+    r.ingestedAt,
+    {raw_columns},
+    r.year,
+    r.month,
+    r.day,
+    r.hour
+FROM telemetry.telemetry_raw r
+CROSS JOIN UNNEST(r.readings) AS t(rd)
+WHERE r.meshid IS NOT NULL
+  AND {raw_partitions}{raw_visible};
+
+"""
+
+
+def _visible(alias: str) -> str:
+    if not SUPERSEDED_TABLE:
+        return ""
+    return f'\n  AND {alias}."$path" NOT IN (SELECT path FROM telemetry.{SUPERSEDED_TABLE})'
+
+
+def _view_sql() -> str:
+    raw_columns = ",\n    ".join(f"rd.{c}" for c in READING_COLUMNS)
+
+    if FLAT_TABLE and FLATTEN_SINCE:
+        return VIEW_SQL_FLAT.format(
+            flat_columns=",\n    ".join(f"f.{c}" for c in READING_COLUMNS),
+            raw_columns=raw_columns,
+            table=FLAT_TABLE,
+            flat_partitions=partition_cutover(CUTOVER_HOUR),
+            raw_partitions=partition_cutover(CUTOVER_HOUR, before=True),
+            flat_visible=_visible("f"),
+            raw_visible=_visible("r"),
+        )
+
+    return VIEW_SQL_RAW.format(columns=raw_columns, raw_visible=_visible("r"))
+
 
+@log.invocation
 def main(event, context):
     if event["RequestType"] == "Delete":
         return {"status": "skipped"}
 
     res = athena.start_query_execution(
-        QueryString=VIEW_SQL,
+        QueryString=_view_sql(),
         QueryExecutionContext={"Database": DATABASE},
         WorkGroup=os.environ["ATHENA_WORKGROUP"],
         ResultConfiguration={"OutputLocation": OUTPUT},
@@ -87,6 +133,8 @@ def main(event, context):
 
     if state != "SUCCEEDED":
         reason = status["QueryExecution"]["Status"].get("StateChangeReason", "No reason provided")
+        logger.error("view creation failed", queryExecutionId=qid, reason=reason)
         raise RuntimeError(f"Athena query FAILED: {state} - {reason}")
 
+    logger.info("view created", queryExecutionId=qid)
     return {"status": "ok"}
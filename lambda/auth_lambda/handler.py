@@ -1,26 +1,74 @@
-import json
+import base64
 import os
 import time
-import boto3
 
-dynamodb = boto3.resource("dynamodb")
+from akame_common import clients, gateway_token, log
+from akame_common.cache import MISSING, TTLCache
+
+dynamodb = clients.resource("dynamodb")
+ssm = clients.client("ssm")
 TABLE_NAME = os.environ.get("DEVICE_METADATA_TABLE")
 
 if not TABLE_NAME:
     raise RuntimeError("DEVICE_METADATA_TABLE environment variable is not set")
 
-table = dynamodb.Table(TABLE_NAME)
+table = clients.table(TABLE_NAME)
+
+logger = log.get_logger("iot_authorizer")
+
+# Cache de DeviceMetadata por thingName: en una tormenta de reconexiones cada
+# contenedor lee cada gateway una sola vez por TTL.
+CACHE_TTL_SECONDS = int(os.environ.get("AUTH_CACHE_TTL_SECONDS", "60"))
+NEGATIVE_CACHE_TTL_SECONDS = int(os.environ.get("AUTH_NEGATIVE_CACHE_TTL_SECONDS", "15"))
+CACHE_MAX_ENTRIES = int(os.environ.get("AUTH_CACHE_MAX_ENTRIES", "10000"))
+CACHE_STATS_EVERY = int(os.environ.get("AUTH_CACHE_STATS_EVERY", "1000"))
+# Las denegaciones se cuentan por motivo y se reportan juntas cada N: en una
+# tormenta de reconexiones de gateways vencidos o revocados no hay una linea
+# por conexion. El detalle (thing, motivo) sale con LOG_LEVEL=DEBUG.
+DENY_STATS_EVERY = int(os.environ.get("AUTH_DENY_STATS_EVERY", "1000"))
+
+# Limites de IoT Core para refreshAfterInSeconds / disconnectAfterInSeconds
+MIN_SESSION_SECONDS = 300
+MAX_SESSION_SECONDS = 86400
+# Cada cuanto IoT Core vuelve a evaluar la politica (acota el tiempo hasta
+# que una revocacion de status se aplica a una conexion abierta)
+REFRESH_MAX_SECONDS = int(os.environ.get("AUTH_REFRESH_MAX_SECONDS", str(MAX_SESSION_SECONDS)))
+
+# None = thing no registrado (negative caching)
+_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+
+# Modo "token": el gateway presenta un token firmado (akame_common.gateway_token)
+# como password MQTT y se verifica sin DynamoDB. Sin token se usa DeviceMetadata.
+AUTH_MODE = os.environ.get("AUTH_MODE", "metadata")
+GATEWAY_TOKEN_KEYS_PARAM = os.environ.get("GATEWAY_TOKEN_KEYS_PARAM", "")
+TOKEN_DENYLIST_TABLE = os.environ.get("TOKEN_DENYLIST_TABLE", "")
+KEYRING_TTL_SECONDS = int(os.environ.get("GATEWAY_TOKEN_KEYRING_TTL_SECONDS", "300"))
+DENYLIST_REFRESH_SECONDS = int(os.environ.get("TOKEN_DENYLIST_REFRESH_SECONDS", "60"))
+
+if AUTH_MODE == "token" and not (GATEWAY_TOKEN_KEYS_PARAM and TOKEN_DENYLIST_TABLE):
+    raise RuntimeError("token mode requires GATEWAY_TOKEN_KEYS_PARAM and TOKEN_DENYLIST_TABLE")
+
+_keyring = TTLCache(maxsize=1, ttl=KEYRING_TTL_SECONDS)
+# {thingName: revokedAt}, recargado completo cada DENYLIST_REFRESH_SECONDS
+_denylist = {"items": None, "loadedAt": 0}
+# motivo -> denegaciones desde el ultimo reporte
+_denies = {}
 
 
+@log.invocation
 def lambda_handler(event, context):
-    # Log completo del evento para depuración
-    print("Authorizer Event:", json.dumps(event))
+    # Evento completo solo con LOG_LEVEL=DEBUG (el password MQTT se redacta)
+    logger.debug("event", event=event)
 
     thing_name = None
-    
+
     try:
         now = int(time.time())
 
+        token = _presented_token(event) if AUTH_MODE == "token" else None
+        if token:
+            return _authorize_token(event, token, now)
+
         thing_name = event.get("principalId") or event.get("authorizationToken")
 
         if not thing_name:
@@ -34,9 +82,8 @@ def lambda_handler(event, context):
         ):
             return _deny("invalid_thing_name", thing_name)
 
-        # Buscar en DynamoDB
-        resp = table.get_item(Key={"thingName": thing_name})
-        item = resp.get("Item")
+        # Buscar en cache / DynamoDB
+        item = _get_device(thing_name, now)
 
         if not item:
             return _deny("not_registered", thing_name)
@@ -48,52 +95,186 @@ def lambda_handler(event, context):
         if status != "active" or is_expired:
             return _deny(f"inactive_or_expired: {status} (Expires: {expires_at})", thing_name)
 
-        user_id = item.get("userId", "unknown")
+        return _allow(thing_name, item.get("userId", "unknown"), expires_at, now)
 
-        # Política de autorización MQTT
-        policy_doc = {
-            "Version": "2012-10-17",
-            "Statement": [
-                {
-                    "Action": ["iot:Connect"],
-                    "Effect": "Allow",
-                    "Resource": [f"arn:aws:iot:*:*:client/${{iot:ClientId}}"]
-                },
-                {
-                    "Action": ["iot:Publish"],
-                    "Effect": "Allow",
-                    "Resource": [f"arn:aws:iot:*:*:topic/gateway/{user_id}/data/telemetry"]
-                },
-                {
-                    "Action": ["iot:Subscribe", "iot:Receive"],
-                    "Effect": "Allow",
-                    "Resource": [
-                        f"arn:aws:iot:*:*:topicfilter/gateway/{user_id}/command/#",
-                        f"arn:aws:iot:*:*:topic/gateway/{user_id}/command/#"
-                    ]
-                }
-            ]
-        }
+    except Exception as e:
+        logger.error("authorizer failed", error=str(e), thing=thing_name)
+        return _deny("error", thing_name)
 
-        return {
-            "isAuthenticated": True,
-            "principalId": thing_name,
-            "policyDocument": policy_doc,
-            "context": {"userId": user_id}
-        }
 
+def _allow(thing_name, user_id, expires_at, now):
+    # Política de autorización MQTT
+    policy_doc = {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Action": ["iot:Connect"],
+                "Effect": "Allow",
+                "Resource": [f"arn:aws:iot:*:*:client/${{iot:ClientId}}"]
+            },
+            {
+                "Action": ["iot:Publish"],
+                "Effect": "Allow",
+                "Resource": [f"arn:aws:iot:*:*:topic/gateway/{user_id}/data/telemetry"]
+            },
+            {
+                "Action": ["iot:Subscribe", "iot:Receive"],
+                "Effect": "Allow",
+                "Resource": [
+                    f"arn:aws:iot:*:*:topicfilter/gateway/{user_id}/command/#",
+                    f"arn:aws:iot:*:*:topic/gateway/{user_id}/command/#"
+                ]
+            }
+        ]
+    }
+
+    refresh_after, disconnect_after = _session_seconds(expires_at, now)
+
+    return {
+        "isAuthenticated": True,
+        "principalId": thing_name,
+        "policyDocument": policy_doc,
+        "refreshAfterInSeconds": refresh_after,
+        "disconnectAfterInSeconds": disconnect_after,
+        "context": {"userId": user_id}
+    }
+
+
+def _session_seconds(expires_at, now):
+    """
+    (refreshAfterInSeconds, disconnectAfterInSeconds) segun lo que le queda
+    al plan. La conexion se corta al vencer el plan; IoT Core no acepta menos
+    de 5 minutos, asi que un plan a punto de vencer se corta a los 5 minutos.
+    """
+    remaining = expires_at - now
+    disconnect_after = max(MIN_SESSION_SECONDS, min(remaining, MAX_SESSION_SECONDS))
+    refresh_after = max(MIN_SESSION_SECONDS, min(remaining, REFRESH_MAX_SECONDS, MAX_SESSION_SECONDS))
+    return refresh_after, disconnect_after
+
+
+# ---------- Token mode ----------
+
+def _authorize_token(event, token, now):
+    try:
+        claims = gateway_token.verify(_get_keyring(), token, now)
+    except gateway_token.TokenError as e:
+        return _deny(e.reason)
+
+    thing_name = claims["t"]
+
+    # El token es de un gateway concreto: no se puede usar con otro ClientId
+    client_id = ((event.get("protocolData") or {}).get("mqtt") or {}).get("clientId")
+    if client_id and client_id != thing_name:
+        return _deny("client_id_mismatch", thing_name)
+
+    revoked_at = _get_denylist(now).get(thing_name)
+    if revoked_at is not None and claims["iat"] <= revoked_at:
+        return _deny("revoked", thing_name)
+
+    return _allow(thing_name, claims["u"], claims["exp"], now)
+
+
+def _presented_token(event):
+    """Token en el password MQTT (base64, como lo entrega IoT Core) o en `token`."""
+    password = ((event.get("protocolData") or {}).get("mqtt") or {}).get("password")
+    if password:
+        try:
+            return base64.b64decode(password).decode()
+        except ValueError:
+            return None
+    return event.get("token")
+
+
+def _get_keyring():
+    keyring = _keyring.get(GATEWAY_TOKEN_KEYS_PARAM)
+    if keyring is MISSING:
+        keyring = gateway_token.load_keyring(ssm, GATEWAY_TOKEN_KEYS_PARAM)
+        _keyring.set(GATEWAY_TOKEN_KEYS_PARAM, keyring)
+    return keyring
+
+
+def _get_denylist(now):
+    """
+    Lista de revocados completa (tabla pequenia: las entradas expiran por TTL
+    cuando ya no hay tokens vigentes). Si la recarga falla se sigue usando la
+    anterior; sin ninguna cargada se deniega (el error llega al handler).
+    """
+    if _denylist["items"] is not None and now - _denylist["loadedAt"] < DENYLIST_REFRESH_SECONDS:
+        return _denylist["items"]
+
+    try:
+        items = {}
+        denylist_table = dynamodb.Table(TOKEN_DENYLIST_TABLE)
+        kwargs = {"ProjectionExpression": "thingName, revokedAt"}
+        while True:
+            resp = denylist_table.scan(**kwargs)
+            for item in resp.get("Items", []):
+                items[item["thingName"]] = int(item.get("revokedAt", 0))
+            if "LastEvaluatedKey" not in resp:
+                break
+            kwargs["ExclusiveStartKey"] = resp["LastEvaluatedKey"]
     except Exception as e:
-        print(json.dumps({
-            "error": str(e),
-            "thing": thing_name,
-            "source": "iot_authorizer"
-        }))
-        return _deny("error", thing_name)
+        if _denylist["items"] is None:
+            raise
+        logger.warning("denylist refresh failed", error=str(e))
+        return _denylist["items"]
+
+    _denylist["items"] = items
+    _denylist["loadedAt"] = now
+    return items
+
+
+# ---------- Metadata mode ----------
+
+def _get_device(thing_name, now):
+    item = _cache.get(thing_name)
+
+    if item is MISSING:
+        resp = table.get_item(
+            Key={"thingName": thing_name},
+            ProjectionExpression="#s, expiresAt, userId",
+            ExpressionAttributeNames={"#s": "status"},
+        )
+        item = _device_entry(resp.get("Item"))
+        _cache.set(thing_name, item, _cache_ttl(item, now))
+
+    lookups = _cache.hits + _cache.misses
+    if CACHE_STATS_EVERY and lookups % CACHE_STATS_EVERY == 0:
+        logger.info("cache stats", cache=cache_stats())
+
+    return item
+
+
+def _device_entry(item):
+    if not item:
+        return None
+    return {
+        "status": item.get("status", "inactive"),
+        "expiresAt": int(item.get("expiresAt", 0)),
+        "userId": item.get("userId", "unknown"),
+    }
+
+
+def _cache_ttl(item, now):
+    """
+    Denegaciones (no registrado, inactivo, vencido) solo por poco tiempo para
+    que una activacion o renovacion se vea rapido; un gateway activo no se
+    cachea mas alla de su expiresAt.
+    """
+    if not item or item["status"] != "active" or now > item["expiresAt"]:
+        return NEGATIVE_CACHE_TTL_SECONDS
+    return min(CACHE_TTL_SECONDS, item["expiresAt"] - now)
+
+
+def cache_stats():
+    return _cache.stats()
 
 
 def _deny(reason, principal_id="anonymous"):
     if principal_id is None:
         principal_id = "anonymous"
+    logger.debug("deny", thing=principal_id, reason=reason)
+    _count_deny(reason)
     return {
         "isAuthenticated": False,
         "principalId": principal_id,
@@ -109,3 +290,12 @@ def _deny(reason, principal_id="anonymous"):
         },
         "context": {"reason": reason}
     }
+
+
+def _count_deny(reason):
+    # "inactive_or_expired: ..." lleva el detalle del item: se cuenta por tipo
+    kind = reason.partition(":")[0]
+    _denies[kind] = _denies.get(kind, 0) + 1
+    if DENY_STATS_EVERY and sum(_denies.values()) >= DENY_STATS_EVERY:
+        logger.info("deny stats", denies=dict(_denies))
+        _denies.clear()
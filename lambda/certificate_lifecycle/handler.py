@@ -1,105 +1,454 @@
+import json
 import os
 import time
-import boto3
-from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
 from botocore.exceptions import ClientError
 
-dynamodb = boto3.resource("dynamodb")
-iot = boto3.client("iot")
+from akame_common import certificates, clients, lifecycle_buckets, log, ratelimit
+from akame_common.ratelimit import TokenBucket
+
+iot = clients.client("iot")
+# Continuaciones del barrido (se invoca a si misma)
+lambda_client = clients.client("lambda")
 
 DEVICE_METADATA_TABLE = os.environ["DEVICE_METADATA_TABLE"]
-device_table = dynamodb.Table(DEVICE_METADATA_TABLE)
+device_table = clients.table(DEVICE_METADATA_TABLE)
+
+logger = log.get_logger("certificate_lifecycle")
 
 BUCKET_PREFIXES = ["TRIAL#", "ACTIVE#"]
 BUCKET_PREFIX_EXPIRED = "EXPIRED#"
 
+# Shards por hora de lifecycleBucket (ver akame_common.lifecycle_buckets);
+# igual que en device_factory y activation_code
+BUCKET_SHARDS = int(os.environ.get("LIFECYCLE_BUCKET_SHARDS", "1"))
+# Consultas concurrentes sobre los shards (scatter-gather)
+QUERY_WORKERS = int(os.environ.get("LIFECYCLE_QUERY_WORKERS", "8"))
+# Items por pagina: una ronda expira hasta QUERY_WORKERS x PAGE_SIZE
+# dispositivos al ritmo de IoT (8 x 50 a 8 TPS ~ 50 s), muy por debajo del
+# timeout, para que el corte entre rondas llegue a tiempo
+PAGE_SIZE = int(os.environ.get("LIFECYCLE_PAGE_SIZE", "50"))
+
+# Watermark por prefijo (ultima hora de lifecycleBucket drenada) en
+# LifecycleState: cada ejecucion solo consulta las horas posteriores.
+LIFECYCLE_STATE_TABLE = os.environ.get("LIFECYCLE_STATE_TABLE", "")
+state_table = clients.table(LIFECYCLE_STATE_TABLE) if LIFECYCLE_STATE_TABLE else None
+WATERMARK_KEY = "watermark#"
+# Progreso de la ejecucion en curso (rondas y continuaciones)
+PROGRESS_KEY = "progress#sweep"
+# Un progreso mas viejo que esto se descarta (continuacion perdida)
+PROGRESS_MAX_AGE_SECONDS = 6 * 3600
+# Margen para guardar el progreso e invocar la continuacion
+SAFETY_MS = 10000
+
+LOOKBACK_HOURS = int(os.environ.get("LIFECYCLE_LOOKBACK_HOURS", "24"))
+# Horas atrasadas que se recuperan por ejecucion tras una caida larga
+MAX_CATCHUP_HOURS = int(os.environ.get("LIFECYCLE_MAX_CATCHUP_HOURS", "168"))
+
+# Expiraciones en paralelo: el cuello de botella es el TPS del plano de
+# control de IoT (por cuenta y region), no la latencia de cada llamada.
+# Cada funcion que importa este modulo (barrido, tick, reconciliacion) tiene
+# su parte de la cuota por env; el reparto esta en CertificateLifecycleStack.
+WORKERS = int(os.environ.get("LIFECYCLE_WORKERS", "8"))
+DESCRIBE_CERTIFICATE_TPS = float(os.environ.get("IOT_DESCRIBE_CERTIFICATE_TPS", "8"))
+UPDATE_CERTIFICATE_TPS = float(os.environ.get("IOT_UPDATE_CERTIFICATE_TPS", "8"))
+
+# Compartidos por todos los hilos (y entre invocaciones del contenedor)
+_limiters = {
+    "DescribeCertificate": TokenBucket(DESCRIBE_CERTIFICATE_TPS),
+    "UpdateCertificate": TokenBucket(UPDATE_CERTIFICATE_TPS),
+}
+
 
 def _bucket_for_now(prefix: str, now: int) -> str:
-    return f"{prefix}{datetime.fromtimestamp(now, tz=timezone.utc):%Y%m%d%H}"
+    return lifecycle_buckets.hour_bucket(prefix, now)
 
 
-def _expired_bucket(now: int) -> str:
-    return f"{BUCKET_PREFIX_EXPIRED}{datetime.fromtimestamp(now, tz=timezone.utc):%Y%m%d%H}"
+def _expired_bucket(now: int, thing_name: str) -> str:
+    return lifecycle_buckets.bucket_for(BUCKET_PREFIX_EXPIRED, now, thing_name, BUCKET_SHARDS)
 
 
+@log.invocation
 def main(event, context):
+    """
+    Barrido por buckets en rondas: cada ronda pide una pagina de hasta
+    QUERY_WORKERS buckets en paralelo y la expira en el acto, asi que en
+    memoria solo hay una ronda. Tras cada ronda el progreso (plan de horas,
+    siguiente consulta y LastEvaluatedKey de los buckets a medias) queda en
+    LifecycleState; si no queda tiempo para otra ronda se invoca una
+    continuacion que sigue desde ahi. Un timeout solo pierde la ronda en
+    curso: la siguiente ejecucion retoma el progreso.
+    """
+    event = event or {}
+    start = time.monotonic()
+
+    progress = _load_progress()
+    if "continuation" in event and (progress is None or progress["runId"] != event["continuation"]):
+        # La ejecucion ya termino (o la retomo una programada)
+        logger.info("stale continuation", runId=event["continuation"])
+        return {"status": "skipped", "processed": 0}
+    if progress is None:
+        progress = _new_progress(event, context)
+    progress["invocations"] += 1
+
+    finished = _run_rounds(progress, context)
+
+    stats = dict(progress["counts"])
+    elapsed = time.monotonic() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["devicesPerSecond"] = round(progress["roundDevices"] / elapsed, 1) if elapsed > 0 else 0.0
+    stats["limiters"] = progress["roundLimiters"]
+    stats["invocations"] = progress["invocations"]
+
+    if not finished:
+        _save_progress(progress)
+        _continue(progress, context)
+        logger.info("lifecycle run continued", runId=progress["runId"], nextQuery=progress["nextQuery"], **stats)
+        return {"status": "continued", "processed": stats["expired"], **stats}
+
+    now = progress["runAt"]
+    incomplete = {tuple(h) for h in progress["incomplete"]}
+    stats["watermarks"] = {
+        prefix: _advance_watermark(
+            prefix,
+            progress["watermarks"][prefix],
+            [(hour, (prefix, hour) not in incomplete) for hour in hours],
+            set(progress["failedBuckets"]),
+            now,
+        )
+        for prefix, hours in progress["hours"].items()
+    }
+    _clear_progress(progress)
+
+    logger.info("lifecycle run completed", **stats)
+    return {"status": "ok", "processed": stats["expired"], **stats}
+
+
+def _plan(progress):
+    """Consultas (prefix, hora, bucket) de la ejecucion, en orden estable."""
+    return [
+        (prefix, hour, bucket)
+        for prefix, hours in progress["hours"].items()
+        for hour in hours
+        for bucket in lifecycle_buckets.shard_keys(prefix, hour, progress["shards"])
+    ]
+
+
+def _run_rounds(progress, context) -> bool:
+    """Rondas hasta agotar el plan (True) o el tiempo (False)."""
+    plan = _plan(progress)
+    by_bucket = {bucket: (prefix, hour) for prefix, hour, bucket in plan}
+    now = progress["runAt"]
+    slowest = 0.0
+
+    while progress["cursors"] or progress["nextQuery"] < len(plan):
+        if _out_of_time(context, slowest):
+            return False
+        round_start = time.monotonic()
+
+        # Primero los buckets a medias, despues los siguientes del plan
+        batch = list(progress["cursors"])[:QUERY_WORKERS]
+        while len(batch) < QUERY_WORKERS and progress["nextQuery"] < len(plan):
+            batch.append(plan[progress["nextQuery"]][2])
+            progress["nextQuery"] += 1
+
+        # --- Scatter-gather: una pagina de cada bucket en paralelo ---
+        with ThreadPoolExecutor(max_workers=len(batch)) as pool:
+            pages = list(pool.map(lambda b: _query_page(b, progress["cursors"].get(b), now), batch))
+
+        devices = []
+        for bucket, page in zip(batch, pages):
+            progress["cursors"].pop(bucket, None)
+            if page is None:
+                prefix, hour = by_bucket[bucket]
+                progress["incomplete"].append([prefix, hour])
+                continue
+            items, last_evaluated_key = page
+            devices.extend(items)
+            if last_evaluated_key:
+                progress["cursors"][bucket] = last_evaluated_key
+        progress["counts"]["queries"] += len(batch)
+
+        # --- Expirar la ronda en el pool ---
+        stats, failed_buckets = _expire_devices(devices, now)
+        for key in ("devices", "expired", "skipped", "failed", "throttled", "sdkRetries"):
+            progress["counts"][key] += stats[key]
+        progress["roundDevices"] += len(devices)
+        for api, delta in stats["limiters"].items():
+            total = progress["roundLimiters"].setdefault(api, dict.fromkeys(delta, 0))
+            for k, v in delta.items():
+                total[k] = round(total[k] + v, 3)
+        progress["failedBuckets"].extend(b for b in failed_buckets if b not in progress["failedBuckets"])
+
+        _save_progress(progress)
+        slowest = max(slowest, time.monotonic() - round_start)
+
+    return True
+
+
+def _query_page(bucket, exclusive_start_key, now):
+    """(devices vencidos, LastEvaluatedKey) de una pagina, o None si fallo."""
+    query_kwargs = {
+        "IndexName": "ByLifecycleBucket",
+        "KeyConditionExpression": "lifecycleBucket = :bucket AND expiresAt <= :now",
+        "ExpressionAttributeValues": {
+            ":bucket": bucket,
+            ":now": now,
+        },
+        "ProjectionExpression": "thingName, certificateId, lifecycleStatus, lifecycleBucket",
+        "Limit": PAGE_SIZE,
+    }
+    if exclusive_start_key:
+        query_kwargs["ExclusiveStartKey"] = exclusive_start_key
+
+    try:
+        response = device_table.query(**query_kwargs)
+    except ClientError as e:
+        logger.error("bucket query failed", bucket=bucket, error=str(e))
+        return None
+    return response.get("Items", []), response.get("LastEvaluatedKey")
+
+
+# ---------- Progress ----------
+
+def _new_progress(event, context):
     now = int(time.time())
-    expired_devices = []
-
-    # --- Consultar buckets exactos de esta hora ---
-    LOOKBACK_HOURS = 24
-   
-    for prefix in BUCKET_PREFIXES:
-        for offset in range(LOOKBACK_HOURS):
-            ts = now - offset * 3600
-            bucket = _bucket_for_now(prefix, ts)
-            last_evaluated_key = None
-
-            while True:
-                try:
-                    query_kwargs = {
-                        "IndexName": "ByLifecycleBucket",
-                        "KeyConditionExpression": "lifecycleBucket = :bucket AND expiresAt <= :now",
-                        "ExpressionAttributeValues": {
-                            ":bucket": bucket,
-                            ":now": now,
-                        },
-                        "ProjectionExpression": "thingName, certificateId, lifecycleStatus",
-                    }
-                    if last_evaluated_key:
-                        query_kwargs["ExclusiveStartKey"] = last_evaluated_key
-                    response = device_table.query(**query_kwargs)
-                    expired_devices.extend(response.get("Items", []))
-                    last_evaluated_key = response.get("LastEvaluatedKey")
-                    if not last_evaluated_key:
-                        break
-
-                except ClientError as e:
-                    print(f"Error querying bucket {bucket}: {e}")
-                    break
-
-    # --- Procesar expiraciones ---
-    processed = 0
-    for device in expired_devices:
-        thing_name = device["thingName"]
-        cert_id = device["certificateId"]
-
-        try:
-            device_table.update_item(
-                Key={"thingName": thing_name},
-                UpdateExpression="""
-                    SET lifecycleStatus = :expired,
-                        lifecycleBucket = :expired_bucket,
-                        expiredAt = :now
-                """,
-                ConditionExpression="lifecycleStatus = :trial OR lifecycleStatus = :active",
-                ExpressionAttributeValues={
-                    ":expired": "EXPIRED",
-                    ":expired_bucket": _expired_bucket(now),
-                    ":now": now,
-                    ":trial": "TRIAL",
-                    ":active": "ACTIVE",
-                },
-            )
-
-            try:
-                cert_desc = iot.describe_certificate(
-                    certificateId=cert_id
-                )["certificateDescription"]
-
-                if cert_desc["status"] == "ACTIVE":
-                    iot.update_certificate(
-                        certificateId=cert_id,
-                        newStatus="INACTIVE"
-                    )
-            except ClientError as cert_error:
-                print(f"Could not update certificate {cert_id}: {cert_error}")
-
-            processed += 1
-
-        except ClientError as e:
-            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
-                print(f"Error expiring device {thing_name}: {e}")
-
-    print(f"Certificate lifecycle run completed: {processed} devices expired.")
-    return {"status": "ok", "processed": processed}
+    current_hour = now // 3600 * 3600
+    watermarks = {prefix: _get_watermark(prefix) for prefix in BUCKET_PREFIXES}
+    return {
+        "runId": getattr(context, "aws_request_id", None) or f"run-{now}",
+        "runAt": now,
+        "shards": BUCKET_SHARDS,
+        "watermarks": watermarks,
+        "hours": {
+            prefix: _hours_to_scan(watermarks[prefix], current_hour, event)
+            for prefix in BUCKET_PREFIXES
+        },
+        "nextQuery": 0,
+        "cursors": {},
+        "incomplete": [],
+        "failedBuckets": [],
+        "counts": {k: 0 for k in ("devices", "expired", "skipped", "failed", "throttled", "sdkRetries", "queries")},
+        "invocations": 0,
+        "roundDevices": 0,
+        "roundLimiters": {},
+    }
+
+
+def _load_progress():
+    if state_table is None:
+        return None
+    item = state_table.get_item(Key={"stateKey": PROGRESS_KEY}).get("Item")
+    if not item:
+        return None
+    if int(item["runAt"]) < int(time.time()) - PROGRESS_MAX_AGE_SECONDS:
+        # Abandonada hace mucho: el watermark ya cubre lo que falto
+        logger.warning("discarding stale progress", runId=item["runId"])
+        return None
+    # DynamoDB devuelve Decimal: los numeros del plan vuelven a int
+    return {
+        "runId": item["runId"],
+        "runAt": int(item["runAt"]),
+        "shards": int(item["shards"]),
+        "watermarks": {p: int(w) if w is not None else None for p, w in item["watermarks"].items()},
+        "hours": {p: [int(h) for h in hours] for p, hours in item["hours"].items()},
+        "nextQuery": int(item["nextQuery"]),
+        "cursors": dict(item["cursors"]),
+        "incomplete": [[p, int(h)] for p, h in item["incomplete"]],
+        "failedBuckets": list(item["failedBuckets"]),
+        "counts": {k: int(v) for k, v in item["counts"].items()},
+        "invocations": int(item["invocations"]),
+        "roundDevices": 0,
+        "roundLimiters": {},
+    }
+
+
+def _save_progress(progress):
+    if state_table is None:
+        return
+    # round*: solo de esta invocacion
+    item = {k: v for k, v in progress.items() if k not in ("roundDevices", "roundLimiters")}
+    state_table.put_item(Item={"stateKey": PROGRESS_KEY, **item, "updatedAt": int(time.time())})
+
+
+def _clear_progress(progress):
+    if state_table is None:
+        return
+    try:
+        state_table.delete_item(
+            Key={"stateKey": PROGRESS_KEY},
+            ConditionExpression="runId = :run",
+            ExpressionAttributeValues={":run": progress["runId"]},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            raise
+
+
+def _out_of_time(context, slowest_round) -> bool:
+    # Sin tabla de estado no hay donde dejar el progreso: se sigue hasta el final
+    if context is None or state_table is None:
+        return False
+    needed_ms = SAFETY_MS + 2 * slowest_round * 1000
+    return context.get_remaining_time_in_millis() < needed_ms
+
+
+def _continue(progress, context):
+    """Invoca (asincrono) la misma funcion para seguir con `progress`."""
+    lambda_client.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps({"continuation": progress["runId"]}),
+    )
+
+
+# ---------- Watermark ----------
+
+def _hours_to_scan(watermark, current_hour, event):
+    """
+    Horas (epoch) a consultar para un prefijo, de la mas antigua a la actual.
+
+    Con watermark: solo las posteriores a la ultima hora drenada. Sin el
+    (primer despliegue) o sin tabla de estado: las ultimas LOOKBACK_HOURS.
+    Si el watermark quedo muy atras (caida larga) se recupera de a
+    MAX_CATCHUP_HOURS por ejecucion, empezando por las mas antiguas, sin
+    dejar de mirar las ultimas LOOKBACK_HOURS. `catchUpFrom` (epoch) en el
+    evento fuerza a revisar desde esa hora.
+    """
+    lookback_start = current_hour - (LOOKBACK_HOURS - 1) * 3600
+
+    start = lookback_start if watermark is None else watermark + 3600
+    if "catchUpFrom" in event:
+        start = min(start, int(event["catchUpFrom"]) // 3600 * 3600)
+
+    catch_up_end = min(current_hour, start + (MAX_CATCHUP_HOURS - 1) * 3600)
+    hours = list(range(start, catch_up_end + 1, 3600))
+    recent = range(max(lookback_start, catch_up_end + 3600), current_hour + 1, 3600)
+    return hours + list(recent)
+
+
+def _get_watermark(prefix):
+    if state_table is None:
+        return None
+    item = state_table.get_item(Key={"stateKey": WATERMARK_KEY + prefix}).get("Item")
+    return int(item["drainedThrough"]) if item else None
+
+
+def _advance_watermark(prefix, watermark, hours, failed_buckets, now):
+    """
+    Avanza el watermark por las horas consultadas contiguas que quedaron
+    drenadas: hora cerrada (todos sus devices ya vencieron), consulta
+    completa y sin expiraciones fallidas. Devuelve el watermark resultante.
+    """
+    drained = None
+    previous = None
+    for hour, complete in hours:
+        if previous is not None and hour != previous + 3600:
+            break
+        if hour + 3600 > now or not complete or _bucket_for_now(prefix, hour) in failed_buckets:
+            break
+        drained = previous = hour
+
+    if state_table is None or drained is None or (watermark is not None and drained <= watermark):
+        return watermark
+
+    try:
+        # Solo hacia adelante: dos ejecuciones concurrentes no lo retroceden
+        state_table.update_item(
+            Key={"stateKey": WATERMARK_KEY + prefix},
+            UpdateExpression="SET drainedThrough = :h, updatedAt = :now",
+            ConditionExpression="attribute_not_exists(drainedThrough) OR drainedThrough < :h",
+            ExpressionAttributeValues={":h": drained, ":now": now},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.error("watermark update failed", prefix=prefix, error=str(e))
+    return drained
+
+
+# ---------- Expiry ----------
+
+def _expire_devices(devices, now):
+    """
+    Expira `devices` en un pool acotado. Devuelve (conteos y throughput,
+    buckets con alguna expiracion fallida).
+    """
+    stats = {"devices": len(devices), "expired": 0, "skipped": 0, "failed": 0, "throttled": 0, "sdkRetries": 0}
+    failed_buckets = set()
+    start = time.monotonic()
+    limiters_before = ratelimit.snapshot(_limiters)
+
+    if devices:
+        with ThreadPoolExecutor(max_workers=max(1, min(WORKERS, len(devices)))) as pool:
+            for device, (outcome, throttled, retries) in zip(devices, pool.map(lambda d: _expire_device(d, now), devices)):
+                stats[outcome] += 1
+                if outcome == "failed" and device.get("lifecycleBucket"):
+                    # Por hora: el watermark no distingue shards
+                    failed_buckets.add(lifecycle_buckets.base_bucket(device["lifecycleBucket"]))
+                stats["throttled"] += throttled
+                stats["sdkRetries"] += retries
+
+    elapsed = time.monotonic() - start
+    stats["seconds"] = round(elapsed, 3)
+    stats["devicesPerSecond"] = round(len(devices) / elapsed, 1) if elapsed > 0 else 0.0
+    stats["limiters"] = ratelimit.since(_limiters, limiters_before)
+    return stats, failed_buckets
+
+
+def _expire_device(device, now):
+    """(outcome, throttles, reintentos del SDK); outcome: expired | skipped | failed."""
+    thing_name = device["thingName"]
+    cert_id = device["certificateId"]
+
+    try:
+        resp = device_table.update_item(
+            Key={"thingName": thing_name},
+            UpdateExpression=f"""
+                SET lifecycleStatus = :expired,
+                    lifecycleBucket = :expired_bucket,
+                    expiredAt = :now,
+                    {certificates.SET_STATUS}
+            """,
+            # Vencido y sin renovar (una renovacion mueve expiresAt)
+            ConditionExpression=(
+                "lifecycleStatus = :trial AND expiresAt <= :now"
+                " OR lifecycleStatus = :active AND expiresAt <= :now"
+            ),
+            ExpressionAttributeValues={
+                ":expired": "EXPIRED",
+                ":expired_bucket": _expired_bucket(now, thing_name),
+                ":now": now,
+                ":trial": "TRIAL",
+                ":active": "ACTIVE",
+                **certificates.status_values(certificates.INACTIVE, now),
+            },
+            # El certificateStatus previo decide si hace falta llamar a IoT
+            ReturnValues="UPDATED_OLD",
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            # Otra ejecucion (o una renovacion) ya lo movio
+            return "skipped", 0, 0
+        logger.error("expire failed", thing=thing_name, error=str(e))
+        return "failed", 0, 0
+
+    if not certificates.changed(resp, certificates.INACTIVE):
+        return "expired", 0, 0
+
+    try:
+        resp = ratelimit.call(
+            _limiters, "UpdateCertificate", iot.update_certificate, certificateId=cert_id, newStatus="INACTIVE"
+        )
+    except ClientError as cert_error:
+        # La metadata ya es la fuente de verdad: el device queda expirado y la
+        # reconciliacion desactiva el certificado
+        logger.warning("certificate update failed", certificateId=cert_id, error=str(cert_error))
+        certificates.forget(device_table, thing_name, certificates.INACTIVE)
+        return "expired", int(ratelimit.is_throttling(cert_error)), 0
+
+    return "expired", 0, _retry_attempts(resp)
+
+
+def _retry_attempts(resp) -> int:
+    # Reintentos internos del SDK (casi siempre throttling)
+    return resp.get("ResponseMetadata", {}).get("RetryAttempts", 0)
@@ -0,0 +1,163 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+
+from akame_common import certificates, log, ratelimit
+
+# Limitadores, cliente IoT y tabla compartidos con el job de expiracion
+import handler as lifecycle
+
+# Reconciliacion de certificateStatus: recorre DeviceMetadata por tramos y
+# compara con IoT los certificados sin estado replicado o con estado de mas
+# de RECONCILE_STALE_DAYS (el filtro va en el Scan: los demas no cuestan
+# DescribeCertificate). Corrige la metadata cuando no refleja a
+# IoT (cambios hechos a mano, escrituras perdidas) y el certificado cuando no
+# corresponde al lifecycle (EXPIRED -> INACTIVE, TRIAL/ACTIVE -> ACTIVE, p.ej.
+# un UpdateCertificate fallido). Los revocados no se tocan en IoT.
+#
+# El cursor del Scan queda en LifecycleState: cada ejecucion sigue donde
+# termino la anterior y al completar una pasada vuelve a empezar.
+RECONCILE_CURSOR_KEY = "reconcile#cursor"
+PAGE_SIZE = int(os.environ.get("RECONCILE_PAGE_SIZE", "100"))
+STALE_SECONDS = int(os.environ.get("RECONCILE_STALE_DAYS", "7")) * 86400
+# Tiempo minimo restante para empezar otra pagina (una pagina a 8 TPS ~ 13 s)
+SAFETY_MS = 30000
+
+FIXABLE = {certificates.ACTIVE, certificates.INACTIVE}
+
+logger = log.get_logger("certificate_reconcile")
+
+
+@log.invocation
+def main(event, context):
+    now = int(time.time())
+    cursor = _get_cursor()
+
+    stats = {"pages": 0, "scanned": 0, "devices": 0, "inSync": 0, "metadataFixed": 0, "certificateFixed": 0,
+             "changed": 0, "failed": 0, "passCompleted": False}
+    scan_kwargs = {
+        "ProjectionExpression": "thingName, certificateId, lifecycleStatus, #s, certificateStatus",
+        "FilterExpression": (
+            "attribute_not_exists(certificateStatus) OR attribute_not_exists(certificateStatusAt)"
+            " OR certificateStatusAt < :stale"
+        ),
+        "ExpressionAttributeNames": {"#s": "status"},
+        "ExpressionAttributeValues": {":stale": now - STALE_SECONDS},
+        "Limit": PAGE_SIZE,
+    }
+
+    while True:
+        if cursor:
+            scan_kwargs["ExclusiveStartKey"] = cursor
+        else:
+            scan_kwargs.pop("ExclusiveStartKey", None)
+        page = lifecycle.device_table.scan(**scan_kwargs)
+
+        devices = [d for d in page.get("Items", []) if d.get("certificateId")]
+        if devices:
+            with ThreadPoolExecutor(max_workers=max(1, min(lifecycle.WORKERS, len(devices)))) as pool:
+                for outcome in pool.map(lambda d: _reconcile(d, now), devices):
+                    stats[outcome] += 1
+        stats["pages"] += 1
+        stats["scanned"] += page.get("ScannedCount", 0)
+        stats["devices"] += len(devices)
+
+        cursor = page.get("LastEvaluatedKey")
+        if not cursor:
+            stats["passCompleted"] = True
+            break
+        if _remaining_ms(context) < SAFETY_MS:
+            break
+
+    _save_cursor(cursor, now)
+    logger.info("reconcile run completed", **stats)
+    return {"status": "ok", **stats}
+
+
+def _expected_status(device):
+    if device.get("status") == "revoked":
+        return None
+    lifecycle_status = device.get("lifecycleStatus")
+    if lifecycle_status == "EXPIRED":
+        return certificates.INACTIVE
+    if lifecycle_status in ("TRIAL", "ACTIVE"):
+        return certificates.ACTIVE
+    return None
+
+
+def _reconcile(device, now):
+    """inSync | metadataFixed | certificateFixed | changed | failed."""
+    thing_name = device["thingName"]
+    cert_id = device["certificateId"]
+
+    try:
+        resp = ratelimit.call(
+            lifecycle._limiters, "DescribeCertificate", lifecycle.iot.describe_certificate, certificateId=cert_id
+        )
+    except ClientError as e:
+        logger.warning("describe certificate failed", certificateId=cert_id, error=str(e))
+        return "failed"
+
+    actual = resp["certificateDescription"]["status"]
+    expected = _expected_status(device)
+    target = expected if expected and actual in FIXABLE else actual
+    in_sync = device.get("certificateStatus") == target == actual
+
+    # Primero la metadata (tambien en sincronia: renueva certificateStatusAt
+    # y saca al item del filtro), condicionada a que el lifecycle no cambio
+    # desde el Scan: una expiracion o activacion en curso manda sobre la
+    # reconciliacion
+    update_kwargs = {
+        "Key": {"thingName": thing_name},
+        "UpdateExpression": "SET " + certificates.SET_STATUS,
+        "ExpressionAttributeValues": certificates.status_values(target, now),
+    }
+    if "lifecycleStatus" in device:
+        update_kwargs["ConditionExpression"] = "lifecycleStatus = :seen"
+        update_kwargs["ExpressionAttributeValues"][":seen"] = device["lifecycleStatus"]
+    try:
+        lifecycle.device_table.update_item(**update_kwargs)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+            return "changed"
+        logger.warning("certificate status write failed", thing=thing_name, error=str(e))
+        return "failed"
+
+    if in_sync:
+        return "inSync"
+    if target == actual:
+        return "metadataFixed"
+
+    try:
+        ratelimit.call(
+            lifecycle._limiters, "UpdateCertificate", lifecycle.iot.update_certificate,
+            certificateId=cert_id, newStatus=target,
+        )
+    except ClientError as e:
+        logger.warning("certificate update failed", certificateId=cert_id, error=str(e))
+        certificates.forget(lifecycle.device_table, thing_name, target)
+        return "failed"
+
+    logger.info("certificate drift fixed", thing=thing_name, certificateId=cert_id, previous=actual, status=target)
+    return "certificateFixed"
+
+
+def _remaining_ms(context):
+    if context is None:
+        return float("inf")
+    return context.get_remaining_time_in_millis()
+
+
+def _get_cursor():
+    item = lifecycle.state_table.get_item(Key={"stateKey": RECONCILE_CURSOR_KEY}).get("Item")
+    return item.get("lastEvaluatedKey") if item else None
+
+
+def _save_cursor(cursor, now):
+    if cursor:
+        lifecycle.state_table.put_item(Item={
+            "stateKey": RECONCILE_CURSOR_KEY, "lastEvaluatedKey": cursor, "updatedAt": now,
+        })
+    else:
+        lifecycle.state_table.put_item(Item={"stateKey": RECONCILE_CURSOR_KEY, "passCompletedAt": now})
@@ -0,0 +1,266 @@
+import heapq
+import os
+import time
+from botocore.exceptions import ClientError
+
+from akame_common import clients, log
+
+# Misma logica de expiracion (condicion, certificado, limitadores) que el
+# barrido por buckets; este modulo solo decide *cuando* expirar.
+import handler as lifecycle
+
+# Expiracion a la hora exacta:
+#
+#   DeviceMetadata --stream--> stream()  agenda/cancela (slot de minuto, thing)
+#   EventBridge cada minuto -> tick()    espera cada expiresAt del minuto y expira
+#
+# La agenda es una rueda de slots de un minuto en ExpirySchedule
+# (dueMinute = epoch del minuto, sort key thingName); dentro del minuto, un
+# heap por expiresAt. El checkpoint (ultimo slot procesado) vive en
+# LifecycleState; si un slot no entra en el tiempo de la invocacion, el
+# mismo item guarda hasta que entrada (expiresAt, thingName) se proceso y el
+# proximo tick sigue desde ahi. handler.main queda como barrido de reconciliacion (stream
+# perdido, caidas, expiraciones fallidas).
+EXPIRY_SCHEDULE_TABLE = os.environ["EXPIRY_SCHEDULE_TABLE"]
+schedule_table = clients.table(EXPIRY_SCHEDULE_TABLE)
+
+logger = log.get_logger("expiry_scheduler")
+
+SLOT_SECONDS = 60
+SCHEDULABLE = {"TRIAL", "ACTIVE"}
+CHECKPOINT_KEY = "scheduler#checkpoint"
+# TTL de las entradas ya vencidas (la agenda no se borra a mano)
+SCHEDULE_TTL_SECONDS = 2 * 24 * 3600
+# Slots atrasados que se recuperan por tick; lo anterior lo cubre el barrido
+MAX_LAG_SLOTS = int(os.environ.get("EXPIRY_MAX_LAG_MINUTES", "60"))
+# Margen antes del timeout para guardar el checkpoint
+SAFETY_MS = 5000
+
+
+def _slot(ts) -> int:
+    return int(ts) // SLOT_SECONDS * SLOT_SECONDS
+
+
+# ---------- Stream ----------
+
+def _value(attr):
+    # DynamoDB JSON -> python, solo los tipos de la agenda
+    if "S" in attr:
+        return attr["S"]
+    if "N" in attr:
+        n = attr["N"]
+        return int(n) if n.lstrip("-").isdigit() else float(n)
+    return None
+
+
+def _entry(image):
+    """(expiresAt, certificateId) si el device debe expirar, o None."""
+    if not image:
+        return None
+    status = _value(image.get("lifecycleStatus", {}))
+    expires_at = _value(image.get("expiresAt", {}))
+    if status not in SCHEDULABLE or not isinstance(expires_at, int):
+        return None
+    return expires_at, _value(image.get("certificateId", {}))
+
+
+@log.invocation
+def stream(event, context):
+    """
+    Consumer del stream de DeviceMetadata (NEW_AND_OLD_IMAGES). Con
+    ReportBatchItemFailures: ante un fallo se corta el lote y Lambda
+    reintenta desde ese record, manteniendo el orden por thing.
+    """
+    scheduled = cancelled = 0
+    for record in event.get("Records", []):
+        change = record["dynamodb"]
+        try:
+            added, removed = _apply(change)
+        except ClientError as e:
+            logger.error("schedule update failed", sequence=change.get("SequenceNumber"), error=str(e))
+            logger.info("schedule batch", records=len(event["Records"]), scheduled=scheduled, cancelled=cancelled)
+            return {"batchItemFailures": [{"itemIdentifier": change["SequenceNumber"]}]}
+        scheduled += added
+        cancelled += removed
+
+    logger.info("schedule batch", records=len(event.get("Records", [])), scheduled=scheduled, cancelled=cancelled)
+    return {"batchItemFailures": []}
+
+
+def _apply(change):
+    thing_name = _value(change["Keys"]["thingName"])
+    old = _entry(change.get("OldImage"))
+    new = _entry(change.get("NewImage"))
+    if old == new:
+        # Escrituras que no tocan la expiracion (la mayoria)
+        return 0, 0
+
+    removed = 0
+    if old and (not new or _slot(old[0]) != _slot(new[0])):
+        schedule_table.delete_item(Key={"dueMinute": _slot(old[0]), "thingName": thing_name})
+        removed = 1
+
+    if not new:
+        return 0, removed
+
+    expires_at, cert_id = new
+    schedule_table.put_item(Item={
+        "dueMinute": _slot(expires_at),
+        "thingName": thing_name,
+        "certificateId": cert_id,
+        "expiresAt": expires_at,
+        "ttl": expires_at + SCHEDULE_TTL_SECONDS,
+    })
+    return 1, removed
+
+
+# ---------- Ticker ----------
+
+@log.invocation
+def tick(event, context):
+    """
+    Procesa los slots desde el checkpoint hasta el minuto actual. Las
+    entradas vencidas se expiran en el acto; las del minuto actual se
+    esperan con un heap y se expiran en su segundo. La Lambda corre con
+    concurrencia reservada 1: un tick no se solapa con el siguiente.
+    """
+    now = time.time()
+    current = _slot(now)
+    checkpoint, cursor = _get_checkpoint()
+
+    first = current if checkpoint is None else checkpoint + SLOT_SECONDS
+    first = max(first, current - (MAX_LAG_SLOTS - 1) * SLOT_SECONDS)
+
+    stats = {"slots": 0, "due": 0, "expired": 0, "skipped": 0, "failed": 0, "maxDelaySeconds": 0}
+    for slot in range(first, current + 1, SLOT_SECONDS):
+        entries = _load_slot(slot)
+        if entries is not None and cursor and cursor[0] == slot:
+            # Slot cortado por tiempo: lo anterior al cursor ya se expiro
+            entries = [e for e in entries if (int(e["expiresAt"]), e["thingName"]) > cursor[1]]
+        if entries is None or not _run_slot(slot, entries, context, stats):
+            # Sin checkpoint: el proximo tick retoma este slot
+            break
+        _save_checkpoint(slot)
+        checkpoint = slot
+        stats["slots"] += 1
+
+    stats["checkpoint"] = checkpoint
+    logger.info("tick completed", **stats)
+    return {"status": "ok", **stats}
+
+
+def _load_slot(slot):
+    entries = []
+    query_kwargs = {
+        "KeyConditionExpression": "dueMinute = :slot",
+        "ExpressionAttributeValues": {":slot": slot},
+    }
+    while True:
+        try:
+            response = schedule_table.query(**query_kwargs)
+        except ClientError as e:
+            logger.error("slot query failed", slot=slot, error=str(e))
+            return None
+        entries.extend(response.get("Items", []))
+        if not response.get("LastEvaluatedKey"):
+            return entries
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+
+def _run_slot(slot, entries, context, stats) -> bool:
+    """
+    Expira las entradas en orden de expiresAt, de a WORKERS por vez. False
+    si no hubo tiempo: lo ya expirado queda en el cursor del checkpoint.
+    """
+    heap = [(int(e["expiresAt"]), e["thingName"], e.get("certificateId")) for e in entries]
+    heapq.heapify(heap)
+    last = None
+    slowest = 0.0
+
+    while heap:
+        wait = heap[0][0] - time.time()
+        if wait > 0:
+            if wait * 1000 > _remaining_ms(context) - SAFETY_MS:
+                return _stop(slot, last)
+            time.sleep(wait)
+
+        # Lo que ya vencio sale por el pool de handler, un lote por vez: un
+        # slot con miles de entradas no pasa del timeout
+        now = int(time.time())
+        while heap and heap[0][0] <= now:
+            if _out_of_time(context, slowest):
+                return _stop(slot, last)
+            chunk_start = time.monotonic()
+            due = []
+            while heap and heap[0][0] <= now and len(due) < lifecycle.WORKERS:
+                expires_at, thing_name, cert_id = heapq.heappop(heap)
+                due.append({"thingName": thing_name, "certificateId": cert_id})
+                stats["maxDelaySeconds"] = max(stats["maxDelaySeconds"], now - expires_at)
+                last = (expires_at, thing_name)
+
+            run_stats, _ = lifecycle._expire_devices(due, now)
+            stats["due"] += len(due)
+            for outcome in ("expired", "skipped", "failed"):
+                stats[outcome] += run_stats[outcome]
+            slowest = max(slowest, time.monotonic() - chunk_start)
+
+    return True
+
+
+def _stop(slot, last) -> bool:
+    if last is not None:
+        _save_cursor(slot, last)
+    return False
+
+
+def _out_of_time(context, slowest_chunk) -> bool:
+    return _remaining_ms(context) < SAFETY_MS + 2 * slowest_chunk * 1000
+
+
+def _remaining_ms(context):
+    if context is None:
+        return float("inf")
+    return context.get_remaining_time_in_millis()
+
+
+def _get_checkpoint():
+    """(ultimo slot procesado, cursor (slot, expiresAt, thingName) o None)."""
+    item = lifecycle.state_table.get_item(Key={"stateKey": CHECKPOINT_KEY}).get("Item")
+    if not item:
+        return None, None
+    checkpoint = int(item["processedThrough"]) if "processedThrough" in item else None
+    cursor = None
+    if "cursorSlot" in item:
+        cursor = (int(item["cursorSlot"]), (int(item["cursorExpiresAt"]), item["cursorThing"]))
+    return checkpoint, cursor
+
+
+def _save_checkpoint(slot):
+    try:
+        lifecycle.state_table.update_item(
+            Key={"stateKey": CHECKPOINT_KEY},
+            UpdateExpression="SET processedThrough = :slot, updatedAt = :now REMOVE cursorSlot, cursorExpiresAt, cursorThing",
+            ConditionExpression="attribute_not_exists(processedThrough) OR processedThrough < :slot",
+            ExpressionAttributeValues={":slot": slot, ":now": int(time.time())},
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.error("checkpoint update failed", slot=slot, error=str(e))
+
+
+def _save_cursor(slot, last):
+    expires_at, thing_name = last
+    try:
+        lifecycle.state_table.update_item(
+            Key={"stateKey": CHECKPOINT_KEY},
+            UpdateExpression="SET cursorSlot = :slot, cursorExpiresAt = :expires, cursorThing = :thing, updatedAt = :now",
+            ConditionExpression="attribute_not_exists(processedThrough) OR processedThrough < :slot",
+            ExpressionAttributeValues={
+                ":slot": slot, ":expires": expires_at, ":thing": thing_name, ":now": int(time.time()),
+            },
+        )
+    except ClientError as e:
+        # Sin cursor el proximo tick repite el slot; la condicion sobre
+        # expiresAt salta los ya expirados
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+            logger.error("cursor update failed", slot=slot, error=str(e))
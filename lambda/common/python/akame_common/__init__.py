@@ -0,0 +1,2 @@
+# Codigo compartido entre Lambdas (se despliega como Lambda Layer, ver
+# aws_iot_akame/common_layer.py). Solo stdlib + boto3.
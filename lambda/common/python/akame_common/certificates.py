@@ -0,0 +1,53 @@
+from botocore.exceptions import ClientError
+
+# Estado del certificado IoT replicado en DeviceMetadata (certificateStatus,
+# certificateStatusAt), para no pedir DescribeCertificate antes de cada
+# UpdateCertificate.
+#
+#   resp = table.update_item(
+#       ...,
+#       UpdateExpression="SET lifecycleStatus = :expired, " + certificates.SET_STATUS,
+#       ExpressionAttributeValues={..., **certificates.status_values("INACTIVE", now)},
+#       ReturnValues="UPDATED_OLD",
+#   )
+#   if certificates.changed(resp, "INACTIVE"):
+#       try:
+#           iot.update_certificate(certificateId=cert_id, newStatus="INACTIVE")
+#       except ClientError:
+#           certificates.forget(table, thing_name, "INACTIVE")
+#
+# Se escribe junto con el cambio de lifecycle (una sola escritura) y antes
+# de llamar a IoT; si la llamada falla, forget() borra el estado para que el
+# siguiente paso vuelva a llamar. Items sin certificateStatus (anteriores a
+# este cambio) cuentan como desconocidos: se llama a IoT sin describir.
+# La deriva (cambios fuera de los handlers) la corrige la reconciliacion de
+# certificate_lifecycle.
+SET_STATUS = "certificateStatus = :certificateStatus, certificateStatusAt = :certificateStatusAt"
+
+ACTIVE = "ACTIVE"
+INACTIVE = "INACTIVE"
+
+
+def status_values(status: str, now: int) -> dict:
+    return {":certificateStatus": status, ":certificateStatusAt": now}
+
+
+def changed(update_response: dict, status: str) -> bool:
+    """Con ReturnValues=UPDATED_OLD: si el certificado no estaba ya en `status`."""
+    return update_response.get("Attributes", {}).get("certificateStatus") != status
+
+
+def forget(table, thing_name: str, status: str):
+    """
+    Borra certificateStatus si sigue en `status` (el cambio en IoT fallo).
+    Best effort: si tampoco se puede escribir, la reconciliacion lo corrige.
+    """
+    try:
+        table.update_item(
+            Key={"thingName": thing_name},
+            UpdateExpression="REMOVE certificateStatus, certificateStatusAt",
+            ConditionExpression="certificateStatus = :certificateStatus",
+            ExpressionAttributeValues={":certificateStatus": status},
+        )
+    except ClientError:
+        pass
@@ -0,0 +1,58 @@
+import threading
+
+# Clientes de boto3 perezosos y compartidos por contenedor.
+#
+#   s3 = clients.client("s3")
+#   table = clients.table(os.environ["DEVICE_METADATA_TABLE"])
+#
+# Importar el handler ya no importa boto3 ni construye clientes: se hace en
+# el primer uso, y solo para los servicios que la invocacion necesita (p.ej.
+# SSM solo en modo token). Todos los modulos del contenedor comparten el mismo
+# cliente por servicio. Los tests siguen pudiendo reemplazar el atributo del
+# modulo (module.s3 = FakeS3()).
+
+_lock = threading.Lock()
+_clients = {}
+_resources = {}
+
+
+class _Lazy:
+    """Proxy que construye el objeto real en el primer acceso a un atributo."""
+
+    __slots__ = ("_factory", "_target")
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+
+    def __getattr__(self, name):
+        target = self._target
+        if target is None:
+            target = self._target = self._factory()
+        return getattr(target, name)
+
+
+def client(service: str):
+    return _Lazy(lambda: _get(_clients, "client", service))
+
+
+def resource(service: str):
+    return _Lazy(lambda: _get(_resources, "resource", service))
+
+
+def table(name: str):
+    """dynamodb.Table(name) perezosa sobre el resource compartido."""
+    return _Lazy(lambda: _get(_resources, "resource", "dynamodb").Table(name))
+
+
+def _get(cache: dict, kind: str, service: str):
+    obj = cache.get(service)
+    if obj is None:
+        # La sesion por defecto de boto3 no es thread-safe al crear clientes
+        with _lock:
+            obj = cache.get(service)
+            if obj is None:
+                import boto3
+
+                obj = cache[service] = getattr(boto3, kind)(service)
+    return obj
@@ -0,0 +1,95 @@
+import base64
+import hashlib
+import hmac
+import json
+
+# Token firmado del gateway (modo stateless del authorizer):
+#   <base64url(payload)>.<base64url(HMAC-SHA256(payload))>
+#   payload = {"v": 1, "k": kid, "t": thingName, "u": userId, "iat": ..., "exp": ...}
+#
+# Las claves viven en un SecureString de SSM como
+#   {"active": "k2", "keys": {"k1": "<base64>", "k2": "<base64>"}}
+# Se firma con "active"; se verifican todas las listadas (rotacion).
+VERSION = 1
+
+
+class TokenError(Exception):
+    """Token invalido; `reason` va en el contexto del deny."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+def parse_keyring(value: str) -> dict:
+    """Valor del parametro SSM -> {"active": kid, "keys": {kid: bytes}}."""
+    data = json.loads(value)
+    keys = {kid: base64.b64decode(secret) for kid, secret in data["keys"].items()}
+    if data["active"] not in keys:
+        raise ValueError("active key id not in keys")
+    return {"active": data["active"], "keys": keys}
+
+
+def load_keyring(ssm, name: str) -> dict:
+    value = ssm.get_parameter(Name=name, WithDecryption=True)["Parameter"]["Value"]
+    return parse_keyring(value)
+
+
+def mint(keyring: dict, thing_name: str, user_id: str, issued_at: int, expires_at: int) -> str:
+    kid = keyring["active"]
+    payload = _b64encode(json.dumps({
+        "v": VERSION,
+        "k": kid,
+        "t": thing_name,
+        "u": user_id,
+        "iat": int(issued_at),
+        "exp": int(expires_at),
+    }, separators=(",", ":")).encode())
+    return f"{payload}.{_sign(keyring['keys'][kid], payload)}"
+
+
+def verify(keyring: dict, token: str, now: int) -> dict:
+    """Claims del token (t, u, iat, exp) o TokenError."""
+    if not isinstance(token, str) or token.count(".") != 1:
+        raise TokenError("malformed_token")
+
+    payload, signature = token.split(".")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise TokenError("malformed_token")
+
+    if not isinstance(claims, dict) or claims.get("v") != VERSION:
+        raise TokenError("unsupported_token")
+
+    key = keyring["keys"].get(claims.get("k"))
+    if key is None:
+        raise TokenError("unknown_key")
+
+    if not hmac.compare_digest(_sign(key, payload), signature):
+        raise TokenError("bad_signature")
+
+    if not all(isinstance(claims.get(f), str) for f in ("t", "u")) or not all(
+        type(claims.get(f)) is int for f in ("iat", "exp")
+    ):
+        raise TokenError("malformed_token")
+
+    if now > claims["exp"]:
+        raise TokenError("token_expired")
+
+    return claims
+
+
+def _sign(key: bytes, payload: str) -> str:
+    return _b64encode(hmac.new(key, payload.encode(), hashlib.sha256).digest())
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _b64decode(value: str) -> bytes:
+    try:
+        return base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+    except (ValueError, TypeError):
+        raise ValueError("invalid base64")
@@ -0,0 +1,51 @@
+import zlib
+from datetime import datetime, timezone
+
+# Claves del GSI ByLifecycleBucket de DeviceMetadata:
+#
+#   PREFIJO#YYYYMMDDHH      un bucket por hora (shards = 1, items antiguos)
+#   PREFIJO#YYYYMMDDHH#n    shard n de la hora, n = crc32(thingName) % shards
+#
+# Con un solo bucket por hora una tanda de provisioning o de activaciones
+# escribe todo en la misma particion del GSI y DynamoDB la throttlea. El
+# shard sale del thingName: es estable, asi que reescribir un item (o la
+# migracion) siempre lo deja en el mismo shard. Los lectores consultan todos
+# los shards y la clave sin sufijo; el numero de shards (LIFECYCLE_BUCKET_SHARDS)
+# solo debe crecer, o migrar antes con scripts/reshard_lifecycle_buckets.py.
+
+
+def hour_bucket(prefix: str, ts: int) -> str:
+    return f"{prefix}{datetime.fromtimestamp(ts, tz=timezone.utc):%Y%m%d%H}"
+
+
+def shard_of(thing_name: str, shards: int) -> int:
+    return zlib.crc32(thing_name.encode()) % shards
+
+
+def bucket_for(prefix: str, ts: int, thing_name: str, shards: int) -> str:
+    """lifecycleBucket que se escribe para `thing_name`."""
+    bucket = hour_bucket(prefix, ts)
+    if shards <= 1:
+        return bucket
+    return f"{bucket}#{shard_of(thing_name, shards)}"
+
+
+def shard_keys(prefix: str, ts: int, shards: int) -> list:
+    """Todas las claves de la hora: la antigua sin sufijo y cada shard."""
+    bucket = hour_bucket(prefix, ts)
+    if shards <= 1:
+        return [bucket]
+    return [bucket] + [f"{bucket}#{n}" for n in range(shards)]
+
+
+def base_bucket(bucket: str) -> str:
+    """PREFIJO#YYYYMMDDHH de cualquier clave (con o sin shard)."""
+    return "#".join(bucket.split("#")[:2])
+
+
+def rebucket(bucket: str, thing_name: str, shards: int) -> str:
+    """La misma hora de `bucket` con el shard de `thing_name` (migracion)."""
+    base = base_bucket(bucket)
+    if shards <= 1:
+        return base
+    return f"{base}#{shard_of(thing_name, shards)}"
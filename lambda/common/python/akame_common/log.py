@@ -0,0 +1,163 @@
+import functools
+import json
+import os
+import random
+import threading
+import time
+
+# Logs estructurados (una linea JSON por registro) para los handlers.
+#
+#   logger = log.get_logger("iot_authorizer")
+#
+#   @log.invocation
+#   def lambda_handler(event, context):
+#       logger.debug("event", event=event)
+#       logger.info("deny", thing=thing_name, reason=reason)
+#
+# - LOG_LEVEL: DEBUG, INFO (por defecto), WARNING o ERROR.
+# - LOG_SAMPLE_RATES: fraccion de registros que se emite por nivel, p.ej.
+#   "DEBUG=0.01,INFO=0.1" (por defecto todos). El descarte se decide antes de
+#   serializar: un registro filtrado o no muestreado no cuesta json.dumps.
+# - Los registros se acumulan y se escriben juntos al terminar la invocacion
+#   (@log.invocation), al llegar a LOG_BUFFER_MAX o con el primer ERROR, que
+#   sale en el acto junto con lo acumulado (si la Lambda muere por timeout
+#   lo pendiente se pierde).
+# - Se redactan passwords, tokens, claims JWT, firmas y codigos de
+#   activacion, por nombre de clave y cualquier string con forma de JWT.
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+REDACTED = "***"
+REDACT_KEYS = frozenset({
+    "password",
+    "token",
+    "gatewaytoken",
+    "authorization",
+    "authorizationtoken",
+    "claims",
+    "cookie",
+    "cookies",
+    "stripe-signature",
+    "secret",
+    "activationcode",
+})
+MAX_DEPTH = 8
+
+_lock = threading.Lock()
+_buffer = []
+_context = {"requestId": None}
+_config = {}
+
+
+def configure(level: str = None, sample_rates: str = None, buffer_max: int = None):
+    """(Re)lee la configuracion; los argumentos ausentes salen del entorno."""
+    level = (level or os.environ.get("LOG_LEVEL", "INFO")).upper()
+    if sample_rates is None:
+        sample_rates = os.environ.get("LOG_SAMPLE_RATES", "")
+    if buffer_max is None:
+        buffer_max = int(os.environ.get("LOG_BUFFER_MAX", "100"))
+
+    _config["level"] = LEVELS.get(level, LEVELS["INFO"])
+    _config["rates"] = _parse_rates(sample_rates)
+    _config["buffer_max"] = max(1, buffer_max)
+
+
+def _parse_rates(value: str) -> dict:
+    rates = {}
+    for part in value.split(","):
+        name, _, rate = part.partition("=")
+        name = name.strip().upper()
+        if name in LEVELS and rate.strip():
+            rates[name] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class Logger:
+    def __init__(self, source: str):
+        self.source = source
+
+    def enabled(self, level: str) -> bool:
+        """Para no construir campos caros de un nivel que no se emite."""
+        return LEVELS[level] >= _config["level"]
+
+    def debug(self, msg: str, **fields):
+        self._log("DEBUG", msg, fields)
+
+    def info(self, msg: str, **fields):
+        self._log("INFO", msg, fields)
+
+    def warning(self, msg: str, **fields):
+        self._log("WARNING", msg, fields)
+
+    def error(self, msg: str, **fields):
+        self._log("ERROR", msg, fields)
+
+    def _log(self, level: str, msg: str, fields: dict):
+        if LEVELS[level] < _config["level"]:
+            return
+        rate = _config["rates"].get(level, 1.0)
+        if rate < 1.0 and random.random() >= rate:
+            return
+
+        # Se serializa en flush(); los campos no deben mutarse despues
+        with _lock:
+            _buffer.append((int(time.time() * 1000), level, self.source, msg, fields))
+            full = len(_buffer) >= _config["buffer_max"]
+        if level == "ERROR" or full:
+            flush()
+
+
+def get_logger(source: str) -> Logger:
+    return Logger(source)
+
+
+def flush():
+    with _lock:
+        if not _buffer:
+            return
+        records = _buffer[:]
+        del _buffer[:]
+
+    request_id = _context["requestId"]
+    print("\n".join(_format(record, request_id) for record in records))
+
+
+def _format(record, request_id) -> str:
+    ts, level, source, msg, fields = record
+    line = {"level": level, "source": source, "msg": msg, "ts": ts}
+    if request_id:
+        line["requestId"] = request_id
+    line.update(redact(fields))
+    return json.dumps(line, default=str, separators=(",", ":"))
+
+
+def redact(value, _depth=0):
+    if _depth > MAX_DEPTH:
+        return "..."
+    if isinstance(value, dict):
+        return {
+            k: REDACTED if isinstance(k, str) and k.lower() in REDACT_KEYS else redact(v, _depth + 1)
+            for k, v in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(v, _depth + 1) for v in value]
+    if isinstance(value, str) and value.startswith("eyJ") and value.count(".") == 2:
+        # JWT (header base64url de un objeto JSON)
+        return REDACTED
+    return value
+
+
+def invocation(fn):
+    """Decorador del entry point: requestId en cada linea y flush al terminar."""
+
+    @functools.wraps(fn)
+    def wrapper(event, context):
+        _context["requestId"] = getattr(context, "aws_request_id", None)
+        try:
+            return fn(event, context)
+        finally:
+            flush()
+
+    return wrapper
+
+
+configure()
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+
+# Layout de la telemetria en S3 (Firehose prefix + partition projection):
+#   meshid=<id>/year=YYYY/month=MM/day=DD/hour=HH/
+PARTITION_TEMPLATE = "meshid={mesh_id}/year={year}/month={month}/day={day}/hour={hour}/"
+
+_HOUR = timedelta(hours=1)
+
+# event_ts del gateway: epoch en segundos; si parece milisegundos se convierte
+_MS_THRESHOLD = 100_000_000_000
+
+
+# Fuera de rango (antes del inicio de la partition projection, o reloj del
+# gateway adelantado) se particiona por la llegada, para que el record no
+# quede en una particion que nadie consulta
+MIN_EVENT_TS = 1672531200  # 2023-01-01, projection.year.range
+
+
+def epoch_seconds(ts) -> int:
+    ts = int(ts)
+    return ts // 1000 if ts >= _MS_THRESHOLD else ts
+
+
+def partition_ts(event_ts, arrival_ts: float, max_skew_seconds: int) -> int:
+    """Instante por el que se particiona un record: event_ts, o la llegada si no es usable."""
+    try:
+        ts = epoch_seconds(event_ts)
+    except (TypeError, ValueError, OverflowError):
+        return int(arrival_ts)
+    if isinstance(event_ts, bool) or not MIN_EVENT_TS <= ts <= arrival_ts + max_skew_seconds:
+        return int(arrival_ts)
+    return ts
+
+
+def hour_partition(ts: int):
+    """(year, month, day, hour) como strings con padding, igual que el prefix."""
+    d = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return f"{d.year:04d}", f"{d.month:02d}", f"{d.day:02d}", f"{d.hour:02d}"
+
+
+def partition_key_prefix(mesh_id: str, ts: int) -> str:
+    year, month, day, hour = hour_partition(ts)
+    return PARTITION_TEMPLATE.format(
+        mesh_id=mesh_id, year=year, month=month, day=day, hour=hour
+    )
+
+
+def partition_filter(from_ts: int, to_ts: int) -> str:
+    """
+    Predicado SQL sobre (year, month, day, hour) que cubre [from_ts, to_ts].
+    Usa los prefijos mas gruesos posibles (anio completo, mes, dia, rango
+    de horas) para que partition projection pode con igualdades simples.
+    """
+    cursor = _floor_hour(from_ts)
+    last = _floor_hour(to_ts)
+    terms = []
+
+    while cursor <= last:
+        if cursor.hour == 0:
+            if cursor.day == 1:
+                next_year = cursor.replace(year=cursor.year + 1) if cursor.month == 1 else None
+                if next_year and next_year - _HOUR <= last:
+                    terms.append(f"(year = '{cursor.year:04d}')")
+                    cursor = next_year
+                    continue
+
+                next_month = _add_month(cursor)
+                if next_month - _HOUR <= last:
+                    terms.append(
+                        f"(year = '{cursor.year:04d}' AND month = '{cursor.month:02d}')"
+                    )
+                    cursor = next_month
+                    continue
+
+            next_day = cursor + timedelta(days=1)
+            if next_day - _HOUR <= last:
+                terms.append(
+                    f"(year = '{cursor.year:04d}' AND month = '{cursor.month:02d}'"
+                    f" AND day = '{cursor.day:02d}')"
+                )
+                cursor = next_day
+                continue
+
+        end_hour = last.hour if cursor.date() == last.date() else 23
+        terms.append(
+            f"(year = '{cursor.year:04d}' AND month = '{cursor.month:02d}'"
+            f" AND day = '{cursor.day:02d}'"
+            f" AND hour BETWEEN '{cursor.hour:02d}' AND '{end_hour:02d}')"
+        )
+        cursor = cursor.replace(hour=0) + timedelta(days=1)
+
+    return "(" + " OR ".join(terms) + ")"
+
+
+def partition_cutover(ts: int, before: bool = False) -> str:
+    """
+    Predicado SQL sobre (year, month, day, hour) con las horas desde la de
+    `ts` (inclusive), o las anteriores con before=True. Para cortes abiertos
+    que partition_filter no cubre; las dos mitades no se solapan.
+    """
+    year, month, day, hour = hour_partition(ts)
+    strict, last = ("<", "<") if before else (">", ">=")
+    return (
+        f"(year {strict} '{year}'"
+        f" OR (year = '{year}' AND month {strict} '{month}')"
+        f" OR (year = '{year}' AND month = '{month}' AND day {strict} '{day}')"
+        f" OR (year = '{year}' AND month = '{month}' AND day = '{day}' AND hour {last} '{hour}'))"
+    )
+
+
+def _floor_hour(ts: int) -> datetime:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(
+        minute=0, second=0, microsecond=0
+    )
+
+
+def _add_month(d: datetime) -> datetime:
+    if d.month == 12:
+        return d.replace(year=d.year + 1, month=1)
+    return d.replace(month=d.month + 1)
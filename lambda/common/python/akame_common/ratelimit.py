@@ -0,0 +1,99 @@
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+# Codigos con los que AWS rechaza por TPS (plano de control)
+THROTTLING_CODES = {"ThrottlingException", "TooManyRequestsException", "RequestLimitExceeded"}
+# Pausa comun tras un throttling que agota los reintentos del SDK
+THROTTLE_PENALTY_SECONDS = 1.0
+
+
+class TokenBucket:
+    """
+    Limitador token bucket thread-safe: `rate` llamadas por segundo con
+    rafagas de hasta `burst` (por defecto 1: ritmo uniforme, lo mas seguro
+    frente a los limites por segundo de AWS). Pensado para repartir un
+    limite de TPS de una API (p.ej. IoT UpdateCertificate) entre los hilos
+    de un pool.
+
+    acquire() reserva el token y duerme fuera del lock lo que falte: los
+    hilos quedan en cola en orden de llegada sin espera activa.
+    """
+
+    def __init__(self, rate: float, burst: float = None, clock=time.monotonic, sleep=time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.burst = float(burst if burst is not None else 1.0)
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._tokens = self.burst
+        self._updated = clock()
+        self.acquired = 0
+        self.waits = 0
+        self.waited_seconds = 0.0
+
+    def acquire(self):
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            self.acquired += 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            if wait:
+                self.waits += 1
+                self.waited_seconds += wait
+        if wait:
+            self._sleep(wait)
+
+    def penalize(self, seconds: float):
+        """Tras un throttling: nadie consigue token durante `seconds` (no se acumula)."""
+        with self._lock:
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+    def stats(self) -> dict:
+        return {
+            "acquired": self.acquired,
+            "waits": self.waits,
+            "waitedSeconds": round(self.waited_seconds, 3),
+        }
+
+
+# ---------- Llamadas limitadas ----------
+#
+#   _limiters = {"UpdateCertificate": TokenBucket(UPDATE_CERTIFICATE_TPS), ...}
+#   ratelimit.call(_limiters, "UpdateCertificate", iot.update_certificate, certificateId=cert_id, ...)
+#
+# Los limitadores viven en el contenedor (compartidos por los hilos y entre
+# invocaciones): snapshot() al empezar y since() al terminar dan lo de la
+# invocacion.
+
+def is_throttling(error: ClientError) -> bool:
+    return error.response["Error"]["Code"] in THROTTLING_CODES
+
+
+def call(limiters: dict, api: str, fn, **kwargs):
+    """fn(**kwargs) con un token de limiters[api]; un throttling frena a todos los hilos."""
+    limiter = limiters[api]
+    limiter.acquire()
+    try:
+        return fn(**kwargs)
+    except ClientError as e:
+        if is_throttling(e):
+            limiter.penalize(THROTTLE_PENALTY_SECONDS)
+        raise
+
+
+def snapshot(limiters: dict) -> dict:
+    return {api: limiter.stats() for api, limiter in limiters.items()}
+
+
+def since(limiters: dict, before: dict) -> dict:
+    """stats() de cada limitador menos lo que tenia en `before` (de snapshot())."""
+    return {
+        api: {k: round(v - before[api][k], 3) for k, v in limiter.stats().items()}
+        for api, limiter in limiters.items()
+    }
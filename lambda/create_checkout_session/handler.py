@@ -1,9 +1,11 @@
 import json
 import os
-import boto3
-import stripe
 
-ssm = boto3.client("ssm")
+from akame_common import clients, log
+
+ssm = clients.client("ssm")
+
+logger = log.get_logger("checkout_session")
 
 # ---------------- Helpers ----------------
 def _get_stripe_secret():
@@ -21,6 +23,7 @@ PLAN_PRICE_IDS = {
 }
 
 # ---------------- Entry ----------------
+@log.invocation
 def lambda_handler(event, context):
     try:
         body = json.loads(event.get("body", "{}"))
@@ -34,6 +37,9 @@ def lambda_handler(event, context):
         if not price_id:
             return {"statusCode": 400, "body": json.dumps({"error": "Invalid planId"})}
 
+        # SDK de Stripe diferido: las peticiones invalidas no pagan su import
+        import stripe
+
         stripe.api_key = _get_stripe_secret()
 
         session = stripe.checkout.Session.create(
@@ -50,5 +56,5 @@ def lambda_handler(event, context):
         }
 
     except Exception as e:
-        print("Error creating checkout session:", str(e))
+        logger.error("checkout session failed", error=str(e))
         return {"statusCode": 500, "body": json.dumps({"error": str(e)})}
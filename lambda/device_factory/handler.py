@@ -1,12 +1,13 @@
 import os
 import time
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from uuid import uuid4
-from datetime import datetime, timezone
 from botocore.exceptions import ClientError
 
-iot = boto3.client("iot")
-dynamodb = boto3.resource("dynamodb")
+from akame_common import certificates, clients, lifecycle_buckets, log, ratelimit
+from akame_common.ratelimit import TokenBucket
+
+iot = clients.client("iot")
 
 METADATA_TABLE = os.environ["METADATA_TABLE"]
 ACTIVATION_TABLE = os.environ["ACTIVATION_CODE_TABLE"]
@@ -14,8 +15,42 @@ DEFAULT_EXPIRATION_SECONDS = int(
     os.environ.get("DEFAULT_EXPIRATION_SECONDS", 3 * 24 * 3600)
 )
 
-metadata_table = dynamodb.Table(METADATA_TABLE)
-activation_table = dynamodb.Table(ACTIVATION_TABLE)
+# Shards por hora del GSI ByLifecycleBucket (ver akame_common.lifecycle_buckets)
+BUCKET_SHARDS = int(os.environ.get("LIFECYCLE_BUCKET_SHARDS", "1"))
+
+metadata_table = clients.table(METADATA_TABLE)
+activation_table = clients.table(ACTIVATION_TABLE)
+
+logger = log.get_logger("device_factory")
+
+POLICY_NAME = "GatewayBasePolicy"
+
+# ---------- Lote (count) ----------
+
+# Dispositivos por invocacion: cada resultado lleva certificado y claves
+# (~4 KB), asi que 500 quedan lejos del limite de 6 MB de la respuesta
+MAX_BATCH = int(os.environ.get("FACTORY_MAX_BATCH", "500"))
+# Dispositivos en paralelo; el ritmo real lo marca el TPS de IoT
+WORKERS = int(os.environ.get("FACTORY_WORKERS", "8"))
+# TPS por API de IoT de la factory, al 80% de la cuota por defecto (10/s).
+# UpdateCertificate (rollbacks) se comparte con el lifecycle y las
+# activaciones: tiene su propia parte
+IOT_TPS = float(os.environ.get("IOT_PROVISIONING_TPS", "8"))
+UPDATE_CERTIFICATE_TPS = float(os.environ.get("IOT_UPDATE_CERTIFICATE_TPS", "1"))
+# No se empieza un dispositivo con menos tiempo que esto
+SAFETY_MS = 10000
+
+# Por API de IoT (ver akame_common.ratelimit)
+_limiters = {
+    **{
+        api: TokenBucket(IOT_TPS)
+        for api in (
+            "CreateThing", "CreateKeysAndCertificate", "AttachPolicy", "AttachThingPrincipal",
+            "DetachPolicy", "DetachThingPrincipal", "DeleteCertificate", "DeleteThing",
+        )
+    },
+    "UpdateCertificate": TokenBucket(UPDATE_CERTIFICATE_TPS),
+}
 
 BUCKET_PREFIXES = {
     "TRIAL": "TRIAL#",
@@ -23,9 +58,9 @@ BUCKET_PREFIXES = {
 }
 
 
-def _bucket_for_expiry(expires_at: int, lifecycle_status: str) -> str:
+def _bucket_for_expiry(expires_at: int, lifecycle_status: str, thing_name: str) -> str:
     prefix = BUCKET_PREFIXES[lifecycle_status]
-    return f"{prefix}{datetime.fromtimestamp(expires_at, tz=timezone.utc):%Y%m%d%H}"
+    return lifecycle_buckets.bucket_for(prefix, expires_at, thing_name, BUCKET_SHARDS)
 
 
 def _generate_activation_code() -> str:
@@ -34,6 +69,7 @@ def _generate_activation_code() -> str:
     return "ACT-" + "".join(secrets.choice(alphabet) for _ in range(10))
 
 
+@log.invocation
 def main(event, context):
     plan_days = None
     try:
@@ -41,62 +77,107 @@ def main(event, context):
     except (ValueError, TypeError):
         plan_days = None
 
+    if plan_days and plan_days > 0:
+        plan_seconds = plan_days * 24 * 3600
+    else:
+        plan_seconds = DEFAULT_EXPIRATION_SECONDS
+
+    if event.get("count") is not None:
+        return _provision_batch(event["count"], plan_seconds, context)
 
     try:
-        now = int(time.time())
-
-        if plan_days and plan_days > 0:
-            plan_seconds = plan_days * 24 * 3600
-        else:
-            plan_seconds = DEFAULT_EXPIRATION_SECONDS
-
-        expires_at = now + DEFAULT_EXPIRATION_SECONDS
-        thing_name = f"gw_{uuid4().hex}"
-
-        # --- Crear Thing ---
-        iot.create_thing(
-            thingName=thing_name,
-            thingTypeName="Gateway",
-            attributePayload={
-                "attributes": {
-                    "role": "Gateway",
-                    "displayName": "unassigned",
-                    "userId": "unassigned",
-                    "createdAt": str(now),
-                }
-            },
-        )
+        return {"status": "ok", **_provision_device(int(time.time()), plan_seconds)}
+    except Exception as e:
+        logger.error("device factory failed", error=str(e))
+        return {"status": "error", "message": str(e)}
+
+
+def _provision_batch(count, plan_seconds, context):
+    """
+    `count` dispositivos en un pool de WORKERS hilos, con cada API de IoT
+    limitada a IOT_TPS. Cada dispositivo que falla se deshace entero; si se
+    acaba el tiempo de la invocacion los que faltan no se empiezan y quedan
+    como {"status": "notStarted"}: `devices` tiene una entrada por cada
+    dispositivo pedido.
+    """
+    try:
+        count = int(count)
+    except (ValueError, TypeError):
+        count = 0
+    if not 1 <= count <= MAX_BATCH:
+        return {"status": "error", "message": f"count must be between 1 and {MAX_BATCH}"}
+
+    now = int(time.time())
+    start = time.monotonic()
+    limiters_before = ratelimit.snapshot(_limiters)
+
+    def provision(_):
+        if context is not None and context.get_remaining_time_in_millis() < SAFETY_MS:
+            return {"status": "notStarted"}
+        try:
+            return {"status": "ok", **_provision_device(now, plan_seconds)}
+        except Exception as e:
+            logger.error("device factory failed", error=str(e))
+            return {"status": "error", "message": str(e)}
 
+    with ThreadPoolExecutor(max_workers=min(WORKERS, count)) as pool:
+        results = list(pool.map(provision, range(count)))
+
+    elapsed = time.monotonic() - start
+    outcomes = {"ok": 0, "error": 0, "notStarted": 0}
+    for r in results:
+        outcomes[r["status"]] += 1
+    provisioned = outcomes["ok"]
+    stats = {
+        "requested": count,
+        "provisioned": provisioned,
+        "failed": outcomes["error"],
+        "notStarted": outcomes["notStarted"],
+        "seconds": round(elapsed, 3),
+        "devicesPerSecond": round(provisioned / elapsed, 2) if elapsed > 0 else 0.0,
+        "limiters": ratelimit.since(_limiters, limiters_before),
+    }
+    logger.info("device batch completed", **stats)
+
+    status = "ok" if provisioned == count else ("error" if provisioned == 0 else "partial")
+    return {"status": status, **stats, "devices": results}
+
+
+def _provision_device(now, plan_seconds):
+    """Thing, certificado, codigo de activacion y metadata de un gateway."""
+    expires_at = now + DEFAULT_EXPIRATION_SECONDS
+    thing_name = f"gw_{uuid4().hex}"
+
+    # --- Crear Thing ---
+    ratelimit.call(
+        _limiters,
+        "CreateThing",
+        iot.create_thing,
+        thingName=thing_name,
+        thingTypeName="Gateway",
+        attributePayload={
+            "attributes": {
+                "role": "Gateway",
+                "displayName": "unassigned",
+                "userId": "unassigned",
+                "createdAt": str(now),
+            }
+        },
+    )
+
+    cert_arn = cert_id = activation_code = None
+    try:
         # --- Crear certificado ---
-        cert = iot.create_keys_and_certificate(setAsActive=True)
+        cert = ratelimit.call(_limiters, "CreateKeysAndCertificate", iot.create_keys_and_certificate, setAsActive=True)
         cert_arn = cert["certificateArn"]
         cert_id = cert["certificateId"]
 
-        try:
-            iot.attach_policy(
-                policyName="GatewayBasePolicy",
-                target=cert_arn
-            )
-            iot.attach_thing_principal(
-                thingName=thing_name,
-                principal=cert_arn
-            )
-        except Exception:
-            # Cleanup defensivo
-            try: iot.detach_policy(policyName="GatewayBasePolicy", target=cert_arn)
-            except: pass
-            try: iot.detach_thing_principal(thingName=thing_name, principal=cert_arn)
-            except: pass
-            try: iot.update_certificate(certificateId=cert_id, newStatus="REVOKED")
-            except: pass
-            try: iot.delete_certificate(certificateId=cert_id)
-            except: pass
-            try: iot.delete_thing(thingName=thing_name)
-            except: pass
-            raise
+        ratelimit.call(_limiters, "AttachPolicy", iot.attach_policy, policyName=POLICY_NAME, target=cert_arn)
+        ratelimit.call(
+            _limiters, "AttachThingPrincipal", iot.attach_thing_principal, thingName=thing_name, principal=cert_arn
+        )
 
         # --- Código de activación ---
-        activation_code = None
         for _ in range(10):
             code = _generate_activation_code()
             try:
@@ -128,9 +209,12 @@ def main(event, context):
                 "displayName": "unassigned",
                 "role": "Gateway",
                 "lifecycleStatus": lifecycle_status,
-                "lifecycleBucket": _bucket_for_expiry(expires_at, lifecycle_status),
+                "lifecycleBucket": _bucket_for_expiry(expires_at, lifecycle_status, thing_name),
                 "certificateArn": cert_arn,
                 "certificateId": cert_id,
+                # Creado con setAsActive=True
+                "certificateStatus": certificates.ACTIVE,
+                "certificateStatusAt": now,
                 "createdAt": now,
                 "lastRenewalDate": None,
                 "expiredAt": None,
@@ -138,17 +222,41 @@ def main(event, context):
             },
             ConditionExpression="attribute_not_exists(thingName)",
         )
+    except Exception:
+        _cleanup_device(thing_name, cert_arn, cert_id, activation_code)
+        raise
 
-        return {
-            "status": "ok",
-            "thingName": thing_name,
-            "activationCode": activation_code,
-            "certificatePem": cert["certificatePem"],
-            "privateKey": cert["keyPair"]["PrivateKey"],
-            "publicKey": cert["keyPair"]["PublicKey"],
-            "gatewayTopic": "gateway/data/telemetry/" + thing_name,
-        }
+    return {
+        "thingName": thing_name,
+        "activationCode": activation_code,
+        "certificatePem": cert["certificatePem"],
+        "privateKey": cert["keyPair"]["PrivateKey"],
+        "publicKey": cert["keyPair"]["PublicKey"],
+        "gatewayTopic": "gateway/data/telemetry/" + thing_name,
+    }
+
+
+def _cleanup_device(thing_name, cert_arn=None, cert_id=None, activation_code=None):
+    """Cleanup defensivo de un dispositivo a medias: cada paso es best-effort."""
+    steps = []
+    if cert_arn:
+        steps += [
+            ("DetachPolicy", iot.detach_policy, {"policyName": POLICY_NAME, "target": cert_arn}),
+            ("DetachThingPrincipal", iot.detach_thing_principal, {"thingName": thing_name, "principal": cert_arn}),
+            ("UpdateCertificate", iot.update_certificate, {"certificateId": cert_id, "newStatus": "REVOKED"}),
+            ("DeleteCertificate", iot.delete_certificate, {"certificateId": cert_id}),
+        ]
+    steps.append(("DeleteThing", iot.delete_thing, {"thingName": thing_name}))
+
+    for api, fn, kwargs in steps:
+        try:
+            ratelimit.call(_limiters, api, fn, **kwargs)
+        except Exception as e:
+            logger.warning("device cleanup step failed", thingName=thing_name, api=api, error=str(e))
+
+    if activation_code:
+        try:
+            activation_table.delete_item(Key={"code": activation_code})
+        except Exception as e:
+            logger.warning("device cleanup step failed", thingName=thing_name, api="DeleteItem", error=str(e))
 
-    except Exception as e:
-        print("DeviceFactory error:", str(e))
-        return {"status": "error", "message": str(e)}
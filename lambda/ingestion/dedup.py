@@ -0,0 +1,210 @@
+import os
+import time
+from array import array
+
+# Supresion de lecturas duplicadas (meshId, event_ts, nodeId) por contenedor.
+# Los reintentos QoS1 del gateway llegan como records nuevos con el mismo
+# contenido; se filtran con un filtro probabilistico por ventana de tiempo.
+# Sin parseo (fast path) la clave es el record: (meshId, event_ts, bytes del
+# gateway), asi que solo se detectan reenvios exactos.
+WINDOW_SECONDS = int(os.environ.get("DEDUP_WINDOW_SECONDS", "900"))
+CAPACITY = int(os.environ.get("DEDUP_CAPACITY", "500000"))
+MAX_BYTES = int(os.environ.get("DEDUP_MAX_BYTES", str(8 * 1024 * 1024)))
+
+SLOTS = 4
+# Sin reubicaciones el primer bucket doble lleno aparece hacia ~60% de carga
+MAX_LOAD = 0.5
+
+
+class FingerprintFilter:
+    """
+    Tabla de fingerprints de 16 bits en buckets de SLOTS, con dos buckets
+    candidatos por clave (un cuckoo filter sin reubicaciones).
+
+    - Falso positivo por filtro <= 2 * SLOTS / 2**16 (~1.2e-4), sin importar
+      la carga (WindowedDedup consulta dos filtros: ~2.4e-4).
+    - Sin falsos negativos mientras la clave este en la tabla.
+    - 2 bytes por slot (~4 bytes por clave); `max_bytes` acota la memoria y
+      con ella la capacidad.
+
+    Se usa hash() de Python: el salt es por proceso, y el filtro tambien.
+    """
+
+    FALSE_POSITIVE_RATE = 2 * SLOTS / 2 ** 16
+
+    def __init__(self, capacity: int, max_bytes: int = None):
+        buckets = max(1, int(capacity / (SLOTS * MAX_LOAD)) + 1)
+        if max_bytes:
+            buckets = max(1, min(buckets, max_bytes // (2 * SLOTS)))
+
+        self.buckets = buckets
+        self.capacity = int(buckets * SLOTS * MAX_LOAD)
+        self.table = array("H", bytes(2 * SLOTS * buckets))
+        self.count = 0
+        # ambos buckets llenos: la tabla ya no puede recordar claves nuevas
+        self.full = False
+
+    def _locate(self, key):
+        try:
+            h = hash(key)
+        except TypeError:
+            h = hash(repr(key))
+
+        fp = (h >> 48) & 0xFFFF or 1
+        i1 = (h & 0xFFFFFF) % self.buckets * SLOTS
+        i2 = ((h >> 24) & 0xFFFFFF) % self.buckets * SLOTS
+        return fp, i1, i2
+
+    def contains(self, key) -> bool:
+        fp, i1, i2 = self._locate(key)
+        table = self.table
+        return fp in table[i1:i1 + SLOTS] or fp in table[i2:i2 + SLOTS]
+
+    def add(self, key) -> bool:
+        """Agrega la clave; devuelve True si (probablemente) ya estaba."""
+        fp, i1, i2 = self._locate(key)
+        table = self.table
+
+        b1 = table[i1:i1 + SLOTS]
+        if fp in b1:
+            return True
+        b2 = table[i2:i2 + SLOTS]
+        if fp in b2:
+            return True
+
+        # Los slots se llenan de izquierda a derecha (no hay borrados)
+        free1 = b1.count(0)
+        free2 = b2.count(0)
+        if free1 and free1 >= free2:
+            table[i1 + SLOTS - free1] = fp
+        elif free2:
+            table[i2 + SLOTS - free2] = fp
+        else:
+            self.full = True
+            return False
+
+        self.count += 1
+        return False
+
+
+class WindowedDedup:
+    """
+    Dos generaciones de filtro: la actual y la anterior. Se rota al cerrar la
+    ventana o al llenar la capacidad, asi una clave se recuerda entre 1 y 2
+    ventanas y la memoria total queda en `max_bytes`.
+
+    Cada consulta mira ambas generaciones, asi que el falso positivo es hasta
+    el doble que el de un filtro: <= 4 * SLOTS / 2**16 (~2.4e-4).
+    """
+
+    FALSE_POSITIVE_RATE = 2 * FingerprintFilter.FALSE_POSITIVE_RATE
+
+    def __init__(self, window_seconds: int, capacity: int, max_bytes: int, clock=time.time):
+        self.window_seconds = window_seconds
+        self.capacity = capacity
+        # memoria total: dos generaciones
+        self.max_bytes = max_bytes // 2
+        self._clock = clock
+        self._previous = None
+        self._current = self._new_filter()
+        self._window_end = clock() + window_seconds
+
+    def _new_filter(self) -> FingerprintFilter:
+        return FingerprintFilter(self.capacity, self.max_bytes)
+
+    def _rotate(self):
+        now = self._clock()
+        current = self._current
+        if now >= self._window_end or current.full or current.count >= current.capacity:
+            # Si paso mas de una ventana la anterior ya no sirve
+            stale = now >= self._window_end + self.window_seconds
+            self._previous = None if stale else current
+            self._current = self._new_filter()
+            self._window_end = now + self.window_seconds
+
+    def contains(self, key) -> bool:
+        self._rotate()
+        previous = self._previous
+        if previous is not None and previous.contains(key):
+            return True
+        return self._current.contains(key)
+
+    def add(self, key) -> bool:
+        """Agrega la clave a la generacion actual; True si (probablemente) ya estaba."""
+        self._rotate()
+        if self._current.add(key):
+            return True
+        if self._current.full:
+            # La clave no entro: rota y la guarda en la generacion nueva
+            self._rotate()
+            self._current.add(key)
+        return False
+
+    def seen(self, key) -> bool:
+        return self.contains(key) or self.add(key)
+
+    def memory_bytes(self) -> int:
+        size = self._current.table.itemsize * len(self._current.table)
+        if self._previous is not None:
+            size += self._previous.table.itemsize * len(self._previous.table)
+        return size
+
+
+_filter = WindowedDedup(WINDOW_SECONDS, CAPACITY, MAX_BYTES)
+
+# Claves vistas en la invocacion en curso. Entran al filtro solo cuando la
+# invocacion termina bien (commit): si falla o vence el timeout, Firehose
+# reintenta el lote con los mismos records y el filtro todavia no los tiene,
+# asi que un reintento nunca se descarta contra su propio primer intento.
+_pending = set()
+
+
+def begin():
+    """Inicio de invocacion: descarta lo pendiente de una invocacion fallida."""
+    _pending.clear()
+
+
+def commit():
+    """Fin de invocacion: las claves del lote pasan al filtro."""
+    add = _filter.add
+    for key in _pending:
+        add(key)
+    _pending.clear()
+
+
+def _seen(key) -> bool:
+    if key in _pending or _filter.contains(key):
+        return True
+    _pending.add(key)
+    return False
+
+
+def drop_duplicates(mesh_id: str, data: dict) -> int:
+    """
+    Quita de data["readings"] las lecturas ya vistas en la ventana (o antes
+    en el mismo lote) y devuelve cuantas quito.
+    """
+    readings = data.get("readings")
+    if not isinstance(readings, list) or not readings:
+        return 0
+
+    event_ts = data.get("event_ts")
+    seen = _seen
+    kept = [
+        r for r in readings
+        if not isinstance(r, dict) or not seen((mesh_id, event_ts, r.get("nodeId")))
+    ]
+
+    dropped = len(readings) - len(kept)
+    if dropped:
+        data["readings"] = kept
+    return dropped
+
+
+def is_resent(mesh_id: str, event_ts, body: bytes) -> bool:
+    """
+    True si el record ya se vio en la ventana. `body` son los bytes que
+    publico el gateway, sin los campos que agrega la IoT Rule (ingestedAt
+    cambia en cada reenvio).
+    """
+    return _seen((mesh_id, event_ts, body))
@@ -0,0 +1,92 @@
+import os
+import time
+
+from akame_common import clients
+from akame_common.cache import MISSING, TTLCache
+
+# Filtro de entitlements: la telemetria de gateways vencidos o revocados no
+# llega a S3. meshId == thingName del gateway (topic(4) en el IoT Rule).
+TABLE_NAME = os.environ.get("DEVICE_METADATA_TABLE", "")
+CACHE_TTL_SECONDS = int(os.environ.get("ENTITLEMENT_CACHE_TTL_SECONDS", "60"))
+CACHE_MAX_ENTRIES = int(os.environ.get("ENTITLEMENT_CACHE_MAX_ENTRIES", "10000"))
+
+BATCH_GET_LIMIT = 100
+MAX_UNPROCESSED_RETRIES = 5
+
+dynamodb = clients.resource("dynamodb")
+
+# status por meshId: True = puede enviar telemetria
+_cache = TTLCache(maxsize=CACHE_MAX_ENTRIES, ttl=CACHE_TTL_SECONDS)
+
+
+def entitled(mesh_ids, now: int = None) -> dict:
+    """
+    {meshId: bool} para los meshId dados. Solo los que no estan en cache se
+    leen de DynamoDB, con un BatchGetItem por cada 100 ids distintos.
+    """
+    now = int(time.time()) if now is None else now
+    result = {}
+    pending = []
+
+    for mesh_id in set(mesh_ids):
+        cached = _cache.get(mesh_id)
+        if cached is MISSING:
+            pending.append(mesh_id)
+        else:
+            result[mesh_id] = cached
+
+    if pending:
+        items = _batch_get(pending)
+        for mesh_id in pending:
+            allowed, ttl = _evaluate(items.get(mesh_id), now)
+            _cache.set(mesh_id, allowed, ttl)
+            result[mesh_id] = allowed
+
+    return result
+
+
+def cache_stats() -> dict:
+    return _cache.stats()
+
+
+def _evaluate(item, now: int):
+    """(permitido, ttl en cache). Un gateway activo no se cachea mas alla de su expiresAt."""
+    if not item:
+        return False, CACHE_TTL_SECONDS
+
+    expires_at = int(item.get("expiresAt", 0))
+    status = item.get("status", "inactive")
+
+    # Misma condicion que el authorizer
+    if now > expires_at or status != "active":
+        return False, CACHE_TTL_SECONDS
+
+    return True, min(CACHE_TTL_SECONDS, expires_at - now)
+
+
+def _batch_get(mesh_ids) -> dict:
+    items = {}
+
+    for i in range(0, len(mesh_ids), BATCH_GET_LIMIT):
+        request = {
+            TABLE_NAME: {
+                "Keys": [{"thingName": m} for m in mesh_ids[i:i + BATCH_GET_LIMIT]],
+                "ProjectionExpression": "thingName, #s, expiresAt",
+                "ExpressionAttributeNames": {"#s": "status"},
+            }
+        }
+
+        for attempt in range(MAX_UNPROCESSED_RETRIES + 1):
+            resp = dynamodb.batch_get_item(RequestItems=request)
+
+            for item in resp.get("Responses", {}).get(TABLE_NAME, []):
+                items[item["thingName"]] = item
+
+            request = resp.get("UnprocessedKeys") or {}
+            if not request:
+                break
+            if attempt == MAX_UNPROCESSED_RETRIES:
+                raise RuntimeError("BatchGetItem left unprocessed keys")
+            time.sleep(0.05 * 2 ** attempt)
+
+    return items
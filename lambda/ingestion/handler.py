@@ -1,10 +1,484 @@
 import base64
 import json
+import os
+import re
+import time
 
+import validation
+from akame_common import log
+from akame_common.partitions import hour_partition, partition_ts
+
+# "batch": extrae meshId y event_ts con un escaneo acotado sobre los bytes del payload
+# "legacy": json.loads completo de cada record (comportamiento original)
+TRANSFORM_MODE = os.environ.get("TRANSFORM_MODE", "batch")
+
+# "raw": se entrega el payload original
+# "flat": una fila JSON por lectura (nodeId) para la tabla telemetry_flat
+TRANSFORM_OUTPUT = os.environ.get("TRANSFORM_OUTPUT", "raw")
+
+# Validacion + coercion de tipos contra el schema de las lecturas (el mismo
+# que el struct Glue de telemetry_raw, lo inyecta TelemetryIngestionStack)
+VALIDATE_PAYLOADS = os.environ.get("VALIDATE_PAYLOADS", "false").lower() == "true"
+READING_SCHEMA = json.loads(os.environ.get("READING_SCHEMA", "{}"))
+
+if VALIDATE_PAYLOADS and not READING_SCHEMA:
+    raise RuntimeError("READING_SCHEMA environment variable is not set")
+
+# Compilado una vez por contenedor
+COMPILED_SCHEMA = validation.compile_schema(READING_SCHEMA)
+
+# Descarta telemetria de gateways vencidos/revocados (DeviceMetadata)
+ENFORCE_ENTITLEMENTS = os.environ.get("ENFORCE_ENTITLEMENTS", "false").lower() == "true"
+
+if ENFORCE_ENTITLEMENTS:
+    # Solo si hace falta (cold start); el cliente se crea en el primer lote
+    import entitlements
+
+# Supresion de lecturas duplicadas (reintentos QoS1). Con el payload parseado
+# es por lectura; en el fast path, por record (reenvios exactos)
+DEDUP_ENABLED = os.environ.get("DEDUP_ENABLED", "false").lower() == "true"
+
+if DEDUP_ENABLED:
+    import dedup
+
+# Agregados parciales minuto/hora escritos en ROLLUP_BUCKET (solo el stream RAW)
+ROLLUPS_ENABLED = os.environ.get("ROLLUPS_ENABLED", "false").lower() == "true"
+
+if ROLLUPS_ENABLED:
+    import rollups
+
+# El fast path (escaneo de meshId/event_ts) solo sirve si nada necesita el payload
+# parseado: la validacion y los rollups lo necesitan, el dedup no
+PARSE_PAYLOADS = VALIDATE_PAYLOADS or ROLLUPS_ENABLED
+
+logger = log.get_logger("telemetry_transform")
+
+MESH_ID_KEY = b'"meshId"'
+MAX_MESH_ID_LEN = 128
+EVENT_TS_KEY = b'"event_ts"'
+MAX_EVENT_TS_LEN = 16
+
+# Particion S3 por hora de event_ts (ver akame_common.partitions.partition_ts)
+MAX_CLOCK_SKEW_SECONDS = int(os.environ.get("MAX_CLOCK_SKEW_SECONDS", "3600"))
+
+_BRACKETS = re.compile(rb"[\[\]{}]")
+_BACKSLASH = 0x5C
+_COLON = 0x3A
+_QUOTE = 0x22
+_WHITESPACE = b" \t\r\n"
+_DIGITS = b"0123456789"
+_VALUE_END = b" \t\r\n,}"
+
+# Detalle del lote en curso (rechazos, duplicados, entitlements) para el
+# resumen: una sola linea de log por invocacion
+_report = {}
+# hora (epoch // 3600) -> keys de particion, por lote
+_hour_keys = {}
+# metrica fuera del schema -> lecturas de las que se quito, por lote
+_unknown_metrics = {}
+
+
+@log.invocation
 def handler(event, context):
+    _report.clear()
+    _hour_keys.clear()
+    _unknown_metrics.clear()
+    if DEDUP_ENABLED:
+        dedup.begin()
+    # recordId -> (meshId, data) de los records parseados, para los rollups
+    parsed = {} if ROLLUPS_ENABLED else None
+
+    if TRANSFORM_OUTPUT == "flat":
+        output = _transform_flat(event["records"], parsed)
+    elif TRANSFORM_MODE == "legacy":
+        output = _transform_legacy(event["records"])
+    else:
+        output = _transform_batch(event["records"], parsed)
+
+    if ENFORCE_ENTITLEMENTS:
+        _filter_entitlements(output)
+
+    if parsed:
+        _write_rollups(output, parsed)
+
+    # Al final: si algo antes falla, el reintento de Firehose no es duplicado
+    if DEDUP_ENABLED:
+        dedup.commit()
+
+    _report_batch(output)
+    return {"records": output}
+
+
+def _report_batch(output):
+    """Resumen del lote: Ok / Dropped / ProcessingFailed mas el detalle."""
+    counts = {"Ok": 0, "Dropped": 0, "ProcessingFailed": 0}
+    for r in output:
+        counts[r["result"]] += 1
+
+    # ProcessingFailed va al prefijo de errores de Firehose: merece warning
+    emit = logger.warning if counts["ProcessingFailed"] else logger.info
+    emit(
+        "batch",
+        records=len(output),
+        ok=counts["Ok"],
+        dropped=counts["Dropped"],
+        failed=counts["ProcessingFailed"],
+        **_report,
+    )
+
+
+# ---------- Rollups ----------
+
+def _write_rollups(output, parsed):
+    """Agregados de los records que efectivamente llegan a S3 (result Ok)."""
+    record_ids = [r["recordId"] for r in output if r["result"] == "Ok" and r["recordId"] in parsed]
+    if record_ids:
+        rollups.write([parsed[i] for i in record_ids], rollups.batch_id(record_ids))
+
+
+# ---------- Entitlements ----------
+
+def _filter_entitlements(output):
+    """
+    Marca como Dropped los records Ok de gateways sin entitlement. Una sola
+    consulta por meshId distinto del lote (y solo si no esta en cache).
+    """
+    mesh_ids = {
+        r["metadata"]["partitionKeys"]["meshId"]
+        for r in output
+        if r["result"] == "Ok"
+    }
+    if not mesh_ids:
+        return
+
+    allowed = entitlements.entitled(mesh_ids)
+    _report["meshIds"] = len(mesh_ids)
+    dropped = {}
+
+    for i, r in enumerate(output):
+        if r["result"] != "Ok":
+            continue
+        mesh_id = r["metadata"]["partitionKeys"]["meshId"]
+        if not allowed.get(mesh_id):
+            dropped[mesh_id] = dropped.get(mesh_id, 0) + 1
+            output[i] = _dropped(r["recordId"], r["data"])
+
+    if dropped:
+        _report["notEntitled"] = dropped
+    _report["entitlementCache"] = entitlements.cache_stats()
+
+
+# ---------- Batch mode ----------
+
+def _transform_batch(records, parsed=None):
     output = []
+    append = output.append
+    b64decode = base64.b64decode
+    rejected = {}
+    duplicates = [0, 0]
 
-    for record in event["records"]:
+    for record in records:
+        raw_data = record["data"]
+
+        try:
+            payload = b64decode(raw_data)
+
+            if PARSE_PAYLOADS:
+                data, changed = _parse(payload)
+                mesh_id = data.get("meshId", "unknown")
+                event_ts = data.get("event_ts")
+
+                if DEDUP_ENABLED and _drop_duplicates(mesh_id, data, duplicates):
+                    if not data["readings"]:
+                        duplicates[1] += 1
+                        append(_dropped(record["recordId"], raw_data))
+                        continue
+                    changed = True
+
+                if changed:
+                    raw_data = base64.b64encode(_dumps(data)).decode()
+                if parsed is not None:
+                    parsed[record["recordId"]] = (mesh_id, data)
+            else:
+                scanned = _scan_record(payload)
+
+                # Escaneo ambiguo: caemos al parseo completo
+                if scanned is None:
+                    data = json.loads(payload)
+                    mesh_id, event_ts = data.get("meshId", "unknown"), data.get("event_ts")
+
+                    if DEDUP_ENABLED and _drop_duplicates(mesh_id, data, duplicates):
+                        if not data["readings"]:
+                            duplicates[1] += 1
+                            append(_dropped(record["recordId"], raw_data))
+                            continue
+                        raw_data = base64.b64encode(_dumps(data)).decode()
+                else:
+                    mesh_id, event_ts = scanned
+
+                    if DEDUP_ENABLED and _resent(mesh_id, event_ts, payload, duplicates):
+                        append(_dropped(record["recordId"], raw_data))
+                        continue
+
+            append(_ok(record["recordId"], raw_data, mesh_id, event_ts))
+
+        except validation.ValidationError as e:
+            rejected[e.reason] = rejected.get(e.reason, 0) + 1
+            append(_failed(record["recordId"], raw_data))
+
+        except Exception:
+            if VALIDATE_PAYLOADS:
+                rejected[validation.INVALID_JSON] = rejected.get(validation.INVALID_JSON, 0) + 1
+            append(_failed(record["recordId"], raw_data))
+
+    _report_rejected(rejected)
+    _report_duplicates(duplicates)
+    return output
+
+
+def _parse(payload: bytes):
+    if VALIDATE_PAYLOADS:
+        return _parse_valid(payload)
+    return json.loads(payload), False
+
+
+def _parse_valid(payload: bytes):
+    """
+    Parsea y valida el payload. Devuelve (data, changed); changed indica que
+    la coercion modifico el contenido y hay que re-serializarlo.
+    """
+    try:
+        data = json.loads(payload, parse_constant=_reject_constant)
+    except ValueError:
+        raise validation.ValidationError(validation.INVALID_JSON)
+
+    return data, validation.validate(data, COMPILED_SCHEMA, _unknown_metrics)
+
+
+def _reject_constant(name):
+    # NaN / Infinity no son JSON valido para Athena
+    raise ValueError(name)
+
+
+def _report_rejected(rejected: dict):
+    if rejected:
+        _report["rejected"] = rejected
+    if _unknown_metrics:
+        _report["unknownMetrics"] = dict(_unknown_metrics)
+
+
+def _drop_duplicates(mesh_id, data, duplicates) -> int:
+    dropped = dedup.drop_duplicates(mesh_id, data)
+    duplicates[0] += dropped
+    return dropped
+
+
+def _resent(mesh_id, event_ts, payload, duplicates) -> bool:
+    body = _gateway_body(payload)
+    if body is None or not dedup.is_resent(mesh_id, event_ts, body):
+        return False
+    duplicates[1] += 1
+    return True
+
+
+def _gateway_body(payload: bytes):
+    """
+    Bytes del payload hasta el ultimo objeto/array anidado (las lecturas), o
+    None si no hay. Lo que sigue son escalares de primer nivel, entre ellos
+    los que agrega la IoT Rule. Solo vale tras un _scan_record exitoso.
+    """
+    last = payload.rfind(b"}")
+    end = max(payload.rfind(b"]", 0, last), payload.rfind(b"}", 0, last))
+    return payload[:end + 1] if end >= 0 else None
+
+
+def _report_duplicates(duplicates):
+    if duplicates[0] or duplicates[1]:
+        _report["duplicateReadings"] = duplicates[0]
+        _report["droppedRecords"] = duplicates[1]
+
+
+def _scan_mesh_id(payload: bytes):
+    """
+    Devuelve el valor de "meshId" sin decodificar el JSON, o None cuando
+    el escaneo no es concluyente y hay que parsear: clave ausente o repetida,
+    valor que no es un string simple (escapes, longitud fuera de rango),
+    clave que no es de primer nivel o payload que no cierra como un objeto.
+
+    Es conservador: solo acepta la clave de primer nivel despues del ultimo
+    objeto/array anidado, que es donde la IoT Rule la agrega
+    (SELECT *, ..., topic(4) AS meshId). No valida el resto del JSON mas
+    alla de llaves y corchetes balanceados: un payload truncado cae al
+    parseo completo (y a ProcessingFailed), uno con otra sintaxis invalida
+    no. La IoT Rule siempre emite JSON valido.
+    """
+    found = _scan_string(payload, MESH_ID_KEY, MAX_MESH_ID_LEN)
+    if found is None or not _top_level_tail(payload, found[1]):
+        return None
+    return found[0]
+
+
+def _scan_record(payload: bytes):
+    """
+    (meshId, event_ts) del fast path, o None si hay que parsear. event_ts
+    tiene las mismas reglas que meshId (ver _scan_mesh_id) y ademas debe
+    ser un entero sin signo: la IoT Rule lo agrega como
+    `timestamp AS event_ts` antes de meshId.
+    """
+    mesh = _scan_string(payload, MESH_ID_KEY, MAX_MESH_ID_LEN)
+    if mesh is None:
+        return None
+    event_ts = _scan_int(payload, EVENT_TS_KEY, MAX_EVENT_TS_LEN)
+    if event_ts is None:
+        return None
+    if not _top_level_tail(payload, min(mesh[1], event_ts[1])):
+        return None
+    return mesh[0], event_ts[0]
+
+
+def _scan_value(payload: bytes, key: bytes):
+    """Posicion del valor de `key` (clave unica y sin escapar), o None."""
+    pos = payload.find(key)
+    if pos < 0:
+        return None
+
+    end_key = pos + len(key)
+    if payload.find(key, end_key) >= 0:
+        return None
+    if pos > 0 and payload[pos - 1] == _BACKSLASH:
+        return None
+
+    n = len(payload)
+    i = end_key
+    while i < n and payload[i] in _WHITESPACE:
+        i += 1
+    if i >= n or payload[i] != _COLON:
+        return None
+
+    i += 1
+    while i < n and payload[i] in _WHITESPACE:
+        i += 1
+    return i if i < n else None
+
+
+def _scan_string(payload: bytes, key: bytes, max_len: int):
+    """(valor, posicion tras el valor) de un string simple, o None."""
+    i = _scan_value(payload, key)
+    if i is None or payload[i] != _QUOTE:
+        return None
+
+    start = i + 1
+    end = payload.find(b'"', start, start + max_len + 1)
+    if end <= start:
+        return None
+
+    value = payload[start:end]
+    if _BACKSLASH in value:
+        return None
+
+    try:
+        return value.decode("utf-8"), end + 1
+    except UnicodeDecodeError:
+        return None
+
+
+def _scan_int(payload: bytes, key: bytes, max_len: int):
+    """(valor, posicion tras el valor) de un entero sin signo, o None."""
+    start = _scan_value(payload, key)
+    if start is None:
+        return None
+
+    n = min(len(payload), start + max_len + 1)
+    end = start
+    while end < n and payload[end] in _DIGITS:
+        end += 1
+    # 1.5, 1e3, -1, demasiado largo: lo resuelve el parseo completo
+    if end == start or end >= len(payload) or payload[end] not in _VALUE_END:
+        return None
+    return int(payload[start:end]), end
+
+
+def _top_level_tail(payload: bytes, start: int) -> bool:
+    """
+    True si `payload` es un objeto con llaves y corchetes balanceados y
+    entre `start` y la llave final no hay ninguno: lo que esta en `start`
+    pertenece al objeto de primer nivel.
+    """
+    body = payload.strip()
+    if body[:1] != b"{" or body[-1:] != b"}":
+        return False
+    if payload.count(b"{") != payload.count(b"}") or payload.count(b"[") != payload.count(b"]"):
+        return False
+    last = payload.rfind(b"}")
+    return _BRACKETS.search(payload, start, last) is None
+
+
+# ---------- Flat output ----------
+
+def _transform_flat(records, parsed=None):
+    output = []
+    append = output.append
+    b64decode = base64.b64decode
+    b64encode = base64.b64encode
+    rejected = {}
+    duplicates = [0, 0]
+
+    for record in records:
+        raw_data = record["data"]
+
+        try:
+            data, _ = _parse(b64decode(raw_data))
+
+            mesh_id = data.get("meshId", "unknown")
+            if DEDUP_ENABLED and _drop_duplicates(mesh_id, data, duplicates):
+                if not data["readings"]:
+                    duplicates[1] += 1
+
+            rows = _flatten(data, mesh_id)
+
+            if rows is None:
+                append(_dropped(record["recordId"], raw_data))
+            else:
+                append(_ok(record["recordId"], b64encode(rows).decode(), mesh_id, data.get("event_ts")))
+                if parsed is not None:
+                    parsed[record["recordId"]] = (mesh_id, data)
+
+        except validation.ValidationError as e:
+            rejected[e.reason] = rejected.get(e.reason, 0) + 1
+            append(_failed(record["recordId"], raw_data))
+
+        except Exception:
+            append(_failed(record["recordId"], raw_data))
+
+    _report_rejected(rejected)
+    _report_duplicates(duplicates)
+    return output
+
+
+def _flatten(data: dict, mesh_id: str):
+    """Filas JSON (una por lectura) separadas por newline, o None si no hay lecturas."""
+    stamp = {
+        "meshId": mesh_id,
+        "event_ts": data.get("event_ts"),
+        "ingestedAt": data.get("ingestedAt"),
+    }
+    dumps = json.dumps
+    lines = [
+        dumps({**reading, **stamp}, separators=(",", ":"))
+        for reading in data.get("readings") or ()
+        if isinstance(reading, dict)
+    ]
+    if not lines:
+        return None
+    return ("\n".join(lines) + "\n").encode()
+
+
+# ---------- Legacy mode ----------
+
+def _transform_legacy(records):
+    output = []
+
+    for record in records:
         raw_data = record["data"]
 
         try:
@@ -15,26 +489,59 @@ def handler(event, context):
             # meshId viene del IoT Rule
             mesh_id = data.get("meshId", "unknown")
 
-            transformed_record = {
-                "recordId": record["recordId"],
-                "result": "Ok",
-                # retornamos EXACTAMENTE el payload original
-                "data": raw_data,
-                "metadata": {
-                    "partitionKeys": {
-                        "meshId": mesh_id
-                    }
-                }
-            }
+            transformed_record = _ok(record["recordId"], raw_data, mesh_id, data.get("event_ts"))
 
-        except Exception as e:
+        except Exception:
             # Si un record falla, no detenemos el lote
-            transformed_record = {
-                "recordId": record["recordId"],
-                "result": "ProcessingFailed",
-                "data": raw_data
-            }
+            transformed_record = _failed(record["recordId"], raw_data)
 
         output.append(transformed_record)
 
-    return {"records": output}
+    return output
+
+
+# ---------- Helpers ----------
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def _ok(record_id, raw_data, mesh_id, event_ts):
+    return {
+        "recordId": record_id,
+        "result": "Ok",
+        # retornamos EXACTAMENTE el payload original
+        "data": raw_data,
+        "metadata": {
+            "partitionKeys": {
+                "meshId": mesh_id,
+                **_event_hour(event_ts),
+            }
+        }
+    }
+
+
+def _event_hour(event_ts) -> dict:
+    """Keys year/month/day/hour de event_ts, o de la llegada si no es usable."""
+    hour = partition_ts(event_ts, time.time(), MAX_CLOCK_SKEW_SECONDS) // 3600
+    keys = _hour_keys.get(hour)
+    if keys is None:
+        year, month, day, hh = hour_partition(hour * 3600)
+        keys = _hour_keys[hour] = {"year": year, "month": month, "day": day, "hour": hh}
+    return keys
+
+
+def _dropped(record_id, raw_data):
+    return {
+        "recordId": record_id,
+        "result": "Dropped",
+        "data": raw_data
+    }
+
+
+def _failed(record_id, raw_data):
+    return {
+        "recordId": record_id,
+        "result": "ProcessingFailed",
+        "data": raw_data
+    }
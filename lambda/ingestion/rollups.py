@@ -0,0 +1,201 @@
+import gzip
+import hashlib
+import json
+import os
+import time
+
+from botocore.exceptions import ClientError
+
+from akame_common import clients
+from akame_common.partitions import epoch_seconds, hour_partition
+
+# Agregados parciales (count/sum/min/max) por (meshId, nodeId, metrica,
+# minuto/hora), escritos junto a la telemetria RAW. Son mergeables: la
+# tabla telemetry_rollups se consulta con sum(count), sum(sum), min, max.
+#
+# Una fila por (meshid, nodeid, bucket_ts) con todas las metricas:
+#   {"meshid": "gw_1", "nodeid": 3, "bucket_ts": 1760698800,
+#    "metrics": {"humidity": [count, sum, min, max], ...}}
+ROLLUP_BUCKET = os.environ.get("ROLLUP_BUCKET", "")
+ROLLUP_PREFIX = os.environ.get("ROLLUP_PREFIX", "rollups/")
+
+GRANULARITY_SECONDS = {"minute": 60, "hour": 3600}
+GRANULARITIES = sorted(
+    (g for g in os.environ.get("ROLLUP_GRANULARITIES", "minute,hour").split(",") if g in GRANULARITY_SECONDS),
+    key=GRANULARITY_SECONDS.get,
+)
+
+# Instante del primer lote con rollups. Lo escribe el primer contenedor que
+# llega (PUT condicional) antes de sus objetos y no se vuelve a tocar;
+# telemetry_aggregates lee de aqui el corte en vez de un valor a mano.
+MARKER_KEY = os.environ.get("ROLLUP_MARKER_KEY", f"{ROLLUP_PREFIX}_since.json")
+
+_NUMBER = (int, float)
+_marked = False
+
+s3 = clients.client("s3")
+
+
+def aggregate(items, seconds: int) -> dict:
+    """
+    items: (meshId, data) ya validados/deduplicados.
+    -> {(meshId, nodeId, bucket_ts): {metrica: [count, sum, min, max]}}
+    """
+    aggs = {}
+    get = aggs.get
+
+    for mesh_id, data in items:
+        event_ts = data.get("event_ts")
+        readings = data.get("readings")
+        if event_ts is None or not isinstance(readings, list):
+            continue
+
+        try:
+            bucket = epoch_seconds(event_ts) // seconds * seconds
+        except (TypeError, ValueError):
+            continue
+
+        for reading in readings:
+            if not isinstance(reading, dict):
+                continue
+
+            node_id = reading.get("nodeId")
+            if type(node_id) is not int:
+                # nodeid es int en telemetry_rollups
+                continue
+
+            key = (mesh_id, node_id, bucket)
+            metrics = get(key)
+            if metrics is None:
+                # Caso comun: primera lectura del nodo en el bucket dentro del lote
+                aggs[key] = {
+                    m: [1, v, v, v]
+                    for m, v in reading.items()
+                    # v - v == 0 descarta NaN/Infinity (sin validacion)
+                    if m != "nodeId" and type(v) in _NUMBER and v - v == 0
+                }
+                continue
+
+            for m, v in reading.items():
+                if m == "nodeId" or type(v) not in _NUMBER or v - v != 0:
+                    continue
+                agg = metrics.get(m)
+                if agg is None:
+                    metrics[m] = [1, v, v, v]
+                else:
+                    _merge(agg, (1, v, v, v))
+
+    return aggs
+
+
+def coarsen(aggs: dict, seconds: int) -> dict:
+    """Re-agrega a buckets de `seconds` (p.ej. minuto -> hora)."""
+    merged = {}
+
+    for (mesh_id, node_id, bucket), metrics in aggs.items():
+        key = (mesh_id, node_id, bucket // seconds * seconds)
+        current = merged.get(key)
+        if current is None:
+            merged[key] = {m: list(agg) for m, agg in metrics.items()}
+            continue
+        for m, agg in metrics.items():
+            if m in current:
+                _merge(current[m], agg)
+            else:
+                current[m] = list(agg)
+
+    return merged
+
+
+def _merge(into: list, other):
+    into[0] += other[0]
+    into[1] += other[1]
+    if other[2] < into[2]:
+        into[2] = other[2]
+    if other[3] > into[3]:
+        into[3] = other[3]
+
+
+def rollups(items) -> dict:
+    """{granularidad: agregados}; las gruesas se derivan de la mas fina."""
+    result = {}
+    finest = None
+
+    for granularity in GRANULARITIES:
+        seconds = GRANULARITY_SECONDS[granularity]
+        finest = aggregate(items, seconds) if finest is None else coarsen(finest, seconds)
+        result[granularity] = finest
+
+    return result
+
+
+def write(items, batch_id: str) -> int:
+    """
+    Escribe un objeto gzip (JSON lines) por granularidad y hora. La key se
+    deriva de batch_id: si Firehose reintenta el lote, se sobrescribe en vez
+    de duplicar los conteos. Devuelve el numero de objetos escritos.
+
+    Son parciales por lote; la compactacion horaria los consolida en una fila
+    por (meshid, nodeid, bucket_ts).
+    """
+    hour = GRANULARITY_SECONDS["hour"]
+    dumps = json.dumps
+    objects = {}
+
+    for granularity, aggs in rollups(items).items():
+        for (mesh_id, node_id, bucket_ts), metrics in aggs.items():
+            if not metrics:
+                continue
+            objects.setdefault((granularity, bucket_ts // hour * hour), []).append(dumps({
+                "meshid": mesh_id,
+                "nodeid": node_id,
+                "bucket_ts": bucket_ts,
+                "metrics": metrics,
+            }, separators=(",", ":")))
+
+    if objects:
+        _mark_since()
+
+    for (granularity, hour_ts), lines in objects.items():
+        year, month, day, hh = hour_partition(hour_ts)
+        s3.put_object(
+            Bucket=ROLLUP_BUCKET,
+            Key=(
+                f"{ROLLUP_PREFIX}granularity={granularity}/"
+                f"year={year}/month={month}/day={day}/hour={hh}/{batch_id}.json.gz"
+            ),
+            # Nivel bajo: la compactacion recomprime al consolidar
+            Body=gzip.compress(("\n".join(lines) + "\n").encode(), compresslevel=1),
+            ContentType="application/json",
+        )
+
+    return len(objects)
+
+
+def _mark_since():
+    """Crea la marca si no existe; una vez por contenedor."""
+    global _marked
+    if _marked:
+        return
+    try:
+        s3.put_object(
+            Bucket=ROLLUP_BUCKET,
+            Key=MARKER_KEY,
+            Body=json.dumps({"since": int(time.time())}).encode(),
+            ContentType="application/json",
+            IfNoneMatch="*",
+        )
+    except ClientError as e:
+        # Ya la escribio otro contenedor (o un despliegue anterior)
+        if e.response["Error"]["Code"] not in ("PreconditionFailed", "ConditionalRequestConflict"):
+            raise
+    _marked = True
+
+
+def batch_id(record_ids) -> str:
+    """Id estable del lote (mismo conjunto de recordIds -> misma key)."""
+    digest = hashlib.sha1()
+    for record_id in sorted(record_ids):
+        digest.update(record_id.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
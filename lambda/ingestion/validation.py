@@ -0,0 +1,187 @@
+import math
+from functools import partial
+from itertools import chain, repeat
+from operator import is_not
+
+# Codigos de rechazo (se reportan por lote en los logs del transform)
+INVALID_JSON = "invalid_json"
+NOT_AN_OBJECT = "not_an_object"
+MISSING_MESH_ID = "missing_mesh_id"
+INVALID_TIMESTAMP = "invalid_timestamp"
+READINGS_NOT_LIST = "readings_not_list"
+READING_NOT_OBJECT = "reading_not_object"
+INVALID_TYPE = "invalid_type"
+OUT_OF_RANGE = "out_of_range"
+
+
+class ValidationError(Exception):
+    def __init__(self, reason: str, detail: str = ""):
+        super().__init__(f"{reason}: {detail}" if detail else reason)
+        self.reason = reason
+        self.detail = detail
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        raise ValueError("bool")
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError("not integral")
+        return int(value)
+    if isinstance(value, str):
+        text = value.strip()
+        try:
+            return int(text)
+        except ValueError:
+            return _to_int(float(text))
+    raise ValueError(type(value).__name__)
+
+
+def _to_float(value):
+    if isinstance(value, bool):
+        raise ValueError("bool")
+    if isinstance(value, str):
+        value = float(value.strip())
+    elif not isinstance(value, (int, float)):
+        raise ValueError(type(value).__name__)
+    if not math.isfinite(value):
+        raise ValueError("not finite")
+    return value
+
+
+_INT32 = (-2 ** 31, 2 ** 31 - 1)
+_INT64 = (-2 ** 63, 2 ** 63 - 1)
+
+# tipo Glue -> (tipos JSON que se aceptan sin tocar, coercion, rango o None)
+_GLUE_TYPES = {
+    "int": ((int,), _to_int, _INT32),
+    "bigint": ((int,), _to_int, _INT64),
+    "double": ((float, int), _to_float, None),
+}
+
+
+class CompiledSchema:
+    """
+    Schema de lecturas listo para validar: specs por campo para el camino
+    lento (coercion y errores) y los conjuntos que usa el camino rapido.
+    """
+
+    def __init__(self, specs: dict):
+        self.specs = specs
+        self.names = frozenset(specs)
+        # rango de los campos enteros; los double aceptan int y float
+        self.int_fields = tuple(
+            (name, spec[2]) for name, spec in specs.items() if spec[0] == (int,)
+        )
+
+
+def compile_schema(reading_schema: dict) -> CompiledSchema:
+    """{campo: tipo Glue} -> schema compilado (tipos aceptados, coercion, rango)."""
+    compiled = {}
+    for name, glue_type in reading_schema.items():
+        if glue_type not in _GLUE_TYPES:
+            raise ValueError(f"Unsupported reading type {name}:{glue_type}")
+        compiled[name] = _GLUE_TYPES[glue_type]
+    return CompiledSchema(compiled)
+
+
+# ---------- Camino rapido ----------
+# Un lote de lecturas ya valido (el caso normal) se comprueba con
+# operaciones de conjuntos que recorren los dicts en C, sin bucle Python por
+# valor ni asignaciones por lectura. Si algo no encaja se valida lectura a
+# lectura con el camino lento, que coerciona y reporta el error exacto.
+_DICT_ONLY = {dict}
+_PLAIN_TYPES = frozenset((int, float, type(None)))
+_not_none = partial(is_not, None)
+_values = dict.values
+_get = dict.get
+
+
+def _readings_clean(readings: list, compiled: CompiledSchema) -> bool:
+    if not readings:
+        return True
+    if set(map(type, readings)) != _DICT_ONLY:
+        return False
+    if not compiled.names.issuperset(set().union(*readings)):
+        return False
+    values = list(chain.from_iterable(map(_values, readings)))
+    if not _PLAIN_TYPES.issuperset(set(map(type, values))):
+        return False
+    for name, (low, high) in compiled.int_fields:
+        values = list(filter(_not_none, map(_get, readings, repeat(name))))
+        # un float en un campo entero -> camino lento (coercion)
+        if values and (type(sum(values)) is not int
+                       or min(values) < low or max(values) > high):
+            return False
+    return True
+
+
+def validate(data, compiled: CompiledSchema, unknown: dict = None) -> bool:
+    """
+    Valida y normaliza el payload en sitio. Devuelve True si alguna
+    coercion cambio el contenido (hay que re-serializar el record).
+
+    Las metricas que no estan en el schema se quitan de la lectura (Athena
+    no tiene columna para ellas) y se cuentan por nombre en `unknown`; el
+    resto del payload sigue. Un valor de tipo o rango invalido rechaza el
+    record entero.
+    """
+    if type(data) is not dict:
+        raise ValidationError(NOT_AN_OBJECT)
+
+    mesh_id = data.get("meshId")
+    if type(mesh_id) is not str or not mesh_id:
+        raise ValidationError(MISSING_MESH_ID)
+
+    changed = False
+    for field in ("event_ts", "ingestedAt"):
+        value = data.get(field)
+        if type(value) is int or value is None:
+            continue
+        try:
+            data[field] = _to_int(value)
+        except (ValueError, TypeError, OverflowError):
+            raise ValidationError(INVALID_TIMESTAMP, field)
+        changed = True
+
+    readings = data.get("readings")
+    if readings is None:
+        return changed
+    if type(readings) is not list:
+        raise ValidationError(READINGS_NOT_LIST)
+    if _readings_clean(readings, compiled):
+        return changed
+
+    get = compiled.specs.get
+    for reading in readings:
+        if type(reading) is not dict:
+            raise ValidationError(READING_NOT_OBJECT)
+
+        extra = None
+        for name, value in reading.items():
+            spec = get(name)
+            if spec is None:
+                if extra is None:
+                    extra = []
+                extra.append(name)
+                continue
+            if value is None:
+                continue
+            if type(value) not in spec[0]:
+                try:
+                    value = reading[name] = spec[1](value)
+                except (ValueError, TypeError, OverflowError):
+                    raise ValidationError(INVALID_TYPE, name)
+                changed = True
+            bounds = spec[2]
+            if bounds and not bounds[0] <= value <= bounds[1]:
+                raise ValidationError(OUT_OF_RANGE, name)
+
+        if extra:
+            for name in extra:
+                del reading[name]
+                if unknown is not None:
+                    unknown[name] = unknown.get(name, 0) + 1
+            changed = True
+
+    return changed
@@ -1,25 +1,37 @@
 import json
 import os
 import time
-import boto3
-from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 from decimal import Decimal
 from datetime import datetime, timezone
 
+from akame_common import clients, gateway_token, log
+
 # ---------- Init ----------
 
-dynamodb = boto3.resource("dynamodb")
+ssm = clients.client("ssm")
 
 TABLE_NAME = os.environ["DEVICE_METADATA_TABLE"]
-table = dynamodb.Table(TABLE_NAME)
+table = clients.table(TABLE_NAME)
+
+logger = log.get_logger("renewal")
 
 RENEWAL_PERIOD_DAYS = int(os.environ.get("RENEWAL_PERIOD_DAYS", 30))
 RENEWAL_PERIOD_SECONDS = RENEWAL_PERIOD_DAYS * 86400
 
+# Modo token del authorizer: renew/rehabilitate devuelven un token nuevo y
+# revoke agrega el thing a la deny list (rehabilitate no lo saca)
+GATEWAY_TOKEN_KEYS_PARAM = os.environ.get("GATEWAY_TOKEN_KEYS_PARAM", "")
+TOKEN_DENYLIST_TABLE = os.environ.get("TOKEN_DENYLIST_TABLE", "")
+denylist_table = clients.table(TOKEN_DENYLIST_TABLE) if TOKEN_DENYLIST_TABLE else None
+
+# Las entradas de la deny list viven hasta que vence el ultimo token emitido
+DENYLIST_GRACE_SECONDS = 86400
+
 
 # ---------- Entry ----------
 
+@log.invocation
 def lambda_handler(event, context):
     try:
         scope, action = _parse_path(event)
@@ -42,12 +54,19 @@ def lambda_handler(event, context):
         if not targets:
             return _bad("No devices found")
 
+        keyring = None
+        if GATEWAY_TOKEN_KEYS_PARAM and action in ("renew", "rehabilitate"):
+            keyring = gateway_token.load_keyring(ssm, GATEWAY_TOKEN_KEYS_PARAM)
+
         result = {"ok": [], "skipped": []}
 
         for user_id, thing_name in targets:
             try:
-                _apply_action(thing_name, action, now, source)
-                result["ok"].append({"thingName": thing_name})
+                token = _apply_action(thing_name, action, now, source, keyring)
+                entry = {"thingName": thing_name}
+                if token:
+                    entry["gatewayToken"] = token
+                result["ok"].append(entry)
             except ClientError as e:
                 if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
                     result["skipped"].append({"thingName": thing_name})
@@ -67,13 +86,14 @@ def lambda_handler(event, context):
         }
 
     except Exception as e:
-        print("Renewal error:", e)
+        logger.error("renewal failed", error=str(e))
         return _bad(str(e))
 
 
 # ---------- Core logic ----------
 
-def _apply_action(thing_name, action, now, source):
+def _apply_action(thing_name, action, now, source, keyring=None):
+    """Aplica la accion; devuelve el token nuevo del gateway si hay keyring."""
     item = table.get_item(Key={"thingName": thing_name}).get("Item")
     if not item:
         raise ValueError("Thing not found")
@@ -107,8 +127,13 @@ def _apply_action(thing_name, action, now, source):
                 ":s": source,
             },
         )
+        # Nunca antes del iat de una rehabilitacion del mismo segundo
+        return _mint(keyring, thing_name, item, max(now, int(item.get("rehabilitatedAt", 0))), new_expires_at)
 
     elif action == "revoke":
+        # El authorizer rechaza iat <= revokedAt: tambien cubre el token de
+        # una rehabilitacion en este mismo segundo (emitido con iat adelantado)
+        revoked_at = max(now, int(item.get("rehabilitatedAt", 0)))
         table.update_item(
             Key={"thingName": thing_name},
             ConditionExpression="#s <> :r",
@@ -116,19 +141,30 @@ def _apply_action(thing_name, action, now, source):
             ExpressionAttributeNames={"#s": "status"},
             ExpressionAttributeValues={
                 ":r": "revoked",
-                ":t": now,
+                ":t": revoked_at,
             },
         )
 
+        if denylist_table is not None:
+            denylist_table.put_item(Item={
+                "thingName": thing_name,
+                "revokedAt": revoked_at,
+                "expiresAt": max(now, int(item.get("expiresAt", 0))) + DENYLIST_GRACE_SECONDS,
+            })
+
     elif action == "rehabilitate":
         new_expires_at = now + RENEWAL_PERIOD_SECONDS
+        # La deny list no se toca: los tokens emitidos hasta la revocacion
+        # (incluido uno filtrado) siguen rechazados. Solo vale el token nuevo,
+        # con iat posterior a revokedAt aunque sea el mismo segundo.
+        issued_at = max(now, int(item.get("revokedAt", 0)) + 1)
         table.update_item(
             Key={"thingName": thing_name},
             ConditionExpression="#s = :r",
             UpdateExpression="""
                 SET #s = :a,
                     lifecycleStatus = :l,
-                    rehabilitatedAt = :t,
+                    rehabilitatedAt = :i,
                     lastRenewalDate = :t,
                     expiresAt = :e
             """,
@@ -138,14 +174,22 @@ def _apply_action(thing_name, action, now, source):
                 ":a": "active",
                 ":l": "ACTIVE",
                 ":t": now,
+                ":i": issued_at,
                 ":e": new_expires_at,
             },
         )
+        return _mint(keyring, thing_name, item, issued_at, new_expires_at)
 
     else:
         raise ValueError("Invalid action")
 
 
+def _mint(keyring, thing_name, item, now, expires_at):
+    if not keyring:
+        return None
+    return gateway_token.mint(keyring, thing_name, item.get("userId", "unknown"), now, expires_at)
+
+
 # ---------- Target resolution ----------
 
 def _resolve_targets(scope, body):
@@ -161,7 +205,8 @@ def _resolve_targets(scope, body):
 
         resp = table.query(
             IndexName="ByUser",
-            KeyConditionExpression=Key("userId").eq(user_id)
+            KeyConditionExpression="userId = :u",
+            ExpressionAttributeValues={":u": user_id}
         )
 
         return [(item["userId"], item["thingName"]) for item in resp.get("Items", [])]
@@ -178,7 +223,8 @@ def _status_user(body):
 
     resp = table.query(
         IndexName="ByUser",
-        KeyConditionExpression=Key("userId").eq(user_id)
+        KeyConditionExpression="userId = :u",
+        ExpressionAttributeValues={":u": user_id}
     )
 
     devices = []
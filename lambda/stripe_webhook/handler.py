@@ -1,21 +1,22 @@
 import json
 import os
 import time
-import boto3
-import stripe
 from botocore.exceptions import ClientError
 
+from akame_common import clients, log
+
 # ---------- AWS Clients ----------
-ssm = boto3.client("ssm")
-lambda_client = boto3.client("lambda")
-dynamodb = boto3.resource("dynamodb")
+ssm = clients.client("ssm")
+lambda_client = clients.client("lambda")
 
 # ---------- Env ----------
 STRIPE_WEBHOOK_SECRET_PARAM = os.environ["STRIPE_WEBHOOK_SECRET_PARAM"]
 RENEWAL_LAMBDA_ARN = os.environ["RENEWAL_LAMBDA_ARN"]
 IDEMPOTENCY_TABLE = os.environ["IDEMPOTENCY_TABLE"]
 
-table = dynamodb.Table(IDEMPOTENCY_TABLE)
+table = clients.table(IDEMPOTENCY_TABLE)
+
+logger = log.get_logger("stripe_webhook")
 
 # ---------- Plans ----------
 PLAN_CATALOG = {
@@ -82,8 +83,12 @@ def _invoke_renewal(user_id, plan_days, source):
 
 # ---------- Entry ----------
 
+@log.invocation
 def main(event, context):
     try:
+        # SDK de Stripe diferido al primer evento (cold start)
+        import stripe
+
         stripe.api_key = None
 
         payload = event["body"]
@@ -131,7 +136,7 @@ def main(event, context):
         return _ok("processed")
 
     except Exception as e:
-        print("Stripe webhook error:", str(e))
+        logger.error("webhook failed", error=str(e))
         return {
             "statusCode": 400,
             "body": json.dumps({"error": str(e)})
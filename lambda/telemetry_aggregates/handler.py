@@ -1,10 +1,17 @@
 import json
 import os
 import time
-import boto3
 from datetime import datetime, timezone
 
-athena = boto3.client("athena")
+from botocore.exceptions import ClientError
+
+from akame_common import clients, log
+from akame_common.partitions import partition_filter as _partition_filter
+
+athena = clients.client("athena")
+s3 = clients.client("s3")
+
+logger = log.get_logger("telemetry_aggregates")
 
 DATABASE = os.environ["ATHENA_DATABASE"]
 WORKGROUP = os.environ["ATHENA_WORKGROUP"]
@@ -14,32 +21,169 @@ MAX_RANGE_DAYS = 365
 MAX_METRICS = 5
 ALLOWED_INTERVALS = {"day", "week", "month", "year"}
 
-# métricas permitidas (deben existir como columnas)
-ALLOWED_METRICS = {
-    "humidity", "raw", "soil_moisture", "soil_temperature", "soil_ph", "soil_ec",
-    "soil_nitrogen", "soil_phosphorus", "soil_potassium", "soil_salinity",
-    "air_temperature", "air_humidity", "air_pressure", "wind_speed", "rainfall",
-    "solar_radiation", "co2_level", "leaf_wetness",
-    "pm1", "pm2_5", "pm10", "voc", "o3_level", "no2_level", "so2_level",
-    "battery_voltage", "battery_level", "battery_health", "signal_strength",
-    "device_temperature"
-}
+# métricas permitidas: las columnas del schema de lecturas (lo inyecta
+# TelemetryAggregatesApiStack) salvo la clave y el contador de uptime
+NON_METRIC_FIELDS = {"nodeId", "uptime"}
+ALLOWED_METRICS = set(json.loads(os.environ["READING_SCHEMA"])) - NON_METRIC_FIELDS
 
 TABLE = "telemetry.telemetry_flattened"
 
+# Rollups horarios de la ingesta (vacio = todo desde RAW). Una hora se da por
+# cerrada cuando paso el buffer de Firehose (ROLLUP_GRACE_SECONDS).
+ROLLUPS_TABLE = os.environ.get("ROLLUPS_TABLE", "")
+ROLLUP_GRACE_SECONDS = int(os.environ.get("ROLLUP_GRACE_SECONDS", "900"))
+# Corte: la marca que escribe la ingesta con su primer lote de rollups
+# ({"since": epoch}). Se usan desde la primera hora completa despues de
+# since + gracia (invocaciones del transform anteriores que seguian en
+# curso); lo anterior sigue saliendo de RAW. Sin marca no se usan.
+ROLLUPS_MARKER_BUCKET = os.environ.get("ROLLUPS_MARKER_BUCKET", "")
+ROLLUPS_MARKER_KEY = os.environ.get("ROLLUPS_MARKER_KEY", "")
+# Sin marca todavia: se vuelve a mirar pasado este tiempo
+MARKER_RETRY_SECONDS = 300
+# Parciales que la compactacion ya consolido y todavia no borro
+SUPERSEDED_TABLE = os.environ.get("SUPERSEDED_TABLE", "")
+
+HOUR = 3600
+
+# Marca leida por contenedor; una vez escrita no cambia
+_marker = {"since": 0, "checked": None}
+
 
-def _bucket_expr(interval: str) -> str:
+def _bucket_expr(interval: str, column: str = "timestamp") -> str:
     if interval == "day":
-        return "date_trunc('day', timestamp)"
+        return f"date_trunc('day', {column})"
     if interval == "week":
-        return "date_trunc('week', timestamp)"
+        return f"date_trunc('week', {column})"
     if interval == "month":
-        return "date_trunc('month', timestamp)"
+        return f"date_trunc('month', {column})"
     if interval == "year":
-        return "date_trunc('year', timestamp)"
+        return f"date_trunc('year', {column})"
     raise ValueError("Invalid interval")
 
 
+def _split_range(from_ts: int, to_ts: int, now: int):
+    """
+    Divide [from_ts, to_ts] en horas completas y cerradas (servidas desde los
+    rollups) y los extremos que quedan (hora abierta, horas parciales) que se
+    leen de RAW. -> (rango_rollups | None, [rangos_raw])
+    """
+    since = _rollups_since(now) if ROLLUPS_TABLE else 0
+    if not since:
+        return None, [(from_ts, to_ts)]
+
+    first = -(-max(from_ts, since + ROLLUP_GRACE_SECONDS) // HOUR) * HOUR
+    closed = (now - ROLLUP_GRACE_SECONDS) // HOUR * HOUR
+    last = min(closed, (to_ts + 1) // HOUR * HOUR)
+
+    if last <= first:
+        return None, [(from_ts, to_ts)]
+
+    raw_ranges = []
+    if from_ts < first:
+        raw_ranges.append((from_ts, first - 1))
+    if last <= to_ts:
+        raw_ranges.append((last, to_ts))
+
+    return (first, last - 1), raw_ranges
+
+
+def _rollups_since(now: int) -> int:
+    """Epoch del primer lote con rollups segun la marca de la ingesta, o 0."""
+    checked = _marker["checked"]
+    if _marker["since"] or (checked is not None and now - checked < MARKER_RETRY_SECONDS):
+        return _marker["since"]
+
+    _marker["checked"] = now
+    try:
+        obj = s3.get_object(Bucket=ROLLUPS_MARKER_BUCKET, Key=ROLLUPS_MARKER_KEY)
+    except ClientError as e:
+        # Todo desde RAW es correcto, solo mas caro
+        code = e.response["Error"]["Code"]
+        if code not in ("NoSuchKey", "404"):
+            logger.warning("rollups marker unreadable", error=code)
+        return 0
+
+    _marker["since"] = int(json.loads(obj["Body"].read())["since"])
+    return _marker["since"]
+
+
+def _build_sql(things, metrics, interval: str, from_ts: int, to_ts: int, now: int) -> str:
+    """
+    Parciales (sum/count/min/max) de rollups y RAW unidos y re-agregados por
+    (metric, bucket): avg = sum / count, igual que sobre las filas RAW.
+    """
+    thing_list = ", ".join(f"'{t}'" for t in things)
+    rollup_range, raw_ranges = _split_range(from_ts, to_ts, now)
+    parts = []
+
+    if rollup_range:
+        start, end = rollup_range
+        metric_list = ", ".join(f"'{m}'" for m in metrics)
+        visible = (
+            f'AND r."$path" NOT IN (SELECT path FROM telemetry.{SUPERSEDED_TABLE})'
+            if SUPERSEDED_TABLE else ""
+        )
+        # metrics[metrica] = [count, sum, min, max]
+        parts.append(f"""
+                SELECT
+                    m.metric,
+                    {_bucket_expr(interval, "from_unixtime(r.bucket_ts)")} AS bucket,
+                    m.agg[2] AS value_sum,
+                    CAST(m.agg[1] AS bigint) AS value_count,
+                    m.agg[3] AS value_min,
+                    m.agg[4] AS value_max
+                FROM telemetry.{ROLLUPS_TABLE} r
+                CROSS JOIN UNNEST(r.metrics) AS m(metric, agg)
+                WHERE
+                    r.granularity = 'hour'
+                    AND r.meshid IN ({thing_list})
+                    AND m.metric IN ({metric_list})
+                    AND r.bucket_ts BETWEEN {start} AND {end}
+                    AND {_partition_filter(start, end)}
+                    {visible}
+            """)
+
+    bucket = _bucket_expr(interval)
+
+    for start, end in raw_ranges:
+        # Particiones meshid/year/month/day/hour (partition projection)
+        partition_filter = _partition_filter(start, end)
+
+        for metric in metrics:
+            parts.append(f"""
+                SELECT
+                    '{metric}' AS metric,
+                    {bucket} AS bucket,
+                    CAST(sum({metric}) AS double) AS value_sum,
+                    count({metric}) AS value_count,
+                    CAST(min({metric}) AS double) AS value_min,
+                    CAST(max({metric}) AS double) AS value_max
+                FROM {TABLE}
+                WHERE
+                    meshid IN ({thing_list})
+                    AND {metric} IS NOT NULL
+                    AND timestamp BETWEEN
+                        from_unixtime({start})
+                        AND from_unixtime({end})
+                    AND {partition_filter}
+                GROUP BY 2
+            """)
+
+    return f"""
+        SELECT
+            metric,
+            bucket,
+            sum(value_sum) / sum(value_count) AS avg,
+            min(value_min) AS min,
+            max(value_max) AS max,
+            sum(value_count) AS count
+        FROM ({" UNION ALL ".join(parts)})
+        GROUP BY metric, bucket
+        ORDER BY bucket
+    """
+
+
+@log.invocation
 def handler(event, context):
     try:
         body = json.loads(event.get("body", "{}"))
@@ -75,40 +219,7 @@ def handler(event, context):
 
 
         # SQL building
-        bucket = _bucket_expr(interval)
-
-        thing_list = ", ".join(f"'{t}'" for t in things)
-
-        partition_filter = f"""
-        (year, month, day, hour) BETWEEN
-            ('{f.year}', '{f.month:02d}', '{f.day:02d}', '{f.hour:02d}')
-        AND
-            ('{t.year}', '{t.month:02d}', '{t.day:02d}', '{t.hour:02d}')
-        """
-
-        queries = []
-
-        for metric in metrics:
-            queries.append(f"""
-                SELECT
-                    '{metric}' AS metric,
-                    {bucket} AS bucket,
-                    avg({metric}) AS avg,
-                    min({metric}) AS min,
-                    max({metric}) AS max,
-                    count({metric}) AS count
-                FROM {TABLE}
-                WHERE
-                    thingname IN ({thing_list})
-                    AND {metric} IS NOT NULL
-                    AND timestamp BETWEEN
-                        from_unixtime({from_ts})
-                        AND from_unixtime({to_ts})
-                    AND {partition_filter}
-                GROUP BY bucket
-            """)
-
-        sql = " UNION ALL ".join(queries) + " ORDER BY bucket"
+        sql = _build_sql(things, metrics, interval, from_ts, to_ts, int(time.time()))
 
 
         # Athena execution
@@ -149,7 +260,7 @@ def handler(event, context):
         }
 
     except Exception as e:
-        print("ERROR:", str(e))
+        logger.error("aggregates failed", error=str(e))
         return _err(500, "internal error")
 
 
@@ -0,0 +1,504 @@
+import gzip
+import io
+import json
+import os
+import time
+from uuid import uuid4
+
+from botocore.exceptions import ClientError
+
+from akame_common import clients, log
+from akame_common.partitions import hour_partition, partition_key_prefix
+
+s3 = clients.client("s3")
+lambda_client = clients.client("lambda")
+
+logger = log.get_logger("telemetry_compaction")
+
+TELEMETRY_BUCKET = os.environ["TELEMETRY_BUCKET"]
+KMS_KEY_ARN = os.environ.get("KMS_KEY_ARN")
+OUTPUT_FORMAT = os.environ.get("OUTPUT_FORMAT", "json")
+
+# Objetos por debajo de este tamano se consideran "pequenos"
+SMALL_OBJECT_BYTES = int(os.environ.get("SMALL_OBJECT_BYTES", 8 * 1024 * 1024))
+# Tamano maximo (sin comprimir) de cada objeto compactado
+TARGET_OBJECT_BYTES = int(os.environ.get("TARGET_OBJECT_BYTES", 256 * 1024 * 1024))
+# Solo horas cerradas. La particion es por event_ts: Firehose todavia puede
+# escribir datos atrasados en ellas, asi que cada hora se compacta dos veces
+# (ver PASSES): al cerrarse y al salir de las ultimas LOOKBACK_HOURS
+MIN_AGE_SECONDS = int(os.environ.get("MIN_AGE_SECONDS", 2 * 3600))
+LOOKBACK_HOURS = int(os.environ.get("LOOKBACK_HOURS", 24))
+# Raices con layout meshid=/year=/.../hour=/ ("" = RAW, "flat/" = telemetry_flat)
+PARTITION_ROOTS = os.environ.get("PARTITION_ROOTS", "").split(",")
+# Rollups del transform de ingesta (vacio = no hay): los parciales de cada
+# lote se consolidan en una fila por (meshid, nodeid, bucket_ts)
+ROLLUPS_ROOT = os.environ.get("ROLLUPS_ROOT", "")
+ROLLUP_GRANULARITIES = [g for g in os.environ.get("ROLLUP_GRANULARITIES", "").split(",") if g]
+
+# Origenes reemplazados por un compactado: un objeto por compactacion con
+# las rutas que las vistas excluyen por "$path" (tabla telemetry_superseded).
+# Reescribir ese objeto es el cambio atomico de origenes a compactado.
+SUPERSEDED_ROOT = os.environ.get("SUPERSEDED_ROOT", "compaction/superseded/")
+# Los origenes se borran pasado este tiempo desde el cambio: mas que lo que
+# dura una query de Athena (30 min por defecto), asi ninguna query que ya
+# listo la particion se encuentra con objetos borrados
+SUPERSEDED_GRACE_SECONDS = int(os.environ.get("SUPERSEDED_GRACE_SECONDS", 3600))
+
+# Athena ignora los objetos que empiezan por "_" o "."
+STAGING_PREFIX = "_compacting-"
+COMPACTED_PREFIX = "compacted-"
+
+# Estado en el bucket: por pasada, la ultima hora ya compactada (watermark) y
+# la corrida en curso con su cursor
+STATE_KEY = os.environ.get("STATE_KEY", "compaction/state.json")
+# "closed": la hora recien cerrada. "final": la hora que sale de la ventana,
+# con lo que llego atrasado. Cada particion se lista dos veces, no en cada
+# corrida mientras este en la ventana.
+PASSES = ("closed", "final")
+# Margen para guardar el cursor e invocar la continuacion (una particion
+# grande puede tardar en fusionarse)
+SAFETY_MS = int(os.environ.get("SAFETY_MS", 120000))
+
+HOUR = 3600
+
+
+@log.invocation
+def main(event, context):
+    """
+    Cada corrida planifica sus horas desde los watermarks y recorre
+    (hora, raiz, malla) en orden estable. Si se acaba el tiempo guarda el
+    cursor en STATE_KEY e invoca una continuacion que sigue desde ahi; al
+    terminar avanza los watermarks. `lookbackHours` en el evento revisa las
+    ultimas N horas sin tocarlos.
+    """
+    event = event or {}
+
+    if OUTPUT_FORMAT != "json" and not ROLLUPS_ROOT:
+        # Parquet no se puede concatenar objeto a objeto
+        logger.info("compaction skipped", reason="unsupported_format", outputFormat=OUTPUT_FORMAT)
+        return {"status": "skipped", "reason": "unsupported_format"}
+
+    state = _load_state()
+    run = state.get("run")
+    if "continuation" in event and (run is None or run["runId"] != event["continuation"]):
+        # La corrida ya termino (o la retomo una programada)
+        logger.info("stale continuation", runId=event["continuation"])
+        return {"status": "skipped"}
+    if run is None:
+        run = state["run"] = _new_run(event, context, state["watermarks"])
+    report = run["report"]
+
+    finished = _collect_superseded(report, context) and _run_plan(run, context)
+
+    if not finished:
+        _save_state(state)
+        _continue(run, context)
+        logger.info("compaction continued", runId=run["runId"], step=run["step"], **report)
+        return {"status": "continued", **report}
+
+    for name, start, end in run["passes"]:
+        if name in PASSES and start <= end:
+            state["watermarks"][name] = max(state["watermarks"].get(name) or end, end)
+    del state["run"]
+    _save_state(state)
+
+    report["avgBytesBefore"] = report["bytesBefore"] // max(report["filesBefore"], 1)
+    report["avgBytesAfter"] = report["bytesAfter"] // max(report["filesAfter"], 1)
+
+    logger.info("compaction report", watermarks=state["watermarks"], **report)
+    return {"status": "ok", **report}
+
+
+# ---------- Plan ----------
+
+def _new_run(event, context, watermarks):
+    now = int(time.time())
+    newest = (now - MIN_AGE_SECONDS) // HOUR * HOUR
+
+    if "lookbackHours" in event:
+        passes = [["manual", newest - (int(event["lookbackHours"]) - 1) * HOUR, newest]]
+    else:
+        window = (LOOKBACK_HOURS - 1) * HOUR
+        passes = []
+        for name, end in (("closed", newest), ("final", newest - window)):
+            if name == "final" and LOOKBACK_HOURS <= 1:
+                continue
+            watermark = watermarks.get(name)
+            if watermark is not None:
+                # Tras una caida no se recupera mas que la ventana
+                start = max(watermark + HOUR, end - window)
+            else:
+                # Primer despliegue: la ventana entera al cerrar, la ultima hora al salir
+                start = end - window if name == "closed" else end
+            passes.append([name, start, end])
+
+    return {
+        "runId": getattr(context, "aws_request_id", None) or f"run-{now}",
+        "passes": passes,
+        "step": 0,
+        # ultima malla terminada del paso en curso
+        "after": None,
+        "report": {
+            "partitions": 0,
+            "compactedPartitions": 0,
+            "filesBefore": 0,
+            "bytesBefore": 0,
+            "filesAfter": 0,
+            "bytesAfter": 0,
+        },
+    }
+
+
+def _steps(run):
+    """(hora, raiz de particiones | None, granularidad de rollups | None) en orden estable."""
+    # Parquet no se puede concatenar objeto a objeto
+    roots = PARTITION_ROOTS if OUTPUT_FORMAT == "json" else []
+    granularities = ROLLUP_GRANULARITIES if ROLLUPS_ROOT else []
+
+    steps = []
+    for _, start, end in run["passes"]:
+        for hour in range(start, end + 1, HOUR):
+            steps.extend((hour, root, None) for root in roots)
+            steps.extend((hour, None, g) for g in granularities)
+    return steps
+
+
+def _run_plan(run, context) -> bool:
+    """Avanza el cursor de `run`; False si se corto por tiempo."""
+    steps = _steps(run)
+    report = run["report"]
+
+    while run["step"] < len(steps):
+        hour, root, granularity = steps[run["step"]]
+
+        if root is None:
+            if _out_of_time(context):
+                return False
+            year, month, day, hh = hour_partition(hour)
+            _consolidate_rollups(
+                f"{ROLLUPS_ROOT}granularity={granularity}/year={year}/month={month}/day={day}/hour={hh}/",
+                report,
+            )
+        else:
+            for mesh_id in _list_mesh_ids(root):
+                # Las mallas salen en orden de clave: se salta hasta el cursor
+                if run["after"] is not None and mesh_id + "/" <= run["after"] + "/":
+                    continue
+                if _out_of_time(context):
+                    return False
+                _compact_partition(root + partition_key_prefix(mesh_id, hour), report)
+                run["after"] = mesh_id
+
+        run["step"] += 1
+        run["after"] = None
+
+    return True
+
+
+def _out_of_time(context) -> bool:
+    return context is not None and context.get_remaining_time_in_millis() < SAFETY_MS
+
+
+def _continue(run, context):
+    """Invoca (asincrono) la misma funcion para seguir con `run`."""
+    lambda_client.invoke(
+        FunctionName=context.invoked_function_arn,
+        InvocationType="Event",
+        Payload=json.dumps({"continuation": run["runId"]}),
+    )
+
+
+def _load_state() -> dict:
+    try:
+        body = s3.get_object(Bucket=TELEMETRY_BUCKET, Key=STATE_KEY)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return {"watermarks": {}}
+    return json.loads(body)
+
+
+def _save_state(state: dict):
+    _put_json(STATE_KEY, state)
+
+
+# ---------- Partition ----------
+
+def _compact_partition(prefix: str, report: dict):
+    data = _prepare_partition(prefix)
+    if not data:
+        return
+
+    report["partitions"] += 1
+    report["filesBefore"] += len(data)
+    report["bytesBefore"] += sum(o["Size"] for o in data)
+
+    groups = _plan_groups([o for o in data if o["Size"] < SMALL_OBJECT_BYTES])
+    for group in groups:
+        _merge(prefix, group)
+
+    if groups:
+        report["compactedPartitions"] += 1
+        data = _prepare_partition(prefix)
+
+    report["filesAfter"] += len(data)
+    report["bytesAfter"] += sum(o["Size"] for o in data)
+
+
+def _consolidate_rollups(prefix: str, report: dict):
+    """
+    Fusiona los parciales de una hora cerrada (un objeto por lote de
+    Firehose) en un solo objeto con una fila por (meshid, nodeid, bucket_ts).
+    Mismo swap que la telemetria (ver _swap).
+    """
+    data = _prepare_partition(prefix)
+    if len(data) < 2:
+        return
+
+    report["rollupPartitions"] = report.get("rollupPartitions", 0) + 1
+    report["rollupFilesBefore"] = report.get("rollupFilesBefore", 0) + len(data)
+
+    merged = {}
+    for obj in data:
+        for line in _read_lines(obj["Key"]):
+            row = json.loads(line)
+            key = (row["meshid"], row["nodeid"], row["bucket_ts"])
+            current = merged.get(key)
+            if current is None:
+                merged[key] = row
+                continue
+            # metrics[metrica] = [count, sum, min, max]
+            for metric, (count, total, low, high) in row["metrics"].items():
+                agg = current["metrics"].get(metric)
+                if agg is None:
+                    current["metrics"][metric] = [count, total, low, high]
+                else:
+                    agg[0] += count
+                    agg[1] += total
+                    agg[2] = min(agg[2], low)
+                    agg[3] = max(agg[3], high)
+
+    body = "".join(json.dumps(row, separators=(",", ":")) + "\n" for row in merged.values())
+    _swap(prefix, data, gzip.compress(body.encode()))
+
+
+def _plan_groups(small_objects):
+    groups = []
+    current, current_bytes = [], 0
+
+    for obj in sorted(small_objects, key=lambda o: o["Key"]):
+        # Size es comprimido; estimacion conservadora x10 para el tamano final
+        estimated = obj["Size"] * 10
+        if current and current_bytes + estimated > TARGET_OBJECT_BYTES:
+            groups.append(current)
+            current, current_bytes = [], 0
+        current.append(obj)
+        current_bytes += estimated
+
+    if current:
+        groups.append(current)
+
+    return [g for g in groups if len(g) > 1]
+
+
+# ---------- Swap ----------
+
+def _prepare_partition(prefix: str):
+    """
+    Avanza los swaps abiertos de la particion y devuelve los objetos
+    visibles: sin ocultos ni origenes ya reemplazados (aun en gracia).
+    """
+    objects = _list_partition(prefix)
+    now = int(time.time())
+
+    excluded = set()
+    for manifest in (o for o in objects if _is_manifest(o["Key"])):
+        excluded.update(_settle(manifest["Key"], now))
+
+    return [o for o in objects if not _is_hidden(o["Key"]) and o["Key"] not in excluded]
+
+
+def _read_body(key: str) -> bytes:
+    body = s3.get_object(Bucket=TELEMETRY_BUCKET, Key=key)["Body"].read()
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+    return body
+
+
+def _read_lines(key: str):
+    return [line for line in _read_body(key).splitlines() if line.strip()]
+
+
+def _merge(prefix: str, group):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode="wb") as out:
+        for obj in group:
+            body = _read_body(obj["Key"])
+            out.write(body)
+            if body and not body.endswith(b"\n"):
+                out.write(b"\n")
+
+    _swap(prefix, group, buffer.getvalue())
+
+
+def _swap(prefix: str, group, body: bytes):
+    """
+    Reemplaza `group` por `body` sin que una query vea ambos ni ninguno.
+
+    El registro en SUPERSEDED_ROOT decide que rutas excluyen las vistas:
+    primero oculta el compactado mientras se escribe y despues pasa a
+    ocultar los origenes, con un solo PUT. Los origenes se borran pasada la
+    gracia (ver _settle); el manifest en la particion permite retomar o
+    deshacer un swap interrumpido.
+    """
+    compaction_id = uuid4().hex
+    manifest_key = f"{prefix}{STAGING_PREFIX}{compaction_id}.manifest"
+    manifest = {
+        "state": "pending",
+        "target": f"{prefix}{COMPACTED_PREFIX}{compaction_id}.gz",
+        "record": f"{SUPERSEDED_ROOT}{compaction_id}.json",
+        "sources": [o["Key"] for o in group],
+    }
+
+    # 1. Manifest: desde aqui el swap se retoma o se deshace
+    _put_json(manifest_key, manifest)
+    # 2. Compactado, oculto por el registro mientras se escribe
+    _put_record(manifest["record"], [manifest["target"]], manifest_key)
+    s3.put_object(Bucket=TELEMETRY_BUCKET, Key=manifest["target"], Body=body, **_sse())
+    # 3. El cambio: el registro pasa a ocultar los origenes
+    _put_record(manifest["record"], manifest["sources"], manifest_key)
+
+    manifest.update(state="published", publishedAt=int(time.time()))
+    _put_json(manifest_key, manifest)
+    _settle(manifest_key, manifest["publishedAt"])
+
+
+def _settle(manifest_key: str, now: int):
+    """
+    Idempotente. Termina un swap y devuelve las claves del listado previo
+    que ya no son datos visibles (origenes reemplazados o compactado
+    deshecho).
+
+    - pending con el registro ya en los origenes: el cambio ocurrio, se
+      marca publicado.
+    - pending sin el cambio: se deshace. El compactado se borra antes que
+      el registro que lo oculta.
+    - publicado y pasada la gracia: se borran los origenes y luego el
+      registro y el manifest.
+    """
+    manifest = json.loads(
+        s3.get_object(Bucket=TELEMETRY_BUCKET, Key=manifest_key)["Body"].read()
+    )
+
+    if manifest["state"] == "pending":
+        if _record_paths(manifest["record"]) != {_s3_path(k) for k in manifest["sources"]}:
+            _delete_keys([manifest["target"]])
+            _delete_keys([manifest["record"], manifest_key])
+            return [manifest["target"]]
+        manifest.update(state="published", publishedAt=now)
+        _put_json(manifest_key, manifest)
+
+    if now - manifest["publishedAt"] < SUPERSEDED_GRACE_SECONDS:
+        return manifest["sources"]
+
+    _delete_keys(manifest["sources"])
+    _delete_keys([manifest["record"], manifest_key])
+    return manifest["sources"]
+
+
+def _collect_superseded(report: dict, context) -> bool:
+    """
+    Cierra los swaps con el registro pasado de gracia, sin esperar a que el
+    plan vuelva a su particion: borra los origenes (o deshace un swap
+    cortado) y el registro deja de pesar en las vistas. False si se corto
+    por tiempo.
+    """
+    now = int(time.time())
+    for obj in _list_partition(SUPERSEDED_ROOT):
+        if now - obj["LastModified"].timestamp() < SUPERSEDED_GRACE_SECONDS:
+            continue
+        if _out_of_time(context):
+            return False
+        manifest_key = s3.head_object(Bucket=TELEMETRY_BUCKET, Key=obj["Key"])["Metadata"].get("manifest")
+        try:
+            _settle(manifest_key, now)
+        except ClientError as e:
+            if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+                raise
+            # Manifest ya borrado: solo quedo el registro
+            _delete_keys([obj["Key"]])
+        report["supersededCollected"] = report.get("supersededCollected", 0) + 1
+    return True
+
+
+def _put_json(key: str, value: dict):
+    s3.put_object(Bucket=TELEMETRY_BUCKET, Key=key, Body=json.dumps(value).encode(), **_sse())
+
+
+def _put_record(key: str, keys, manifest_key: str):
+    body = "".join(json.dumps({"path": _s3_path(k)}) + "\n" for k in keys)
+    s3.put_object(
+        Bucket=TELEMETRY_BUCKET,
+        Key=key,
+        Body=body.encode(),
+        # Para llegar al swap desde el registro (ver _collect_superseded)
+        Metadata={"manifest": manifest_key},
+        **_sse(),
+    )
+
+
+def _record_paths(key: str) -> set:
+    try:
+        body = s3.get_object(Bucket=TELEMETRY_BUCKET, Key=key)["Body"].read()
+    except ClientError as e:
+        if e.response["Error"]["Code"] not in ("NoSuchKey", "404"):
+            raise
+        return set()
+    return {json.loads(line)["path"] for line in body.splitlines() if line.strip()}
+
+
+def _s3_path(key: str) -> str:
+    # Mismo formato que "$path" en Athena
+    return f"s3://{TELEMETRY_BUCKET}/{key}"
+
+
+# ---------- Helpers ----------
+
+def _list_mesh_ids(root: str):
+    prefix = f"{root}meshid="
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=TELEMETRY_BUCKET, Prefix=prefix, Delimiter="/"):
+        for cp in page.get("CommonPrefixes", []):
+            yield cp["Prefix"][len(prefix):-1]
+
+
+def _list_partition(prefix: str):
+    objects = []
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=TELEMETRY_BUCKET, Prefix=prefix, Delimiter="/"):
+        objects.extend(page.get("Contents", []))
+    return objects
+
+
+def _delete_keys(keys):
+    for i in range(0, len(keys), 1000):
+        s3.delete_objects(
+            Bucket=TELEMETRY_BUCKET,
+            Delete={"Objects": [{"Key": k} for k in keys[i:i + 1000]], "Quiet": True},
+        )
+
+
+def _is_hidden(key: str) -> bool:
+    name = key.rsplit("/", 1)[-1]
+    return name.startswith(("_", "."))
+
+
+def _is_manifest(key: str) -> bool:
+    name = key.rsplit("/", 1)[-1]
+    return name.startswith(STAGING_PREFIX) and name.endswith(".manifest")
+
+
+def _sse():
+    if not KMS_KEY_ARN:
+        return {}
+    return {"ServerSideEncryption": "aws:kms", "SSEKMSKeyId": KMS_KEY_ARN}
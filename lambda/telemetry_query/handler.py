@@ -2,25 +2,29 @@ import os
 import json
 import time
 import re
-import boto3
-from datetime import datetime, timezone
-from boto3.dynamodb.conditions import Key
+
+from akame_common import clients, log
+from akame_common.partitions import partition_filter as _partition_filter
 
 
 MAX_RANGE_SECONDS = 24 * 60 * 60
 MAX_ROWS = 1000
 
-dynamodb = boto3.resource("dynamodb")
-athena = boto3.client("athena")
+athena = clients.client("athena")
+
+logger = log.get_logger("telemetry_query")
 
-TABLE = dynamodb.Table(os.environ["METADATA_TABLE"])
+TABLE = clients.table(os.environ["METADATA_TABLE"])
 DB = os.environ["ATHENA_DATABASE"]
 OUTPUT = os.environ["ATHENA_OUTPUT"]
 WORKGROUP = os.environ["ATHENA_WORKGROUP"]
 
 
 def error(status, message):
-    print("ERROR:", message)
+    if status >= 500:
+        logger.error("request failed", status=status, error=message)
+    else:
+        logger.info("request rejected", status=status, error=message)
     return {
         "statusCode": status,
         "headers": {"Content-Type": "application/json"},
@@ -48,9 +52,10 @@ def validate_query_params(params):
     return {"from_ts": from_ts, "to_ts": to_ts, "metric": metric}
 
 
+@log.invocation
 def main(event, context):
-    print("=== EVENT ===")
-    print(json.dumps(event))
+    # Claims JWT y headers de autorizacion se redactan
+    logger.debug("event", event=event)
 
     # ------ USER AUTH ------
     try:
@@ -69,25 +74,22 @@ def main(event, context):
     to_ts = validation["to_ts"]
     metric = validation["metric"]
 
-    print("from_ts:", from_ts)
-    print("to_ts:", to_ts)
-    print("metric:", metric)
-
     # ------ FETCH USER DEVICES ------
     thing_names = []
     try:
         resp = TABLE.query(
             IndexName="ByUser",
-            KeyConditionExpression=Key("userId").eq(user_id),
+            KeyConditionExpression="userId = :u",
+            ExpressionAttributeValues={":u": user_id},
             ProjectionExpression="thingName",
         )
         thing_names.extend([i["thingName"] for i in resp.get("Items", [])])
-        print ("DynamoDB query returned", len(thing_names), "items")
 
         while "LastEvaluatedKey" in resp:
             resp = TABLE.query(
                 IndexName="ByUser",
-                KeyConditionExpression=Key("userId").eq(user_id),
+                KeyConditionExpression="userId = :u",
+                ExpressionAttributeValues={":u": user_id},
                 ProjectionExpression="thingName",
                 ExclusiveStartKey=resp["LastEvaluatedKey"],
             )
@@ -113,11 +115,8 @@ def main(event, context):
     # timestamp range
     where_time = f"timestamp >= {from_ts} AND timestamp <= {to_ts}"
 
-    # Partition filter (ONLY year, because partition projection is enabled)
-    f = datetime.fromtimestamp(from_ts, tz=timezone.utc)
-    year = f.year
-    print("Query partition year:", year)
-    partition_filter = f"year='{year}'"
+    # Partition filter (year/month/day/hour, partition projection)
+    partition_filter = _partition_filter(from_ts, to_ts)
 
     # ------ FINAL SQL ------
     sql = f"""
@@ -131,8 +130,7 @@ def main(event, context):
         LIMIT {MAX_ROWS}
     """
 
-    print("=== ATHENA QUERY ===")
-    print(sql)
+    logger.debug("athena query", sql=sql)
 
     # ------ EXECUTE ATHENA QUERY ------
     try:
@@ -151,7 +149,14 @@ def main(event, context):
     except Exception as e:
         return error(500, f"Athena start_query_execution failed: {str(e)}")
 
-    print("QueryExecutionId:", qid)
+    logger.info(
+        "query started",
+        queryExecutionId=qid,
+        things=len(thing_names),
+        fromTs=from_ts,
+        toTs=to_ts,
+        metric=metric,
+    )
 
     # ------ WAIT FOR ATHENA ------
     try:
@@ -0,0 +1,146 @@
+"""
+Migracion unica del bucket RAW de telemetria del layout antiguo
+
+    meshid=<id>/year=YYYY/<objeto>
+
+al layout por hora que usan Firehose y partition projection
+
+    meshid=<id>/year=YYYY/month=MM/day=DD/hour=HH/<objeto>
+
+Cada record va a la hora de su event_ts, con la misma regla que la ingesta
+(akame_common.partitions.partition_ts): un objeto con lecturas de varias
+horas se reparte en un objeto por hora. La llegada, para los records sin
+event_ts usable, sale del nombre que genera Firehose
+(<stream>-<version>-YYYY-MM-DD-HH-MM-SS-<uuid>) o, si no se puede leer, de
+LastModified. Los objetos nuevos llevan el mismo cifrado que el original.
+Por defecto solo muestra el plan (dry-run).
+
+El layout antiguo es anterior a la salida Parquet: solo hay objetos JSON
+(gzip o no) en la raiz del bucket.
+
+    python scripts/repartition_telemetry.py --bucket <TelemetryRawBucketName> [--apply]
+"""
+import argparse
+import calendar
+import gzip
+import json
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda", "common", "python"))
+
+from akame_common.partitions import partition_key_prefix, partition_ts  # noqa: E402
+
+LEGACY_KEY = re.compile(r"^meshid=(?P<mesh>[^/]+)/year=(?P<year>\d{4})/(?P<name>[^/]+)$")
+FIREHOSE_TIME = re.compile(r"-(\d{4})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-(\d{2})-")
+# Igual que MAX_CLOCK_SKEW_SECONDS del transform de ingesta
+MAX_CLOCK_SKEW_SECONDS = 3600
+# Cifrado del original que se repite en cada objeto nuevo
+SSE_FIELDS = ("ServerSideEncryption", "SSEKMSKeyId")
+
+
+def object_timestamp(name: str, last_modified) -> int:
+    m = FIREHOSE_TIME.search(name)
+    if m:
+        year, month, day, hour, minute, second = (int(g) for g in m.groups())
+        return calendar.timegm((year, month, day, hour, minute, second))
+    return int(last_modified.timestamp())
+
+
+def split_by_hour(mesh_id: str, body: bytes, arrival_ts: int, max_skew: int = MAX_CLOCK_SKEW_SECONDS):
+    """{prefijo de la hora: [lineas]} de un objeto RAW (JSON por linea)."""
+    if body[:2] == b"\x1f\x8b":
+        body = gzip.decompress(body)
+
+    hours = {}
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        try:
+            event_ts = json.loads(line).get("event_ts")
+        except (ValueError, AttributeError):
+            event_ts = None
+        prefix = partition_key_prefix(mesh_id, partition_ts(event_ts, arrival_ts, max_skew))
+        hours.setdefault(prefix, []).append(line)
+    return hours
+
+
+def plan_moves(s3, bucket: str):
+    """(clave antigua, {clave nueva: lineas}, tamano, respuesta de GetObject, gzip)."""
+    paginator = s3.get_paginator("list_objects_v2")
+    for page in paginator.paginate(Bucket=bucket, Prefix="meshid="):
+        for obj in page.get("Contents", []):
+            m = LEGACY_KEY.match(obj["Key"])
+            if not m:
+                continue
+            arrival = object_timestamp(m["name"], obj["LastModified"])
+            response = s3.get_object(Bucket=bucket, Key=obj["Key"])
+            body = response["Body"].read()
+            hours = split_by_hour(m["mesh"], body, arrival)
+            targets = {f"{prefix}{m['name']}": lines for prefix, lines in hours.items()}
+            yield obj["Key"], targets, obj["Size"], response, body[:2] == b"\x1f\x8b"
+
+
+def repartition(s3, bucket: str, apply: bool = False, delete_source: bool = True):
+    stats = {"objects": 0, "bytes": 0, "records": 0, "split": 0, "written": 0, "deleted": 0, "partitions": set()}
+
+    for source, targets, size, response, compressed in plan_moves(s3, bucket):
+        stats["objects"] += 1
+        stats["bytes"] += size
+        stats["records"] += sum(len(lines) for lines in targets.values())
+        stats["split"] += len(targets) > 1
+        stats["partitions"].update(t.rsplit("/", 1)[0] for t in targets)
+
+        if not apply:
+            for target, lines in targets.items():
+                print(f"PLAN {source} -> {target} ({len(lines)} records)")
+            continue
+
+        sse = {k: response[k] for k in SSE_FIELDS if response.get(k)}
+
+        # Escribir primero: el layout nuevo no ve los objetos antiguos,
+        # asi que nunca hay duplicados para Athena. Las claves nuevas son
+        # deterministas: repetir tras un corte reescribe lo mismo.
+        for target, lines in targets.items():
+            if len(targets) == 1:
+                s3.copy_object(Bucket=bucket, Key=target, CopySource={"Bucket": bucket, "Key": source}, **sse)
+            else:
+                body = b"".join(line + b"\n" for line in lines)
+                if compressed:
+                    body = gzip.compress(body)
+                s3.put_object(Bucket=bucket, Key=target, Body=body, **sse)
+            stats["written"] += 1
+
+        if delete_source:
+            s3.delete_object(Bucket=bucket, Key=source)
+            stats["deleted"] += 1
+
+    stats["partitions"] = len(stats["partitions"])
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--apply", action="store_true", help="ejecutar la migracion (por defecto dry-run)")
+    parser.add_argument("--keep-source", action="store_true", help="no borrar los objetos originales")
+    args = parser.parse_args()
+
+    import boto3
+
+    stats = repartition(
+        boto3.client("s3"),
+        args.bucket,
+        apply=args.apply,
+        delete_source=not args.keep_source,
+    )
+    print(
+        f"{'APPLIED' if args.apply else 'DRY-RUN'}: {stats['objects']} objects "
+        f"({stats['bytes']} bytes, {stats['records']} records, {stats['split']} split) -> "
+        f"{stats['partitions']} hourly partitions, {stats['written']} written, {stats['deleted']} deleted"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Migracion de lifecycleBucket en DeviceMetadata al formato con shard
+
+    TRIAL#YYYYMMDDHH      ->  TRIAL#YYYYMMDDHH#n      (n = crc32(thingName) % shards)
+
+para los items escritos antes del sharding (o con otro numero de shards).
+Idempotente: el shard sale del thingName. Cada item se reescribe solo si
+su lifecycleBucket no cambio desde el Scan, asi que puede correr con las
+Lambdas activas. Por defecto solo muestra el plan (dry-run).
+
+    python scripts/reshard_lifecycle_buckets.py --table <DeviceMetadataTableName> --shards 8
+        [--apply] [--writes-per-second 50]
+
+Debe usar el mismo numero de shards que LIFECYCLE_BUCKET_SHARDS del
+despliegue (contexto lifecycle_bucket_shards).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda", "common", "python"))
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from akame_common import lifecycle_buckets  # noqa: E402
+from akame_common.ratelimit import TokenBucket  # noqa: E402
+
+PREFIXES = ("TRIAL#", "ACTIVE#", "EXPIRED#")
+
+
+def plan_moves(table, shards: int, page_size: int = 1000):
+    scan_kwargs = {"ProjectionExpression": "thingName, lifecycleBucket", "Limit": page_size}
+    while True:
+        page = table.scan(**scan_kwargs)
+        for item in page.get("Items", []):
+            bucket = item.get("lifecycleBucket")
+            if not bucket or not bucket.startswith(PREFIXES):
+                continue
+            target = lifecycle_buckets.rebucket(bucket, item["thingName"], shards)
+            if target != bucket:
+                yield item["thingName"], bucket, target
+        if not page.get("LastEvaluatedKey"):
+            return
+        scan_kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def reshard(table, shards: int, apply: bool = False, writes_per_second: float = 50.0):
+    stats = {"items": 0, "moved": 0, "changed": 0, "buckets": {}}
+    limiter = TokenBucket(writes_per_second)
+
+    for thing_name, source, target in plan_moves(table, shards):
+        stats["items"] += 1
+        stats["buckets"][target] = stats["buckets"].get(target, 0) + 1
+
+        if not apply:
+            print(f"PLAN {thing_name}: {source} -> {target}")
+            continue
+
+        limiter.acquire()
+        try:
+            table.update_item(
+                Key={"thingName": thing_name},
+                UpdateExpression="SET lifecycleBucket = :target",
+                ConditionExpression="lifecycleBucket = :source",
+                ExpressionAttributeValues={":source": source, ":target": target},
+            )
+            stats["moved"] += 1
+        except ClientError as e:
+            if e.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
+            # Una Lambda lo reescribio mientras tanto (ya con shard)
+            stats["changed"] += 1
+
+    stats["maxPerBucket"] = max(stats["buckets"].values(), default=0)
+    stats["buckets"] = len(stats["buckets"])
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", required=True)
+    parser.add_argument("--shards", type=int, required=True)
+    parser.add_argument("--apply", action="store_true", help="ejecutar la migracion (por defecto dry-run)")
+    parser.add_argument("--writes-per-second", type=float, default=50.0)
+    args = parser.parse_args()
+
+    import boto3
+
+    stats = reshard(
+        boto3.resource("dynamodb").Table(args.table),
+        args.shards,
+        apply=args.apply,
+        writes_per_second=args.writes_per_second,
+    )
+    print(
+        f"{'APPLIED' if args.apply else 'DRY-RUN'}: {stats['items']} items -> {stats['buckets']} buckets "
+        f"(max {stats['maxPerBucket']} per bucket), {stats['moved']} moved, {stats['changed']} changed concurrently"
+    )
+
+
+if __name__ == "__main__":
+    main()
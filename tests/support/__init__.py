@@ -0,0 +1,45 @@
+import importlib.util
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+LAMBDA_ROOT = os.path.join(REPO_ROOT, "lambda")
+COMMON_LAYER = os.path.join(LAMBDA_ROOT, "common", "python")
+
+# En Lambda el layer queda en /opt/python; aqui lo exponemos en sys.path
+if COMMON_LAYER not in sys.path:
+    sys.path.insert(0, COMMON_LAYER)
+
+
+def load_lambda(name: str, env: dict = None, module: str = "handler"):
+    """
+    Carga lambda/<name>/<module>.py como un modulo nuevo (equivalente a un
+    cold start) con `env` como variables de entorno. Los modulos auxiliares
+    del mismo directorio se recargan.
+    """
+    code_dir = os.path.join(LAMBDA_ROOT, name)
+
+    for mod_name, mod in list(sys.modules.items()):
+        mod_file = getattr(mod, "__file__", None) or ""
+        if mod_file.startswith(code_dir + os.sep):
+            del sys.modules[mod_name]
+
+    # Las Lambdas leen la configuracion al importar; el entorno se restaura
+    # despues para que no se filtre entre tests.
+    saved_env = dict(os.environ)
+    os.environ.update(env or {})
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-2")
+
+    sys.path.insert(0, code_dir)
+    try:
+        spec = importlib.util.spec_from_file_location(
+            f"{name}_{module}", os.path.join(code_dir, f"{module}.py")
+        )
+        loaded = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(loaded)
+    finally:
+        sys.path.remove(code_dir)
+        os.environ.clear()
+        os.environ.update(saved_env)
+
+    return loaded
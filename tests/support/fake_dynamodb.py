@@ -0,0 +1,345 @@
+import copy
+import operator
+import re
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+_MISSING = object()
+
+_COMPARE = {
+    "=": operator.eq,
+    "<>": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+}
+
+
+class FakeTable:
+    """
+    Subconjunto de boto3 dynamodb.Table sobre un dict en memoria.
+
+    Las expresiones (KeyCondition/Condition/Filter/Update) soportan lo que usan las
+    Lambdas: comparaciones, attribute_exists/attribute_not_exists y
+    begins_with unidas por AND/OR (sin parentesis), y SET/REMOVE de valores.
+    Las consultas por indice necesitan add_index(); `page_size` simula el
+    limite de 1 MB por pagina. Las queries solo recorren los items de su
+    partition key (mapa armado en add_index o en la primera query y
+    mantenido en cada escritura), asi que su coste no crece con la tabla;
+    cambiar la partition key mutando un item de `items` en el sitio no lo
+    actualiza.
+    """
+
+    def __init__(self, owner, name, key="thingName", sort_key=None):
+        self._owner = owner
+        self.name = name
+        self.key = key
+        self.sort_key = sort_key
+        # key -> item; con sort_key la clave es (key, sort_key)
+        self.items = {}
+        self.indexes = {}
+        self.page_size = 1000
+        # fn(old, new) por cada escritura (ver fake_stream.FakeStream)
+        self.listeners = []
+        # indice (None = tabla) -> {valor de la partition key: ids}
+        self._partitions = {}
+
+    def add_index(self, index_name, partition_key, sort_key=None):
+        self.indexes[index_name] = (partition_key, sort_key)
+        self._partitions.pop(index_name, None)
+        self._partition(index_name, partition_key)
+
+    def _id(self, key):
+        return key[self.key] if self.sort_key is None else (key[self.key], key[self.sort_key])
+
+    def get_item(self, Key, **kwargs):
+        self._owner._count("get_item")
+        item = self.items.get(self._id(Key))
+        return {"Item": copy.deepcopy(item)} if item is not None else {}
+
+    def put_item(self, Item, ConditionExpression=None, ExpressionAttributeValues=None,
+                 ExpressionAttributeNames=None, **kwargs):
+        self._owner._count("put_item")
+        with self._owner._data_lock:
+            old = self.items.get(self._id(Item))
+            self._check(old, ConditionExpression,
+                        ExpressionAttributeValues, ExpressionAttributeNames, "PutItem")
+            self.items[self._id(Item)] = copy.deepcopy(Item)
+            self._reindex(old, Item)
+            self._notify(old, Item)
+        return {}
+
+    def delete_item(self, Key, ConditionExpression=None, ExpressionAttributeValues=None,
+                    ExpressionAttributeNames=None, **kwargs):
+        self._owner._count("delete_item")
+        with self._owner._data_lock:
+            old = self.items.get(self._id(Key))
+            self._check(old, ConditionExpression,
+                        ExpressionAttributeValues, ExpressionAttributeNames, "DeleteItem")
+            self.items.pop(self._id(Key), None)
+            if old is not None:
+                self._reindex(old, None)
+                self._notify(old, None)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ConditionExpression=None, ExpressionAttributeValues=None,
+                    ExpressionAttributeNames=None, ReturnValues="NONE", **kwargs):
+        self._owner._count("update_item")
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
+
+        with self._owner._data_lock:
+            old = self.items.get(self._id(Key))
+            self._check(old, ConditionExpression, values, names, "UpdateItem")
+
+            new = copy.deepcopy(old) if old is not None else dict(Key)
+            updated = []
+            for action, attr, value in _parse_update(UpdateExpression, names):
+                updated.append(attr)
+                if action == "SET":
+                    new[attr] = copy.deepcopy(values[value])
+                else:
+                    new.pop(attr, None)
+            self.items[self._id(Key)] = new
+            self._reindex(old, new)
+            self._notify(old, new)
+
+        if ReturnValues == "ALL_NEW":
+            return {"Attributes": copy.deepcopy(new)}
+        if ReturnValues == "ALL_OLD":
+            return {"Attributes": copy.deepcopy(old)} if old else {}
+        if ReturnValues in ("UPDATED_OLD", "UPDATED_NEW"):
+            source = old if ReturnValues == "UPDATED_OLD" else new
+            attrs = {a: copy.deepcopy(source[a]) for a in updated if source and a in source}
+            return {"Attributes": attrs} if attrs else {}
+        return {}
+
+    def query(self, KeyConditionExpression, ExpressionAttributeValues=None, ExpressionAttributeNames=None,
+              IndexName=None, ExclusiveStartKey=None, Limit=None, ProjectionExpression=None,
+              ScanIndexForward=True, **kwargs):
+        self._owner._count("query")
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
+        partition_key, sort_key = self.indexes[IndexName] if IndexName else (self.key, self.sort_key)
+
+        # La igualdad sobre la partition key descarta casi todo sin evaluar
+        # la expresion completa (benchmarks con muchos items)
+        m = re.search(r"(\S+)\s*=\s*(:\w+)", KeyConditionExpression)
+        partition_value = values.get(m.group(2), _MISSING) if m and _attr(m.group(1), names) == partition_key else _MISSING
+
+        with self._owner._data_lock:
+            if partition_value is _MISSING:
+                candidates = self.items.values()
+            else:
+                ids = self._partition(IndexName, partition_key).get(partition_value, ())
+                candidates = [self.items[i] for i in ids if i in self.items]
+            matches = [
+                item for item in candidates
+                if partition_key in item and (sort_key is None or sort_key in item)
+                and (partition_value is _MISSING or item[partition_key] == partition_value)
+                and _evaluate(KeyConditionExpression, item, values, names)
+            ]
+        matches.sort(
+            key=lambda i: (i[sort_key] if sort_key else 0, str(self._id(i))),
+            reverse=not ScanIndexForward,
+        )
+
+        start = 0
+        if ExclusiveStartKey:
+            # Como DynamoDB: se sigue por posicion de la clave, aunque el item
+            # ya no este en el indice (p.ej. movido a otro bucket entre paginas)
+            order = lambda i: (i[sort_key] if sort_key else 0, str(self._id(i)))  # noqa: E731
+            last = order(ExclusiveStartKey)
+            after = (lambda o: o > last) if ScanIndexForward else (lambda o: o < last)
+            start = next((n for n, i in enumerate(matches) if after(order(i))), len(matches))
+
+        size = min(Limit or self.page_size, self.page_size)
+        page = matches[start:start + size]
+        resp = {"Items": [_project(i, ProjectionExpression, names) for i in page], "Count": len(page)}
+
+        if start + size < len(matches):
+            last = page[-1]
+            resp["LastEvaluatedKey"] = {
+                k: last[k] for k in (self.key, self.sort_key, partition_key, sort_key) if k
+            }
+        return resp
+
+    def scan(self, Limit=None, ExclusiveStartKey=None, ProjectionExpression=None,
+             ExpressionAttributeNames=None, FilterExpression=None, ExpressionAttributeValues=None, **kwargs):
+        self._owner._count("scan")
+        with self._owner._data_lock:
+            ids = sorted(self.items, key=str)
+            start = 0
+            if ExclusiveStartKey:
+                last = self._id(ExclusiveStartKey)
+                start = next((n + 1 for n, i in enumerate(ids) if i == last), len(ids))
+            page = ids[start:start + (Limit or self.page_size)]
+            items = [self.items[i] for i in page]
+
+        # Como DynamoDB: Limit cuenta los items leidos, el filtro va despues
+        names = ExpressionAttributeNames or {}
+        matched = [
+            i for i in items
+            if not FilterExpression or _evaluate(FilterExpression, i, ExpressionAttributeValues or {}, names)
+        ]
+        resp = {
+            "Items": [_project(i, ProjectionExpression, names) for i in matched],
+            "Count": len(matched),
+            "ScannedCount": len(items),
+        }
+        if start + len(page) < len(ids):
+            last = items[-1]
+            resp["LastEvaluatedKey"] = {k: last[k] for k in (self.key, self.sort_key) if k}
+        return resp
+
+    def _partition(self, index_name, partition_key):
+        if index_name not in self._partitions:
+            partitions = {}
+            for item_id, item in self.items.items():
+                if partition_key in item:
+                    partitions.setdefault(item[partition_key], set()).add(item_id)
+            self._partitions[index_name] = partitions
+        return self._partitions[index_name]
+
+    def _reindex(self, old, new):
+        for index_name, partitions in self._partitions.items():
+            partition_key = self.indexes[index_name][0] if index_name else self.key
+            if old is not None and partition_key in old:
+                partitions.get(old[partition_key], set()).discard(self._id(old))
+            if new is not None and partition_key in new:
+                partitions.setdefault(new[partition_key], set()).add(self._id(new))
+
+    def _notify(self, old, new):
+        for listener in self.listeners:
+            listener(copy.deepcopy(old), copy.deepcopy(new))
+
+    def _check(self, item, expression, values, names, operation):
+        if expression and not _evaluate(expression, item or {}, values or {}, names or {}):
+            raise ClientError(
+                {"Error": {"Code": "ConditionalCheckFailedException", "Message": "The conditional request failed"}},
+                operation,
+            )
+
+
+def _attr(token, names):
+    return names.get(token, token)
+
+
+def _operand(token, item, values, names):
+    if token.startswith(":"):
+        return values[token]
+    return item.get(_attr(token, names), _MISSING)
+
+
+def _evaluate(expression, item, values, names) -> bool:
+    for alternative in re.split(r"\s+OR\s+", expression.strip()):
+        if all(_term(t.strip(), item, values, names) for t in re.split(r"\s+AND\s+", alternative)):
+            return True
+    return False
+
+
+def _term(term, item, values, names) -> bool:
+    m = re.fullmatch(r"(attribute_exists|attribute_not_exists)\(\s*(\S+?)\s*\)", term)
+    if m:
+        present = _attr(m.group(2), names) in item
+        return present if m.group(1) == "attribute_exists" else not present
+
+    m = re.fullmatch(r"begins_with\(\s*(\S+?)\s*,\s*(\S+?)\s*\)", term)
+    if m:
+        value = _operand(m.group(1), item, values, names)
+        return isinstance(value, str) and value.startswith(_operand(m.group(2), item, values, names))
+
+    m = re.fullmatch(r"(\S+)\s*(<>|<=|>=|=|<|>)\s*(\S+)", term)
+    if not m:
+        raise ValueError(f"unsupported expression: {term}")
+    left = _operand(m.group(1), item, values, names)
+    right = _operand(m.group(3), item, values, names)
+    if left is _MISSING or right is _MISSING:
+        return False
+    return _COMPARE[m.group(2)](left, right)
+
+
+def _parse_update(expression, names):
+    """[(SET|REMOVE, atributo, :valor)] de una UpdateExpression."""
+    actions = []
+    for clause, body in re.findall(r"(SET|REMOVE)\s+(.*?)(?=\s+(?:SET|REMOVE)\s+|$)", expression.strip(), re.S):
+        for part in body.split(","):
+            part = part.strip()
+            if clause == "SET":
+                attr, value = (p.strip() for p in part.split("="))
+                actions.append(("SET", _attr(attr, names), value))
+            else:
+                actions.append(("REMOVE", _attr(part, names), None))
+    return actions
+
+
+def _project(item, projection, names):
+    if not projection:
+        return copy.deepcopy(item)
+    attrs = [_attr(a.strip(), names) for a in projection.split(",")]
+    return {a: copy.deepcopy(item[a]) for a in attrs if a in item}
+
+
+class FakeDynamoDB:
+    """
+    Stand-in en memoria del recurso DynamoDB de boto3. `unprocessed_once`
+    simula throttling devolviendo UnprocessedKeys en la primera llamada;
+    `latency` (segundos) se suma a cada llamada, como un round trip de red.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.tables = {}
+        self.calls = {}
+        self.unprocessed_once = False
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._data_lock = threading.RLock()
+
+    # ---------- Helpers de test ----------
+
+    def put(self, table_name, item, key="thingName", sort_key=None):
+        table = self.Table(table_name, key=key, sort_key=sort_key)
+        with self._data_lock:
+            old = table.items.get(table._id(item))
+            table.items[table._id(item)] = copy.deepcopy(item)
+            table._reindex(old, item)
+
+    def _count(self, op):
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    # ---------- boto3 API ----------
+
+    def Table(self, name, key="thingName", sort_key=None):
+        if name not in self.tables:
+            self.tables[name] = FakeTable(self, name, key, sort_key)
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems):
+        self._count("batch_get_item")
+        responses = {}
+        unprocessed = {}
+
+        for table_name, request in RequestItems.items():
+            keys = request["Keys"]
+            if len(keys) > 100:
+                raise ValueError("Too many items requested for the BatchGetItem call")
+
+            if self.unprocessed_once and len(keys) > 1:
+                self.unprocessed_once = False
+                unprocessed[table_name] = dict(request, Keys=keys[1:])
+                keys = keys[:1]
+
+            table = self.Table(table_name)
+            responses[table_name] = [
+                copy.deepcopy(table.items[table._id(k)])
+                for k in keys
+                if table._id(k) in table.items
+            ]
+
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
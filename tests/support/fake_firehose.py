@@ -0,0 +1,119 @@
+import base64
+import itertools
+import time
+
+RESULTS = ("Ok", "Dropped", "ProcessingFailed")
+
+
+class FakeFirehose:
+    """
+    Stand-in en memoria de un delivery stream con transform Lambda, para
+    probar el camino IoT Rule -> Firehose -> lambda/ingestion sin AWS.
+
+    Acumula los records de put_record/put_record_batch (como el IoT Rule) y
+    llama a `transform(event, context)` con un lote cada `buffer_records`
+    records o `buffer_bytes` bytes, y en flush(). Aplica el contrato de
+    Firehose sobre la respuesta: cada recordId exactamente una vez, result
+    Ok/Dropped/ProcessingFailed y data en base64. Si el transform lanza una
+    excepcion se reintenta el lote completo `retries` veces y despues todo
+    el lote va a errores, como hace Firehose.
+    """
+
+    MAX_BATCH_RECORDS = 500
+
+    def __init__(self, transform, buffer_records: int = 500, buffer_bytes: int = 3 * 1024 * 1024, retries: int = 3):
+        self.transform = transform
+        self.buffer_records = buffer_records
+        self.buffer_bytes = buffer_bytes
+        self.retries = retries
+
+        self.delivered = []  # (meshId, bytes) de los records Ok
+        self.errors = []  # (errorCode, bytes) de ProcessingFailed / fallos del transform
+        self.dropped = 0
+        self.invocations = 0
+        self.failed_invocations = 0
+        self.calls = {}
+
+        self._buffer = []
+        self._buffered_bytes = 0
+        self._ids = itertools.count()
+
+    # ---------- Firehose API (la usa el IoT Rule) ----------
+
+    def put_record(self, DeliveryStreamName, Record):
+        self._count("put_record")
+        record_id = self._add(Record["Data"])
+        return {"RecordId": record_id, "Encrypted": False}
+
+    def put_record_batch(self, DeliveryStreamName, Records):
+        self._count("put_record_batch")
+        if len(Records) > self.MAX_BATCH_RECORDS:
+            raise ValueError("PutRecordBatch accepts at most 500 records")
+        responses = [{"RecordId": self._add(r["Data"])} for r in Records]
+        return {"FailedPutCount": 0, "Encrypted": False, "RequestResponses": responses}
+
+    # ---------- Helpers de test ----------
+
+    def flush(self):
+        """Entrega lo acumulado (el buffer interval de Firehose)."""
+        if self._buffer:
+            batch, self._buffer, self._buffered_bytes = self._buffer, [], 0
+            self._deliver(batch)
+
+    def _count(self, op):
+        self.calls[op] = self.calls.get(op, 0) + 1
+
+    def _add(self, data) -> str:
+        if isinstance(data, str):
+            data = data.encode()
+        record_id = f"{next(self._ids):020d}"
+        self._buffer.append((record_id, data))
+        self._buffered_bytes += len(data)
+        if len(self._buffer) >= self.buffer_records or self._buffered_bytes >= self.buffer_bytes:
+            self.flush()
+        return record_id
+
+    def _deliver(self, batch):
+        event = {
+            "invocationId": f"invocation-{self.invocations}",
+            "deliveryStreamArn": "arn:aws:firehose:us-east-2:000000000000:deliverystream/fake",
+            "region": "us-east-2",
+            "records": [
+                {
+                    "recordId": record_id,
+                    "approximateArrivalTimestamp": int(time.time() * 1000),
+                    "data": base64.b64encode(data).decode(),
+                }
+                for record_id, data in batch
+            ],
+        }
+
+        for _ in range(self.retries + 1):
+            self.invocations += 1
+            try:
+                response = self.transform(event, None)
+            except Exception:
+                self.failed_invocations += 1
+                continue
+            self._collect(batch, response)
+            return
+
+        self.errors.extend(("Lambda.FunctionError", data) for _, data in batch)
+
+    def _collect(self, batch, response):
+        records = response["records"]
+        sent = {record_id: data for record_id, data in batch}
+        returned = [r["recordId"] for r in records]
+        if sorted(returned) != sorted(sent):
+            raise AssertionError("transform must return every recordId exactly once")
+
+        for r in records:
+            if r["result"] not in RESULTS:
+                raise AssertionError(f"invalid result {r['result']!r}")
+            if r["result"] == "Ok":
+                mesh_id = r.get("metadata", {}).get("partitionKeys", {}).get("meshId")
+                self.delivered.append((mesh_id, base64.b64decode(r["data"], validate=True)))
+            elif r["result"] == "Dropped":
+                self.dropped += 1
+            else:
+                self.errors.append(("Lambda.ProcessingFailed", sent[r["recordId"]]))
@@ -0,0 +1,148 @@
+import threading
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+
+class FakeIoT:
+    """
+    Stand-in en memoria del cliente IoT de boto3 (plano de control de
+    things y certificados). `latency` (segundos) se suma a cada llamada;
+    `throttle_tps` rechaza con ThrottlingException las llamadas por encima
+    de ese ritmo por API, como los limites de la cuenta. fail_next() hace
+    fallar las proximas llamadas de una API.
+    """
+
+    def __init__(self, latency: float = 0.0, throttle_tps: float = None):
+        self.certificates = {}
+        # thingName -> attributes; principales (cert ARN) por thing y
+        # politicas por target
+        self.things = {}
+        self.principals = {}
+        self.policies = {}
+        self.calls = {}
+        self.throttled = {}
+        self.latency = latency
+        self.throttle_tps = throttle_tps
+        self._lock = threading.Lock()
+        # API -> instantes de las llamadas aceptadas en el ultimo segundo
+        self._windows = {}
+        # API -> [codigo de error, llamadas que aun fallan]
+        self._failures = {}
+
+    # ---------- Helpers de test ----------
+
+    def add_certificate(self, cert_id, status="ACTIVE"):
+        self.certificates[cert_id] = status
+
+    def fail_next(self, op, code="InternalFailureException", times=1):
+        self._failures[op] = [code, times]
+
+    def _call(self, op):
+        with self._lock:
+            self.calls[op] = self.calls.get(op, 0) + 1
+            failure = self._failures.get(op)
+            if failure and failure[1] > 0:
+                failure[1] -= 1
+                raise ClientError({"Error": {"Code": failure[0], "Message": "Injected failure"}}, op)
+            if self.throttle_tps is not None:
+                now = time.monotonic()
+                window = [t for t in self._windows.get(op, []) if now - t < 1.0]
+                if len(window) >= self.throttle_tps:
+                    self._windows[op] = window
+                    self.throttled[op] = self.throttled.get(op, 0) + 1
+                    raise ClientError(
+                        {"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, op
+                    )
+                window.append(now)
+                self._windows[op] = window
+        if self.latency:
+            time.sleep(self.latency)
+        return {"ResponseMetadata": {"HTTPStatusCode": 200, "RetryAttempts": 0}}
+
+    def _cert(self, op, cert_id):
+        if cert_id not in self.certificates:
+            raise ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": cert_id}}, op)
+        return self.certificates[cert_id]
+
+    # ---------- boto3 API ----------
+
+    def describe_certificate(self, certificateId):
+        resp = self._call("DescribeCertificate")
+        status = self._cert("DescribeCertificate", certificateId)
+        return {**resp, "certificateDescription": {"certificateId": certificateId, "status": status}}
+
+    def update_certificate(self, certificateId, newStatus):
+        resp = self._call("UpdateCertificate")
+        self._cert("UpdateCertificate", certificateId)
+        self.certificates[certificateId] = newStatus
+        return resp
+
+    def create_thing(self, thingName, thingTypeName=None, attributePayload=None):
+        resp = self._call("CreateThing")
+        with self._lock:
+            if thingName in self.things:
+                raise ClientError({"Error": {"Code": "ResourceAlreadyExistsException", "Message": thingName}},
+                                  "CreateThing")
+            self.things[thingName] = (attributePayload or {}).get("attributes", {})
+        return {**resp, "thingName": thingName, "thingArn": f"arn:aws:iot:us-east-2:000000000000:thing/{thingName}"}
+
+    def delete_thing(self, thingName):
+        resp = self._call("DeleteThing")
+        with self._lock:
+            if self.principals.get(thingName):
+                raise ClientError({"Error": {"Code": "InvalidRequestException", "Message": "principals attached"}},
+                                  "DeleteThing")
+            self.things.pop(thingName, None)
+            self.principals.pop(thingName, None)
+        return resp
+
+    def create_keys_and_certificate(self, setAsActive=False):
+        resp = self._call("CreateKeysAndCertificate")
+        cert_id = uuid.uuid4().hex * 2
+        with self._lock:
+            self.certificates[cert_id] = "ACTIVE" if setAsActive else "INACTIVE"
+        return {
+            **resp,
+            "certificateArn": f"arn:aws:iot:us-east-2:000000000000:cert/{cert_id}",
+            "certificateId": cert_id,
+            "certificatePem": f"-----BEGIN CERTIFICATE-----\n{cert_id}\n-----END CERTIFICATE-----\n",
+            "keyPair": {"PublicKey": f"public-{cert_id}", "PrivateKey": f"private-{cert_id}"},
+        }
+
+    def delete_certificate(self, certificateId):
+        resp = self._call("DeleteCertificate")
+        if self._cert("DeleteCertificate", certificateId) == "ACTIVE":
+            raise ClientError({"Error": {"Code": "CertificateStateException", "Message": "active"}},
+                              "DeleteCertificate")
+        with self._lock:
+            del self.certificates[certificateId]
+        return resp
+
+    def attach_policy(self, policyName, target):
+        resp = self._call("AttachPolicy")
+        with self._lock:
+            self.policies.setdefault(target, set()).add(policyName)
+        return resp
+
+    def detach_policy(self, policyName, target):
+        resp = self._call("DetachPolicy")
+        with self._lock:
+            self.policies.get(target, set()).discard(policyName)
+        return resp
+
+    def attach_thing_principal(self, thingName, principal):
+        resp = self._call("AttachThingPrincipal")
+        with self._lock:
+            if thingName not in self.things:
+                raise ClientError({"Error": {"Code": "ResourceNotFoundException", "Message": thingName}},
+                                  "AttachThingPrincipal")
+            self.principals.setdefault(thingName, set()).add(principal)
+        return resp
+
+    def detach_thing_principal(self, thingName, principal):
+        resp = self._call("DetachThingPrincipal")
+        with self._lock:
+            self.principals.get(thingName, set()).discard(principal)
+        return resp
@@ -0,0 +1,152 @@
+import io
+from datetime import datetime, timezone
+
+from botocore.exceptions import ClientError
+
+
+class FakeS3:
+    """
+    Stand-in en memoria del cliente S3 de boto3, con el subconjunto de
+    operaciones que usan las Lambdas y scripts de telemetria.
+    """
+
+    def __init__(self):
+        self.buckets = {}
+        self.calls = {}
+
+    # ---------- Helpers de test ----------
+
+    def put(self, bucket, key, body: bytes, last_modified: datetime = None, sse: dict = None):
+        self.buckets.setdefault(bucket, {})[key] = {
+            "Body": body,
+            "LastModified": last_modified or datetime.now(tz=timezone.utc),
+            "Metadata": {},
+            "SSE": dict(sse or {}),
+        }
+
+    def keys(self, bucket, prefix=""):
+        return sorted(k for k in self.buckets.get(bucket, {}) if k.startswith(prefix))
+
+    def body(self, bucket, key) -> bytes:
+        return self.buckets[bucket][key]["Body"]
+
+    def _count(self, op):
+        self.calls[op] = self.calls.get(op, 0) + 1
+
+    def _obj(self, bucket, key):
+        try:
+            return self.buckets[bucket][key]
+        except KeyError:
+            raise ClientError({"Error": {"Code": "NoSuchKey", "Message": key}}, "GetObject")
+
+    # ---------- API boto3 ----------
+
+    def list_objects_v2(self, Bucket, Prefix="", ContinuationToken=None, MaxKeys=1000, Delimiter=None, **_):
+        self._count("ListObjectsV2")
+        entries = []
+        for k in self.keys(Bucket, Prefix):
+            rest = k[len(Prefix):]
+            if Delimiter and Delimiter in rest:
+                common = Prefix + rest[:rest.index(Delimiter) + len(Delimiter)]
+                if not entries or entries[-1] != ("prefix", common):
+                    entries.append(("prefix", common))
+            else:
+                entries.append(("key", k))
+
+        start = int(ContinuationToken or 0)
+        page = entries[start:start + MaxKeys]
+        contents = [
+            {
+                "Key": k,
+                "Size": len(self.buckets[Bucket][k]["Body"]),
+                "LastModified": self.buckets[Bucket][k]["LastModified"],
+            }
+            for kind, k in page if kind == "key"
+        ]
+        prefixes = [{"Prefix": p} for kind, p in page if kind == "prefix"]
+
+        resp = {"KeyCount": len(page), "IsTruncated": start + MaxKeys < len(entries)}
+        if contents:
+            resp["Contents"] = contents
+        if prefixes:
+            resp["CommonPrefixes"] = prefixes
+        if resp["IsTruncated"]:
+            resp["NextContinuationToken"] = str(start + MaxKeys)
+        return resp
+
+    def get_paginator(self, name):
+        assert name == "list_objects_v2"
+        return _ListPaginator(self)
+
+    def get_object(self, Bucket, Key, **_):
+        self._count("GetObject")
+        obj = self._obj(Bucket, Key)
+        return {
+            "Body": io.BytesIO(obj["Body"]),
+            "ContentLength": len(obj["Body"]),
+            "LastModified": obj["LastModified"],
+            "Metadata": dict(obj["Metadata"]),
+            **obj["SSE"],
+        }
+
+    def head_object(self, Bucket, Key, **_):
+        self._count("HeadObject")
+        obj = self._obj(Bucket, Key)
+        return {
+            "ContentLength": len(obj["Body"]),
+            "LastModified": obj["LastModified"],
+            "Metadata": dict(obj["Metadata"]),
+            **obj["SSE"],
+        }
+
+    def put_object(self, Bucket, Key, Body, Metadata=None, IfNoneMatch=None, **kwargs):
+        self._count("PutObject")
+        if IfNoneMatch == "*" and Key in self.buckets.get(Bucket, {}):
+            raise ClientError({"Error": {"Code": "PreconditionFailed", "Message": Key}}, "PutObject")
+        if isinstance(Body, str):
+            Body = Body.encode()
+        elif hasattr(Body, "read"):
+            Body = Body.read()
+        self.put(Bucket, Key, bytes(Body))
+        self.buckets[Bucket][Key]["Metadata"] = dict(Metadata or {})
+        self.buckets[Bucket][Key]["SSE"] = _sse(kwargs)
+        return {}
+
+    def copy_object(self, Bucket, Key, CopySource, **kwargs):
+        self._count("CopyObject")
+        src = self._obj(CopySource["Bucket"], CopySource["Key"])
+        self.put(Bucket, Key, src["Body"], src["LastModified"])
+        self.buckets[Bucket][Key]["Metadata"] = dict(src["Metadata"])
+        # Como S3: la copia no hereda el cifrado del original, solo el que se pide
+        self.buckets[Bucket][Key]["SSE"] = _sse(kwargs)
+        return {}
+
+    def delete_object(self, Bucket, Key, **_):
+        self._count("DeleteObject")
+        self.buckets.get(Bucket, {}).pop(Key, None)
+        return {}
+
+    def delete_objects(self, Bucket, Delete, **_):
+        self._count("DeleteObjects")
+        assert len(Delete["Objects"]) <= 1000
+        for o in Delete["Objects"]:
+            self.buckets.get(Bucket, {}).pop(o["Key"], None)
+        return {"Deleted": [{"Key": o["Key"]} for o in Delete["Objects"]]}
+
+
+def _sse(kwargs):
+    return {k: kwargs[k] for k in ("ServerSideEncryption", "SSEKMSKeyId") if k in kwargs}
+
+
+class _ListPaginator:
+    def __init__(self, s3):
+        self.s3 = s3
+
+    def paginate(self, **kwargs):
+        token = None
+        while True:
+            resp = self.s3.list_objects_v2(ContinuationToken=token, **kwargs)
+            yield resp
+            if not resp["IsTruncated"]:
+                return
+            token = resp["NextContinuationToken"]
@@ -0,0 +1,73 @@
+import itertools
+
+from boto3.dynamodb.types import TypeSerializer
+
+_serializer = TypeSerializer()
+
+
+class FakeStream:
+    """
+    Stand-in de un DynamoDB Stream (NEW_AND_OLD_IMAGES) sobre una FakeTable
+    y de su event source mapping hacia una Lambda.
+
+    Cada escritura de la tabla genera un record INSERT/MODIFY/REMOVE con las
+    imagenes en formato DynamoDB JSON, como los entrega Lambda. deliver()
+    llama a `handler(event, context)` con lotes de `batch_size` en orden y
+    aplica ReportBatchItemFailures: el lote se reintenta desde el primer
+    SequenceNumber fallido, hasta `retries` veces.
+    """
+
+    def __init__(self, table, batch_size: int = 100, retries: int = 3):
+        self.table = table
+        self.batch_size = batch_size
+        self.retries = retries
+        self.pending = []
+        self.invocations = 0
+        self.failed_records = []
+        self._sequence = itertools.count(1)
+        table.listeners.append(self._record)
+
+    def _record(self, old, new):
+        if old is None and new is None:
+            return
+        event_name = "INSERT" if old is None else "REMOVE" if new is None else "MODIFY"
+        item = new if new is not None else old
+        key_names = [k for k in (self.table.key, self.table.sort_key) if k]
+        change = {
+            "Keys": {k: _serializer.serialize(item[k]) for k in key_names},
+            "SequenceNumber": f"{next(self._sequence):021d}",
+            "StreamViewType": "NEW_AND_OLD_IMAGES",
+        }
+        if new is not None:
+            change["NewImage"] = {k: _serializer.serialize(v) for k, v in new.items()}
+        if old is not None:
+            change["OldImage"] = {k: _serializer.serialize(v) for k, v in old.items()}
+        self.pending.append({
+            "eventID": change["SequenceNumber"],
+            "eventName": event_name,
+            "eventSource": "aws:dynamodb",
+            "dynamodb": change,
+        })
+
+    def deliver(self, handler, context=None):
+        """Entrega todo lo pendiente; devuelve cuantos records se procesaron."""
+        delivered = 0
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            attempts = 0
+            while batch:
+                self.invocations += 1
+                response = handler({"Records": batch}, context) or {}
+                failures = [f["itemIdentifier"] for f in response.get("batchItemFailures", [])]
+                if not failures:
+                    delivered += len(batch)
+                    break
+                first = min(failures)
+                done = [r for r in batch if r["dynamodb"]["SequenceNumber"] < first]
+                delivered += len(done)
+                batch = batch[len(done):]
+                attempts += 1
+                if attempts > self.retries:
+                    self.failed_records.extend(batch)
+                    break
+        return delivered
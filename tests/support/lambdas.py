@@ -0,0 +1,52 @@
+from tests.support.fake_dynamodb import FakeDynamoDB
+from tests.support.fake_iot import FakeIoT
+
+
+class Context:
+    """
+    Context de Lambda para los tests. `remaining_ms` es un numero o una
+    lista: cada consulta consume un valor y el ultimo se repite.
+    """
+
+    invoked_function_arn = "arn:aws:lambda:us-east-2:123456789012:function:CertificateLifecycle"
+
+    def __init__(self, remaining_ms, request_id="req-1"):
+        self.remaining_ms = list(remaining_ms) if isinstance(remaining_ms, (list, tuple)) else [remaining_ms]
+        self.aws_request_id = request_id
+
+    def get_remaining_time_in_millis(self):
+        return self.remaining_ms.pop(0) if len(self.remaining_ms) > 1 else self.remaining_ms[0]
+
+
+class FakeLambda:
+    """Cliente Lambda que solo registra las invocaciones (continuaciones)."""
+
+    def __init__(self):
+        self.invocations = []
+
+    def invoke(self, **kwargs):
+        self.invocations.append(kwargs)
+        return {"StatusCode": 202}
+
+
+def install_fakes(monkeypatch, module, tables: dict, target=None, now=None):
+    """
+    Reemplaza en `target` (por defecto `module`) las tablas y el cliente IoT
+    por fakes en memoria y los deja en module.ddb / module.fake_iot.
+
+    `tables`: atributo -> nombre de la tabla, o (nombre, key[, sort_key]).
+    Con `now`, time.time del modulo queda fijo en ese instante.
+    """
+    target = target or module
+    ddb = FakeDynamoDB()
+    iot = FakeIoT()
+
+    for attr, spec in tables.items():
+        name, *keys = spec if isinstance(spec, tuple) else (spec,)
+        monkeypatch.setattr(target, attr, ddb.Table(name, *keys))
+    monkeypatch.setattr(target, "iot", iot)
+    if now is not None:
+        monkeypatch.setattr(module.time, "time", lambda: now)
+
+    module.ddb, module.fake_iot = ddb, iot
+    return module
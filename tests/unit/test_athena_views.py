@@ -0,0 +1,57 @@
+import re
+
+import pytest
+
+from aws_iot_akame.telemetry_schema import READING_FIELDS, reading_schema_json
+from tests.support import load_lambda
+
+SINCE = 1760000000  # 2025-10-09 08:53:20 UTC
+
+
+def _load(**env):
+    return load_lambda("athena_views", env={
+        "ATHENA_DATABASE": "telemetry",
+        "ATHENA_OUTPUT": "s3://athena-results/",
+        "READING_SCHEMA": reading_schema_json(),
+        **env,
+    })
+
+
+def test_columns_follow_reading_schema():
+    views = _load()
+    assert views.READING_COLUMNS == [name for name, _ in READING_FIELDS]
+
+
+@pytest.mark.parametrize("env", [{}, {"FLAT_TABLE": "telemetry_flat"}])
+def test_raw_only_without_cutover(env):
+    sql = _load(**env)._view_sql()
+    assert "UNION ALL" not in sql and "telemetry.telemetry_flat " not in sql
+    assert "CROSS JOIN UNNEST(r.readings)" in sql
+
+
+def test_flat_table_from_cutover_raw_before():
+    sql = _load(FLAT_TABLE="telemetry_flat", FLATTEN_SINCE=str(SINCE))._view_sql()
+    flat, raw = sql.split("UNION ALL")
+
+    # Corte sobre las particiones, en la hora siguiente a la activacion
+    assert "FROM telemetry.telemetry_flat f" in flat
+    assert "AND month = '10' AND day = '09' AND hour >= '09')" in flat
+    assert "FROM telemetry.telemetry_raw r" in raw
+    assert "AND month = '10' AND day = '09' AND hour < '09')" in raw
+    assert "event_ts" not in flat.split("WHERE")[1] + raw.split("WHERE")[1]
+    # Mismas columnas en el mismo orden en las dos ramas
+    assert _columns(flat) == _columns(raw)
+
+
+def test_superseded_objects_are_excluded_from_every_branch():
+    env = {"FLAT_TABLE": "telemetry_flat", "SUPERSEDED_TABLE": "telemetry_superseded"}
+    exclusion = '."$path" NOT IN (SELECT path FROM telemetry.telemetry_superseded)'
+
+    assert f"r{exclusion}" in _load(**env)._view_sql()
+
+    flat, raw = _load(FLATTEN_SINCE=str(SINCE), **env)._view_sql().split("UNION ALL")
+    assert f"f{exclusion}" in flat and f"r{exclusion}" in raw
+
+
+def _columns(select):
+    return re.findall(r"^\s+(?:f|r|rd)\.(\w+)", select.split("FROM")[0], re.M)
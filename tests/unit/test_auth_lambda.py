@@ -0,0 +1,145 @@
+import base64
+import json
+
+import pytest
+
+from tests.support import load_lambda
+from tests.support.fake_dynamodb import FakeDynamoDB
+
+TABLE = "DeviceMetadata"
+NOW = 1760700000
+
+
+@pytest.fixture
+def auth(monkeypatch):
+    module = load_lambda("auth_lambda", env={"DEVICE_METADATA_TABLE": TABLE})
+    fake = FakeDynamoDB()
+    monkeypatch.setattr(module, "table", fake.Table(TABLE))
+    monkeypatch.setattr(module.time, "time", lambda: NOW)
+    module.fake = fake
+    return module
+
+
+def _connect(auth, thing):
+    return auth.lambda_handler({"principalId": thing}, None)
+
+
+def test_cached_decision_skips_dynamodb(auth):
+    auth.fake.put(TABLE, {"thingName": "gw_1", "status": "active", "expiresAt": NOW + 3600, "userId": "u1"})
+
+    for _ in range(3):
+        result = _connect(auth, "gw_1")
+        assert result["isAuthenticated"] and result["context"] == {"userId": "u1"}
+
+    assert auth.fake.calls == {"get_item": 1}
+    assert auth.cache_stats()["hits"] == 2
+
+
+def test_unknown_things_are_negatively_cached(auth):
+    assert not _connect(auth, "gw_ghost")["isAuthenticated"]
+    assert not _connect(auth, "gw_ghost")["isAuthenticated"]
+    assert auth.fake.calls == {"get_item": 1}
+
+
+def test_denies_are_reported_in_aggregate(auth, monkeypatch, capsys):
+    monkeypatch.setattr(auth, "DENY_STATS_EVERY", 3)
+    monkeypatch.setattr(auth, "_denies", {})
+    auth.fake.put(TABLE, {"thingName": "gw_old", "status": "active", "expiresAt": NOW - 60, "userId": "u1"})
+
+    capsys.readouterr()
+    for thing in ("gw_ghost", "gw_old", "gw_ghost"):
+        assert not _connect(auth, thing)["isAuthenticated"]
+
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    # Sin una linea INFO por conexion denegada: solo el resumen por motivo
+    assert [l["msg"] for l in lines] == ["deny stats"]
+    assert lines[0]["denies"] == {"not_registered": 2, "inactive_or_expired": 1}
+    assert auth._denies == {}
+
+    # El TTL negativo es corto: tras una activacion se vuelve a leer
+    assert auth._cache_ttl(None, NOW) == auth.NEGATIVE_CACHE_TTL_SECONDS
+    assert auth.NEGATIVE_CACHE_TTL_SECONDS < auth.CACHE_TTL_SECONDS
+
+
+def test_cache_respects_expires_at(auth, monkeypatch):
+    auth.fake.put(TABLE, {"thingName": "gw_2", "status": "active", "expiresAt": NOW + 10, "userId": "u2"})
+    assert _connect(auth, "gw_2")["isAuthenticated"]
+
+    entry = auth._cache._data["gw_2"]
+    assert entry[1] - auth._cache._clock() <= 10
+
+    monkeypatch.setattr(auth.time, "time", lambda: NOW + 11)
+    assert not _connect(auth, "gw_2")["isAuthenticated"]
+
+
+@pytest.mark.parametrize("remaining, expected", [
+    (30 * 86400, (3600, 86400)),
+    (7200, (3600, 7200)),
+    (1200, (1200, 1200)),
+    (10, (300, 300)),
+])
+def test_session_seconds_follow_expires_at(remaining, expected, monkeypatch):
+    auth = load_lambda("auth_lambda", env={
+        "DEVICE_METADATA_TABLE": TABLE,
+        "AUTH_REFRESH_MAX_SECONDS": "3600",
+    })
+    fake = FakeDynamoDB()
+    monkeypatch.setattr(auth, "table", fake.Table(TABLE))
+    monkeypatch.setattr(auth.time, "time", lambda: NOW)
+    fake.put(TABLE, {"thingName": "gw_3", "status": "active", "expiresAt": NOW + remaining, "userId": "u3"})
+
+    result = _connect(auth, "gw_3")
+    assert (result["refreshAfterInSeconds"], result["disconnectAfterInSeconds"]) == expected
+
+
+@pytest.fixture
+def token_auth(monkeypatch):
+    from akame_common import gateway_token
+
+    module = load_lambda("auth_lambda", env={
+        "DEVICE_METADATA_TABLE": TABLE,
+        "AUTH_MODE": "token",
+        "GATEWAY_TOKEN_KEYS_PARAM": "/akame/gateway-token/keys",
+        "TOKEN_DENYLIST_TABLE": "DenyList",
+    })
+    fake = FakeDynamoDB()
+    monkeypatch.setattr(module, "dynamodb", fake)
+    monkeypatch.setattr(module, "table", fake.Table(TABLE))
+    monkeypatch.setattr(module.time, "time", lambda: NOW)
+
+    keyring = gateway_token.parse_keyring('{"active": "k1", "keys": {"k1": "c2VjcmV0"}}')
+    module._keyring.set(module.GATEWAY_TOKEN_KEYS_PARAM, keyring)
+    module.fake = fake
+    module.mint = lambda thing, iat=NOW: gateway_token.mint(keyring, thing, "u1", iat, NOW + 7200)
+    return module
+
+
+def _mqtt_connect(auth, client_id, token):
+    return auth.lambda_handler({
+        "protocolData": {"mqtt": {
+            "clientId": client_id,
+            "password": base64.b64encode(token.encode()).decode(),
+        }},
+    }, None)
+
+
+def test_token_mode_skips_device_metadata(token_auth):
+    result = _mqtt_connect(token_auth, "gw_1", token_auth.mint("gw_1"))
+
+    assert result["isAuthenticated"] and result["principalId"] == "gw_1"
+    assert result["disconnectAfterInSeconds"] == 7200
+    assert "get_item" not in token_auth.fake.calls
+    assert not _mqtt_connect(token_auth, "gw_2", token_auth.mint("gw_1"))["isAuthenticated"]
+
+
+def test_token_mode_denylist(token_auth):
+    token_auth.fake.put("DenyList", {"thingName": "gw_1", "revokedAt": NOW - 10})
+
+    result = _mqtt_connect(token_auth, "gw_1", token_auth.mint("gw_1", iat=NOW - 100))
+    assert result["context"] == {"reason": "revoked"}
+    # Token emitido despues de la revocacion (rehabilitado)
+    assert _mqtt_connect(token_auth, "gw_1", token_auth.mint("gw_1"))["isAuthenticated"]
+
+    # La deny list se recarga cada DENYLIST_REFRESH_SECONDS, no por conexion
+    _mqtt_connect(token_auth, "gw_1", token_auth.mint("gw_1"))
+    assert token_auth.fake.calls["scan"] == 1
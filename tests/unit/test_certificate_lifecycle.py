@@ -0,0 +1,262 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from tests.support import load_lambda
+from tests.support.lambdas import Context, FakeLambda, install_fakes
+
+from akame_common import ratelimit  # en sys.path via tests.support
+
+TABLE = "DeviceMetadata"
+STATE_TABLE = "LifecycleState"
+NOW = 1760700000
+HOUR = NOW // 3600 * 3600
+
+
+def _bucket(prefix, ts):
+    return f"{prefix}{datetime.fromtimestamp(ts, tz=timezone.utc):%Y%m%d%H}"
+
+
+def _load(monkeypatch, **env):
+    module = load_lambda("certificate_lifecycle", env={
+        "DEVICE_METADATA_TABLE": TABLE,
+        "LIFECYCLE_WORKERS": "4",
+        "IOT_DESCRIBE_CERTIFICATE_TPS": "1000",
+        "IOT_UPDATE_CERTIFICATE_TPS": "1000",
+        **env,
+    })
+    tables = {"device_table": TABLE}
+    if module.state_table is not None:
+        tables["state_table"] = (STATE_TABLE, "stateKey")
+    install_fakes(monkeypatch, module, tables, now=NOW)
+    module.device_table.add_index("ByLifecycleBucket", "lifecycleBucket", "expiresAt")
+    return module
+
+
+@pytest.fixture
+def lifecycle(monkeypatch):
+    return _load(monkeypatch)
+
+
+@pytest.fixture
+def watermarked(monkeypatch):
+    return _load(monkeypatch, LIFECYCLE_STATE_TABLE=STATE_TABLE, LIFECYCLE_MAX_CATCHUP_HOURS="168")
+
+
+def _seed(lifecycle, n, prefix="TRIAL#", status="TRIAL", hours_ago=2, cert_status="ACTIVE", tracked=True):
+    expires_at = NOW - hours_ago * 3600
+    for i in range(n):
+        thing = f"gw_{prefix[0]}{hours_ago}_{i:04d}"
+        item = {
+            "thingName": thing,
+            "certificateId": f"cert-{thing}",
+            "lifecycleStatus": status,
+            "lifecycleBucket": _bucket(prefix, expires_at),
+            "expiresAt": expires_at,
+        }
+        if tracked:
+            item["certificateStatus"] = cert_status
+        lifecycle.ddb.put(TABLE, item)
+        lifecycle.fake_iot.add_certificate(f"cert-{thing}", cert_status)
+
+
+def test_expires_devices_on_worker_pool(lifecycle):
+    _seed(lifecycle, 30)
+    _seed(lifecycle, 20, prefix="ACTIVE#", status="ACTIVE", hours_ago=5)
+    # Ya movido por otra ejecucion: la condicion falla y se salta
+    _seed(lifecycle, 3, status="EXPIRED", hours_ago=7)
+    # Certificado ya inactivo segun la metadata: no hace falta UpdateCertificate
+    _seed(lifecycle, 2, hours_ago=9, cert_status="INACTIVE")
+    # Sin certificateStatus (item anterior): UpdateCertificate sin describir
+    _seed(lifecycle, 4, hours_ago=11, tracked=False)
+
+    result = lifecycle.main({}, None)
+
+    assert result["processed"] == result["expired"] == 56
+    assert (result["devices"], result["skipped"], result["failed"], result["throttled"]) == (59, 3, 0, 0)
+    assert result["limiters"]["UpdateCertificate"]["acquired"] == 54
+
+    items = lifecycle.ddb.Table(TABLE).items.values()
+    assert {i["lifecycleStatus"] for i in items} == {"EXPIRED"}
+    active = sorted(c for c, status in lifecycle.fake_iot.certificates.items() if status == "ACTIVE")
+    assert active == [f"cert-gw_T7_{i:04d}" for i in range(3)]
+    # El estado del certificado sale de la metadata: ningun DescribeCertificate
+    assert lifecycle.fake_iot.calls == {"UpdateCertificate": 54}
+    expired = [i for i in items if i["thingName"].startswith(("gw_T2", "gw_T11"))]
+    assert {(i["certificateStatus"], i["certificateStatusAt"]) for i in expired} == {("INACTIVE", NOW)}
+
+
+def test_throttled_certificate_updates_are_counted(lifecycle, monkeypatch):
+    monkeypatch.setattr(ratelimit, "THROTTLE_PENALTY_SECONDS", 0.01)
+    lifecycle.fake_iot.throttle_tps = 5
+    _seed(lifecycle, 20)
+
+    result = lifecycle.main({}, None)
+
+    # La metadata manda: todos quedan expirados aunque IoT rechace llamadas
+    assert result["expired"] == 20
+    assert result["throttled"] == sum(lifecycle.fake_iot.throttled.values()) > 0
+    # Los rechazados quedan sin certificateStatus para la reconciliacion
+    untracked = [i for i in lifecycle.ddb.Table(TABLE).items.values() if "certificateStatus" not in i]
+    assert len(untracked) == result["throttled"]
+    assert all(lifecycle.fake_iot.certificates[i["certificateId"]] == "ACTIVE" for i in untracked)
+
+
+def test_queries_every_shard_of_each_hour(monkeypatch):
+    from akame_common import lifecycle_buckets
+
+    lifecycle = _load(monkeypatch, LIFECYCLE_BUCKET_SHARDS="4")
+    _seed(lifecycle, 2)  # items anteriores al sharding, sin sufijo
+    expires_at = NOW - 3 * 3600
+    for i in range(40):
+        thing = f"gw_sharded_{i:04d}"
+        lifecycle.ddb.put(TABLE, {
+            "thingName": thing,
+            "certificateId": f"cert-{thing}",
+            "lifecycleStatus": "TRIAL",
+            "lifecycleBucket": lifecycle_buckets.bucket_for("TRIAL#", expires_at, thing, 4),
+            "expiresAt": expires_at,
+            "certificateStatus": "ACTIVE",
+        })
+        lifecycle.fake_iot.add_certificate(f"cert-{thing}")
+
+    result = lifecycle.main({}, None)
+
+    # 24 horas x 2 prefijos x (clave antigua + 4 shards)
+    assert result["queries"] == 24 * 2 * 5
+    assert result["expired"] == 42
+    expired = {i["lifecycleBucket"] for i in lifecycle.ddb.Table(TABLE).items.values()}
+    assert {b.rsplit("#", 1)[0] for b in expired} == {_bucket("EXPIRED#", NOW)}
+    assert len(expired) == 4
+
+
+# ---------- Watermark ----------
+
+def test_watermark_skips_drained_buckets(watermarked):
+    _seed(watermarked, 3)
+
+    first = watermarked.main({}, None)
+    # Sin watermark: las 24 horas de cada prefijo
+    assert first["queries"] == 48 and first["expired"] == 3
+    assert first["watermarks"] == {"TRIAL#": HOUR - 3600, "ACTIVE#": HOUR - 3600}
+
+    _seed(watermarked, 2, hours_ago=0)  # vence en la hora en curso
+    second = watermarked.main({}, None)
+    # Solo la hora en curso, que aun no esta cerrada
+    assert second["queries"] == 2 and second["expired"] == 2
+    assert second["watermarks"] == first["watermarks"]
+
+
+def test_failed_expiry_holds_watermark(watermarked, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    _seed(watermarked, 1, hours_ago=5)
+    _seed(watermarked, 1, hours_ago=3)
+    table = watermarked.device_table
+    update_item = table.update_item
+
+    def flaky(**kwargs):
+        if kwargs["Key"]["thingName"] == "gw_T5_0000":
+            raise ClientError({"Error": {"Code": "InternalServerError", "Message": "x"}}, "UpdateItem")
+        return update_item(**kwargs)
+
+    monkeypatch.setattr(table, "update_item", flaky)
+    result = watermarked.main({}, None)
+
+    assert (result["expired"], result["failed"]) == (1, 1)
+    # El bucket del fallo (y los posteriores) se vuelven a consultar
+    assert result["watermarks"]["TRIAL#"] == HOUR - 6 * 3600
+    assert result["watermarks"]["ACTIVE#"] == HOUR - 3600
+
+
+def test_catch_up_after_long_outage(watermarked):
+    for prefix in ("TRIAL#", "ACTIVE#"):
+        watermarked.ddb.put(STATE_TABLE, {"stateKey": f"watermark#{prefix}", "drainedThrough": HOUR - 300 * 3600},
+                            key="stateKey")
+    _seed(watermarked, 2, hours_ago=250)
+    _seed(watermarked, 1, hours_ago=100)
+    _seed(watermarked, 1, hours_ago=2)
+
+    first = watermarked.main({}, None)
+    # 168 horas atrasadas + las ultimas 24 por prefijo
+    assert first["queries"] == 2 * (168 + 24)
+    assert first["expired"] == 3
+    assert first["watermarks"]["TRIAL#"] == HOUR - 132 * 3600
+
+    second = watermarked.main({}, None)
+    assert second["expired"] == 1
+    assert second["watermarks"]["TRIAL#"] == HOUR - 3600
+
+
+# ---------- Continuation ----------
+
+@pytest.fixture
+def continued(monkeypatch):
+    module = _load(monkeypatch, LIFECYCLE_STATE_TABLE=STATE_TABLE, LIFECYCLE_QUERY_WORKERS="2")
+    module.device_table.page_size = 5
+    module.fake_lambda = FakeLambda()
+    monkeypatch.setattr(module, "lambda_client", module.fake_lambda)
+
+    # Tamano de cada ronda que llega a expirarse
+    module.rounds = []
+    expire_devices = module._expire_devices
+    monkeypatch.setattr(module, "_expire_devices", lambda devices, now: (
+        module.rounds.append(len(devices)) or expire_devices(devices, now)
+    ))
+    return module
+
+
+def test_hands_off_to_continuation_and_resumes(continued):
+    for prefix in ("TRIAL#", "ACTIVE#"):
+        continued.ddb.put(STATE_TABLE, {"stateKey": f"watermark#{prefix}", "drainedThrough": HOUR - 3 * 3600},
+                          key="stateKey")
+    _seed(continued, 23)
+    _seed(continued, 4, prefix="ACTIVE#", status="ACTIVE", hours_ago=1)
+
+    # Tiempo para dos rondas; despues queda por debajo del margen
+    first = continued.main({}, Context([60000, 60000, 5000]))
+
+    assert first["status"] == "continued"
+    assert first["expired"] == 10 and continued.rounds == [5, 5]
+    assert continued.fake_lambda.invocations == [{
+        "FunctionName": Context.invoked_function_arn,
+        "InvocationType": "Event",
+        "Payload": json.dumps({"continuation": "req-1"}),
+    }]
+    progress = continued.ddb.Table(STATE_TABLE).items["progress#sweep"]
+    assert progress["runId"] == "req-1" and len(progress["cursors"]) == 1
+
+    # La continuacion sigue desde el cursor: no repite consultas ni dispositivos
+    second = continued.main({"continuation": "req-1"}, Context([60000], request_id="req-2"))
+
+    assert second["status"] == "ok"
+    assert (second["expired"], second["devices"], second["invocations"]) == (27, 27, 2)
+    assert max(continued.rounds) <= 2 * 5 and sum(continued.rounds) == 27
+    assert continued.fake_iot.calls == {"UpdateCertificate": 27}
+    assert second["watermarks"] == {"TRIAL#": HOUR - 3600, "ACTIVE#": HOUR - 3600}
+    assert "progress#sweep" not in continued.ddb.Table(STATE_TABLE).items
+
+    # Una continuacion repetida (o ya terminada) no arranca otra ejecucion
+    assert continued.main({"continuation": "req-1"}, Context([60000]))["status"] == "skipped"
+    assert len(continued.fake_lambda.invocations) == 1
+
+
+def test_scheduled_run_resumes_abandoned_progress(continued):
+    _seed(continued, 12)
+
+    # Ejecucion cortada sin continuacion (p.ej. la invocacion se perdio)
+    assert continued.main({}, Context([60000, 5000]))["status"] == "continued"
+
+    resumed = continued.main({}, Context([60000], request_id="req-2"))
+    assert (resumed["status"], resumed["expired"], resumed["invocations"]) == ("ok", 12, 2)
+
+    # Un progreso demasiado viejo se descarta y empieza una ejecucion nueva
+    _seed(continued, 3, hours_ago=0)
+    continued.ddb.put(STATE_TABLE, {
+        "stateKey": "progress#sweep", "runId": "old", "runAt": NOW - 7 * 3600, "shards": 1,
+        "watermarks": {}, "hours": {}, "nextQuery": 0, "cursors": {}, "incomplete": [],
+        "failedBuckets": [], "counts": {}, "invocations": 1,
+    }, key="stateKey")
+    fresh = continued.main({}, Context([60000], request_id="req-3"))
+    assert (fresh["status"], fresh["expired"], fresh["invocations"]) == ("ok", 3, 1)
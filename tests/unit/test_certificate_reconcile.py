@@ -0,0 +1,100 @@
+import pytest
+
+from tests.support import load_lambda
+from tests.support.lambdas import Context, install_fakes
+
+TABLE = "DeviceMetadata"
+STATE_TABLE = "LifecycleState"
+NOW = 1760700000
+
+
+@pytest.fixture
+def reconcile(monkeypatch):
+    module = load_lambda("certificate_lifecycle", module="reconcile", env={
+        "DEVICE_METADATA_TABLE": TABLE,
+        "LIFECYCLE_STATE_TABLE": STATE_TABLE,
+        "LIFECYCLE_WORKERS": "4",
+        "IOT_DESCRIBE_CERTIFICATE_TPS": "1000",
+        "IOT_UPDATE_CERTIFICATE_TPS": "1000",
+        "RECONCILE_PAGE_SIZE": "3",
+    })
+    return install_fakes(monkeypatch, module, {
+        "device_table": TABLE,
+        "state_table": (STATE_TABLE, "stateKey"),
+    }, target=module.lifecycle, now=NOW)
+
+
+def _device(reconcile, thing, lifecycle_status, cert_status, tracked=None, **extra):
+    item = {"thingName": thing, "certificateId": f"cert-{thing}", "lifecycleStatus": lifecycle_status, **extra}
+    if tracked:
+        item["certificateStatus"] = tracked
+    reconcile.ddb.put(TABLE, item)
+    reconcile.fake_iot.add_certificate(f"cert-{thing}", cert_status)
+
+
+def test_fixes_metadata_and_certificate_drift(reconcile):
+    _device(reconcile, "gw_ok", "ACTIVE", "ACTIVE", tracked="ACTIVE")
+    _device(reconcile, "gw_untracked", "TRIAL", "ACTIVE")
+    _device(reconcile, "gw_expired_active", "EXPIRED", "ACTIVE", tracked="INACTIVE")
+    _device(reconcile, "gw_renewed", "ACTIVE", "INACTIVE", tracked="INACTIVE")
+    _device(reconcile, "gw_revoked", "ACTIVE", "INACTIVE", status="revoked")
+    _device(reconcile, "gw_iot_revoked", "EXPIRED", "REVOKED", tracked="INACTIVE")
+
+    result = reconcile.main({}, None)
+
+    assert (result["pages"], result["scanned"], result["devices"], result["passCompleted"]) == (2, 6, 6, True)
+    assert (result["inSync"], result["metadataFixed"], result["certificateFixed"]) == (1, 3, 2)
+
+    certs = reconcile.fake_iot.certificates
+    assert certs["cert-gw_expired_active"] == "INACTIVE"
+    assert certs["cert-gw_renewed"] == "ACTIVE"
+    # Los revocados no se reactivan; REVOKED en IoT no se puede cambiar
+    assert certs["cert-gw_revoked"] == "INACTIVE"
+    assert certs["cert-gw_iot_revoked"] == "REVOKED"
+
+    items = reconcile.ddb.Table(TABLE).items
+    assert {t: i["certificateStatus"] for t, i in items.items()} == {
+        "gw_ok": "ACTIVE",
+        "gw_untracked": "ACTIVE",
+        "gw_expired_active": "INACTIVE",
+        "gw_renewed": "ACTIVE",
+        "gw_revoked": "INACTIVE",
+        "gw_iot_revoked": "REVOKED",
+    }
+
+
+def test_resumes_from_cursor_between_runs(reconcile):
+    for i in range(7):
+        _device(reconcile, f"gw_{i}", "TRIAL", "ACTIVE", tracked="ACTIVE")
+
+    # Sin tiempo para una segunda pagina: el cursor queda guardado
+    first = reconcile.main({}, Context(1000))
+    assert (first["devices"], first["passCompleted"]) == (3, False)
+
+    second = reconcile.main({}, Context(1000))
+    third = reconcile.main({}, Context(1000))
+    assert (second["devices"], third["devices"], third["passCompleted"]) == (3, 1, True)
+    assert reconcile.fake_iot.calls == {"DescribeCertificate": 7}
+
+    # Pasada completa: la siguiente vuelve a empezar, pero todo esta al dia
+    fourth = reconcile.main({}, Context(1000))
+    assert (fourth["scanned"], fourth["devices"]) == (3, 0)
+
+
+def test_describes_only_untracked_or_stale(reconcile, monkeypatch):
+    stale = NOW - reconcile.STALE_SECONDS - 1
+    _device(reconcile, "gw_fresh", "ACTIVE", "ACTIVE", tracked="ACTIVE", certificateStatusAt=NOW - 3600)
+    _device(reconcile, "gw_stale", "ACTIVE", "ACTIVE", tracked="ACTIVE", certificateStatusAt=stale)
+    _device(reconcile, "gw_untracked", "TRIAL", "ACTIVE")
+
+    result = reconcile.main({}, None)
+    assert (result["scanned"], result["devices"], result["inSync"], result["metadataFixed"]) == (3, 2, 1, 1)
+    assert reconcile.fake_iot.calls == {"DescribeCertificate": 2}
+
+    # En sincronia tambien renueva certificateStatusAt: la pasada siguiente no describe nada
+    items = reconcile.ddb.Table(TABLE).items
+    assert items["gw_stale"]["certificateStatusAt"] == NOW
+    assert reconcile.main({}, None)["devices"] == 0
+
+    monkeypatch.setattr(reconcile.time, "time", lambda: NOW + reconcile.STALE_SECONDS + 1)
+    assert reconcile.main({}, None)["devices"] == 3
@@ -0,0 +1,42 @@
+from tests.support import COMMON_LAYER  # noqa: F401  (akame_common en sys.path)
+
+from akame_common.cache import MISSING, TTLCache
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_expiry_and_per_entry_ttl():
+    clock = _Clock()
+    cache = TTLCache(ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", None, ttl=2)
+
+    clock.now = 1
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+
+    clock.now = 5
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+
+    clock.now = 10
+    assert cache.get("a") is MISSING
+    assert cache.stats() == {"size": 0, "hits": 3, "misses": 2, "evictions": 0}
+
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
@@ -0,0 +1,54 @@
+import boto3
+
+from tests.support import COMMON_LAYER  # noqa: F401  (akame_common en sys.path)
+
+from akame_common import clients
+
+
+def test_clients_are_lazy_and_shared(monkeypatch):
+    built = []
+
+    class FakeClient:
+        def __init__(self, service):
+            self.service = service
+
+        def get_object(self, **kwargs):
+            return self.service, kwargs
+
+    def fake_client(service):
+        built.append(service)
+        return FakeClient(service)
+
+    monkeypatch.setattr(boto3, "client", fake_client)
+    monkeypatch.setattr(clients, "_clients", {})
+
+    a = clients.client("s3")
+    b = clients.client("s3")
+    # Crear el proxy no construye nada
+    assert built == []
+
+    assert a.get_object(Key="k") == ("s3", {"Key": "k"})
+    assert b.service == "s3"
+    # Un solo cliente por servicio en el contenedor
+    assert built == ["s3"]
+
+
+def test_table_uses_shared_resource(monkeypatch):
+    built = []
+
+    class FakeResource:
+        def Table(self, name):
+            return {"TableName": name}
+
+    def fake_resource(service):
+        built.append(service)
+        return FakeResource()
+
+    monkeypatch.setattr(boto3, "resource", fake_resource)
+    monkeypatch.setattr(clients, "_resources", {})
+
+    devices = clients.table("DeviceMetadata")
+    codes = clients.table("ActivationCodes")
+    assert devices.get("TableName") == "DeviceMetadata"
+    assert codes.get("TableName") == "ActivationCodes"
+    assert built == ["dynamodb"]
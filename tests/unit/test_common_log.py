@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from tests.support import COMMON_LAYER  # noqa: F401  (akame_common en sys.path)
+
+from akame_common import log
+
+logger = log.get_logger("test")
+
+
+@pytest.fixture(autouse=True)
+def _reset():
+    log.flush()
+    yield
+    log.configure()
+    log.flush()
+
+
+def _lines(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_buffers_until_end_of_invocation(capsys):
+    log.configure(level="DEBUG")
+
+    @log.invocation
+    def handler(event, context):
+        logger.debug("one", n=1)
+        logger.info("two", n=2)
+        # Nada escrito hasta terminar la invocacion
+        assert capsys.readouterr().out == ""
+        return "ok"
+
+    assert handler({}, SimpleNamespace(aws_request_id="req-1")) == "ok"
+    lines = _lines(capsys)
+    assert [(l["level"], l["msg"], l["n"]) for l in lines] == [("DEBUG", "one", 1), ("INFO", "two", 2)]
+    assert {l["requestId"] for l in lines} == {"req-1"}
+    assert {l["source"] for l in lines} == {"test"}
+
+
+def test_error_flushes_immediately(capsys):
+    logger.info("context")
+    logger.error("boom", error="x")
+    assert [l["msg"] for l in _lines(capsys)] == ["context", "boom"]
+
+
+def test_level_and_sampling(capsys):
+    log.configure(level="INFO", sample_rates="INFO=0,WARNING=1")
+    logger.debug("filtered")
+    logger.info("sampled out")
+    logger.warning("kept")
+    log.flush()
+    assert [l["msg"] for l in _lines(capsys)] == ["kept"]
+    assert not logger.enabled("DEBUG")
+
+
+def test_redacts_secrets(capsys):
+    jwt = "eyJhbGciOiJIUzI1NiJ9.eyJzdWIiOiJ1In0.c2ln"
+    logger.info("event", event={
+        "protocolData": {"mqtt": {"clientId": "gw_1", "password": "c2VjcmV0"}},
+        "headers": {"Authorization": f"Bearer {jwt}", "X-Trace": jwt},
+        "requestContext": {"authorizer": {"jwt": {"claims": {"sub": "user-1"}}}},
+        "items": [{"gatewayToken": "abc.def"}],
+    })
+    log.flush()
+
+    (line,) = _lines(capsys)
+    event = line["event"]
+    assert event["protocolData"]["mqtt"] == {"clientId": "gw_1", "password": "***"}
+    assert event["headers"] == {"Authorization": "***", "X-Trace": "***"}
+    assert event["requestContext"]["authorizer"]["jwt"]["claims"] == "***"
+    assert event["items"] == [{"gatewayToken": "***"}]
@@ -0,0 +1,61 @@
+from tests.support import COMMON_LAYER  # noqa: F401  (akame_common en sys.path)
+
+import pytest
+from botocore.exceptions import ClientError
+
+from akame_common import ratelimit
+from akame_common.ratelimit import TokenBucket
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_token_bucket_paces_after_burst():
+    clock = Clock()
+    bucket = TokenBucket(10, burst=5, clock=clock, sleep=clock.sleep)
+
+    for _ in range(25):
+        bucket.acquire()
+
+    # 5 de rafaga + 20 a 10/s
+    assert clock.now == 2.0
+    assert bucket.stats() == {"acquired": 25, "waits": 20, "waitedSeconds": 2.0}
+
+
+def test_penalize_blocks_everyone():
+    clock = Clock()
+    bucket = TokenBucket(10, clock=clock, sleep=clock.sleep)
+
+    bucket.acquire()
+    bucket.penalize(1.0)
+    bucket.acquire()
+    assert clock.now == 1.1
+
+
+def test_call_penalizes_on_throttling():
+    clock = Clock()
+    limiters = {"UpdateCertificate": TokenBucket(10, clock=clock, sleep=clock.sleep)}
+    before = ratelimit.snapshot(limiters)
+
+    def throttled(**kwargs):
+        raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "UpdateCertificate")
+
+    assert ratelimit.call(limiters, "UpdateCertificate", lambda **kw: kw, certificateId="c1") == {"certificateId": "c1"}
+    with pytest.raises(ClientError) as error:
+        ratelimit.call(limiters, "UpdateCertificate", throttled)
+    assert ratelimit.is_throttling(error.value)
+
+    # La siguiente espera la pausa comun
+    ratelimit.call(limiters, "UpdateCertificate", lambda: None)
+    assert clock.now == 0.1 + ratelimit.THROTTLE_PENALTY_SECONDS
+    assert ratelimit.since(limiters, before) == {
+        "UpdateCertificate": {"acquired": 3, "waits": 2, "waitedSeconds": round(clock.now, 3)},
+    }
@@ -0,0 +1,90 @@
+import pytest
+
+from tests.support import load_lambda
+from tests.support.lambdas import Context, install_fakes
+
+METADATA_TABLE = "DeviceMetadata"
+ACTIVATION_TABLE = "ActivationCodes"
+NOW = 1760700000
+
+
+@pytest.fixture
+def factory(monkeypatch):
+    module = load_lambda("device_factory", env={
+        "METADATA_TABLE": METADATA_TABLE,
+        "ACTIVATION_CODE_TABLE": ACTIVATION_TABLE,
+        "FACTORY_MAX_BATCH": "50",
+        "FACTORY_WORKERS": "4",
+        "IOT_PROVISIONING_TPS": "1000",
+        "IOT_UPDATE_CERTIFICATE_TPS": "1000",
+    })
+    return install_fakes(monkeypatch, module, {
+        "metadata_table": METADATA_TABLE,
+        "activation_table": (ACTIVATION_TABLE, "code"),
+    }, now=NOW)
+
+
+def _assert_provisioned(factory, device):
+    iot = factory.fake_iot
+    thing = device["thingName"]
+    item = factory.ddb.Table(METADATA_TABLE).items[thing]
+    assert item["lifecycleStatus"] == "TRIAL" and item["certificateStatus"] == "ACTIVE"
+    assert iot.certificates[item["certificateId"]] == "ACTIVE"
+    assert iot.principals[thing] == {item["certificateArn"]}
+    assert iot.policies[item["certificateArn"]] == {"GatewayBasePolicy"}
+    assert factory.ddb.Table(ACTIVATION_TABLE).items[device["activationCode"]]["thingName"] == thing
+
+
+def test_provisions_single_device(factory):
+    result = factory.main({"planDays": 30}, None)
+
+    assert result["status"] == "ok"
+    _assert_provisioned(factory, result)
+    assert factory.ddb.Table(ACTIVATION_TABLE).items[result["activationCode"]]["planSeconds"] == 30 * 86400
+    assert result["privateKey"].startswith("private-")
+
+
+def test_rolls_back_partial_device(factory, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    def failing_put(**kwargs):
+        raise ClientError({"Error": {"Code": "InternalServerError", "Message": "x"}}, "PutItem")
+
+    monkeypatch.setattr(factory.metadata_table, "put_item", failing_put)
+    result = factory.main({}, None)
+
+    # Thing, certificado y codigo de activacion se deshacen
+    assert result["status"] == "error"
+    assert factory.fake_iot.things == {} and factory.fake_iot.certificates == {}
+    assert factory.ddb.Table(ACTIVATION_TABLE).items == {}
+    assert factory.fake_iot.calls["UpdateCertificate"] == factory.fake_iot.calls["DeleteCertificate"] == 1
+
+
+def test_provisions_batch_on_worker_pool(factory):
+    factory.fake_iot.fail_next("AttachThingPrincipal", times=2)
+
+    result = factory.main({"count": 20, "planDays": 7}, None)
+
+    assert result["status"] == "partial"
+    assert (result["requested"], result["provisioned"], result["failed"], result["notStarted"]) == (20, 18, 2, 0)
+    assert len(result["devices"]) == 20 and result["devicesPerSecond"] > 0
+    assert result["limiters"]["CreateThing"]["acquired"] == 20
+    for device in result["devices"]:
+        if device["status"] == "ok":
+            _assert_provisioned(factory, device)
+
+    # Los dos fallidos no dejan things, certificados ni codigos huerfanos
+    assert len(factory.fake_iot.things) == len(factory.fake_iot.certificates) == 18
+    assert len(factory.ddb.Table(ACTIVATION_TABLE).items) == len(factory.ddb.Table(METADATA_TABLE).items) == 18
+
+
+def test_batch_limits(factory):
+    assert factory.main({"count": 51}, None)["status"] == "error"
+    assert factory.main({"count": "x"}, None)["status"] == "error"
+
+    # Sin tiempo para todos: los que faltan no se empiezan
+    result = factory.main({"count": 10}, Context([60000] * 6 + [5000]))
+    assert (result["provisioned"], result["notStarted"]) == (6, 4)
+    assert len(factory.fake_iot.things) == 6
+    # Una entrada por dispositivo pedido, en orden
+    assert [d["status"] for d in result["devices"]] == ["ok"] * 6 + ["notStarted"] * 4
@@ -0,0 +1,173 @@
+import pytest
+
+from tests.support import load_lambda
+from tests.support.fake_stream import FakeStream
+from tests.support.lambdas import Context, install_fakes
+
+TABLE = "DeviceMetadata"
+STATE_TABLE = "LifecycleState"
+SCHEDULE_TABLE = "ExpirySchedule"
+NOW = 1760700000  # minuto exacto
+
+
+class Clock:
+    """time.time/time.sleep de los tests: dormir avanza el reloj."""
+
+    def __init__(self, now):
+        self.now = now
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    module = load_lambda("certificate_lifecycle", module="scheduler", env={
+        "DEVICE_METADATA_TABLE": TABLE,
+        "LIFECYCLE_STATE_TABLE": STATE_TABLE,
+        "EXPIRY_SCHEDULE_TABLE": SCHEDULE_TABLE,
+        "LIFECYCLE_WORKERS": "4",
+        "IOT_DESCRIBE_CERTIFICATE_TPS": "1000",
+        "IOT_UPDATE_CERTIFICATE_TPS": "1000",
+    })
+    install_fakes(monkeypatch, module, {
+        "device_table": TABLE,
+        "state_table": (STATE_TABLE, "stateKey"),
+    }, target=module.lifecycle)
+    monkeypatch.setattr(
+        module, "schedule_table", module.ddb.Table(SCHEDULE_TABLE, key="dueMinute", sort_key="thingName")
+    )
+    clock = Clock(NOW)
+    monkeypatch.setattr(module.time, "time", clock.time)
+    monkeypatch.setattr(module.time, "sleep", clock.sleep)
+    module.clock = clock
+    module.stream_source = FakeStream(module.ddb.Table(TABLE), batch_size=10)
+    return module
+
+
+def _put_device(scheduler, thing, expires_at, status="TRIAL"):
+    scheduler.fake_iot.add_certificate(f"cert-{thing}")
+    scheduler.ddb.Table(TABLE).put_item(Item={
+        "thingName": thing,
+        "certificateId": f"cert-{thing}",
+        "lifecycleStatus": status,
+        "expiresAt": expires_at,
+    })
+
+
+def _scheduled(scheduler):
+    return sorted(
+        (i["dueMinute"], i["thingName"], i["expiresAt"])
+        for i in scheduler.ddb.Table(SCHEDULE_TABLE).items.values()
+    )
+
+
+def test_stream_schedules_and_reschedules_on_expires_at_changes(scheduler):
+    table = scheduler.ddb.Table(TABLE)
+    _put_device(scheduler, "gw_a", NOW + 10)
+    _put_device(scheduler, "gw_b", NOW + 70, status="ACTIVE")
+    _put_device(scheduler, "gw_c", NOW + 20, status="EXPIRED")
+    # Renovacion: gw_a se mueve a otro minuto
+    table.update_item(Key={"thingName": "gw_a"}, UpdateExpression="SET expiresAt = :e, lifecycleStatus = :s",
+                      ExpressionAttributeValues={":e": NOW + 3600, ":s": "ACTIVE"})
+    # Escritura que no toca la expiracion
+    table.update_item(Key={"thingName": "gw_b"}, UpdateExpression="SET lastSeen = :t",
+                      ExpressionAttributeValues={":t": NOW})
+    table.delete_item(Key={"thingName": "gw_b"})
+
+    assert scheduler.stream_source.deliver(scheduler.stream) == 6
+    assert _scheduled(scheduler) == [(NOW + 3600, "gw_a", NOW + 3600)]
+
+
+def test_stream_reports_failed_record_and_is_retried_in_order(scheduler, monkeypatch):
+    _put_device(scheduler, "gw_a", NOW + 10)
+    _put_device(scheduler, "gw_b", NOW + 20)
+
+    schedule = scheduler.schedule_table
+    real_put = schedule.put_item
+    calls = []
+
+    def flaky_put(**kwargs):
+        calls.append(kwargs["Item"]["thingName"])
+        if len(calls) == 2:
+            from botocore.exceptions import ClientError
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException"}}, "PutItem")
+        return real_put(**kwargs)
+
+    monkeypatch.setattr(schedule, "put_item", flaky_put)
+
+    assert scheduler.stream_source.deliver(scheduler.stream) == 2
+    assert calls == ["gw_a", "gw_b", "gw_b"]
+    assert scheduler.stream_source.invocations == 2
+    assert [t for _, t, _ in _scheduled(scheduler)] == ["gw_a", "gw_b"]
+
+
+def test_tick_expires_each_device_at_its_deadline(scheduler):
+    for i, offset in enumerate((-30, 5, 5, 42)):
+        _put_device(scheduler, f"gw_{i}", NOW + offset)
+    # Renovado despues de agendar: la condicion sobre expiresAt lo salta
+    _put_device(scheduler, "gw_renewed", NOW + 50)
+    scheduler.stream_source.deliver(scheduler.stream)
+    scheduler.ddb.Table(TABLE).items["gw_renewed"]["expiresAt"] = NOW + 86400
+
+    # Primer tick sin checkpoint: empieza en el minuto actual
+    scheduler.clock.now = NOW + 1
+    result = scheduler.tick({}, Context(120000))
+    # gw_0 vencio en el minuto anterior: queda para el barrido de reconciliacion
+    assert (result["slots"], result["due"], result["expired"], result["skipped"]) == (1, 4, 3, 1)
+    assert scheduler.clock.slept == [4, 37, 8]
+    assert result["maxDelaySeconds"] == 0
+    assert result["checkpoint"] == NOW
+
+    statuses = {t: i["lifecycleStatus"] for t, i in scheduler.ddb.Table(TABLE).items.items()}
+    assert statuses == {"gw_0": "TRIAL", "gw_1": "EXPIRED", "gw_2": "EXPIRED", "gw_3": "EXPIRED", "gw_renewed": "TRIAL"}
+    assert scheduler.fake_iot.certificates["cert-gw_3"] == "INACTIVE"
+    assert scheduler.fake_iot.certificates["cert-gw_renewed"] == "ACTIVE"
+
+
+def test_tick_catches_up_from_checkpoint_and_stops_before_timeout(scheduler):
+    scheduler.ddb.put(STATE_TABLE, {"stateKey": "scheduler#checkpoint", "processedThrough": NOW - 180}, key="stateKey")
+    _put_device(scheduler, "gw_late_1", NOW - 100)
+    _put_device(scheduler, "gw_late_2", NOW - 50)
+    _put_device(scheduler, "gw_soon", NOW + 30)
+    scheduler.stream_source.deliver(scheduler.stream)
+
+    # Sin tiempo para esperar a gw_soon: el slot actual queda sin checkpoint
+    result = scheduler.tick({}, Context(20000))
+    assert (result["slots"], result["expired"], result["checkpoint"]) == (2, 2, NOW - 60)
+    assert result["maxDelaySeconds"] == 100
+    assert scheduler.clock.slept == []
+
+    scheduler.clock.now = NOW + 2
+    result = scheduler.tick({}, Context(120000))
+    assert (result["slots"], result["expired"], result["checkpoint"]) == (1, 1, NOW)
+    assert scheduler.ddb.Table(TABLE).items["gw_soon"]["lifecycleStatus"] == "EXPIRED"
+
+
+def test_large_slot_stops_between_chunks_and_resumes_from_cursor(scheduler):
+    things = [f"gw_{i:02d}" for i in range(10)]
+    for i, thing in enumerate(things):
+        _put_device(scheduler, thing, NOW + i)
+    scheduler.stream_source.deliver(scheduler.stream)
+    scheduler.clock.now = NOW + 20
+
+    # Tiempo para dos lotes de 4 (WORKERS): el tercero queda para el proximo tick
+    result = scheduler.tick({}, Context([120000, 120000, 3000]))
+    assert (result["slots"], result["due"], result["expired"], result["checkpoint"]) == (0, 8, 8, None)
+    statuses = {t: scheduler.ddb.Table(TABLE).items[t]["lifecycleStatus"] for t in things}
+    assert [t for t in things if statuses[t] == "EXPIRED"] == things[:8]
+    checkpoint = scheduler.ddb.Table(STATE_TABLE).items["scheduler#checkpoint"]
+    assert (checkpoint["cursorSlot"], checkpoint["cursorExpiresAt"], checkpoint["cursorThing"]) == (NOW, NOW + 7, "gw_07")
+
+    # El siguiente tick solo ve lo que falto y cierra el slot
+    scheduler.clock.now = NOW + 30
+    result = scheduler.tick({}, Context(120000))
+    assert (result["slots"], result["due"], result["expired"], result["skipped"]) == (1, 2, 2, 0)
+    assert result["checkpoint"] == NOW
+    assert all(scheduler.ddb.Table(TABLE).items[t]["lifecycleStatus"] == "EXPIRED" for t in things)
+    assert "cursorSlot" not in scheduler.ddb.Table(STATE_TABLE).items["scheduler#checkpoint"]
@@ -0,0 +1,56 @@
+import base64
+import json
+
+import pytest
+
+from tests.support import COMMON_LAYER  # noqa: F401  (akame_common en sys.path)
+
+from akame_common import gateway_token
+from akame_common.gateway_token import TokenError
+
+NOW = 1760700000
+
+
+def _keyring(active="k1", **secrets):
+    secrets = secrets or {"k1": b"a" * 32}
+    return gateway_token.parse_keyring(json.dumps({
+        "active": active,
+        "keys": {kid: base64.b64encode(key).decode() for kid, key in secrets.items()},
+    }))
+
+
+def test_roundtrip_and_rotation():
+    old = _keyring()
+    token = gateway_token.mint(old, "gw_1", "user-1", NOW, NOW + 3600)
+
+    claims = gateway_token.verify(old, token, NOW + 10)
+    assert (claims["t"], claims["u"], claims["iat"], claims["exp"]) == ("gw_1", "user-1", NOW, NOW + 3600)
+
+    # Tras rotar, los tokens firmados con la clave anterior siguen valiendo
+    rotated = _keyring("k2", k1=b"a" * 32, k2=b"b" * 32)
+    assert gateway_token.verify(rotated, token, NOW)["t"] == "gw_1"
+    assert gateway_token.mint(rotated, "gw_1", "user-1", NOW, NOW + 1).count(".") == 1
+
+
+@pytest.mark.parametrize("mutate, reason", [
+    (lambda t: t.replace(".", ".x", 1), "bad_signature"),
+    (lambda t: "e30." + t.split(".")[1], "unsupported_token"),
+    (lambda t: "not-a-token", "malformed_token"),
+    (lambda t: "!!!." + t.split(".")[1], "malformed_token"),
+])
+def test_rejects_tampered_tokens(mutate, reason):
+    keyring = _keyring()
+    token = gateway_token.mint(keyring, "gw_1", "user-1", NOW, NOW + 3600)
+
+    with pytest.raises(TokenError) as exc:
+        gateway_token.verify(keyring, mutate(token), NOW)
+    assert exc.value.reason == reason
+
+
+def test_rejects_expired_and_unknown_key():
+    token = gateway_token.mint(_keyring(), "gw_1", "user-1", NOW, NOW + 60)
+
+    with pytest.raises(TokenError, match="token_expired"):
+        gateway_token.verify(_keyring(), token, NOW + 61)
+    with pytest.raises(TokenError, match="unknown_key"):
+        gateway_token.verify(_keyring("k2", k2=b"b" * 32), token, NOW)
@@ -0,0 +1,543 @@
+import base64
+import json
+
+import pytest
+
+from aws_iot_akame.telemetry_schema import reading_schema_json
+from tests.support import load_lambda
+
+
+@pytest.fixture
+def ingestion():
+    return load_lambda("ingestion", env={"TRANSFORM_MODE": "batch"})
+
+
+def _event(*payloads):
+    return {
+        "records": [
+            {"recordId": str(i), "data": base64.b64encode(p).decode()}
+            for i, p in enumerate(payloads)
+        ]
+    }
+
+
+def _mesh_ids(result):
+    return [
+        r["metadata"]["partitionKeys"]["meshId"] if r["result"] == "Ok" else r["result"]
+        for r in result["records"]
+    ]
+
+
+def test_scan_matches_full_parse(ingestion):
+    payload = json.dumps({
+        "readings": [{"nodeId": 1, "humidity": 40.2}],
+        "event_ts": 1,
+        "meshId": "gw_abc",
+        "ingestedAt": 2,
+    }).encode()
+
+    assert ingestion._scan_mesh_id(payload) == "gw_abc"
+    assert _mesh_ids(ingestion.handler(_event(payload), None)) == ["gw_abc"]
+
+
+@pytest.mark.parametrize("payload", [
+    b'{"meshId": "a", "x": {"meshId": "b"}}',
+    b'{"meshId": "g\\u0077_1"}',
+    b'{"meshId": 12}',
+    # Solo una clave anidada: el valor de primer nivel es "unknown"
+    b'{"x": {"meshId": "nested"}}',
+    b'{"readings": [{"nodeId": 1, "meshId": "nested"}], "event_ts": 1}',
+])
+def test_ambiguous_scan_falls_back(ingestion, payload):
+    assert ingestion._scan_mesh_id(payload) is None
+    expected = json.loads(payload).get("meshId", "unknown")
+    assert _mesh_ids(ingestion.handler(_event(payload), None)) == [expected]
+
+
+def test_escaped_key_inside_string_is_ignored(ingestion):
+    payload = b'{"note": "\\"meshId\\": \\"spoof\\"", "meshId": "gw_1"}'
+    assert ingestion._scan_mesh_id(payload) == "gw_1"
+
+
+@pytest.mark.parametrize("payload", [
+    b'{"readings": [{"nodeId": 1}], "meshId": "gw_1"',
+    b'{"readings": [{"nodeId": 1}, "meshId": "gw_1"}',
+    b'"meshId": "gw_1"}',
+])
+def test_malformed_payload_with_mesh_id_fails(ingestion, payload):
+    assert ingestion._scan_mesh_id(payload) is None
+    assert _mesh_ids(ingestion.handler(_event(payload), None)) == ["ProcessingFailed"]
+
+
+def test_missing_and_invalid_payloads(ingestion):
+    result = ingestion.handler(_event(b'{"readings": []}', b"not json"), None)
+    assert _mesh_ids(result) == ["unknown", "ProcessingFailed"]
+    assert [r["recordId"] for r in result["records"]] == ["0", "1"]
+
+
+def _hours(result):
+    return [
+        "{year}-{month}-{day}T{hour}".format(**r["metadata"]["partitionKeys"])
+        for r in result["records"]
+        if r["result"] == "Ok"
+    ]
+
+
+@pytest.mark.parametrize("mode", ["batch", "legacy"])
+def test_partitions_follow_event_time(mode, monkeypatch):
+    transform = load_lambda("ingestion", env={"TRANSFORM_MODE": mode})
+    monkeypatch.setattr(transform.time, "time", lambda: 1760702400.0)  # 2025-10-17T12:00Z
+
+    payloads = [
+        # Lectura de las 11:59 entregada a las 12:00: sigue en la hora 11
+        b'{"readings": [], "event_ts": 1760702399, "meshId": "gw_1"}',
+        # Milisegundos y datos atrasados del gateway (dia anterior)
+        b'{"readings": [], "event_ts": 1760612400000, "meshId": "gw_1"}',
+        # Sin event_ts, reloj adelantado o antes de la projection: llegada
+        b'{"readings": [], "meshId": "gw_1"}',
+        b'{"readings": [], "event_ts": 1760800000, "meshId": "gw_1"}',
+        b'{"readings": [], "event_ts": 5, "meshId": "gw_1"}',
+        b'{"readings": [], "event_ts": "soon", "meshId": "gw_1"}',
+    ]
+    assert _hours(transform.handler(_event(*payloads), None)) == [
+        "2025-10-17T11",
+        "2025-10-16T11",
+        "2025-10-17T12",
+        "2025-10-17T12",
+        "2025-10-17T12",
+        "2025-10-17T12",
+    ]
+
+
+@pytest.mark.parametrize("payload", [
+    b'{"readings": [], "event_ts": 1.5e9, "meshId": "gw_1"}',
+    b'{"readings": [], "event_ts": "1760702399", "meshId": "gw_1"}',
+    b'{"readings": [{"event_ts": 1}], "meshId": "gw_1"}',
+    b'{"event_ts": 1760702399, "readings": [], "meshId": "gw_1"}',
+])
+def test_event_ts_scan_falls_back(ingestion, payload):
+    assert ingestion._scan_record(payload) is None
+    keys = ingestion.handler(_event(payload), None)["records"][0]["metadata"]["partitionKeys"]
+    assert keys == {"meshId": "gw_1", **ingestion._event_hour(json.loads(payload).get("event_ts"))}
+
+
+def test_event_ts_scan(ingestion):
+    payload = b'{"readings": [{"nodeId": 1}], "event_ts": 1760702399 , "meshId": "gw_1", "ingestedAt": 2}'
+    assert ingestion._scan_record(payload) == ("gw_1", 1760702399)
+
+
+def test_flat_output_emits_one_row_per_reading():
+    flat = load_lambda("ingestion", env={"TRANSFORM_OUTPUT": "flat"})
+    payload = json.dumps({
+        "readings": [{"nodeId": 1, "humidity": 40.2}, {"nodeId": 2, "meshId": "spoof"}],
+        "event_ts": 10,
+        "meshId": "gw_abc",
+        "ingestedAt": 11,
+    }).encode()
+
+    result = flat.handler(_event(payload, b'{"meshId": "gw_abc", "readings": []}'), None)
+    ok, dropped = result["records"]
+
+    rows = [json.loads(line) for line in base64.b64decode(ok["data"]).splitlines()]
+    assert rows == [
+        {"nodeId": 1, "humidity": 40.2, "meshId": "gw_abc", "event_ts": 10, "ingestedAt": 11},
+        {"nodeId": 2, "meshId": "gw_abc", "event_ts": 10, "ingestedAt": 11},
+    ]
+    assert ok["metadata"]["partitionKeys"]["meshId"] == "gw_abc"
+    assert dropped["result"] == "Dropped"
+
+
+@pytest.fixture
+def validating():
+    return load_lambda("ingestion", env={
+        "VALIDATE_PAYLOADS": "true",
+        "READING_SCHEMA": reading_schema_json(),
+    })
+
+
+def test_validation_coerces_numeric_strings(validating):
+    payload = json.dumps({
+        "readings": [{"nodeId": "3", "humidity": "40.5", "signal_strength": -70.0}],
+        "event_ts": "1760700000000",
+        "meshId": "gw_1",
+    }).encode()
+
+    (record,) = validating.handler(_event(payload), None)["records"]
+
+    assert record["result"] == "Ok"
+    assert json.loads(base64.b64decode(record["data"])) == {
+        "readings": [{"nodeId": 3, "humidity": 40.5, "signal_strength": -70}],
+        "event_ts": 1760700000000,
+        "meshId": "gw_1",
+    }
+
+
+def test_valid_payload_is_passed_through_untouched(validating):
+    payload = b'{"readings": [{"nodeId": 1, "humidity": 40}], "event_ts": 1, "meshId": "gw_1"}'
+    (record,) = validating.handler(_event(payload), None)["records"]
+    assert base64.b64decode(record["data"]) == payload
+
+
+def test_valid_batch_check_falls_back_per_reading(validating):
+    # nulls, lecturas dispersas y un float entero en un campo int
+    payload = json.dumps({
+        "readings": [{"nodeId": 1, "humidity": None}, {"raw": 7}, {"nodeId": 2.0, "uptime": 5}],
+        "event_ts": 1,
+        "meshId": "gw_1",
+    }).encode()
+
+    (record,) = validating.handler(_event(payload), None)["records"]
+
+    assert json.loads(base64.b64decode(record["data"]))["readings"] == [
+        {"nodeId": 1, "humidity": None}, {"raw": 7}, {"nodeId": 2, "uptime": 5},
+    ]
+
+
+@pytest.mark.parametrize("payload, reason", [
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 1, "humidity": "wet"}]}', "invalid_type"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 2147483648}]}', "out_of_range"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 1, "signal_strength": "-2147483649"}]}', "out_of_range"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 1, "uptime": 9223372036854775808}]}', "out_of_range"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 1, "humidity": NaN}]}', "invalid_json"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": true}]}', "invalid_type"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 1, "humidity": 4}, {"nodeId": 2, "humidity": false}]}', "invalid_type"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 1, "humidity": [40]}]}', "invalid_type"),
+    (b'{"meshId": "gw_1", "readings": [{"nodeId": 1}, {"nodeId": 1.5}]}', "invalid_type"),
+    (b'{"meshId": "gw_1", "readings": {"nodeId": 1}}', "readings_not_list"),
+    (b'{"meshId": "gw_1", "event_ts": "soon"}', "invalid_timestamp"),
+    (b'{"readings": []}', "missing_mesh_id"),
+    (b'[1, 2]', "not_an_object"),
+])
+def test_validation_rejects_with_reason(validating, capsys, payload, reason):
+    (record,) = validating.handler(_event(payload), None)["records"]
+
+    assert record["result"] == "ProcessingFailed"
+    assert json.loads(capsys.readouterr().out)["rejected"] == {reason: 1}
+
+
+def test_unknown_metrics_are_dropped_not_rejected(validating, capsys):
+    payload = json.dumps({
+        "readings": [{"nodeId": 1, "humidity": 40.5, "lux": 120}, {"nodeId": 2, "lux": 80, "fw": "1.2"}],
+        "event_ts": 1,
+        "meshId": "gw_1",
+    }).encode()
+
+    (record,) = validating.handler(_event(payload), None)["records"]
+
+    assert record["result"] == "Ok"
+    assert json.loads(base64.b64decode(record["data"]))["readings"] == [
+        {"nodeId": 1, "humidity": 40.5},
+        {"nodeId": 2},
+    ]
+    assert json.loads(capsys.readouterr().out)["unknownMetrics"] == {"lux": 2, "fw": 1}
+
+
+def test_aggregate_metrics_follow_schema():
+    aggregates = load_lambda("telemetry_aggregates", env={
+        "ATHENA_DATABASE": "telemetry", "ATHENA_WORKGROUP": "telemetry-prod",
+        "READING_SCHEMA": reading_schema_json(),
+    })
+    schema = json.loads(reading_schema_json())
+    assert aggregates.ALLOWED_METRICS == set(schema) - {"nodeId", "uptime"}
+
+
+# ---------- Entitlements ----------
+
+@pytest.fixture
+def entitled_ingestion(monkeypatch):
+    from tests.support.fake_dynamodb import FakeDynamoDB
+
+    mod = load_lambda("ingestion", env={
+        "TRANSFORM_MODE": "batch",
+        "ENFORCE_ENTITLEMENTS": "true",
+        "DEVICE_METADATA_TABLE": "meta",
+    })
+    fake = FakeDynamoDB()
+    monkeypatch.setattr(mod.entitlements, "dynamodb", fake)
+    return mod, fake
+
+
+def _telemetry(mesh_id):
+    return json.dumps({"meshId": mesh_id, "readings": [{"nodeId": 1}]}).encode()
+
+
+def test_entitlements_drop_expired_and_unknown(entitled_ingestion):
+    ingestion, ddb = entitled_ingestion
+    future = 4_000_000_000
+    ddb.put("meta", {"thingName": "gw_ok", "status": "active", "expiresAt": future})
+    ddb.put("meta", {"thingName": "gw_expired", "status": "active", "expiresAt": 1})
+    ddb.put("meta", {"thingName": "gw_revoked", "status": "revoked", "expiresAt": future})
+
+    event = _event(*(_telemetry(m) for m in ["gw_ok", "gw_expired", "gw_revoked", "gw_ghost", "gw_ok"]))
+    result = ingestion.handler(event, None)
+
+    assert _mesh_ids(result) == ["gw_ok", "Dropped", "Dropped", "Dropped", "gw_ok"]
+    # Un solo BatchGetItem para los 4 meshId distintos
+    assert ddb.calls == {"batch_get_item": 1}
+
+
+def test_entitlements_cached_between_invocations(entitled_ingestion):
+    ingestion, ddb = entitled_ingestion
+    ddb.put("meta", {"thingName": "gw_ok", "status": "active", "expiresAt": 4_000_000_000})
+    ddb.unprocessed_once = True
+
+    event = _event(_telemetry("gw_ok"), _telemetry("gw_ghost"))
+    assert _mesh_ids(ingestion.handler(event, None)) == ["gw_ok", "Dropped"]
+    calls = ddb.calls["batch_get_item"]
+
+    assert _mesh_ids(ingestion.handler(event, None)) == ["gw_ok", "Dropped"]
+    assert ddb.calls["batch_get_item"] == calls
+    assert ingestion.entitlements.cache_stats()["hits"] == 2
+
+
+def test_firehose_batches_resolve_each_gateway_once(entitled_ingestion, capsys):
+    from tests.support.fake_firehose import FakeFirehose
+
+    ingestion, ddb = entitled_ingestion
+    gateways = [f"gw_{i:03d}" for i in range(250)]
+    for mesh_id in gateways[:200]:
+        ddb.put("meta", {"thingName": mesh_id, "status": "active", "expiresAt": 4_000_000_000})
+
+    stream = FakeFirehose(ingestion.handler, buffer_records=300)
+    for i in range(600):
+        stream.put_record(DeliveryStreamName="telemetry", Record={"Data": _telemetry(gateways[i % 250])})
+    stream.flush()
+
+    assert stream.invocations == 2
+    # 250 clientids distintos: 3 BatchGetItem (100 + 100 + 50); el segundo lote sale de la cache
+    assert ddb.calls == {"batch_get_item": 3}
+    assert len(stream.delivered) == 500
+    assert {mesh_id for mesh_id, _ in stream.delivered} == set(gateways[:200])
+    assert stream.dropped == 100 and stream.errors == []
+
+    reports = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [(r["msg"], r["records"], r["ok"], r["dropped"]) for r in reports] == [
+        ("batch", 300, 250, 50),
+        ("batch", 300, 250, 50),
+    ]
+    assert reports[0]["meshIds"] == 250 and len(reports[0]["notEntitled"]) == 50
+
+
+def test_firehose_retries_batch_when_lookup_fails(entitled_ingestion, monkeypatch):
+    from tests.support.fake_firehose import FakeFirehose
+
+    ingestion, ddb = entitled_ingestion
+    ddb.put("meta", {"thingName": "gw_ok", "status": "active", "expiresAt": 4_000_000_000})
+
+    batch_get_item = ddb.batch_get_item
+    failures = [RuntimeError("ProvisionedThroughputExceededException")]
+
+    def flaky(**kwargs):
+        if failures:
+            raise failures.pop()
+        return batch_get_item(**kwargs)
+
+    monkeypatch.setattr(ddb, "batch_get_item", flaky)
+
+    stream = FakeFirehose(ingestion.handler)
+    stream.put_record_batch(DeliveryStreamName="telemetry", Records=[
+        {"Data": _telemetry("gw_ok")}, {"Data": _telemetry("gw_ghost")}, {"Data": b"not json"},
+    ])
+    stream.flush()
+
+    # El lote completo se reintenta; nada se entrega sin pasar el filtro
+    assert (stream.invocations, stream.failed_invocations) == (2, 1)
+    assert [mesh_id for mesh_id, _ in stream.delivered] == ["gw_ok"]
+    assert stream.dropped == 1
+    assert stream.errors == [("Lambda.ProcessingFailed", b"not json")]
+
+
+# ---------- Dedup ----------
+
+@pytest.fixture
+def dedup_ingestion():
+    return load_lambda("ingestion", env={
+        "TRANSFORM_MODE": "batch",
+        "DEDUP_ENABLED": "true",
+        "VALIDATE_PAYLOADS": "true",
+        "READING_SCHEMA": reading_schema_json(),
+    })
+
+
+@pytest.fixture
+def fast_dedup_ingestion():
+    # sin validacion: el transform no parsea y el dedup es por record
+    return load_lambda("ingestion", env={"TRANSFORM_MODE": "batch", "DEDUP_ENABLED": "true"})
+
+
+def _readings_payload(mesh_id, event_ts, node_ids, ingested_at=None):
+    payload = {
+        "readings": [{"nodeId": n, "humidity": 40.0} for n in node_ids],
+        "event_ts": event_ts,
+        "meshId": mesh_id,
+    }
+    if ingested_at is not None:
+        payload["ingestedAt"] = ingested_at
+    return json.dumps(payload).encode()
+
+
+def _records_with_ids(event, prefix):
+    for r in event["records"]:
+        r["recordId"] = prefix + r["recordId"]
+    return event
+
+
+def test_dedup_drops_retried_publishes(dedup_ingestion, capsys):
+    first = _readings_payload("gw_1", 100, [1, 2])
+    retry = _readings_payload("gw_1", 100, [1, 2])
+    partial = _readings_payload("gw_1", 100, [2, 3])
+    other_ts = _readings_payload("gw_1", 101, [1, 2])
+
+    result = dedup_ingestion.handler(_event(first, retry, partial, other_ts), None)
+    assert _mesh_ids(result) == ["gw_1", "Dropped", "gw_1", "gw_1"]
+
+    kept = json.loads(base64.b64decode(result["records"][2]["data"]))
+    assert [r["nodeId"] for r in kept["readings"]] == [3]
+
+    report = json.loads(capsys.readouterr().out)
+    assert report["duplicateReadings"] == 3
+    assert report["droppedRecords"] == 1
+
+
+def test_fast_path_dedup_drops_exact_resends(fast_dedup_ingestion, capsys, monkeypatch):
+    def no_parse(*args, **kwargs):
+        raise AssertionError("dedup parsed the payload")
+
+    monkeypatch.setattr(fast_dedup_ingestion.json, "loads", no_parse)
+
+    first = _readings_payload("gw_1", 100, [1, 2], ingested_at=100500)
+    # ingestedAt lo pone la IoT Rule en cada reenvio
+    resend = _readings_payload("gw_1", 100, [1, 2], ingested_at=100900)
+    partial = _readings_payload("gw_1", 100, [2, 3], ingested_at=100950)
+
+    result = fast_dedup_ingestion.handler(_event(first, resend, partial), None)
+    monkeypatch.undo()
+
+    # Sin parseo solo se detectan reenvios exactos: el solapamiento parcial pasa
+    assert _mesh_ids(result) == ["gw_1", "Dropped", "gw_1"]
+    assert base64.b64decode(result["records"][2]["data"]) == partial
+    report = json.loads(capsys.readouterr().out)
+    assert (report["duplicateReadings"], report["droppedRecords"]) == (0, 1)
+
+
+@pytest.mark.parametrize("mode", ["dedup_ingestion", "fast_dedup_ingestion"])
+def test_dedup_never_drops_a_retried_invocation(mode, request, monkeypatch):
+    module = request.getfixturevalue(mode)
+    event = _event(_readings_payload("gw_1", 100, [1, 2], ingested_at=1))
+
+    transform = module._transform_batch
+
+    def timeout(*args):
+        transform(*args)
+        raise TimeoutError
+
+    # Primer intento: el transform corre y la invocacion vence
+    monkeypatch.setattr(module, "_transform_batch", timeout)
+    with pytest.raises(TimeoutError):
+        module.handler(event, None)
+    monkeypatch.setattr(module, "_transform_batch", transform)
+
+    # Contenedor ocupado antes del reintento: mas recordIds nuevos de los que
+    # cabria recordar por recordId
+    for i in range(101):
+        busy = _records_with_ids(_event(*(
+            b'{"readings":[{"nodeId":1}],"event_ts":%d,"meshId":"gw_busy"}' % (i * 500 + n)
+            for n in range(500)
+        )), f"busy{i}-")
+        module.handler(busy, None)
+
+    # Reintento de Firehose: mismos recordIds y contenido, todo se entrega
+    result = module.handler(event, None)
+    assert _mesh_ids(result) == ["gw_1"]
+    delivered = json.loads(base64.b64decode(result["records"][0]["data"]))
+    assert [r["nodeId"] for r in delivered["readings"]] == [1, 2]
+
+    # Y una vez entregado, un reenvio QoS1 si es duplicado
+    resend = _records_with_ids(_event(_readings_payload("gw_1", 100, [1, 2], ingested_at=2)), "qos1-")
+    assert _mesh_ids(module.handler(resend, None)) == ["Dropped"]
+
+
+def test_fingerprint_filter_bounds(dedup_ingestion):
+    dedup = dedup_ingestion.dedup
+    small = dedup.FingerprintFilter(capacity=100000, max_bytes=4096)
+    assert len(small.table) * small.table.itemsize <= 4096
+    assert small.capacity < 100000
+
+    clock = [0.0]
+    window = dedup.WindowedDedup(60, 20000, 1 << 20, clock=lambda: clock[0])
+    assert sum(window.seen(("gw", i, 1)) for i in range(20000)) < 20
+    assert all(window.seen(("gw", i, 1)) for i in range(20000))
+    assert window.memory_bytes() <= 1 << 20
+
+    false_positives = sum(window.seen(("other", i, 1)) for i in range(20000))
+    assert false_positives < 20000 * dedup.FingerprintFilter.FALSE_POSITIVE_RATE * 3
+
+    # Tras dos ventanas la clave se olvida
+    clock[0] = 121
+    assert not window.seen(("gw", 1, 1))
+
+
+# ---------- Rollups ----------
+
+def test_rollups_written_per_minute_and_hour(monkeypatch):
+    import gzip
+    from tests.support.fake_s3 import FakeS3
+
+    ingestion = load_lambda("ingestion", env={
+        "TRANSFORM_MODE": "batch",
+        "ROLLUPS_ENABLED": "true",
+        "ROLLUP_BUCKET": "raw",
+    })
+    s3 = FakeS3()
+    monkeypatch.setattr(ingestion.rollups, "s3", s3)
+
+    hour = 1760698800  # 2025-10-17T11:00:00Z
+    event = _event(
+        json.dumps({"meshId": "gw_1", "event_ts": hour + 5, "readings": [
+            {"nodeId": 1, "humidity": 40.0, "raw": 3},
+            {"nodeId": 2, "humidity": 50.0},
+        ]}).encode(),
+        json.dumps({"meshId": "gw_1", "event_ts": (hour + 65) * 1000, "readings": [
+            {"nodeId": 1, "humidity": 44.0, "raw": None},
+        ]}).encode(),
+        b"{not json",
+    )
+    result = ingestion.handler(event, None)
+    assert _mesh_ids(result) == ["gw_1", "gw_1", "ProcessingFailed"]
+
+    def rows(granularity):
+        [key] = s3.keys("raw", f"rollups/granularity={granularity}/")
+        assert "/year=2025/month=10/day=17/hour=11/" in key
+        lines = gzip.decompress(s3.body("raw", key)).splitlines()
+        return {(r["nodeid"], r["bucket_ts"]): r["metrics"] for r in map(json.loads, lines)}
+
+    minute = rows("minute")
+    assert minute[(1, hour)] == {"humidity": [1, 40.0, 40.0, 40.0], "raw": [1, 3, 3, 3]}
+    assert minute[(1, hour + 60)] == {"humidity": [1, 44.0, 44.0, 44.0]}
+
+    hourly = rows("hour")
+    assert hourly[(1, hour)] == {"humidity": [2, 84.0, 40.0, 44.0], "raw": [1, 3, 3, 3]}
+    assert hourly[(2, hour)] == {"humidity": [1, 50.0, 50.0, 50.0]}
+
+    # Marca de inicio para telemetry_aggregates, escrita antes que los objetos
+    marker = json.loads(s3.body("raw", "rollups/_since.json"))
+    assert marker["since"] <= s3.buckets["raw"][s3.keys("raw", "rollups/granularity=")[0]]["LastModified"].timestamp()
+
+    # Reintento de Firehose: mismas keys, sin duplicar objetos; la marca no cambia
+    ingestion.handler(event, None)
+    assert len(s3.keys("raw", "rollups/granularity=")) == 2
+    assert json.loads(s3.body("raw", "rollups/_since.json")) == marker
+
+
+def test_rollups_marker_keeps_the_first_writer(monkeypatch):
+    from tests.support.fake_s3 import FakeS3
+
+    ingestion = load_lambda("ingestion", env={"ROLLUPS_ENABLED": "true", "ROLLUP_BUCKET": "raw"})
+    s3 = FakeS3()
+    s3.put("raw", "rollups/_since.json", b'{"since": 1760000000}')
+    monkeypatch.setattr(ingestion.rollups, "s3", s3)
+
+    ingestion.handler(_event(_readings_payload("gw_1", 1760698800, [1])), None)
+
+    assert json.loads(s3.body("raw", "rollups/_since.json")) == {"since": 1760000000}
+    assert s3.keys("raw", "rollups/granularity=")
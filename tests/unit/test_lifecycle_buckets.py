@@ -0,0 +1,64 @@
+import contextlib
+import importlib.util
+import io
+import os
+
+from tests.support import REPO_ROOT
+from tests.support.fake_dynamodb import FakeDynamoDB
+from akame_common import lifecycle_buckets
+
+TS = 1760700000  # 2025-10-17 11:20 UTC
+
+
+def _load_script():
+    path = os.path.join(REPO_ROOT, "scripts", "reshard_lifecycle_buckets.py")
+    spec = importlib.util.spec_from_file_location("reshard_lifecycle_buckets", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_bucket_keys():
+    assert lifecycle_buckets.bucket_for("TRIAL#", TS, "gw_1", 1) == "TRIAL#2025101711"
+
+    bucket = lifecycle_buckets.bucket_for("TRIAL#", TS, "gw_1", 8)
+    assert bucket == f"TRIAL#2025101711#{lifecycle_buckets.shard_of('gw_1', 8)}"
+    assert lifecycle_buckets.base_bucket(bucket) == "TRIAL#2025101711"
+    # La clave antigua sigue entre las que se consultan
+    assert lifecycle_buckets.shard_keys("TRIAL#", TS, 4) == [
+        "TRIAL#2025101711", "TRIAL#2025101711#0", "TRIAL#2025101711#1", "TRIAL#2025101711#2", "TRIAL#2025101711#3",
+    ]
+
+
+def test_shards_spread_a_provisioning_batch():
+    counts = {}
+    for i in range(8000):
+        bucket = lifecycle_buckets.bucket_for("TRIAL#", TS, f"gw_{i:032x}", 8)
+        counts[bucket] = counts.get(bucket, 0) + 1
+    assert len(counts) == 8
+    assert max(counts.values()) < 1.1 * 8000 / 8
+
+
+def test_reshard_moves_legacy_items():
+    script = _load_script()
+    ddb = FakeDynamoDB()
+    table = ddb.Table("DeviceMetadata")
+    table.page_size = 7
+    for i in range(20):
+        ddb.put("DeviceMetadata", {"thingName": f"gw_{i:02d}", "lifecycleBucket": "ACTIVE#2025101711"})
+    already = lifecycle_buckets.bucket_for("TRIAL#", TS, "gw_sharded", 4)
+    ddb.put("DeviceMetadata", {"thingName": "gw_sharded", "lifecycleBucket": already})
+    ddb.put("DeviceMetadata", {"thingName": "gw_no_bucket"})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        dry = script.reshard(table, 4)
+    assert dry["items"] == 20 and dry["moved"] == 0 and "update_item" not in ddb.calls
+
+    stats = script.reshard(table, 4, apply=True, writes_per_second=1000)
+    assert (stats["items"], stats["moved"], stats["buckets"]) == (20, 20, 4)
+    for item in table.items.values():
+        if "lifecycleBucket" in item:
+            assert item["lifecycleBucket"] == lifecycle_buckets.rebucket(item["lifecycleBucket"], item["thingName"], 4)
+
+    # Idempotente
+    assert script.reshard(table, 4, apply=True)["items"] == 0
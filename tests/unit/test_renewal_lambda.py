@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from tests.support import load_lambda
+from tests.support.fake_dynamodb import FakeDynamoDB
+
+TABLE = "DeviceMetadata"
+DENYLIST = "DenyList"
+KEYS_PARAM = "/akame/gateway-token/keys"
+NOW = 1760700000
+
+
+class FakeSSM:
+    def get_parameter(self, Name, WithDecryption=False):
+        assert Name == KEYS_PARAM
+        return {"Parameter": {"Value": '{"active": "k1", "keys": {"k1": "c2VjcmV0"}}'}}
+
+
+@pytest.fixture
+def renewal(monkeypatch):
+    module = load_lambda("renewal_lambda", env={
+        "DEVICE_METADATA_TABLE": TABLE,
+        "GATEWAY_TOKEN_KEYS_PARAM": KEYS_PARAM,
+        "TOKEN_DENYLIST_TABLE": DENYLIST,
+    })
+    fake = FakeDynamoDB()
+    monkeypatch.setattr(module, "table", fake.Table(TABLE))
+    monkeypatch.setattr(module, "denylist_table", fake.Table(DENYLIST))
+    monkeypatch.setattr(module, "ssm", FakeSSM())
+    monkeypatch.setattr(module.time, "time", lambda: NOW)
+    module.fake = fake
+    module.keyring = module.gateway_token.parse_keyring(FakeSSM().get_parameter(KEYS_PARAM)["Parameter"]["Value"])
+    return module
+
+
+def _call(renewal, action, thing="gw_1"):
+    response = renewal.lambda_handler({"path": f"/thing/{action}", "body": {"thingName": thing}}, None)
+    assert response["statusCode"] == 200, response
+    return json.loads(response["body"])["result"]["ok"]
+
+
+def _accepted(renewal, token):
+    # Misma regla que el authorizer en modo token
+    claims = renewal.gateway_token.verify(renewal.keyring, token, NOW)
+    row = renewal.fake.Table(DENYLIST).items.get(claims["t"])
+    return row is None or claims["iat"] > row["revokedAt"]
+
+
+def test_rehabilitate_keeps_old_tokens_revoked(renewal):
+    renewal.fake.put(TABLE, {"thingName": "gw_1", "userId": "u1", "status": "active", "expiresAt": NOW + 3600})
+    leaked = _call(renewal, "renew")[0]["gatewayToken"]
+
+    _call(renewal, "revoke")
+    assert not _accepted(renewal, leaked)
+
+    # Todo en el mismo segundo: el token nuevo igual queda despues de revokedAt
+    token = _call(renewal, "rehabilitate")[0]["gatewayToken"]
+    assert renewal.fake.Table(DENYLIST).items["gw_1"]["revokedAt"] == NOW
+    assert _accepted(renewal, token)
+    assert not _accepted(renewal, leaked)
+
+    renewed = _call(renewal, "renew")[0]["gatewayToken"]
+    assert _accepted(renewal, renewed)
+
+    # Una nueva revocacion cubre tambien los tokens de la rehabilitacion
+    _call(renewal, "revoke")
+    assert not any(_accepted(renewal, t) for t in (leaked, token, renewed))
@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from aws_iot_akame.telemetry_schema import reading_schema_json
+from tests.support import load_lambda
+from tests.support.fake_s3 import FakeS3
+
+HOUR = 3600
+NOW = 1760700000  # 2025-10-17T11:20:00Z
+MARKER = "rollups/_since.json"
+
+
+@pytest.fixture
+def s3():
+    s3 = FakeS3()
+    s3.put("raw", MARKER, json.dumps({"since": NOW - 30 * 86400}).encode())
+    return s3
+
+
+@pytest.fixture
+def aggregates(s3, monkeypatch):
+    module = load_lambda("telemetry_aggregates", env={
+        "ATHENA_DATABASE": "telemetry",
+        "ATHENA_WORKGROUP": "telemetry-prod",
+        "ROLLUPS_TABLE": "telemetry_rollups",
+        "ROLLUP_GRACE_SECONDS": "900",
+        "ROLLUPS_MARKER_BUCKET": "raw",
+        "ROLLUPS_MARKER_KEY": MARKER,
+        "SUPERSEDED_TABLE": "telemetry_superseded",
+        "READING_SCHEMA": reading_schema_json(),
+    })
+    monkeypatch.setattr(module, "s3", s3)
+    return module
+
+
+def _since(s3, ts):
+    s3.put("raw", MARKER, json.dumps({"since": ts}).encode())
+
+
+def test_split_range_serves_closed_hours_from_rollups(aggregates):
+    open_hour = NOW // HOUR * HOUR
+    from_ts = open_hour - 5 * HOUR - 600
+
+    rollup_range, raw_ranges = aggregates._split_range(from_ts, NOW, NOW)
+
+    assert rollup_range == (open_hour - 5 * HOUR, open_hour - 1)
+    # cabeza parcial + hora abierta
+    assert raw_ranges == [(from_ts, open_hour - 5 * HOUR - 1), (open_hour, NOW)]
+
+
+def test_split_range_grace_keeps_recent_hour_raw(aggregates):
+    open_hour = NOW // HOUR * HOUR
+    now = open_hour + 300  # el buffer de Firehose aun no vacio la hora anterior
+
+    rollup_range, raw_ranges = aggregates._split_range(open_hour - 3 * HOUR, now, now)
+
+    assert rollup_range == (open_hour - 3 * HOUR, open_hour - HOUR - 1)
+    assert raw_ranges == [(open_hour - HOUR, now)]
+
+
+def test_split_range_short_window_is_raw_only(aggregates):
+    rollup_range, raw_ranges = aggregates._split_range(NOW - 600, NOW, NOW)
+    assert rollup_range is None
+    assert raw_ranges == [(NOW - 600, NOW)]
+
+
+def test_split_range_reads_raw_before_cutover(aggregates, s3):
+    open_hour = NOW // HOUR * HOUR
+    # Primer lote con rollups a mitad de una hora: esa hora tampoco esta completa
+    _since(s3, open_hour - 3 * HOUR - 1200)
+
+    rollup_range, raw_ranges = aggregates._split_range(open_hour - 10 * HOUR, NOW, NOW)
+
+    assert rollup_range == (open_hour - 3 * HOUR, open_hour - 1)
+    assert raw_ranges == [(open_hour - 10 * HOUR, open_hour - 3 * HOUR - 1), (open_hour, NOW)]
+
+
+def test_cutover_leaves_room_for_transforms_in_flight(aggregates, s3):
+    open_hour = NOW // HOUR * HOUR
+    # Marca poco antes del cambio de hora: invocaciones sin rollups que seguian
+    # en curso pueden haber entregado lecturas de la hora siguiente
+    _since(s3, open_hour - 3 * HOUR - 300)
+
+    rollup_range, _ = aggregates._split_range(open_hour - 10 * HOUR, NOW, NOW)
+
+    assert rollup_range == (open_hour - 2 * HOUR, open_hour - 1)
+
+
+def test_without_marker_everything_is_raw_until_it_appears(aggregates, s3):
+    s3.buckets["raw"].pop(MARKER)
+    from_ts = NOW - 10 * HOUR
+
+    assert aggregates._split_range(from_ts, NOW, NOW) == (None, [(from_ts, NOW)])
+
+    # Aparece la marca: se vuelve a mirar pasado MARKER_RETRY_SECONDS, no antes
+    _since(s3, NOW - 30 * 86400)
+    assert aggregates._split_range(from_ts, NOW, NOW + 60)[0] is None
+    later = NOW + aggregates.MARKER_RETRY_SECONDS
+    assert aggregates._split_range(from_ts, NOW, later)[0] is not None
+    assert s3.calls["GetObject"] == 2
+
+    # Leida una vez, no se vuelve a pedir
+    aggregates._split_range(from_ts, NOW, later + 3600)
+    assert s3.calls["GetObject"] == 2
+
+
+def test_sql_merges_rollups_and_raw(aggregates):
+    sql = aggregates._build_sql(["gw_1"], ["humidity"], "day", NOW // HOUR * HOUR - 3 * 86400, NOW, NOW)
+
+    assert "FROM telemetry.telemetry_rollups" in sql
+    assert "granularity = 'hour'" in sql
+    # Parciales ya consolidados por la compactacion: fuera por "$path"
+    assert 'r."$path" NOT IN (SELECT path FROM telemetry.telemetry_superseded)' in sql
+    assert sql.count("FROM telemetry.telemetry_flattened") == 1
+    assert "sum(value_sum) / sum(value_count) AS avg" in sql
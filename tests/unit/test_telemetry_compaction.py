@@ -0,0 +1,281 @@
+import gzip
+import json
+import time
+
+import pytest
+
+from tests.support import load_lambda
+from tests.support.fake_s3 import FakeS3
+from tests.support.lambdas import Context, FakeLambda
+from akame_common.partitions import partition_key_prefix
+
+BUCKET = "telemetry-raw"
+
+
+@pytest.fixture
+def compaction():
+    module = load_lambda("telemetry_compaction", env={"TELEMETRY_BUCKET": BUCKET})
+    module.s3 = FakeS3()
+    return module
+
+
+@pytest.fixture
+def scheduled(compaction, monkeypatch):
+    """Corridas programadas (sin lookbackHours) con reloj controlado."""
+    monkeypatch.setattr(compaction, "LOOKBACK_HOURS", 3)
+    clock = [int(time.time())]
+    monkeypatch.setattr(compaction.time, "time", lambda: clock[0])
+    compaction.clock = clock
+    compaction.hour = (clock[0] - compaction.MIN_AGE_SECONDS) // 3600 * 3600
+    return compaction
+
+
+def _rows(prefix, s3):
+    """Filas de la particion como las ve la vista: sin ocultos ni reemplazados."""
+    superseded = set()
+    for key in s3.keys(BUCKET, "compaction/superseded/"):
+        superseded.update(json.loads(line)["path"] for line in s3.body(BUCKET, key).splitlines())
+
+    rows = []
+    for key in s3.keys(BUCKET, prefix):
+        if key.rsplit("/", 1)[-1].startswith("_") or f"s3://{BUCKET}/{key}" in superseded:
+            continue
+        rows.extend(gzip.decompress(s3.body(BUCKET, key)).splitlines())
+    return sorted(rows)
+
+
+def _data_keys(prefix, s3):
+    return [k for k in s3.keys(BUCKET, prefix) if not k.rsplit("/", 1)[-1].startswith("_")]
+
+
+def _seed(s3, prefix, n=3):
+    for i in range(n):
+        s3.put(BUCKET, f"{prefix}part-{i}.gz", gzip.compress(b'{"n": %d}\n' % i))
+    return sorted(b'{"n": %d}' % i for i in range(n))
+
+
+def _fail_on_call(monkeypatch, module, name, call):
+    """El `call`-esimo llamado a module.<name> lanza TimeoutError (un corte de Lambda)."""
+    original = getattr(module, name)
+    calls = []
+
+    def wrapper(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == call:
+            raise TimeoutError()
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(module, name, wrapper)
+
+
+def test_merges_small_objects_per_partition(compaction, monkeypatch):
+    s3 = compaction.s3
+    ts = int(time.time()) - compaction.MIN_AGE_SECONDS
+    prefix = partition_key_prefix("gw_1", ts)
+    expected = []
+    for i in range(5):
+        line = json.dumps({"meshId": "gw_1", "event_ts": i}).encode()
+        expected.append(line)
+        s3.put(BUCKET, f"{prefix}TelemetryFirehose-1-{i}.gz", gzip.compress(line + b"\n"))
+
+    report = compaction.main({"lookbackHours": 1}, None)
+
+    assert report["filesBefore"] == 5 and report["filesAfter"] == 1
+    assert report["compactedPartitions"] == 1
+    assert _rows(prefix, s3) == sorted(expected)
+
+    # Pasada la gracia se borran los origenes y el registro
+    monkeypatch.setattr(compaction, "SUPERSEDED_GRACE_SECONDS", 0)
+    assert compaction.main({"lookbackHours": 1}, None)["filesAfter"] == 1
+    keys = s3.keys(BUCKET, prefix)
+    assert len(keys) == 1 and keys[0].rsplit("/", 1)[-1].startswith("compacted-")
+    assert s3.keys(BUCKET, "compaction/superseded/") == []
+    assert _rows(prefix, s3) == sorted(expected)
+
+
+def test_sources_stay_readable_until_grace_ends(compaction):
+    s3 = compaction.s3
+    ts = int(time.time()) - compaction.MIN_AGE_SECONDS
+    prefix = partition_key_prefix("gw_1", ts)
+    expected = _seed(s3, prefix)
+
+    compaction.main({"lookbackHours": 1}, None)
+
+    # Entre el cambio y el borrado: una query que liste la particion ve
+    # origenes y compactado, puede leerlos todos y la exclusion por "$path"
+    # deja cada fila una sola vez
+    listed = _data_keys(prefix, s3)
+    assert len(listed) == 4
+    for key in listed:
+        s3.get_object(Bucket=BUCKET, Key=key)
+    assert _rows(prefix, s3) == expected
+
+    # Otra corrida dentro de la gracia no borra ni recompacta los origenes
+    report = compaction.main({"lookbackHours": 1}, None)
+    assert report["filesBefore"] == 1 and report["compactedPartitions"] == 0
+    assert _data_keys(prefix, s3) == listed
+
+
+@pytest.mark.parametrize("name,call", [
+    ("_put_json", 1),     # antes del manifest
+    ("_put_record", 2),   # compactado escrito, sin el cambio
+    ("_put_json", 2),     # cambio hecho, manifest sin marcar
+])
+def test_interrupted_swap_never_duplicates(compaction, monkeypatch, name, call):
+    s3 = compaction.s3
+    ts = int(time.time()) - compaction.MIN_AGE_SECONDS
+    prefix = partition_key_prefix("gw_2", ts)
+    expected = _seed(s3, prefix)
+
+    _fail_on_call(monkeypatch, compaction, name, call)
+    with pytest.raises(TimeoutError):
+        compaction.main({"lookbackHours": 1}, None)
+    monkeypatch.undo()
+
+    assert _rows(prefix, s3) == expected
+
+    # La siguiente corrida retoma o deshace el swap y termina
+    assert compaction.main({"lookbackHours": 1}, None)["filesAfter"] == 1
+    assert _rows(prefix, s3) == expected
+
+    monkeypatch.setattr(compaction, "SUPERSEDED_GRACE_SECONDS", 0)
+    compaction.main({"lookbackHours": 1}, None)
+    assert _rows(prefix, s3) == expected
+    assert len(_data_keys(prefix, s3)) == 1
+    assert all(not k.rsplit("/", 1)[-1].startswith("_") for k in s3.keys(BUCKET))
+    assert s3.keys(BUCKET, "compaction/superseded/") == []
+
+
+def test_failed_publish_keeps_sources(compaction, monkeypatch):
+    from botocore.exceptions import ClientError
+
+    s3 = compaction.s3
+    ts = int(time.time()) - compaction.MIN_AGE_SECONDS
+    prefix = partition_key_prefix("gw_3", ts)
+    expected = _seed(s3, prefix)
+    put_object = s3.put_object
+
+    def failing_put(**kwargs):
+        if kwargs["Key"].rsplit("/", 1)[-1].startswith("compacted-"):
+            raise ClientError({"Error": {"Code": "InternalError", "Message": "x"}}, "PutObject")
+        return put_object(**kwargs)
+
+    monkeypatch.setattr(s3, "put_object", failing_put)
+    with pytest.raises(ClientError):
+        compaction.main({"lookbackHours": 1}, None)
+    monkeypatch.undo()
+
+    # Sin el cambio los origenes siguen siendo los datos visibles
+    assert _rows(prefix, s3) == expected
+    assert compaction.main({"lookbackHours": 1}, None)["filesAfter"] == 1
+    assert _rows(prefix, s3) == expected
+
+
+def test_skips_large_and_single_objects(compaction):
+    s3 = compaction.s3
+    ts = int(time.time()) - compaction.MIN_AGE_SECONDS
+    prefix = partition_key_prefix("gw_3", ts)
+    s3.put(BUCKET, f"{prefix}only.gz", gzip.compress(b"{}\n"))
+
+    report = compaction.main({"lookbackHours": 1}, None)
+    assert report["compactedPartitions"] == 0
+    assert s3.keys(BUCKET, prefix) == [f"{prefix}only.gz"]
+
+
+def test_consolidates_rollup_partials(monkeypatch):
+    module = load_lambda("telemetry_compaction", env={
+        "TELEMETRY_BUCKET": BUCKET,
+        "ROLLUPS_ROOT": "rollups/",
+        "ROLLUP_GRANULARITIES": "hour",
+    })
+    s3 = module.s3 = FakeS3()
+    ts = int(time.time()) - module.MIN_AGE_SECONDS
+    bucket_ts = ts // 3600 * 3600
+    year, month, day, hour = module.hour_partition(ts)
+    prefix = f"rollups/granularity=hour/year={year}/month={month}/day={day}/hour={hour}/"
+
+    partials = [
+        {"humidity": [2, 80.0, 39.0, 41.0]},
+        {"humidity": [1, 45.0, 45.0, 45.0], "raw": [1, 3, 3, 3]},
+    ]
+    for i, metrics in enumerate(partials):
+        row = {"meshid": "gw_1", "nodeid": 1, "bucket_ts": bucket_ts, "metrics": metrics}
+        s3.put(BUCKET, f"{prefix}batch-{i}.json.gz", gzip.compress(json.dumps(row).encode() + b"\n"))
+
+    # Sin gracia: los parciales se borran en la misma corrida
+    monkeypatch.setattr(module, "SUPERSEDED_GRACE_SECONDS", 0)
+    report = module.main({"lookbackHours": 1}, None)
+    assert report["rollupPartitions"] == 1 and report["rollupFilesBefore"] == 2
+
+    [row] = map(json.loads, _rows(prefix, s3))
+    assert row["metrics"] == {"humidity": [3, 125.0, 39.0, 45.0], "raw": [1, 3, 3, 3]}
+    assert len(s3.keys(BUCKET, prefix)) == 1
+
+
+# ---------- Plan / watermarks ----------
+
+def test_scheduled_runs_visit_each_hour_twice(scheduled):
+    s3 = scheduled.s3
+    hour = scheduled.hour
+    expected = {mesh: _seed(s3, partition_key_prefix(mesh, hour)) for mesh in ("gw_a", "gw_b")}
+
+    assert scheduled.main({}, None)["compactedPartitions"] == 2
+
+    # Misma hora: no se vuelve a listar ninguna particion
+    s3.calls.clear()
+    assert scheduled.main({}, None)["partitions"] == 0
+    assert s3.calls["ListObjectsV2"] == 1  # solo los registros de reemplazados
+
+    # Un lote atrasado a una hora ya compactada espera a la pasada "final"
+    late = partition_key_prefix("gw_a", hour)
+    s3.put(BUCKET, f"{late}late.gz", gzip.compress(b'{"n": 9}\n'))
+    scheduled.clock[0] += 3600
+    assert scheduled.main({}, None)["compactedPartitions"] == 0
+
+    scheduled.clock[0] += 3600
+    report = scheduled.main({}, None)
+    assert report["compactedPartitions"] == 1 and report["filesAfter"] == 2
+    assert _rows(late, s3) == sorted(expected["gw_a"] + [b'{"n": 9}'])
+
+
+def test_stops_before_timeout_and_continues(scheduled, monkeypatch):
+    s3 = scheduled.s3
+    fake_lambda = FakeLambda()
+    monkeypatch.setattr(scheduled, "lambda_client", fake_lambda)
+    meshes = [f"gw_{i}" for i in range(4)]
+    expected = {mesh: _seed(s3, partition_key_prefix(mesh, scheduled.hour)) for mesh in meshes}
+
+    # Tiempo para dos particiones: la tercera ya no entra
+    first = scheduled.main({}, Context([600000, 600000, 1000], request_id="req-1"))
+    assert first["status"] == "continued"
+    assert fake_lambda.invocations == [{
+        "FunctionName": Context.invoked_function_arn,
+        "InvocationType": "Event",
+        "Payload": json.dumps({"continuation": "req-1"}),
+    }]
+
+    done = scheduled.main({"continuation": "req-1"}, Context(600000, request_id="req-2"))
+    assert done["status"] == "ok" and done["compactedPartitions"] == 4
+    for mesh in meshes:
+        prefix = partition_key_prefix(mesh, scheduled.hour)
+        assert _rows(prefix, s3) == expected[mesh]
+        assert len([k for k in _data_keys(prefix, s3) if "compacted-" in k]) == 1
+
+    # La corrida ya termino: una continuacion repetida no hace nada
+    assert scheduled.main({"continuation": "req-1"}, None)["status"] == "skipped"
+
+
+def test_collects_superseded_sources_without_revisiting(scheduled):
+    s3 = scheduled.s3
+    prefix = partition_key_prefix("gw_a", scheduled.hour)
+    expected = _seed(s3, prefix)
+    scheduled.main({}, None)
+    assert len(s3.keys(BUCKET, "compaction/superseded/")) == 1
+
+    # Una hora despues el plan ya no pasa por esa particion, pero la gracia termino
+    scheduled.clock[0] += 3601
+    report = scheduled.main({}, None)
+    assert report["partitions"] == 0 and report["supersededCollected"] == 1
+    assert s3.keys(BUCKET, "compaction/superseded/") == []
+    assert len(_data_keys(prefix, s3)) == 1
+    assert _rows(prefix, s3) == expected
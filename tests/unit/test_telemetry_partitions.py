@@ -0,0 +1,131 @@
+import calendar
+import gzip
+import importlib.util
+import json
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+from tests.support import REPO_ROOT
+from tests.support.fake_s3 import FakeS3
+from akame_common.partitions import (
+    hour_partition,
+    partition_cutover,
+    partition_filter,
+    partition_key_prefix,
+)
+
+
+SSE = {"ServerSideEncryption": "aws:kms", "SSEKMSKeyId": "arn:aws:kms:us-east-2:123456789012:key/telemetry"}
+
+
+def _ts(*parts):
+    return calendar.timegm(parts + (0,) * (6 - len(parts)))
+
+
+def _load_script():
+    path = os.path.join(REPO_ROOT, "scripts", "repartition_telemetry.py")
+    spec = importlib.util.spec_from_file_location("repartition_telemetry", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_partition_key_prefix():
+    assert partition_key_prefix("gw_1", _ts(2026, 3, 7, 5, 59)) == (
+        "meshid=gw_1/year=2026/month=03/day=07/hour=05/"
+    )
+
+
+def test_filter_within_a_day():
+    assert partition_filter(_ts(2026, 10, 17, 5, 30), _ts(2026, 10, 17, 9)) == (
+        "((year = '2026' AND month = '10' AND day = '17' AND hour BETWEEN '05' AND '09'))"
+    )
+
+
+def test_filter_uses_coarsest_prefixes():
+    sql = partition_filter(_ts(2025, 11, 30, 22), _ts(2027, 2, 2, 3))
+    assert sql == "(" + " OR ".join([
+        "(year = '2025' AND month = '11' AND day = '30' AND hour BETWEEN '22' AND '23')",
+        "(year = '2025' AND month = '12')",
+        "(year = '2026')",
+        "(year = '2027' AND month = '01')",
+        "(year = '2027' AND month = '02' AND day = '01')",
+        "(year = '2027' AND month = '02' AND day = '02' AND hour BETWEEN '00' AND '03')",
+    ]) + ")"
+
+
+def _matches(predicate, ts):
+    year, month, day, hour = hour_partition(ts)
+    python = predicate.replace(" = ", " == ").replace("AND", "and").replace("OR", "or")
+    return eval(python, {"year": year, "month": month, "day": day, "hour": hour})
+
+
+@pytest.mark.parametrize("cutover", [_ts(2026, 1, 1, 0), _ts(2026, 3, 15, 13)])
+def test_cutover_splits_hours_without_overlap(cutover):
+    since, before = partition_cutover(cutover), partition_cutover(cutover, before=True)
+
+    for ts in range(cutover - 3 * 86400, cutover + 3 * 86400, 3600):
+        assert _matches(since, ts) == (ts >= cutover)
+        assert _matches(before, ts) == (ts < cutover)
+    assert _matches(since, _ts(2031, 2, 3, 4)) and _matches(before, _ts(2023, 5, 6, 7))
+
+
+def _jsonl(*rows):
+    return gzip.compress(b"".join(json.dumps(r).encode() + b"\n" for r in rows))
+
+
+def test_repartition_moves_legacy_objects():
+    script = _load_script()
+    s3 = FakeS3()
+    legacy = "meshid=gw_1/year=2026/TelemetryFirehose-1-2026-10-17-05-12-00-ab12cd34.gz"
+    s3.put("raw", legacy, _jsonl({"event_ts": _ts(2026, 10, 17, 5, 2)}), sse=SSE)
+    s3.put("raw", "meshid=gw_1/year=2026/month=10/day=17/hour=06/new.gz", b"y")
+    # Sin event_ts: la hora de llegada (LastModified)
+    s3.put("raw", "meshid=gw_2/year=2025/manual.gz", _jsonl({"n": 1}),
+           last_modified=datetime(2025, 12, 31, 23, 5, tzinfo=timezone.utc))
+
+    dry = script.repartition(s3, "raw")
+    assert dry["objects"] == 2 and "CopyObject" not in s3.calls
+
+    stats = script.repartition(s3, "raw", apply=True)
+    assert stats["written"] == 2 and stats["deleted"] == 2
+    assert s3.keys("raw") == [
+        "meshid=gw_1/year=2026/month=10/day=17/hour=05/TelemetryFirehose-1-2026-10-17-05-12-00-ab12cd34.gz",
+        "meshid=gw_1/year=2026/month=10/day=17/hour=06/new.gz",
+        "meshid=gw_2/year=2025/month=12/day=31/hour=23/manual.gz",
+    ]
+    # La copia conserva el cifrado KMS del original
+    moved = s3.get_object(Bucket="raw", Key=s3.keys("raw")[0])
+    assert {k: moved[k] for k in SSE} == SSE
+
+
+def test_repartition_splits_by_event_hour():
+    script = _load_script()
+    s3 = FakeS3()
+    # Lote que llego a las 09:30 con lecturas atrasadas del gateway
+    legacy = "meshid=gw_1/year=2026/TelemetryFirehose-1-2026-10-17-09-30-00-ab12cd34.gz"
+    rows = [
+        {"event_ts": _ts(2026, 10, 17, 7, 10), "n": 1},
+        {"event_ts": _ts(2026, 10, 17, 9, 5) * 1000, "n": 2},   # milisegundos
+        {"event_ts": _ts(2026, 10, 17, 7, 50), "n": 3},
+        {"event_ts": _ts(2027, 1, 1), "n": 4},                  # reloj adelantado
+        {"n": 5},
+    ]
+    s3.put("raw", legacy, _jsonl(*rows), sse=SSE)
+
+    stats = script.repartition(s3, "raw", apply=True)
+    assert stats["split"] == 1 and stats["records"] == 5 and stats["written"] == 2
+
+    name = legacy.rsplit("/", 1)[1]
+    by_hour = {}
+    for key in s3.keys("raw"):
+        obj = s3.get_object(Bucket="raw", Key=key)
+        assert {k: obj[k] for k in SSE} == SSE
+        by_hour[key] = [json.loads(l)["n"] for l in gzip.decompress(obj["Body"].read()).splitlines()]
+
+    assert by_hour == {
+        f"meshid=gw_1/year=2026/month=10/day=17/hour=07/{name}": [1, 3],
+        f"meshid=gw_1/year=2026/month=10/day=17/hour=09/{name}": [2, 4, 5],
+    }